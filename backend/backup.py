@@ -0,0 +1,571 @@
+"""
+Backups de la base de datos en formato NDJSON comprimido con gzip
+El backup se genera directamente desde los cursores de MongoDB en lotes de BACKUP_BATCH_SIZE
+documentos: cada lote se serializa, se comprime y se entrega, así la respuesta empieza de
+inmediato y la memoria no crece con el tamaño de la base de datos.
+
+Formato (una línea JSON extendido por registro, ver json_util):
+- {"type": "header", "format": "ecp-backup", "version": 2, "kind": "full" | "incremental",
+   "backup_id": ..., "parent_id": ..., "since": ..., "until": ..., "collections": [...]}
+- {"type": "doc", "collection": <nombre>, "doc": {...}}            (uno por documento)
+- {"type": "delete", "collection": <nombre>, "id": <id>}           (solo en incrementales)
+- {"type": "collection_end", "collection": <nombre>, "count": N}
+- {"type": "footer", "counts": {<nombre>: N}, "finished_at": ...}
+Un backup sin footer quedó truncado (error a mitad de la descarga) y no se debe restaurar
+
+Incrementales: cada backup de una cadena (BACKUP_STATE_COLLECTION) guarda su marca de agua
+(until, tomada antes de leer). El siguiente incremental exporta los documentos con updated_at
+desde esa marca (menos WATERMARK_OVERLAP_SECONDS, por relojes y peticiones en vuelo: repetir un
+documento no hace daño) y las lápidas de los eliminados (change_tracking.py). Las colecciones de
+configuración (WHOLE_COLLECTIONS) son pequeñas y van completas en cada incremental
+
+Restauración (restore_backup): el archivo se lee por bloques y cada colección se inserta en
+lotes de RESTORE_BATCH_SIZE en una colección sombra (restore_shadow_<nombre>). Los incrementales
+de la cadena se aplican después sobre las sombras (upsert por id y borrado de las lápidas).
+Solo cuando todo se leyó completo se crean los índices sobre las sombras y cada una se renombra
+sobre la colección real (renameCollection con dropTarget). Si algo falla antes, las sombras se
+borran y los datos actuales quedan intactos
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+
+from bson import json_util
+from pymongo import ReplaceOne
+
+from cache_invalidation import invalidate_reference_data
+from change_tracking import TOMBSTONES_COLLECTION, TOMBSTONE_RETENTION_SECONDS
+from indexes import INDEX_REGISTRY
+from invoice_registry import OWNER_COLLECTIONS, REGISTRY_COLLECTION, backfill_invoice_registry
+from money_counters import repair_expense_balances
+from reference_cache import REFERENCE_NAMESPACES
+from stats_counters import rebuild_stats_counters
+
+logger = logging.getLogger(__name__)
+
+BACKUP_FORMAT = "ecp-backup"
+BACKUP_VERSION = 2
+BACKUP_BATCH_SIZE = int(os.environ.get("BACKUP_BATCH_SIZE", "500"))
+RESTORE_BATCH_SIZE = int(os.environ.get("RESTORE_BATCH_SIZE", "1000"))
+RESTORE_READ_SIZE = 1024 * 1024
+SHADOW_PREFIX = "restore_shadow_"
+
+BACKUP_COLLECTIONS = [
+    "users", "customers", "categories", "expense_categories",
+    "villas", "extra_services", "reservations", "villa_owners",
+    "expenses", "reservation_abonos", "expense_abonos",
+    "invoice_counter", "invoice_templates", "logo_config"
+]
+# Configuración sin marca de cambio: siempre se exporta completa
+WHOLE_COLLECTIONS = ["invoice_counter", "invoice_templates", "logo_config"]
+
+FULL = "full"
+INCREMENTAL = "incremental"
+BACKUP_STATE_COLLECTION = "backup_state"
+DOWNLOAD_CHAIN = "download"
+WATERMARK_OVERLAP_SECONDS = 300
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+_JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def _line(record: dict) -> bytes:
+    return (json_util.dumps(record, json_options=_JSON_OPTIONS, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def backup_filename(now: datetime = None, kind: str = FULL) -> str:
+    suffix = "_incremental" if kind == INCREMENTAL else ""
+    return f"espacios_backup_{(now or datetime.now()).strftime('%Y%m%d_%H%M%S')}{suffix}.ndjson.gz"
+
+
+async def plan_backup(db, incremental: bool = False, chain: Optional[str] = DOWNLOAD_CHAIN) -> dict:
+    """
+    Datos del próximo backup de la cadena: completo, o incremental desde la marca de agua
+    del backup anterior. Lanza ValueError si no se puede hacer un incremental
+    chain=None: backup completo suelto, no mueve la marca de agua de ninguna cadena
+    """
+    now = _now()
+    plan = {"kind": FULL, "backup_id": str(uuid.uuid4()), "parent_id": None, "chain": chain, "since": None, "until": now}
+    if not incremental:
+        return plan
+
+    state = await db[BACKUP_STATE_COLLECTION].find_one({"id": chain}, {"_id": 0})
+    if not state:
+        raise ValueError("No hay un backup anterior en la cadena: primero descarga un backup completo")
+    since = _as_utc(state["watermark"])
+    if (now - since).total_seconds() > TOMBSTONE_RETENTION_SECONDS - WATERMARK_OVERLAP_SECONDS:
+        raise ValueError("El último backup es más viejo que la retención de eliminaciones: descarga un backup completo")
+    plan.update(kind=INCREMENTAL, parent_id=state["backup_id"], since=since)
+    return plan
+
+
+async def record_watermark(db, plan: dict) -> None:
+    """El backup terminó: el próximo incremental de la cadena parte de su marca de agua"""
+    await db[BACKUP_STATE_COLLECTION].update_one(
+        {"id": plan["chain"]},
+        {"$set": {"watermark": plan["until"], "backup_id": plan["backup_id"], "kind": plan["kind"], "updated_at": _now()}},
+        upsert=True
+    )
+
+
+async def reset_backup_chains(db) -> None:
+    """Después de restaurar o resetear los datos, la próxima cadena empieza con un backup completo"""
+    await db[BACKUP_STATE_COLLECTION].delete_many({"watermark": {"$exists": True}})
+
+
+def _changed_since(since: datetime) -> dict:
+    """updated_at desde la marca de agua (guardado como fecha nativa o como string ISO)"""
+    start = since - timedelta(seconds=WATERMARK_OVERLAP_SECONDS)
+    return {"$or": [{"updated_at": {"$gte": start}}, {"updated_at": {"$gte": start.isoformat()}}]}
+
+
+class BackupDigest:
+    """Cantidad y SHA-256 de las líneas de documentos de cada colección (manifiesto de un backup)"""
+
+    def __init__(self):
+        self._collections: Dict[str, list] = {}
+
+    def start(self, collection: str) -> None:
+        self._collections.setdefault(collection, [0, hashlib.sha256()])
+
+    def add(self, collection: str, line: bytes) -> None:
+        self.start(collection)
+        entry = self._collections[collection]
+        entry[0] += 1
+        entry[1].update(line)
+
+    def summary(self) -> Dict[str, dict]:
+        return {name: {"documents": count, "sha256": digest.hexdigest()}
+                for name, (count, digest) in self._collections.items()}
+
+
+async def iter_backup_lines(db, collections: Iterable[str] = BACKUP_COLLECTIONS,
+                            batch_size: int = BACKUP_BATCH_SIZE, plan: Optional[dict] = None,
+                            digest: Optional[BackupDigest] = None) -> AsyncIterator[bytes]:
+    """Líneas NDJSON sin comprimir, un bloque de bytes por lote de documentos"""
+    collections = list(collections)
+    plan = plan or {"kind": FULL, "backup_id": str(uuid.uuid4()), "parent_id": None, "since": None, "until": _now()}
+    incremental = plan["kind"] == INCREMENTAL
+    yield _line({
+        "type": "header",
+        "format": BACKUP_FORMAT,
+        "version": BACKUP_VERSION,
+        "kind": plan["kind"],
+        "backup_id": plan["backup_id"],
+        "parent_id": plan["parent_id"],
+        "since": plan["since"].isoformat() if plan["since"] else None,
+        "until": plan["until"].isoformat(),
+        "backup_date": _now().isoformat(),
+        "app_version": "1.0",
+        "collections": collections,
+    })
+
+    counts = {}
+    for name in collections:
+        query = {}
+        if incremental and name not in WHOLE_COLLECTIONS:
+            query = _changed_since(plan["since"])
+        count = 0
+        batch = []
+        if digest:
+            digest.start(name)
+        async for doc in db[name].find(query, {"_id": 0}).batch_size(batch_size):
+            line = _line({"type": "doc", "collection": name, "doc": doc})
+            batch.append(line)
+            if digest:
+                digest.add(name, line)
+            if len(batch) >= batch_size:
+                count += len(batch)
+                yield b"".join(batch)
+                batch = []
+        count += len(batch)
+
+        if incremental and name not in WHOLE_COLLECTIONS:
+            start = plan["since"] - timedelta(seconds=WATERMARK_OVERLAP_SECONDS)
+            tombstones = db[TOMBSTONES_COLLECTION].find(
+                {"collection": name, "deleted_at": {"$gte": start}}, {"_id": 0, "doc_id": 1}
+            ).batch_size(batch_size)
+            async for tombstone in tombstones:
+                batch.append(_line({"type": "delete", "collection": name, "id": tombstone["doc_id"]}))
+                if len(batch) >= batch_size:
+                    yield b"".join(batch)
+                    batch = []
+
+        batch.append(_line({"type": "collection_end", "collection": name, "count": count}))
+        yield b"".join(batch)
+        counts[name] = count
+
+    yield _line({"type": "footer", "counts": counts, "finished_at": _now().isoformat()})
+
+
+async def stream_backup(db, collections: Iterable[str] = BACKUP_COLLECTIONS,
+                        batch_size: int = BACKUP_BATCH_SIZE, plan: Optional[dict] = None,
+                        digest: Optional[BackupDigest] = None) -> AsyncIterator[bytes]:
+    """
+    El backup comprimido con gzip, un bloque por lote (para StreamingResponse)
+    Con plan de una cadena, la marca de agua se guarda solo si el backup se entregó completo
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        async for chunk in iter_backup_lines(db, collections, batch_size, plan, digest):
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+    except Exception as e:
+        # La respuesta ya empezó: el archivo queda sin footer y la restauración lo rechaza
+        logger.error(f"Error generando backup: {e}")
+        raise
+    yield compressor.flush()
+    if plan and plan.get("chain"):
+        await record_watermark(db, plan)
+
+
+class BackupDecoder:
+    """
+    Convierte los bloques de un backup (gzip o NDJSON plano) en registros a medida que llegan
+    Solo mantiene en memoria el bloque actual y la línea incompleta
+    """
+
+    def __init__(self):
+        self._decompressor = None
+        self._pending = b""
+        self._started = False
+
+    def feed(self, chunk: bytes) -> List[dict]:
+        if not self._started and chunk:
+            self._started = True
+            if chunk[:2] == GZIP_MAGIC:
+                self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        data = self._decompressor.decompress(chunk) if self._decompressor else chunk
+        lines = (self._pending + data).split(b"\n")
+        self._pending = lines.pop()
+        return [json_util.loads(line, json_options=_JSON_OPTIONS) for line in lines if line.strip()]
+
+    def finish(self) -> List[dict]:
+        if self._decompressor:
+            self._pending += self._decompressor.flush()
+        pending, self._pending = self._pending, b""
+        return [json_util.loads(pending, json_options=_JSON_OPTIONS)] if pending.strip() else []
+
+
+def iter_backup_records(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """Registros de un backup leído bloque a bloque"""
+    decoder = BackupDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.finish()
+
+
+async def aiter_backup_records(read: Callable[[int], Awaitable[bytes]],
+                               read_size: int = RESTORE_READ_SIZE) -> AsyncIterator[dict]:
+    """Registros de un backup leído con read(n) (p. ej. UploadFile.read), bloque a bloque"""
+    decoder = BackupDecoder()
+    while True:
+        chunk = await read(read_size)
+        if not chunk:
+            break
+        for record in decoder.feed(chunk):
+            yield record
+    for record in decoder.finish():
+        yield record
+
+
+def is_legacy_backup(head: bytes) -> bool:
+    """Backups anteriores: un solo documento JSON con la llave 'collections'"""
+    return head[:2] != GZIP_MAGIC and not head.startswith(b'{"type"')
+
+
+def legacy_backup_records(content: bytes) -> Iterator[dict]:
+    """Registros equivalentes al formato NDJSON a partir de un backup JSON anterior"""
+    data = json.loads(content.decode("utf-8"), object_hook=json_util.object_hook)
+    if "collections" not in data:
+        raise ValueError("Formato de backup inválido")
+    collections = data["collections"]
+    yield {"type": "header", "format": BACKUP_FORMAT, "version": 1, "kind": FULL,
+           "backup_date": data.get("backup_date"), "collections": list(collections)}
+    for name, documents in collections.items():
+        for doc in documents:
+            yield {"type": "doc", "collection": name, "doc": doc}
+        yield {"type": "collection_end", "collection": name, "count": len(documents)}
+    yield {"type": "footer", "counts": {name: len(docs) for name, docs in collections.items()}}
+
+
+async def aiter_records(records: Iterable[dict]) -> AsyncIterator[dict]:
+    for record in records:
+        yield record
+
+
+class RestoreProgress:
+    """Estado de la restauración en curso (GET /api/backup/restore/status)"""
+
+    def __init__(self):
+        self.running = False
+        self.phase: Optional[str] = None
+        self.collection: Optional[str] = None
+        self.source: Optional[int] = None
+        self.documents = 0
+        self.started_at: Optional[datetime] = None
+        self._started = 0.0
+        self.error: Optional[str] = None
+
+    def start(self) -> None:
+        self.running = True
+        self.phase = "loading"
+        self.collection = None
+        self.source = None
+        self.documents = 0
+        self.error = None
+        self.started_at = _now()
+        self._started = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started if self.started_at else 0.0
+
+    def docs_per_second(self) -> float:
+        elapsed = self.elapsed()
+        return round(self.documents / elapsed, 1) if elapsed > 0 else 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self.running,
+            "phase": self.phase,
+            "source": self.source,
+            "collection": self.collection,
+            "documents": self.documents,
+            "seconds": round(self.elapsed(), 2),
+            "docs_per_second": self.docs_per_second(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "error": self.error,
+        }
+
+
+restore_progress = RestoreProgress()
+
+
+def _shadow(name: str) -> str:
+    return f"{SHADOW_PREFIX}{name}"
+
+
+class _ShadowLoader:
+    """Carga los registros de una cadena de backups en las colecciones sombra"""
+
+    def __init__(self, db, batch_size: int, progress: RestoreProgress):
+        self.db = db
+        self.batch_size = batch_size
+        self.progress = progress
+        self.shadows: Dict[str, dict] = {}
+        self.skipped = set()
+        self.indexed = False
+
+    async def _open(self, name: str) -> None:
+        if name not in self.shadows:
+            await self.db.drop_collection(_shadow(name))
+            self.shadows[name] = {"read": 0, "seconds": 0.0}
+            if self.indexed:
+                await self._create_indexes(name)
+
+    async def _create_indexes(self, name: str) -> None:
+        if INDEX_REGISTRY.get(name):
+            await self.db[_shadow(name)].create_indexes(INDEX_REGISTRY[name])
+
+    async def create_indexes(self) -> None:
+        self.progress.phase = "indexes"
+        for name in self.shadows:
+            self.progress.collection = name
+            await self._create_indexes(name)
+        self.indexed = True
+
+    async def load(self, records: AsyncIterable[dict], position: int, previous: Optional[dict]) -> dict:
+        """Aplica un backup de la cadena (el primero completo, los demás incrementales); devuelve su header"""
+        self.progress.phase = "loading"
+        self.progress.source = position
+        header = None
+        complete = False
+        incremental = False
+        docs: List[dict] = []
+        deletes: List[str] = []
+        current: Optional[str] = None
+        read: Dict[str, int] = {}
+        started = time.perf_counter()
+
+        async def flush() -> None:
+            nonlocal docs, deletes
+            if docs:
+                shadow = self.db[_shadow(current)]
+                if incremental and current not in WHOLE_COLLECTIONS:
+                    await shadow.bulk_write([ReplaceOne({"id": doc["id"]}, doc, upsert=True) for doc in docs], ordered=False)
+                else:
+                    await shadow.insert_many(docs, ordered=False)
+                self.progress.documents += len(docs)
+                docs = []
+            if deletes:
+                await self.db[_shadow(current)].delete_many({"id": {"$in": deletes}})
+                deletes = []
+
+        async for record in records:
+            kind = record.get("type")
+            if header is None:
+                header = self._check_header(record, position, previous)
+                incremental = header.get("kind") == INCREMENTAL
+                continue
+
+            if kind in ("doc", "delete"):
+                name = record["collection"]
+                if name not in BACKUP_COLLECTIONS:
+                    self.skipped.add(name)
+                    continue
+                if name != current:
+                    await flush()
+                    current = name
+                    started = time.perf_counter()
+                    self.progress.collection = name
+                if kind == "doc":
+                    if name not in read:
+                        read[name] = 0
+                        await self._open(name)
+                        if incremental and name in WHOLE_COLLECTIONS:
+                            # La configuración viene completa: reemplaza la del backup anterior
+                            await self.db[_shadow(name)].delete_many({})
+                    read[name] += 1
+                    docs.append(record["doc"])
+                elif name in self.shadows:
+                    deletes.append(record["id"])
+                if len(docs) + len(deletes) >= self.batch_size:
+                    await flush()
+                    logger.info(f"Restaurando {name}: {self.progress.documents} documentos ({self.progress.docs_per_second()} docs/s)")
+
+            elif kind == "collection_end":
+                name = record["collection"]
+                if name == current:
+                    await flush()
+                if name in self.shadows:
+                    self.shadows[name]["read"] += read.get(name, 0)
+                    self.shadows[name]["seconds"] += time.perf_counter() - started
+                if name in BACKUP_COLLECTIONS and read.get(name, 0) != record.get("count"):
+                    raise ValueError(
+                        f"{name}: el backup declara {record.get('count')} documentos y se leyeron {read.get(name, 0)}"
+                    )
+
+            elif kind == "footer":
+                complete = True
+
+        if header is None or not complete:
+            raise ValueError(f"Backup {position + 1} incompleto: falta el final del archivo")
+        return header
+
+    @staticmethod
+    def _check_header(record: dict, position: int, previous: Optional[dict]) -> dict:
+        if record.get("type") != "header" or record.get("format") != BACKUP_FORMAT:
+            raise ValueError("Formato de backup inválido")
+        kind = record.get("kind", FULL)
+        if position == 0 and kind != FULL:
+            raise ValueError("La restauración debe empezar con un backup completo")
+        if position > 0:
+            if kind != INCREMENTAL:
+                raise ValueError(f"El archivo {position + 1} no es un backup incremental")
+            if record.get("parent_id") != previous.get("backup_id"):
+                raise ValueError(f"El incremental {position + 1} no continúa el backup anterior de la cadena")
+        return record
+
+    async def swap(self) -> None:
+        self.progress.phase = "swap"
+        for name in self.shadows:
+            self.progress.collection = name
+            await self.db[_shadow(name)].rename(name, dropTarget=True)
+
+    async def discard(self) -> None:
+        for name in self.shadows:
+            await self.db.drop_collection(_shadow(name))
+
+
+async def restore_backup(db, sources: List[AsyncIterable[dict]], batch_size: int = RESTORE_BATCH_SIZE,
+                         progress: Optional[RestoreProgress] = None) -> dict:
+    """
+    Restaura un backup completo seguido (opcionalmente) de su cadena de incrementales, cada
+    uno leído como flujo de registros (ver módulo)
+    Solo se restauran las colecciones de BACKUP_COLLECTIONS que traen documentos; devuelve
+    por colección los documentos, el tiempo y los docs/s
+    Lanza ValueError si un backup está incompleto, no cuadra o no sigue la cadena (los datos
+    actuales no se tocan) y RuntimeError si progress ya tiene una restauración en curso
+    """
+    progress = progress or RestoreProgress()
+    if progress.running:
+        raise RuntimeError("Ya hay una restauración en curso")
+    progress.start()
+    loader = _ShadowLoader(db, batch_size, progress)
+    headers = []
+
+    try:
+        for position, records in enumerate(sources):
+            headers.append(await loader.load(records, position, headers[-1] if headers else None))
+            if position == 0 and len(sources) > 1:
+                # Los incrementales hacen upsert por id: las sombras ya necesitan sus índices
+                await loader.create_indexes()
+        if not headers:
+            raise ValueError("No se recibió ningún backup")
+        if not loader.indexed:
+            await loader.create_indexes()
+        restored = []
+        for name, info in loader.shadows.items():
+            restored.append({
+                "collection": name,
+                "documents": await db[_shadow(name)].estimated_document_count(),
+                "seconds": round(info["seconds"], 2),
+                "docs_per_second": round(info["read"] / info["seconds"], 1) if info["seconds"] > 0 else None,
+            })
+        await loader.swap()
+    except Exception as e:
+        progress.error = str(e)
+        await loader.discard()
+        raise
+    finally:
+        progress.running = False
+
+    progress.phase = "done"
+    progress.collection = None
+    summary = {
+        "header": headers[-1],
+        "backups": [{"kind": h.get("kind", FULL), "backup_id": h.get("backup_id"), "until": h.get("until")} for h in headers],
+        "restored": restored,
+        "skipped": sorted(loader.skipped),
+        "documents": progress.documents,
+        "seconds": round(progress.elapsed(), 2),
+        "docs_per_second": progress.docs_per_second(),
+    }
+    logger.info(f"Backup restaurado: {summary['documents']} documentos en {summary['seconds']} s ({summary['docs_per_second']} docs/s)")
+    return summary
+
+
+async def rebuild_derived_data(db, restored: List[dict]) -> None:
+    """Recalcula lo que se deriva de las colecciones restauradas y reinicia las cadenas de backups"""
+    names = {r["collection"] for r in restored}
+    # El registro de facturas se deriva de las colecciones restauradas: reconstruirlo
+    if names & set(OWNER_COLLECTIONS.values()):
+        await db[REGISTRY_COLLECTION].delete_many({})
+        await backfill_invoice_registry(db)
+
+    # total_paid/balance_due de los gastos se derivan de expense_abonos
+    if names & {"expenses", "expense_abonos"}:
+        await repair_expense_balances(db)
+
+    # Los contadores del dashboard se derivan de reservaciones y gastos
+    await rebuild_stats_counters(db)
+    await invalidate_reference_data(db, *REFERENCE_NAMESPACES)
+    await reset_backup_chains(db)
@@ -0,0 +1,416 @@
+"""
+Backups programados en un directorio local
+Un task en segundo plano (uno por proceso de uvicorn, como el worker del outbox) despierta en
+cada hora que indica BACKUP_SCHEDULE (expresión cron de 5 campos en BACKUP_TIMEZONE) y escribe
+un backup completo comprimido en BACKUP_DIR. Los documentos se leen con motor y el archivo se
+escribe por lotes en un hilo (asyncio.to_thread), así las peticiones no esperan por el backup.
+- Cada ejecución se reclama en backup_state: con varios procesos solo uno escribe el backup
+- Junto a cada archivo queda <archivo>.manifest.json con su SHA-256, su tamaño y la cantidad y
+  el SHA-256 de los documentos de cada colección; verify_backup relee el archivo y lo compara
+- Retención: se conserva el backup más reciente de cada uno de los últimos BACKUP_KEEP_DAILY
+  días, BACKUP_KEEP_WEEKLY semanas y BACKUP_KEEP_MONTHLY meses; los demás se borran
+Sin BACKUP_DIR el scheduler no arranca
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Set
+from zoneinfo import ZoneInfo
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from backup import (
+    BACKUP_FORMAT, BACKUP_STATE_COLLECTION, BACKUP_VERSION, BackupDigest,
+    backup_filename, plan_backup, restore_progress, stream_backup
+)
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = os.environ.get("BACKUP_DIR", "")
+BACKUP_SCHEDULE = os.environ.get("BACKUP_SCHEDULE", "0 3 * * *")
+BACKUP_TIMEZONE = os.environ.get("BACKUP_TIMEZONE", "UTC")
+BACKUP_KEEP_DAILY = int(os.environ.get("BACKUP_KEEP_DAILY", "7"))
+BACKUP_KEEP_WEEKLY = int(os.environ.get("BACKUP_KEEP_WEEKLY", "4"))
+BACKUP_KEEP_MONTHLY = int(os.environ.get("BACKUP_KEEP_MONTHLY", "12"))
+
+MANIFEST_SUFFIX = ".manifest.json"
+PARTIAL_SUFFIX = ".partial"
+SCHEDULE_STATE_ID = "scheduled_backup"
+VERIFY_READ_SIZE = 1024 * 1024
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _parse_field(spec: str, low: int, high: int) -> Set[int]:
+    """Un campo cron: *, n, a-b, */n, a-b/n y listas separadas por coma"""
+    values = set()
+    for part in spec.split(","):
+        step = 1
+        if "/" in part:
+            part, step_spec = part.split("/", 1)
+            step = int(step_spec)
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(value) for value in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if step < 1 or start < low or end > high or start > end:
+            raise ValueError(f"Campo cron fuera de rango: '{spec}'")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """Expresión cron de 5 campos (minuto hora día mes día-de-semana) en una zona horaria"""
+
+    def __init__(self, expression: str, tz: str = "UTC"):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"La expresión cron debe tener 5 campos: '{expression}'")
+        self.expression = expression
+        self.zone = ZoneInfo(tz)
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12)
+        self.weekdays = {day % 7 for day in _parse_field(fields[4], 0, 7)}
+        # Como en cron: si se restringen día del mes y día de semana, basta con uno de los dos
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = moment.isoweekday() % 7 in self.weekdays
+        if self._any_day and self._any_weekday:
+            return True
+        if self._any_day:
+            return weekday
+        if self._any_weekday:
+            return day
+        return day or weekday
+
+    def next_after(self, after: datetime) -> datetime:
+        """Próxima hora de ejecución (UTC) estrictamente posterior a after"""
+        moment = after.astimezone(self.zone).replace(tzinfo=None, second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.replace(tzinfo=self.zone).astimezone(timezone.utc)
+        raise ValueError(f"La expresión cron nunca se cumple: '{self.expression}'")
+
+
+def manifest_path(archive_path: str) -> str:
+    return archive_path + MANIFEST_SUFFIX
+
+
+def list_backups(directory: str) -> List[dict]:
+    """Manifiestos de los backups del directorio, del más reciente al más viejo"""
+    if not directory or not os.path.isdir(directory):
+        return []
+    manifests = []
+    for name in os.listdir(directory):
+        if not name.endswith(MANIFEST_SUFFIX):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8") as handle:
+                manifests.append(json.load(handle))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Manifiesto ilegible {name}: {e}")
+    return sorted(manifests, key=lambda manifest: manifest["created_at"], reverse=True)
+
+
+def select_retained(created: Dict[str, datetime], daily: int, weekly: int, monthly: int) -> Set[str]:
+    """
+    Archivos que conserva la retención: el más reciente de cada uno de los últimos daily días,
+    weekly semanas ISO y monthly meses (y siempre el último backup)
+    """
+    ordered = sorted(created.items(), key=lambda item: item[1], reverse=True)
+    periods: List[tuple] = [
+        (lambda moment: moment.date(), daily),
+        (lambda moment: moment.isocalendar()[:2], weekly),
+        (lambda moment: (moment.year, moment.month), monthly),
+    ]
+    keep = {ordered[0][0]} if ordered else set()
+    for period, limit in periods:
+        seen = set()
+        for name, moment in ordered:
+            key = period(moment)
+            if key in seen:
+                continue
+            if len(seen) >= limit:
+                break
+            seen.add(key)
+            keep.add(name)
+    return keep
+
+
+def apply_retention(directory: str, zone: ZoneInfo, daily: int = BACKUP_KEEP_DAILY,
+                    weekly: int = BACKUP_KEEP_WEEKLY, monthly: int = BACKUP_KEEP_MONTHLY) -> List[str]:
+    """Borra los backups (archivo y manifiesto) que la retención no conserva; devuelve sus nombres"""
+    created = {
+        manifest["file"]: datetime.fromisoformat(manifest["created_at"]).astimezone(zone)
+        for manifest in list_backups(directory)
+    }
+    removed = []
+    for name in sorted(set(created) - select_retained(created, daily, weekly, monthly)):
+        archive = os.path.join(directory, name)
+        for path in (archive, manifest_path(archive)):
+            if os.path.exists(path):
+                os.remove(path)
+        removed.append(name)
+    return removed
+
+
+def verify_backup(archive_path: str) -> dict:
+    """
+    Relee un backup y lo compara con su manifiesto: SHA-256 y tamaño del archivo, y cantidad
+    y SHA-256 de los documentos de cada colección; también que cada collection_end cuadre y
+    que el archivo tenga footer. Lectura por bloques (función bloqueante: usar en un hilo)
+    """
+    errors = []
+    try:
+        with open(manifest_path(archive_path), encoding="utf-8") as handle:
+            manifest = json.load(handle)
+    except (OSError, ValueError) as e:
+        return {"file": os.path.basename(archive_path), "ok": False, "errors": [f"Manifiesto no disponible: {e}"]}
+
+    file_hash = hashlib.sha256()
+    size = 0
+    digest = BackupDigest()
+    declared = {}
+    footer = None
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    pending = b""
+
+    def read_lines(data: bytes) -> None:
+        nonlocal pending, footer
+        lines = (pending + data).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record.get("type")
+            if kind == "doc":
+                digest.add(record["collection"], line + b"\n")
+            elif kind == "collection_end":
+                digest.start(record["collection"])
+                declared[record["collection"]] = record.get("count")
+            elif kind == "footer":
+                footer = record
+
+    try:
+        with open(archive_path, "rb") as handle:
+            for chunk in iter(lambda: handle.read(VERIFY_READ_SIZE), b""):
+                file_hash.update(chunk)
+                size += len(chunk)
+                read_lines(decompressor.decompress(chunk))
+        read_lines(decompressor.flush() + b"\n")
+    except (OSError, zlib.error, ValueError) as e:
+        errors.append(f"No se pudo leer el archivo: {e}")
+
+    if file_hash.hexdigest() != manifest.get("sha256"):
+        errors.append("El SHA-256 del archivo no coincide con el manifiesto")
+    if size != manifest.get("size"):
+        errors.append(f"Tamaño {size} bytes, el manifiesto indica {manifest.get('size')}")
+    collections = digest.summary()
+    if footer is None:
+        # Archivo truncado o corrupto: las colecciones no leídas no se comparan una por una
+        errors.append("El backup está incompleto: falta el footer")
+        return {"file": manifest.get("file", os.path.basename(archive_path)), "ok": False, "errors": errors,
+                "size": size, "collections": collections, "verified_at": _now().isoformat()}
+
+    expected = manifest.get("collections", {})
+    for name in sorted(set(expected) | set(collections)):
+        found = collections.get(name, {"documents": 0, "sha256": None})
+        if name not in expected:
+            errors.append(f"{name}: no está en el manifiesto")
+            continue
+        if found["documents"] != expected[name]["documents"]:
+            errors.append(f"{name}: {found['documents']} documentos, el manifiesto indica {expected[name]['documents']}")
+        elif found["sha256"] != expected[name]["sha256"]:
+            errors.append(f"{name}: el SHA-256 de los documentos no coincide con el manifiesto")
+        if declared.get(name) != found["documents"]:
+            errors.append(f"{name}: el backup declara {declared.get(name)} documentos y contiene {found['documents']}")
+
+    return {
+        "file": manifest.get("file", os.path.basename(archive_path)),
+        "ok": not errors,
+        "errors": errors,
+        "size": size,
+        "collections": collections,
+        "verified_at": _now().isoformat(),
+    }
+
+
+async def write_backup(db, directory: str) -> dict:
+    """Escribe un backup completo en directory junto con su manifiesto; devuelve el manifiesto"""
+    await asyncio.to_thread(os.makedirs, directory, exist_ok=True)
+    plan = await plan_backup(db, chain=None)
+    name = backup_filename(plan["until"])
+    archive = os.path.join(directory, name)
+    partial = archive + PARTIAL_SUFFIX
+    digest = BackupDigest()
+    file_hash = hashlib.sha256()
+    size = 0
+
+    handle = await asyncio.to_thread(open, partial, "wb")
+    try:
+        async for chunk in stream_backup(db, plan=plan, digest=digest):
+            file_hash.update(chunk)
+            size += len(chunk)
+            await asyncio.to_thread(handle.write, chunk)
+        await asyncio.to_thread(handle.close)
+        # Solo un archivo completo lleva el nombre final
+        await asyncio.to_thread(os.replace, partial, archive)
+    except BaseException:
+        handle.close()
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+    collections = digest.summary()
+    manifest = {
+        "file": name,
+        "format": BACKUP_FORMAT,
+        "version": BACKUP_VERSION,
+        "backup_id": plan["backup_id"],
+        "created_at": plan["until"].isoformat(),
+        "finished_at": _now().isoformat(),
+        "size": size,
+        "sha256": file_hash.hexdigest(),
+        "documents": sum(entry["documents"] for entry in collections.values()),
+        "collections": collections,
+    }
+    await asyncio.to_thread(_write_json, manifest_path(archive), manifest)
+    return manifest
+
+
+def _write_json(path: str, data: dict) -> None:
+    with open(path + PARTIAL_SUFFIX, "w", encoding="utf-8") as handle:
+        json.dump(data, handle, indent=2)
+    os.replace(path + PARTIAL_SUFFIX, path)
+
+
+class BackupScheduler:
+    """Escribe backups en BACKUP_DIR según BACKUP_SCHEDULE y aplica la retención"""
+
+    def __init__(self, directory: str = BACKUP_DIR, schedule: str = BACKUP_SCHEDULE, tz: str = BACKUP_TIMEZONE,
+                 now: Callable[[], datetime] = _now):
+        self.directory = directory
+        self.schedule = CronSchedule(schedule, tz)
+        self.now = now
+        self.runs = 0
+        self.failed = 0
+        self.next_run_at: Optional[datetime] = None
+        self.last_run_at: Optional[datetime] = None
+        self.last_file: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def start(self, db) -> None:
+        if not self.enabled:
+            logger.info("Backups programados desactivados (BACKUP_DIR no configurado)")
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, db) -> None:
+        while True:
+            self.next_run_at = self.schedule.next_after(self.now())
+            await asyncio.sleep(max((self.next_run_at - self.now()).total_seconds(), 0))
+            try:
+                if await self._claim(db, self.next_run_at):
+                    await self.run_once(db)
+            except Exception as e:
+                # run_once ya lo registró; el scheduler sigue con la próxima ejecución
+                logger.error(f"Backup programado de {self.next_run_at.isoformat()} falló: {e}")
+
+    async def _claim(self, db, slot: datetime) -> bool:
+        """Solo un proceso escribe el backup de cada hora programada"""
+        try:
+            await db[BACKUP_STATE_COLLECTION].update_one(
+                {"id": SCHEDULE_STATE_ID, "slot": {"$ne": slot}},
+                {"$set": {"slot": slot, "claimed_at": self.now()}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        except PyMongoError as e:
+            logger.error(f"Backup programado: no se pudo reclamar la ejecución: {e}")
+            return False
+        return True
+
+    async def run_once(self, db) -> dict:
+        """Escribe un backup y aplica la retención; devuelve el manifiesto y los archivos borrados"""
+        if not self.enabled:
+            raise RuntimeError("BACKUP_DIR no está configurado")
+        if restore_progress.running:
+            raise RuntimeError("Hay una restauración en curso")
+        async with self._lock:
+            self.last_run_at = self.now()
+            try:
+                manifest = await write_backup(db, self.directory)
+                removed = await asyncio.to_thread(apply_retention, self.directory, self.schedule.zone)
+            except Exception as e:
+                self.failed += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                logger.error(f"Backup programado falló: {e}")
+                raise
+            self.runs += 1
+            self.last_file = manifest["file"]
+            self.last_error = None
+            logger.info(
+                f"Backup programado {manifest['file']}: {manifest['documents']} documentos, "
+                f"{manifest['size']} bytes; retención borró {len(removed)}"
+            )
+            return {"manifest": manifest, "removed": removed}
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None and not self._task.done(),
+            "directory": self.directory or None,
+            "schedule": self.schedule.expression,
+            "timezone": str(self.schedule.zone),
+            "retention": {"daily": BACKUP_KEEP_DAILY, "weekly": BACKUP_KEEP_WEEKLY, "monthly": BACKUP_KEEP_MONTHLY},
+            "runs": self.runs,
+            "failed": self.failed,
+            "next_run_at": self.next_run_at.isoformat() if self.next_run_at else None,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_file": self.last_file,
+            "last_error": self.last_error,
+        }
+
+
+backup_scheduler = BackupScheduler()
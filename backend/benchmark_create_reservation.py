@@ -0,0 +1,125 @@
+"""
+Benchmark de POST /api/reservations (create_reservation)
+Mide p50/p99 de la creación de reservaciones con 0, 5 y 20 servicios adicionales y cuenta
+los comandos que llegan a MongoDB por reservación (round trips). Con un replica set todo
+va en una transacción; con un mongod standalone se mide el mismo camino sin sesión.
+Los efectos (gastos, comisión, deuda) van al outbox: se miden aparte, al drenarlo
+"""
+import asyncio
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import benchmark_utils as bu
+from pymongo import monitoring
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Cuenta los comandos enviados (se registra antes de que server.py cree el cliente)"""
+
+    def __init__(self):
+        self.commands = Counter()
+
+    def started(self, event):
+        self.commands[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+command_counter = CommandCounter()
+monitoring.register(command_counter)
+
+import server
+from indexes import ensure_indexes
+from models import ReservationCreate, ReservationExtraService
+from transactions import transactions_supported
+
+SERVICE_COUNTS = [0, 5, 20]
+RUNS = 200
+
+
+def reservation_payload(villa: dict, customer: dict, services: int, i: int) -> ReservationCreate:
+    extra_services = [
+        ReservationExtraService(
+            service_id=f"svc-{n}",
+            service_name=f"Servicio {n}",
+            supplier_name=f"Suplidor {n % 4}",
+            supplier_cost=500,
+            quantity=2,
+            unit_price=800,
+            total=1600
+        )
+        for n in range(services)
+    ]
+    extras_total = sum(svc.total for svc in extra_services)
+    return ReservationCreate(
+        customer_id=customer["id"],
+        customer_name=customer["name"],
+        villa_id=villa["id"],
+        villa_code=villa["code"],
+        rental_type="pasadia",
+        reservation_date=datetime.now(timezone.utc) + timedelta(days=i % 90),
+        guests=10,
+        base_price=10000,
+        owner_price=7000,
+        extra_services=extra_services,
+        extra_services_total=extras_total,
+        subtotal=10000 + extras_total,
+        total_amount=10000 + extras_total,
+        amount_paid=5000,
+        currency="DOP"
+    )
+
+
+async def run_benchmark():
+    db = server.db
+    await db.client.drop_database(bu.BENCHMARK_DB_NAME)
+    await ensure_indexes(db)
+
+    transactional = await transactions_supported(db)
+    print(f"🔗 Base de datos de benchmark: {bu.BENCHMARK_DB_NAME}")
+    print(f"   {'replica set: con transacción' if transactional else 'standalone: sin transacción'}\n")
+    try:
+        villa = {"id": str(uuid.uuid4()), "code": "ECPV01", "name": "Villa Benchmark", "phone": "809-555-0000"}
+        await db.villas.insert_one(dict(villa))
+        customers = bu.fake_customers(100)
+        await bu.insert_in_batches(db.customers, customers)
+
+        created = 0
+        for services in SERVICE_COUNTS:
+            async def create_one():
+                nonlocal created
+                payload = reservation_payload(villa, customers[created % len(customers)], services, created)
+                created += 1
+                await server.create_reservation(payload, bu.BENCHMARK_USER)
+
+            await create_one()  # calentar la caché de la villa y el pool de conexiones
+            command_counter.commands.clear()
+            latencies = await bu.timed_runs(create_one, RUNS)
+            commands = sum(command_counter.commands.values()) / RUNS
+            breakdown = ", ".join(f"{name}={count / RUNS:g}" for name, count in command_counter.commands.most_common())
+
+            print(f"📊 {services:>2} servicios adicionales ({RUNS} reservaciones)")
+            print(f"   {bu.format_latencies(latencies)}")
+            print(f"   {commands:g} comandos por reservación ({breakdown})")
+
+            drained = await bu.timed_runs(lambda: server.outbox_worker.drain(db), 1)
+            print(f"   outbox: {RUNS + 1} eventos aplicados en {drained[0]:.1f} ms")
+
+        owner = await db.villa_owners.find_one({"name": f"Propietario {villa['code']}"}, {"_id": 0})
+        expected_debt = 7000 * created
+        if owner and abs(owner["total_owed"] - expected_debt) < 0.01 and abs(owner["balance_due"] - expected_debt) < 0.01:
+            print(f"\n✅ Deuda del propietario verificada: RD$ {expected_debt:,.2f}")
+        else:
+            print(f"\n❌ Deuda del propietario incorrecta: {owner}")
+    finally:
+        await db.client.drop_database(bu.BENCHMARK_DB_NAME)
+
+
+if __name__ == "__main__":
+    print("🚀 Benchmark de creación de reservaciones...\n")
+    asyncio.run(run_benchmark())
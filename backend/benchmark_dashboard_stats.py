@@ -0,0 +1,83 @@
+"""
+Benchmark de GET /api/dashboard/stats
+Compara la implementación anterior (cargar hasta 10k documentos y sumar en Python)
+con los pipelines $facet/$group a 10k, 100k y 200k reservaciones y gastos.
+También verifica que los totales de la agregación coinciden con una suma completa en Python
+"""
+import asyncio
+from datetime import datetime, timezone
+
+import benchmark_utils as bu
+
+import server
+from dashboard_stats import compute_dashboard_totals
+from indexes import ensure_indexes
+
+SIZES = [10_000, 100_000, 200_000]
+RUNS = 5
+
+
+async def dashboard_totals_in_python(limit: int = 10000):
+    """Implementación anterior: todo a memoria (con límite) y sumas en Python"""
+    all_reservations = await server.db.reservations.find({}, {"_id": 0}).to_list(limit)
+    all_expenses = await server.db.expenses.find({}, {"_id": 0}).to_list(limit)
+    all_owners = await server.db.villa_owners.find({}, {"_id": 0}).to_list(1000)
+
+    now = datetime.now(timezone.utc)
+    commitments = []
+    for expense in all_expenses:
+        if expense.get("category") == "compromiso":
+            expense_date = datetime.fromisoformat(expense["expense_date"].replace('Z', '+00:00'))
+            if expense_date.month == now.month and expense_date.year == now.year:
+                commitments.append(expense)
+
+    return {
+        "total_reservations": len(all_reservations),
+        "total_revenue_dop": sum(r.get("amount_paid", 0) for r in all_reservations if r.get("currency") == "DOP"),
+        "pending_payments_dop": sum(r.get("balance_due", 0) for r in all_reservations if r.get("currency") == "DOP"),
+        "total_expenses_dop": sum(e.get("amount", 0) for e in all_expenses if e.get("currency") == "DOP"),
+        "owners_balance_due_dop": sum(o.get("balance_due", 0) for o in all_owners),
+        "commitments_count": len(commitments),
+    }
+
+
+async def run_benchmark():
+    db = server.db
+    await db.client.drop_database(bu.BENCHMARK_DB_NAME)
+    await ensure_indexes(db)
+
+    print(f"🔗 Base de datos de benchmark: {bu.BENCHMARK_DB_NAME}\n")
+    try:
+        seeded = 0
+        customers = bu.fake_customers(1_000)
+        await bu.insert_in_batches(db.customers, customers)
+        await bu.insert_in_batches(db.villa_owners, bu.fake_owners(200))
+
+        for size in SIZES:
+            # Sembrar solo la diferencia respecto al tamaño anterior
+            await bu.insert_in_batches(db.reservations, bu.fake_reservations(size - seeded, customers, offset=seeded))
+            await bu.insert_in_batches(db.expenses, bu.fake_expenses(size - seeded, offset=seeded))
+            seeded = size
+
+            before = await bu.timed_runs(dashboard_totals_in_python, RUNS)
+            after = await bu.timed_runs(lambda: compute_dashboard_totals(db), RUNS)
+
+            print(f"📊 {size:>7,} reservaciones + {size:,} gastos")
+            print(f"   antes (Python, máx. 10k): {bu.format_latencies(before)}")
+            print(f"   ahora ($facet/$group):    {bu.format_latencies(after)}")
+
+            # La agregación debe coincidir con una suma en Python SIN límite
+            expected = await dashboard_totals_in_python(limit=None)
+            totals = await compute_dashboard_totals(db)
+            mismatches = [key for key, value in expected.items() if abs(totals[key] - value) > 0.01]
+            if mismatches:
+                print(f"   ❌ Totales distintos: {', '.join(mismatches)}")
+            else:
+                print("   ✅ Totales verificados contra la suma completa")
+    finally:
+        await db.client.drop_database(bu.BENCHMARK_DB_NAME)
+
+
+if __name__ == "__main__":
+    print("🚀 Benchmark de estadísticas del dashboard...\n")
+    asyncio.run(run_benchmark())
@@ -0,0 +1,96 @@
+"""
+Micro-benchmark de la conversión de documentos de MongoDB a la respuesta JSON
+Compara, sobre 10k reservaciones, el camino anterior (restore_datetimes con listas de campos
+escritas a mano y luego la respuesta de FastAPI: preparar la lista, validarla contra el
+response_model y codificarla con JSONResponse) con el codec precompilado del modelo
+(una pasada de fechas y JSON en pydantic-core sin revalidar, devuelto como Response). También
+mide el codec validando otra vez cada documento, para ver cuánto cuesta esa validación.
+Se mide con fechas como string ISO (antes de migrate_bson_dates.py) y como fechas nativas
+No necesita MongoDB: los documentos se generan en memoria
+"""
+import asyncio
+import copy
+import time
+from datetime import datetime
+from typing import List
+
+import benchmark_utils as bu
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import TypeAdapter
+
+from database import bson_dates
+from doc_codec import codec_for
+from models import Reservation
+
+SIZE = 10_000
+RUNS = 5
+DATETIME_FIELDS = ["reservation_date", "created_at", "updated_at"]
+
+
+def restore_datetimes(doc: dict, datetime_fields: List[str]) -> dict:
+    """Implementación anterior (database.restore_datetimes)"""
+    for field in datetime_fields:
+        if field in doc and isinstance(doc[field], str):
+            doc[field] = datetime.fromisoformat(doc[field])
+    return doc
+
+
+RESPONSE_FIELD = create_response_field(name="Response_get_reservations", type_=List[Reservation], mode="serialization")
+
+
+async def convert_before(docs: List[dict]) -> bytes:
+    restored = [restore_datetimes(doc, DATETIME_FIELDS) for doc in docs]
+    content = await serialize_response(field=RESPONSE_FIELD, response_content=restored, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def convert_after(docs: List[dict]) -> bytes:
+    return codec_for(Reservation).json_response(docs).body
+
+
+VALIDATING_ADAPTER = TypeAdapter(List[Reservation])
+
+
+async def convert_validated(docs: List[dict]) -> bytes:
+    """El codec anterior: validaba los documentos contra el modelo antes de serializar"""
+    decoded = codec_for(Reservation).decode_many(docs)
+    return VALIDATING_ADAPTER.dump_json(VALIDATING_ADAPTER.validate_python(decoded))
+
+
+async def timed(fn, batches: List[List[dict]]) -> List[float]:
+    """Una ejecución por lote (cada lote es una copia: la conversión modifica los documentos)"""
+    latencies = []
+    for batch in batches:
+        started = time.perf_counter()
+        await fn(batch)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+async def run_benchmark():
+    customers = bu.fake_customers(500)
+    string_docs = bu.fake_reservations(SIZE, customers)
+    # Como las devuelve pymongo después de la migración: datetimes sin zona horaria
+    native_docs = [bson_dates(copy.deepcopy(doc), "reservations") for doc in string_docs]
+    for doc in native_docs:
+        for field in DATETIME_FIELDS:
+            doc[field] = doc[field].replace(tzinfo=None)
+
+    codec_for(Reservation)  # compilar el codec fuera de la medición
+
+    for label, docs in (("strings ISO", string_docs), ("fechas BSON", native_docs)):
+        before = await timed(convert_before, [copy.deepcopy(docs) for _ in range(RUNS)])
+        validated = await timed(convert_validated, [copy.deepcopy(docs) for _ in range(RUNS)])
+        after = await timed(convert_after, [copy.deepcopy(docs) for _ in range(RUNS)])
+
+        print(f"📊 {SIZE:,} reservaciones ({label})")
+        print(f"   antes (restore + FastAPI): {bu.format_latencies(before)}")
+        print(f"   codec validando:           {bu.format_latencies(validated)}")
+        print(f"   ahora (codec):             {bu.format_latencies(after)}")
+
+
+if __name__ == "__main__":
+    print("🚀 Benchmark de conversión de documentos...\n")
+    asyncio.run(run_benchmark())
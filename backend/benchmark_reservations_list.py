@@ -0,0 +1,57 @@
+"""
+Benchmark de GET /api/reservations
+Compara el enriquecimiento anterior (un find_one de cliente por reservación, N+1)
+con la consulta agrupada ($in) a 1k, 10k y 100k reservaciones
+"""
+import asyncio
+
+import benchmark_utils as bu
+from fastapi import Response
+
+import server
+from indexes import ensure_indexes
+
+SIZES = [1_000, 10_000, 100_000]
+RUNS = 5
+
+
+async def get_reservations_n_plus_one():
+    """Implementación anterior: una consulta de cliente por cada reservación"""
+    reservations = await server.db.reservations.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    for r in reservations:
+        if r.get("customer_id"):
+            customer = await server.db.customers.find_one({"id": r["customer_id"]}, {"_id": 0})
+            if customer:
+                r["customer_identification_document"] = customer.get("identification_document") or customer.get("dni")
+    return reservations
+
+
+async def run_benchmark():
+    db = server.db
+    await db.client.drop_database(bu.BENCHMARK_DB_NAME)
+    await ensure_indexes(db)
+
+    print(f"🔗 Base de datos de benchmark: {bu.BENCHMARK_DB_NAME}\n")
+    try:
+        seeded = 0
+        customers = bu.fake_customers(5_000)
+        await bu.insert_in_batches(db.customers, customers)
+
+        for size in SIZES:
+            # Sembrar solo la diferencia respecto al tamaño anterior
+            await bu.insert_in_batches(db.reservations, bu.fake_reservations(size - seeded, customers, offset=seeded))
+            seeded = size
+
+            before = await bu.timed_runs(get_reservations_n_plus_one, RUNS)
+            after = await bu.timed_runs(lambda: server.get_reservations(Response(), limit=1000, current_user=bu.BENCHMARK_USER), RUNS)
+
+            print(f"📊 {size:>7,} reservaciones")
+            print(f"   antes (N+1):  {bu.format_latencies(before)}")
+            print(f"   ahora ($in):  {bu.format_latencies(after)}")
+    finally:
+        await db.client.drop_database(bu.BENCHMARK_DB_NAME)
+
+
+if __name__ == "__main__":
+    print("🚀 Benchmark de listado de reservaciones...\n")
+    asyncio.run(run_benchmark())
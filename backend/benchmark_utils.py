@@ -0,0 +1,144 @@
+"""
+Utilidades compartidas por los scripts de benchmark
+Cada benchmark usa una base de datos temporal ({DB_NAME}_benchmark) que se elimina al terminar
+"""
+import os
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List
+
+# La base de datos de benchmark se fija ANTES de importar server.py,
+# que se conecta al importarse (Database.get_db)
+BENCHMARK_DB_NAME = f"{os.environ.get('DB_NAME', 'villa_management')}_benchmark"
+os.environ["DB_NAME"] = BENCHMARK_DB_NAME
+
+BENCHMARK_USER = {
+    "id": "benchmark-user",
+    "username": "benchmark",
+    "role": "admin",
+    "email": "benchmark@example.com",
+    "full_name": "Benchmark"
+}
+
+INSERT_BATCH_SIZE = 5000
+
+
+async def timed_runs(fn: Callable[[], Awaitable], runs: int = 5) -> List[float]:
+    """Ejecuta fn varias veces y devuelve la latencia de cada ejecución en milisegundos"""
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def percentile(latencies: List[float], pct: float) -> float:
+    ordered = sorted(latencies)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def format_latencies(latencies: List[float]) -> str:
+    return (
+        f"p50={statistics.median(latencies):8.1f} ms  "
+        f"p99={percentile(latencies, 99):8.1f} ms  "
+        f"min={min(latencies):8.1f} ms"
+    )
+
+
+async def insert_in_batches(collection, docs: List[dict]) -> None:
+    for start in range(0, len(docs), INSERT_BATCH_SIZE):
+        await collection.insert_many(docs[start:start + INSERT_BATCH_SIZE])
+
+
+def fake_customers(count: int) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"Cliente {i:06d}",
+            "phone": f"809-555-{i % 10000:04d}",
+            "identification_document": f"001-{i:07d}-0",
+            "created_at": now.isoformat(),
+            "created_by": BENCHMARK_USER["id"]
+        }
+        for i in range(count)
+    ]
+
+
+def fake_reservations(count: int, customers: List[dict], offset: int = 0) -> List[dict]:
+    """offset permite sembrar por tandas sin repetir invoice_number (índice único)"""
+    start = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    reservations = []
+    for i in range(offset, offset + count):
+        customer = customers[i % len(customers)]
+        created = start + timedelta(minutes=i)
+        total = 10000 + (i % 50) * 500
+        paid = total if i % 3 else total / 2
+        reservations.append({
+            "id": str(uuid.uuid4()),
+            "invoice_number": str(100000 + i),
+            "customer_id": customer["id"],
+            "customer_name": customer["name"],
+            "villa_code": f"ECPV{i % 40:02d}",
+            "rental_type": "pasadia",
+            "reservation_date": (created + timedelta(days=7)).isoformat(),
+            "check_in_time": "9:00 AM",
+            "check_out_time": "8:00 PM",
+            "guests": 10,
+            "base_price": total,
+            "owner_price": total * 0.7,
+            "subtotal": total,
+            "total_amount": total,
+            "deposit": 0,
+            "amount_paid": paid,
+            "balance_due": total - paid,
+            "currency": "USD" if i % 10 == 0 else "DOP",
+            "status": "confirmed",
+            "created_at": created.isoformat(),
+            "updated_at": created.isoformat(),
+            "created_by": BENCHMARK_USER["id"]
+        })
+    return reservations
+
+
+EXPENSE_CATEGORIES = ["pago_propietario", "pago_suplidor", "compromiso", "local", "nomina", "otro"]
+
+
+def fake_expenses(count: int, offset: int = 0) -> List[dict]:
+    """Gastos repartidos en los últimos ~2 años; uno de cada seis es un compromiso"""
+    now = datetime.now(timezone.utc)
+    expenses = []
+    for i in range(offset, offset + count):
+        expense_date = now - timedelta(hours=i % 17520)
+        expenses.append({
+            "id": str(uuid.uuid4()),
+            "description": f"Gasto {i:07d}",
+            "amount": 1000 + (i % 40) * 250,
+            "currency": "USD" if i % 10 == 0 else "DOP",
+            "category": EXPENSE_CATEGORIES[i % len(EXPENSE_CATEGORIES)],
+            "expense_type": "variable",
+            "expense_date": expense_date.isoformat(),
+            "payment_status": "paid" if i % 4 else "pending",
+            "created_at": expense_date.isoformat(),
+            "created_by": BENCHMARK_USER["id"]
+        })
+    return expenses
+
+
+def fake_owners(count: int) -> List[dict]:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"Propietario {i:05d}",
+            "total_owed": 50000,
+            "amount_paid": 20000,
+            "balance_due": 30000,
+            "created_at": now.isoformat()
+        }
+        for i in range(count)
+    ]
@@ -0,0 +1,171 @@
+"""
+Invalidación de la caché de referencia entre workers
+Cada worker de uvicorn tiene su propia reference_cache. Un listener por worker sigue un change stream
+de MongoDB sobre las colecciones de referencia e invalida el namespace afectado en ese worker,
+así una escritura atendida por otro worker (o por un script de importación) no deja datos viejos.
+Si el servidor no admite change streams (mongod standalone) se usa polling sobre cache_versions:
+un contador por namespace que incrementa invalidate_reference_data en cada escritura.
+El lag (escritura -> invalidación en este worker) se reporta en GET /api/admin/cache/stats
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
+
+from reference_cache import reference_cache, ReferenceCache, REFERENCE_NAMESPACES
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSIONS_COLLECTION = "cache_versions"
+CACHE_POLL_INTERVAL = float(os.environ.get("CACHE_POLL_INTERVAL", "2"))
+CHANGE_STREAM_RETRY_DELAY = 5
+
+# $changeStream solo existe en replica sets / clusters
+CHANGE_STREAMS_NOT_SUPPORTED = {40573}
+
+
+async def invalidate_reference_data(db, *namespaces: str) -> None:
+    """
+    Invalida los namespaces en este worker y publica la invalidación para los demás
+    (el change stream ya ve la escritura; el contador de cache_versions es para el polling)
+    """
+    reference_cache.invalidate(*namespaces)
+    now = datetime.now(timezone.utc)
+    try:
+        await db[CACHE_VERSIONS_COLLECTION].bulk_write([
+            UpdateOne({"namespace": namespace}, {"$inc": {"version": 1}, "$set": {"updated_at": now}}, upsert=True)
+            for namespace in namespaces
+        ], ordered=False)
+    except PyMongoError as e:
+        # La escritura ya se hizo: en el peor caso los otros workers esperan al TTL
+        logger.warning(f"No se pudo publicar la invalidación de {namespaces}: {e}")
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def _event_time(change: dict) -> Optional[datetime]:
+    """wallTime (MongoDB 6+, con milisegundos) o clusterTime (segundos)"""
+    if change.get("wallTime"):
+        return _as_utc(change["wallTime"])
+    cluster_time = change.get("clusterTime")
+    return cluster_time.as_datetime() if cluster_time else None
+
+
+class InvalidationListener:
+    """Tarea de fondo (una por worker) que aplica a la caché local las escrituras de los demás"""
+
+    def __init__(self, cache: ReferenceCache = reference_cache, poll_interval: float = CACHE_POLL_INTERVAL):
+        self.cache = cache
+        self.poll_interval = poll_interval
+        self.mode: Optional[str] = None  # "change_stream" | "polling"
+        self.events = 0
+        self.errors = 0
+        self.last_lag_ms: Optional[float] = None
+        self.max_lag_ms = 0.0
+        self._total_lag_ms = 0.0
+        self._lag_samples = 0
+        self.last_event_at: Optional[datetime] = None
+        self._versions: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, db, force_polling: bool = False) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(db, force_polling))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _record(self, namespace: str, written_at: Optional[datetime]) -> None:
+        self.cache.invalidate(namespace)
+        now = datetime.now(timezone.utc)
+        self.events += 1
+        self.last_event_at = now
+        if written_at:
+            lag_ms = max(0.0, (now - _as_utc(written_at)).total_seconds() * 1000)
+            self.last_lag_ms = round(lag_ms, 1)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            self._total_lag_ms += lag_ms
+            self._lag_samples += 1
+
+    async def _run(self, db, force_polling: bool) -> None:
+        if not force_polling:
+            resume_token = None
+            while True:
+                try:
+                    resume_token = await self._watch(db, resume_token)
+                except OperationFailure as e:
+                    if e.code in CHANGE_STREAMS_NOT_SUPPORTED:
+                        logger.warning("Change streams no disponibles (¿mongod sin replica set?): usando polling")
+                        break
+                    self.errors += 1
+                    logger.error(f"Change stream de la caché interrumpido: {e}")
+                    resume_token = None
+                except PyMongoError as e:
+                    self.errors += 1
+                    logger.error(f"Change stream de la caché interrumpido: {e}")
+                # Eventos perdidos mientras el stream estuvo caído: descartar todo
+                self.cache.clear()
+                await asyncio.sleep(CHANGE_STREAM_RETRY_DELAY)
+        await self._poll(db)
+
+    async def _watch(self, db, resume_token=None):
+        pipeline = [{"$match": {"ns.coll": {"$in": REFERENCE_NAMESPACES}}}]
+        async with db.watch(pipeline, resume_after=resume_token) as stream:
+            self.mode = "change_stream"
+            logger.info("Invalidación de caché por change stream activa")
+            async for change in stream:
+                self._record(change["ns"]["coll"], _event_time(change))
+            return stream.resume_token
+
+    async def _poll(self, db) -> None:
+        self.mode = "polling"
+        logger.info(f"Invalidación de caché por polling cada {self.poll_interval}s")
+        baseline = True
+        while True:
+            try:
+                await self._check_versions(db, baseline)
+                baseline = False
+            except PyMongoError as e:
+                self.errors += 1
+                logger.error(f"Polling de cache_versions falló: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _check_versions(self, db, baseline: bool) -> None:
+        async for doc in db[CACHE_VERSIONS_COLLECTION].find({}, {"_id": 0}):
+            namespace, version = doc["namespace"], doc.get("version", 0)
+            if self._versions.get(namespace) == version:
+                continue
+            self._versions[namespace] = version
+            if not baseline:
+                self._record(namespace, doc.get("updated_at"))
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "events": self.events,
+            "errors": self.errors,
+            "poll_interval_seconds": self.poll_interval if self.mode == "polling" else None,
+            "lag_ms": {
+                "last": self.last_lag_ms,
+                "avg": round(self._total_lag_ms / self._lag_samples, 1) if self._lag_samples else None,
+                "max": round(self.max_lag_ms, 1) if self._lag_samples else None,
+            },
+            "last_event_at": self.last_event_at.isoformat() if self.last_event_at else None,
+        }
+
+
+invalidation_listener = InvalidationListener()
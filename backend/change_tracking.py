@@ -0,0 +1,71 @@
+"""
+Marcas de cambio para los backups incrementales
+Toda escritura en una colección respaldada deja updated_at (fecha nativa de BSON) en el
+documento y todo borrado deja una lápida (tombstone) con la colección y el id del documento.
+Así un backup incremental exporta solo lo creado, modificado o eliminado desde la marca de
+agua del backup anterior (ver backup.py). Las lápidas se borran solas al vencer
+TOMBSTONE_RETENTION_SECONDS (índice TTL): un incremental más viejo que eso exige un backup completo
+"""
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Iterable, List, Union
+
+logger = logging.getLogger(__name__)
+
+# Colecciones respaldadas con marca de cambio (las de configuración se exportan completas)
+CHANGE_TRACKED_COLLECTIONS = [
+    "users", "customers", "categories", "expense_categories",
+    "villas", "extra_services", "reservations", "villa_owners",
+    "expenses", "reservation_abonos", "expense_abonos"
+]
+
+TOMBSTONES_COLLECTION = "tombstones"
+TOMBSTONE_RETENTION_SECONDS = int(os.environ.get("TOMBSTONE_RETENTION_DAYS", "120")) * 24 * 3600
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def stamped(doc: dict) -> dict:
+    """Documento a insertar con updated_at (se aplica después de prepare_doc_for_insert)"""
+    doc["updated_at"] = _now()
+    return doc
+
+
+def touch(update: Union[dict, list]) -> Union[dict, list]:
+    """El mismo update ($set/$inc/... o pipeline) que además fija updated_at"""
+    now = _now()
+    if isinstance(update, list):
+        return [*update, {"$set": {"updated_at": now}}]
+    return {**update, "$set": {**update.get("$set", {}), "updated_at": now}}
+
+
+async def record_deletions(db, collection: str, ids: Iterable[str], session=None) -> None:
+    """Deja una lápida por documento eliminado"""
+    now = _now()
+    tombstones = [{"collection": collection, "doc_id": doc_id, "deleted_at": now} for doc_id in ids if doc_id]
+    if tombstones:
+        await db[TOMBSTONES_COLLECTION].insert_many(tombstones, ordered=False, session=session)
+
+
+async def delete_one_tracked(db, collection: str, query: dict, session=None) -> bool:
+    """delete_one que deja lápida; devuelve si eliminó algo"""
+    deleted = await db[collection].find_one_and_delete(query, projection={"_id": 0, "id": 1}, session=session)
+    if deleted is None:
+        return False
+    await record_deletions(db, collection, [deleted.get("id")], session=session)
+    return True
+
+
+async def delete_many_tracked(db, collection: str, query: dict, session=None) -> int:
+    """delete_many que deja una lápida por documento; devuelve cuántos eliminó"""
+    ids: List[str] = [
+        doc.get("id") async for doc in db[collection].find(query, {"_id": 0, "id": 1}, session=session)
+    ]
+    if not ids:
+        return 0
+    result = await db[collection].delete_many(query, session=session)
+    await record_deletions(db, collection, ids, session=session)
+    return result.deleted_count
@@ -0,0 +1,257 @@
+"""
+Estadísticas del dashboard calculadas en MongoDB
+Los totales (ingresos, saldos pendientes, gastos por moneda, compromisos del mes y
+propietarios) se calculan con pipelines $facet/$group, sin cargar los documentos en Python
+También los totales de las vistas de reservaciones y gastos, que paginan sus filas
+"""
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from database import date_range_query
+
+# Campos que debe tener una reservación para contarse en el dashboard
+REQUIRED_RESERVATION_FIELDS = ["check_in_time", "check_out_time", "base_price", "subtotal"]
+
+CURRENCIES = ["DOP", "USD"]
+
+
+def _currency_sum(field: str, currency: str) -> dict:
+    """$sum de un campo solo para los documentos de una moneda"""
+    return {"$sum": {"$cond": [{"$eq": ["$currency", currency]}, {"$ifNull": [field, 0]}, 0]}}
+
+
+def _date_prefix(field: str, length: int) -> dict:
+    """
+    Primeros caracteres de una fecha ('YYYY-MM' o 'YYYY-MM-DD') tanto si está guardada
+    como string ISO como si es un datetime de BSON
+    """
+    date_format = "%Y-%m" if length == 7 else "%Y-%m-%d"
+    return {"$cond": [
+        {"$eq": [{"$type": field}, "date"]},
+        {"$dateToString": {"format": date_format, "date": field}},
+        {"$substrCP": [{"$ifNull": [field, ""]}, 0, length]}
+    ]}
+
+
+def reservation_stats_pipeline() -> list:
+    return [
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "total_reservations": {"$sum": 1},
+                    "total_revenue_dop": _currency_sum("$amount_paid", "DOP"),
+                    "total_revenue_usd": _currency_sum("$amount_paid", "USD"),
+                    "pending_payments_dop": _currency_sum("$balance_due", "DOP"),
+                    "pending_payments_usd": _currency_sum("$balance_due", "USD"),
+                }}
+            ],
+            # Solo contar como pendiente si balance_due > 0 Y tiene campos requeridos
+            "pending": [
+                {"$match": {
+                    "balance_due": {"$gt": 0},
+                    **{field: {"$exists": True} for field in REQUIRED_RESERVATION_FIELDS}
+                }},
+                {"$count": "pending_reservations"}
+            ]
+        }}
+    ]
+
+
+def expense_stats_pipeline() -> list:
+    return [
+        {"$group": {
+            "_id": None,
+            "total_expenses_dop": _currency_sum("$amount", "DOP"),
+            "total_expenses_usd": _currency_sum("$amount", "USD"),
+        }}
+    ]
+
+
+def commitment_stats_pipeline(now: datetime) -> list:
+    """Compromisos del mes actual"""
+    current_month = now.strftime("%Y-%m")
+    today = now.strftime("%Y-%m-%d")
+    month_start = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
+    next_month = datetime(now.year + now.month // 12, now.month % 12 + 1, 1, tzinfo=timezone.utc)
+    return [
+        # Rango del mes sobre el índice (category, expense_date): strings ISO o datetimes
+        {"$match": {"category": "compromiso", "$or": [
+            {"expense_date": {"$gte": current_month, "$lt": next_month.strftime("%Y-%m")}},
+            {"expense_date": {"$gte": month_start, "$lt": next_month}}
+        ]}},
+        {"$addFields": {
+            "_month": _date_prefix("$expense_date", 7),
+            "_day": _date_prefix("$expense_date", 10)
+        }},
+        {"$match": {"_month": current_month}},
+        {"$group": {
+            "_id": None,
+            "commitments_count": {"$sum": 1},
+            "commitments_total_dop": _currency_sum("$amount", "DOP"),
+            "commitments_total_usd": _currency_sum("$amount", "USD"),
+            "commitments_paid_count": {"$sum": {"$cond": [{"$eq": ["$payment_status", "paid"]}, 1, 0]}},
+            "commitments_pending_count": {"$sum": {"$cond": [{"$eq": ["$payment_status", "pending"]}, 1, 0]}},
+            # Vencidos: pendientes con fecha anterior a hoy
+            "commitments_overdue_count": {"$sum": {"$cond": [
+                {"$and": [{"$eq": ["$payment_status", "pending"]}, {"$lt": ["$_day", today]}]}, 1, 0
+            ]}},
+        }}
+    ]
+
+
+def owner_stats_pipeline() -> list:
+    return [
+        {"$group": {
+            "_id": None,
+            "total_owners": {"$sum": 1},
+            "owners_balance_due_dop": {"$sum": {"$ifNull": ["$balance_due", 0]}},
+        }}
+    ]
+
+
+def reservation_list_pipeline(query: dict, today: str) -> list:
+    """Totales del listado de reservaciones con los filtros de la vista"""
+    return [
+        {"$match": query},
+        {"$group": {
+            "_id": None,
+            "total_reservations": {"$sum": 1},
+            # Próximas: las que aún no han pasado su fecha
+            "upcoming_reservations": {"$sum": {"$cond": [
+                {"$gte": [_date_prefix("$reservation_date", 10), today]}, 1, 0
+            ]}},
+            "total_paid_dop": _currency_sum("$amount_paid", "DOP"),
+            "total_paid_usd": _currency_sum("$amount_paid", "USD"),
+            "total_remaining_dop": _currency_sum("$balance_due", "DOP"),
+            "total_remaining_usd": _currency_sum("$balance_due", "USD"),
+        }}
+    ]
+
+
+def expense_month_pipeline(start: str, end: str, today: str, category: Optional[str] = None) -> list:
+    """
+    Gastos del mes [start, end) más los pendientes de meses anteriores (los que la vista de
+    gastos arrastra al mes), agrupados por categoría, tipo, estado, moneda, periodo
+    ('month' o 'previous') y vencimiento, con la suma de sus montos y su cantidad
+    """
+    day = _date_prefix("$expense_date", 10)
+    match = {"$or": [
+        date_range_query("expense_date", start, end),
+        {"$and": [date_range_query("expense_date", None, start), {"payment_status": "pending"}]}
+    ]}
+    if category:
+        match["category"] = category
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "category": "$category",
+                "expense_type": "$expense_type",
+                "show_in_variables": "$show_in_variables",
+                "payment_status": "$payment_status",
+                "currency": "$currency",
+                "has_reservation": {"$not": [
+                    {"$in": [{"$ifNull": ["$related_reservation_id", None]}, [None, ""]]}
+                ]},
+                "period": {"$cond": [{"$lt": [day, start]}, "previous", "month"]},
+                "overdue": {"$lt": [day, today]},
+            },
+            "amount": {"$sum": {"$ifNull": ["$amount", 0]}},
+            "count": {"$sum": 1},
+        }},
+        {"$replaceWith": {"$mergeObjects": ["$_id", {"amount": "$amount", "count": "$count"}]}}
+    ]
+
+
+def _first(results: list, key: Optional[str] = None) -> dict:
+    """Primer (único) documento de una agregación o de una rama del $facet, sin el _id del $group"""
+    rows = (results[0].get(key, []) if results else []) if key else results
+    if not rows:
+        return {}
+    row = dict(rows[0])
+    row.pop("_id", None)
+    return row
+
+
+async def compute_history_totals(db) -> dict:
+    """
+    Totales sobre todo el historial de reservaciones y gastos
+    (son los que mantiene de forma incremental el documento stats)
+    """
+    reservation_results = await db.reservations.aggregate(reservation_stats_pipeline()).to_list(1)
+    expense_results = await db.expenses.aggregate(expense_stats_pipeline()).to_list(1)
+
+    totals = {
+        "total_reservations": 0,
+        "pending_reservations": 0,
+        "total_revenue_dop": 0,
+        "total_revenue_usd": 0,
+        "pending_payments_dop": 0,
+        "pending_payments_usd": 0,
+        "total_expenses_dop": 0,
+        "total_expenses_usd": 0,
+    }
+    totals.update(_first(reservation_results, "totals"))
+    totals.update(_first(reservation_results, "pending"))
+    totals.update(_first(expense_results))
+    return totals
+
+
+async def compute_live_totals(db, now: Optional[datetime] = None) -> dict:
+    """
+    Contadores que dependen de la fecha actual (compromisos del mes) y de los propietarios.
+    Recorren pocos documentos: los compromisos de un mes y la colección de propietarios
+    """
+    now = now or datetime.now(timezone.utc)
+
+    commitment_results = await db.expenses.aggregate(commitment_stats_pipeline(now)).to_list(1)
+    owner_results = await db.villa_owners.aggregate(owner_stats_pipeline()).to_list(1)
+
+    totals = {
+        "total_owners": 0,
+        "owners_balance_due_dop": 0,
+        "owners_balance_due_usd": 0,
+        "commitments_count": 0,
+        "commitments_total_dop": 0,
+        "commitments_total_usd": 0,
+        "commitments_paid_count": 0,
+        "commitments_pending_count": 0,
+        "commitments_overdue_count": 0,
+    }
+    totals.update(_first(commitment_results))
+    totals.update(_first(owner_results))
+    return totals
+
+
+async def compute_dashboard_totals(db, now: Optional[datetime] = None) -> dict:
+    """Todos los contadores numéricos del dashboard, recalculados con agregaciones"""
+    totals = await compute_history_totals(db)
+    totals.update(await compute_live_totals(db, now))
+    return totals
+
+
+async def compute_reservation_list_totals(db, query: dict, now: Optional[datetime] = None) -> dict:
+    """Tarjetas de resumen de la vista de reservaciones (filtro de GET /reservations)"""
+    now = now or datetime.now(timezone.utc)
+    results = await db.reservations.aggregate(reservation_list_pipeline(query, now.strftime("%Y-%m-%d"))).to_list(1)
+
+    totals = {
+        "total_reservations": 0,
+        "upcoming_reservations": 0,
+        "total_paid_dop": 0,
+        "total_paid_usd": 0,
+        "total_remaining_dop": 0,
+        "total_remaining_usd": 0,
+    }
+    totals.update(_first(results))
+    return totals
+
+
+async def compute_expense_month_groups(
+    db, start: str, end: str, category: Optional[str] = None, now: Optional[datetime] = None
+) -> List[dict]:
+    """Grupos con los que la vista de gastos arma sus tarjetas de totales del mes"""
+    now = now or datetime.now(timezone.utc)
+    pipeline = expense_month_pipeline(start, end, now.strftime("%Y-%m-%d"), category)
+    return await db.expenses.aggregate(pipeline).to_list(None)
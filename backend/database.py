@@ -1,8 +1,20 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Any
 from datetime import datetime
 
+# Campos de fecha guardados como datetime nativo de BSON (por colección).
+# Los documentos anteriores a la migración (migrate_bson_dates.py) los tienen como string ISO,
+# por eso todas las lecturas y filtros de estos campos aceptan ambos formatos
+BSON_DATE_FIELDS: Dict[str, List[str]] = {
+    "reservations": ["reservation_date", "created_at", "updated_at"],
+    "expenses": ["expense_date", "payment_date", "created_at", "updated_at"],
+    "reservation_abonos": ["payment_date", "created_at"],
+    "expense_abonos": ["payment_date", "created_at"],
+    "commissions": ["created_at"],
+    "quotations": ["quotation_date", "created_at", "updated_at"],
+}
+
 class Database:
     client: Optional[AsyncIOMotorClient] = None
     db = None
@@ -20,40 +32,49 @@ class Database:
         if cls.client:
             cls.client.close()
 
-def serialize_doc(doc: dict) -> dict:
-    """Convert MongoDB document to JSON-serializable dict"""
-    if doc is None:
-        return None
-    
-    # Remove MongoDB _id
-    if '_id' in doc:
-        del doc['_id']
-    
-    # Convert datetime objects to ISO strings
-    for key, value in doc.items():
-        if isinstance(value, datetime):
-            doc[key] = value.isoformat()
-    
-    return doc
+def to_bson_date(value: Any) -> Any:
+    """String ISO (o datetime) -> datetime para guardarlo como fecha nativa de BSON"""
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value
+    return value
 
-def serialize_docs(docs: List[dict]) -> List[dict]:
-    """Convert list of MongoDB documents to JSON-serializable list"""
-    return [serialize_doc(doc) for doc in docs]
+def bson_dates(doc: dict, collection: str) -> dict:
+    """Convierte (in place) los campos de fecha de la colección a datetime nativo"""
+    for field in BSON_DATE_FIELDS.get(collection, []):
+        if field in doc:
+            doc[field] = to_bson_date(doc[field])
+    return doc
 
-def prepare_doc_for_insert(doc: dict) -> dict:
-    """Prepare a document for MongoDB insertion"""
+def prepare_doc_for_insert(doc: dict, collection: Optional[str] = None) -> dict:
+    """
+    Prepare a document for MongoDB insertion
+    Los campos de BSON_DATE_FIELDS de la colección se guardan como fechas nativas;
+    el resto de los datetime se siguen guardando como strings ISO
+    """
     prepared = doc.copy()
+    native_fields = BSON_DATE_FIELDS.get(collection, [])
     
-    # Convert datetime objects to ISO strings for MongoDB
     for key, value in prepared.items():
-        if isinstance(value, datetime):
+        if key in native_fields:
+            prepared[key] = to_bson_date(value)
+        elif isinstance(value, datetime):
             prepared[key] = value.isoformat()
     
     return prepared
 
-def restore_datetimes(doc: dict, datetime_fields: List[str]) -> dict:
-    """Restore datetime fields from ISO strings"""
-    for field in datetime_fields:
-        if field in doc and isinstance(doc[field], str):
-            doc[field] = datetime.fromisoformat(doc[field])
-    return doc
+def date_range_query(field: str, start: Optional[str] = None, end: Optional[str] = None) -> dict:
+    """
+    Rango [start, end) sobre un campo de fecha ('YYYY-MM-DD') que puede estar guardado
+    como string ISO o como fecha nativa (los operadores de MongoDB no comparan entre tipos)
+    """
+    string_range, date_range = {}, {}
+    if start:
+        string_range["$gte"] = start
+        date_range["$gte"] = datetime.fromisoformat(start)
+    if end:
+        string_range["$lt"] = end
+        date_range["$lt"] = datetime.fromisoformat(end)
+    return {"$or": [{field: string_range}, {field: date_range}]}
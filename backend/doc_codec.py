@@ -0,0 +1,139 @@
+"""
+Codecs de documentos precompilados por modelo
+Cada modelo de respuesta (Reservation, Expense, Abono, Commission, Villa, ...) tiene un codec que
+se arma una sola vez: sabe cuáles de sus campos son datetime (ya no hace falta pasar listas de
+campos a mano) y convierte un lote de documentos de MongoDB en una pasada.
+Los listados se serializan a JSON directamente en pydantic-core y se devuelven como Response, así
+FastAPI no vuelve a preparar, validar y codificar la lista en Python. Los documentos vienen de
+nuestra propia base de datos (escritos por los mismos modelos): no se validan otra vez, solo se
+serializan con un TypedDict equivalente al modelo (mismos campos y tipos, sin validación), que
+descarta los campos extra igual que el response_model; los campos con default que falten en
+documentos viejos se completan antes de serializar
+"""
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Type, Union, get_args, get_origin
+
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+from typing_extensions import TypedDict
+
+# Marcas de tiempo (siempre en UTC): las fechas nativas de BSON llegan sin zona horaria
+TIMESTAMP_FIELDS = {"created_at", "updated_at"}
+
+
+def _unwrap_optional(annotation: Any) -> Any:
+    """Optional[X] -> X"""
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def _serialization_type(annotation: Any) -> Any:
+    """La misma anotación con cada modelo anidado reemplazado por su TypedDict de serialización"""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return _typed_dict_for(annotation)
+    origin = get_origin(annotation)
+    args = get_args(annotation)
+    if origin is Union:
+        return Union[tuple(_serialization_type(arg) for arg in args)]
+    if origin is list:
+        return List[_serialization_type(args[0])]
+    if origin is dict:
+        return Dict[args[0], _serialization_type(args[1])]
+    return annotation
+
+
+def _nested_model(annotation: Any) -> Optional[Type[BaseModel]]:
+    """Modelo anidado de un campo (X, Optional[X] o List[X]), si lo hay"""
+    annotation = _unwrap_optional(annotation)
+    if get_origin(annotation) is list:
+        annotation = _unwrap_optional(get_args(annotation)[0])
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    return None
+
+
+@lru_cache(maxsize=None)
+def _typed_dict_for(model: Type[BaseModel]) -> type:
+    return TypedDict(
+        f"{model.__name__}Json",
+        {name: _serialization_type(field.annotation) for name, field in model.model_fields.items()},
+        total=False
+    )
+
+
+class ModelCodec:
+    """Conversión documento de MongoDB -> respuesta de un modelo, compilada una vez por modelo"""
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self.datetime_fields = [
+            name for name, field in model.model_fields.items()
+            if _unwrap_optional(field.annotation) is datetime
+        ]
+        self.timestamp_fields = [name for name in self.datetime_fields if name in TIMESTAMP_FIELDS]
+        self.calendar_fields = [name for name in self.datetime_fields if name not in TIMESTAMP_FIELDS]
+        self._defaults = {name: field for name, field in model.model_fields.items() if not field.is_required()}
+        self._default_names = set(self._defaults)
+        self._nested = [
+            (name, _nested_model(field.annotation)) for name, field in model.model_fields.items()
+            if _nested_model(field.annotation)
+        ]
+        self._list_serializer = TypeAdapter(List[_typed_dict_for(model)])
+
+    def decode(self, doc: Optional[dict]) -> Optional[dict]:
+        """
+        Convierte (in place) los datetime del documento, guardados como string ISO o como
+        fecha nativa de BSON; a las marcas de tiempo sin zona horaria se les asigna UTC
+        """
+        if doc is None:
+            return None
+        for name in self.calendar_fields:
+            value = doc.get(name)
+            if isinstance(value, str):
+                doc[name] = datetime.fromisoformat(value)
+        for name in self.timestamp_fields:
+            value = doc.get(name)
+            if isinstance(value, str):
+                doc[name] = datetime.fromisoformat(value)
+            elif isinstance(value, datetime) and value.tzinfo is None:
+                doc[name] = value.replace(tzinfo=timezone.utc)
+        return doc
+
+    def decode_many(self, docs: List[dict]) -> List[dict]:
+        for doc in docs:
+            self.decode(doc)
+        return docs
+
+    def fill_defaults(self, doc: dict) -> dict:
+        """Completa (in place) los campos con default que el documento (y sus modelos anidados) no traen"""
+        for name in self._default_names - doc.keys():
+            doc[name] = self._defaults[name].get_default(call_default_factory=True)
+        for name, nested in self._nested:
+            value = doc.get(name)
+            if isinstance(value, dict):
+                codec_for(nested).fill_defaults(value)
+            elif isinstance(value, list):
+                nested_codec = codec_for(nested)
+                for item in value:
+                    if isinstance(item, dict):
+                        nested_codec.fill_defaults(item)
+        return doc
+
+    def dump_json(self, docs: List[dict]) -> bytes:
+        """Lista de documentos -> JSON del response_model (campos del modelo, sin extras ni revalidación)"""
+        for doc in self.decode_many(docs):
+            self.fill_defaults(doc)
+        return self._list_serializer.dump_json(docs, warnings=False)
+
+    def json_response(self, docs: List[dict], headers: Optional[Dict[str, str]] = None) -> Response:
+        return Response(content=self.dump_json(docs), media_type="application/json", headers=headers)
+
+
+@lru_cache(maxsize=None)
+def codec_for(model: Type[BaseModel]) -> ModelCodec:
+    """Codec del modelo (se compila la primera vez que se pide)"""
+    return ModelCodec(model)
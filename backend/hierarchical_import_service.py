@@ -8,6 +8,9 @@ from typing import Dict, List, Tuple
 import uuid
 from datetime import datetime, timezone
 
+from invoice_registry import register_invoice_number
+from change_tracking import stamped, touch
+
 def parse_prices_from_excel(price_string: str) -> List[Dict]:
     """
     Parsea string de precios del Excel al formato del modelo
@@ -99,12 +102,12 @@ async def import_customers(file_content: bytes, db) -> Dict:
                     # Actualizar
                     await db.customers.update_one(
                         {'name': customer_data['name']},
-                        {'$set': customer_data}
+                        touch({'$set': customer_data})
                     )
                     updated += 1
                 else:
                     # Crear nuevo
-                    await db.customers.insert_one(customer_data)
+                    await db.customers.insert_one(stamped(customer_data))
                     created += 1
                     
             except Exception as e:
@@ -158,11 +161,11 @@ async def import_villa_categories(file_content: bytes, db) -> Dict:
                 if existing:
                     await db.categories.update_one(
                         {'name': category_data['name']},
-                        {'$set': category_data}
+                        touch({'$set': category_data})
                     )
                     updated += 1
                 else:
-                    await db.categories.insert_one(category_data)
+                    await db.categories.insert_one(stamped(category_data))
                     created += 1
                     
             except Exception as e:
@@ -288,11 +291,11 @@ async def import_villas(file_content: bytes, db) -> Dict:
                 if existing:
                     await db.villas.update_one(
                         {'code': villa_data['code']},
-                        {'$set': villa_data}
+                        touch({'$set': villa_data})
                     )
                     updated += 1
                 else:
-                    await db.villas.insert_one(villa_data)
+                    await db.villas.insert_one(stamped(villa_data))
                     created += 1
                     
             except Exception as e:
@@ -370,16 +373,16 @@ async def import_services(file_content: bytes, db) -> Dict:
                     # SIEMPRE actualizar el precio del Excel (no comparar)
                     await db.extra_services.update_one(
                         {'id': existing['id']},
-                        {'$set': {
+                        touch({'$set': {
                             'default_price': price_float, 
                             'description': service_data['description'], 
                             'is_active': True
-                        }}
+                        }})
                     )
                     updated += 1
                     print(f"  → ACTUALIZADO: {name} de {existing_price} a {price_float}")
                 else:
-                    await db.extra_services.insert_one(service_data)
+                    await db.extra_services.insert_one(stamped(service_data))
                     created += 1
                     print(f"  → CREADO: {name} con precio {price_float}")
                     
@@ -435,11 +438,11 @@ async def import_expense_categories(file_content: bytes, db) -> Dict:
                 if existing:
                     await db.expense_categories.update_one(
                         {'name': category_data['name']},
-                        {'$set': category_data}
+                        touch({'$set': category_data})
                     )
                     updated += 1
                 else:
-                    await db.expense_categories.insert_one(category_data)
+                    await db.expense_categories.insert_one(stamped(category_data))
                     created += 1
                     
             except Exception as e:
@@ -539,11 +542,12 @@ async def import_reservations(file_content: bytes, db) -> Dict:
                 if existing:
                     await db.reservations.update_one(
                         {'invoice_number': invoice_number},
-                        {'$set': reservation_data}
+                        touch({'$set': reservation_data})
                     )
                     updated += 1
                 else:
-                    await db.reservations.insert_one(reservation_data)
+                    await db.reservations.insert_one(stamped(reservation_data))
+                    await register_invoice_number(db, invoice_number, 'reservation', reservation_data['id'])
                     created += 1
                     
             except Exception as e:
@@ -8,6 +8,9 @@ import pandas as pd
 from motor.motor_asyncio import AsyncIOMotorDatabase
 import uuid
 
+from invoice_registry import register_invoice_number
+from change_tracking import stamped, touch
+
 async def import_customers(df: pd.DataFrame, db: AsyncIOMotorDatabase) -> Tuple[int, int, List[str]]:
     """
     Importa clientes desde DataFrame
@@ -40,12 +43,12 @@ async def import_customers(df: pd.DataFrame, db: AsyncIOMotorDatabase) -> Tuple[
                 # Actualizar existente
                 await db.customers.update_one(
                     {'id': existing['id']},
-                    {'$set': customer_data}
+                    touch({'$set': customer_data})
                 )
                 updated += 1
             else:
                 # Crear nuevo
-                await db.customers.insert_one(customer_data)
+                await db.customers.insert_one(stamped(customer_data))
                 created += 1
                 
         except Exception as e:
@@ -117,12 +120,12 @@ async def import_villas(df: pd.DataFrame, db: AsyncIOMotorDatabase) -> Tuple[int
                 # Actualizar existente
                 await db.villas.update_one(
                     {'id': existing['id']},
-                    {'$set': villa_data}
+                    touch({'$set': villa_data})
                 )
                 updated += 1
             else:
                 # Crear nueva
-                await db.villas.insert_one(villa_data)
+                await db.villas.insert_one(stamped(villa_data))
                 created += 1
                 
         except Exception as e:
@@ -226,13 +229,14 @@ async def import_reservations(df: pd.DataFrame, db: AsyncIOMotorDatabase) -> Tup
                 # Actualizar existente
                 await db.reservations.update_one(
                     {'id': existing['id']},
-                    {'$set': reservation_data}
+                    touch({'$set': reservation_data})
                 )
                 reservations_updated += 1
                 reservation_id = existing['id']
             else:
                 # Crear nueva
-                await db.reservations.insert_one(reservation_data)
+                await db.reservations.insert_one(stamped(reservation_data))
+                await register_invoice_number(db, reservation_data['invoice_number'], 'reservation', reservation_data['id'])
                 reservations_created += 1
                 reservation_id = reservation_data['id']
             
@@ -250,6 +254,8 @@ async def import_reservations(df: pd.DataFrame, db: AsyncIOMotorDatabase) -> Tup
                         'expense_category_id': None,
                         'description': f"Pago propietario villa {villa['code']} - Factura #{reservation_data['invoice_number']}",
                         'amount': villa['owner_price'],
+                        'total_paid': 0,
+                        'balance_due': villa['owner_price'],
                         'currency': reservation_data['currency'],
                         'expense_date': reservation_data['reservation_date'],
                         'payment_status': 'pending',
@@ -263,7 +269,7 @@ async def import_reservations(df: pd.DataFrame, db: AsyncIOMotorDatabase) -> Tup
                         'abonos': []
                     }
                     
-                    await db.expenses.insert_one(expense_data)
+                    await db.expenses.insert_one(stamped(expense_data))
                     expenses_created += 1
                 
         except Exception as e:
@@ -311,6 +317,8 @@ async def import_expenses(df: pd.DataFrame, db: AsyncIOMotorDatabase) -> Tuple[i
                 'expense_category_id': None,
                 'description': str(row['Descripción']).strip(),
                 'amount': float(row['Monto']),
+                'total_paid': 0,
+                'balance_due': float(row['Monto']),
                 'currency': str(row['Moneda']).strip().upper(),
                 'expense_date': fecha_obj.isoformat(),
                 'payment_status': str(row['Estado Pago']).strip().lower(),
@@ -324,7 +332,7 @@ async def import_expenses(df: pd.DataFrame, db: AsyncIOMotorDatabase) -> Tuple[i
             }
             
             # Crear nuevo (no buscamos duplicados en gastos)
-            await db.expenses.insert_one(expense_data)
+            await db.expenses.insert_one(stamped(expense_data))
             created += 1
                 
         except Exception as e:
@@ -0,0 +1,266 @@
+"""
+Registro de índices de MongoDB
+Declara los índices que usan las consultas de la API y los crea al arrancar la aplicación
+"""
+import logging
+import time
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from outbox import OUTBOX_RETENTION_SECONDS
+from change_tracking import CHANGE_TRACKED_COLLECTIONS, TOMBSTONES_COLLECTION, TOMBSTONE_RETENTION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def _unique_id() -> IndexModel:
+    """Índice único sobre el campo 'id' (UUID) que usan todas las búsquedas por ID"""
+    return IndexModel([("id", ASCENDING)], name="id_unique", unique=True)
+
+
+def _unique_invoice_number() -> IndexModel:
+    """Índice único sobre 'invoice_number' - respalda al asignador atómico de números de factura"""
+    return IndexModel(
+        [("invoice_number", ASCENDING)],
+        name="invoice_number_unique",
+        unique=True,
+        partialFilterExpression={"invoice_number": {"$type": "string"}}
+    )
+
+
+# Colección -> índices declarados. create_index es idempotente: si el índice ya existe
+# con la misma definición MongoDB no hace nada.
+INDEX_REGISTRY: Dict[str, List[IndexModel]] = {
+    "users": [
+        _unique_id(),
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email"),
+    ],
+    "customers": [
+        _unique_id(),
+        IndexModel([("name", ASCENDING)], name="name"),
+        IndexModel([("name", ASCENDING), ("id", ASCENDING)], name="name_id"),
+    ],
+    "categories": [
+        _unique_id(),
+    ],
+    "expense_categories": [
+        _unique_id(),
+    ],
+    "villas": [
+        _unique_id(),
+        IndexModel([("code", ASCENDING)], name="code"),
+        IndexModel([("code", ASCENDING), ("id", ASCENDING)], name="code_id"),
+        IndexModel([("category_id", ASCENDING), ("code", ASCENDING), ("id", ASCENDING)], name="category_id_code_id"),
+    ],
+    "extra_services": [
+        _unique_id(),
+        IndexModel([("name", ASCENDING), ("id", ASCENDING)], name="name_id"),
+    ],
+    "reservations": [
+        _unique_id(),
+        _unique_invoice_number(),
+        # Listado paginado: orden (created_at, id) y un índice compuesto por cada filtro
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="status_created_at_id"),
+        IndexModel([("villa_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="villa_id_created_at_id"),
+        IndexModel([("customer_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="customer_id_created_at_id"),
+        IndexModel([("currency", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="currency_created_at_id"),
+        # Listado filtrado por rango de reservation_date: el rango se recorre en el índice y la
+        # página se ordena por (created_at, id) sobre las claves ya acotadas
+        IndexModel(
+            [("reservation_date", DESCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="reservation_date_created_at_id"
+        ),
+    ],
+    "reservation_abonos": [
+        _unique_id(),
+        _unique_invoice_number(),
+        IndexModel([("reservation_id", ASCENDING), ("payment_date", DESCENDING)], name="reservation_id_payment_date"),
+    ],
+    "expenses": [
+        _unique_id(),
+        IndexModel([("related_reservation_id", ASCENDING), ("category", ASCENDING)], name="related_reservation_id_category"),
+        # Gastos de suplidores enlazados a su línea de servicio (update_reservation)
+        IndexModel(
+            [("related_reservation_id", ASCENDING), ("service_key.service_id", ASCENDING),
+             ("service_key.supplier_name", ASCENDING), ("service_key.line", ASCENDING)],
+            name="related_reservation_id_service_key",
+            partialFilterExpression={"service_key": {"$exists": True}}
+        ),
+        IndexModel([("expense_date", DESCENDING)], name="expense_date_desc"),
+        IndexModel([("category", ASCENDING), ("expense_date", DESCENDING)], name="category_expense_date"),
+        # Listado paginado: orden (expense_date, id) y un índice compuesto por filtro/tab
+        IndexModel([("expense_date", DESCENDING), ("id", DESCENDING)], name="expense_date_id"),
+        IndexModel(
+            [("expense_type", ASCENDING), ("related_reservation_id", ASCENDING), ("expense_date", DESCENDING), ("id", DESCENDING)],
+            name="expense_type_related_reservation_expense_date_id"
+        ),
+        IndexModel(
+            [("show_in_variables", ASCENDING), ("expense_type", ASCENDING), ("expense_date", DESCENDING), ("id", DESCENDING)],
+            name="show_in_variables_expense_type_expense_date_id"
+        ),
+        IndexModel([("payment_status", ASCENDING), ("expense_date", DESCENDING), ("id", DESCENDING)], name="payment_status_expense_date_id"),
+        IndexModel([("currency", ASCENDING), ("expense_date", DESCENDING), ("id", DESCENDING)], name="currency_expense_date_id"),
+    ],
+    "expense_abonos": [
+        _unique_id(),
+        _unique_invoice_number(),
+        IndexModel([("expense_id", ASCENDING), ("payment_date", DESCENDING)], name="expense_id_payment_date"),
+    ],
+    "villa_owners": [
+        _unique_id(),
+        IndexModel([("name", ASCENDING)], name="name"),
+        IndexModel([("name", ASCENDING), ("id", ASCENDING)], name="name_id"),
+    ],
+    "owner_payments": [
+        _unique_id(),
+        IndexModel([("owner_id", ASCENDING), ("payment_date", DESCENDING)], name="owner_id_payment_date"),
+        IndexModel([("owner_id", ASCENDING), ("payment_date", DESCENDING), ("id", DESCENDING)], name="owner_id_payment_date_id"),
+    ],
+    "quotations": [
+        _unique_id(),
+        IndexModel([("quotation_number", ASCENDING)], name="quotation_number"),
+        IndexModel([("created_at", DESCENDING)], name="created_at_desc"),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="status_created_at_id"),
+        IndexModel([("customer_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="customer_id_created_at_id"),
+    ],
+    "conduces": [
+        _unique_id(),
+        IndexModel([("conduce_number", ASCENDING)], name="conduce_number"),
+        IndexModel([("created_at", DESCENDING)], name="created_at_desc"),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel([("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="status_created_at_id"),
+        IndexModel([("recipient_type", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="recipient_type_created_at_id"),
+    ],
+    "commissions": [
+        _unique_id(),
+        IndexModel([("reservation_id", ASCENDING)], name="reservation_id"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_id_created_at"),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_id_created_at_id"),
+        IndexModel([("user_id", ASCENDING), ("paid", ASCENDING), ("reservation_date", ASCENDING)], name="user_id_paid_reservation_date"),
+    ],
+    "invoice_numbers": [
+        IndexModel([("invoice_number", ASCENDING)], name="invoice_number_unique", unique=True),
+        IndexModel([("owner_id", ASCENDING)], name="owner_id"),
+        IndexModel([("parent_id", ASCENDING)], name="parent_id"),
+    ],
+    "stats": [
+        _unique_id(),
+    ],
+    "invoice_counter": [
+        IndexModel([("counter_id", ASCENDING)], name="counter_id_unique", unique=True),
+    ],
+    "cache_versions": [
+        IndexModel([("namespace", ASCENDING)], name="namespace_unique", unique=True),
+    ],
+    "outbox": [
+        _unique_id(),
+        IndexModel([("idempotency_key", ASCENDING)], name="idempotency_key_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt_at"),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at"),
+        # Los eventos procesados se eliminan solos (los pendientes y fallidos no tienen processed_at)
+        IndexModel([("processed_at", ASCENDING)], name="processed_at_ttl", expireAfterSeconds=OUTBOX_RETENTION_SECONDS),
+    ],
+    TOMBSTONES_COLLECTION: [
+        # Backups incrementales: eliminados desde la marca de agua
+        IndexModel([("deleted_at", ASCENDING)], name="deleted_at_ttl", expireAfterSeconds=TOMBSTONE_RETENTION_SECONDS),
+    ],
+    "backup_state": [
+        _unique_id(),
+    ],
+}
+
+# Backups incrementales: las colecciones respaldadas se recorren por updated_at
+for _collection in CHANGE_TRACKED_COLLECTIONS:
+    INDEX_REGISTRY[_collection].append(IndexModel([("updated_at", ASCENDING)], name="updated_at"))
+
+# Índices que el registro creó antes y ya reemplazó: ensure_indexes los elimina
+OBSOLETE_INDEXES: Dict[str, List[str]] = {
+    "reservations": [
+        # Reemplazado por el índice único parcial invoice_number_unique
+        "invoice_number",
+        # Prefijo de created_at_id
+        "created_at_desc",
+        # Reemplazados por reservation_date_created_at_id
+        "reservation_date_created_at",
+        "created_at_id_reservation_date",
+        # Mismas claves que created_at_id con un filtro parcial (choca con él al crearlo)
+        "with_balance_due_created_at_id",
+    ],
+    # Reemplazados por el índice único parcial invoice_number_unique
+    "reservation_abonos": ["invoice_number"],
+    "expense_abonos": ["invoice_number"],
+}
+
+
+async def drop_obsolete_indexes(db) -> List[dict]:
+    """Elimina los índices de OBSOLETE_INDEXES que todavía existan"""
+    results = []
+    for collection_name, index_names in OBSOLETE_INDEXES.items():
+        try:
+            existing = await db[collection_name].index_information()
+        except OperationFailure as e:
+            logger.error(f"No se pudieron leer los índices de {collection_name}: {e}")
+            continue
+        for index_name in index_names:
+            if index_name not in existing:
+                continue
+            try:
+                await db[collection_name].drop_index(index_name)
+                logger.info(f"Índice obsoleto {collection_name}.{index_name} eliminado")
+                results.append({"collection": collection_name, "index": index_name, "ok": True, "dropped": True})
+            except OperationFailure as e:
+                logger.error(f"No se pudo eliminar el índice obsoleto {collection_name}.{index_name}: {e}")
+                results.append({"collection": collection_name, "index": index_name, "ok": False, "dropped": False, "error": str(e)})
+    return results
+
+
+async def ensure_indexes(db) -> List[dict]:
+    """
+    Crea todos los índices del registro (idempotente) y elimina los obsoletos
+    Un índice que falla (por ejemplo, datos duplicados en un índice único) se registra
+    en el log y no impide arrancar la aplicación
+    """
+    results = await drop_obsolete_indexes(db)
+    for collection_name, indexes in INDEX_REGISTRY.items():
+        for index in indexes:
+            index_name = index.document["name"]
+            started = time.perf_counter()
+            try:
+                await db[collection_name].create_indexes([index])
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                logger.info(f"Índice {collection_name}.{index_name} listo en {elapsed_ms:.1f} ms")
+                results.append({"collection": collection_name, "index": index_name, "ok": True, "ms": round(elapsed_ms, 1)})
+            except OperationFailure as e:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                logger.error(f"No se pudo crear el índice {collection_name}.{index_name}: {e}")
+                results.append({"collection": collection_name, "index": index_name, "ok": False, "ms": round(elapsed_ms, 1), "error": str(e)})
+    return results
+
+
+async def get_index_usage_stats(db) -> List[dict]:
+    """Devuelve las estadísticas de uso ($indexStats) de cada índice de las colecciones registradas"""
+    stats = []
+    for collection_name in INDEX_REGISTRY:
+        try:
+            index_stats = await db[collection_name].aggregate([{"$indexStats": {}}]).to_list(None)
+        except OperationFailure as e:
+            stats.append({"collection": collection_name, "error": str(e)})
+            continue
+
+        for index_stat in index_stats:
+            accesses = index_stat.get("accesses", {})
+            since = accesses.get("since")
+            stats.append({
+                "collection": collection_name,
+                "index": index_stat.get("name"),
+                "key": dict(index_stat.get("key", {})),
+                "ops": accesses.get("ops", 0),
+                "since": since.isoformat() if since else None
+            })
+    return stats
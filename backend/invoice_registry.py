@@ -0,0 +1,117 @@
+"""
+Registro unificado de números de factura
+Una sola colección (invoice_numbers) indexada por número de factura que indica qué documento
+lo usa: una reservación, un abono de reservación o un abono de gasto
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_COLLECTION = "invoice_numbers"
+
+# Tipo de dueño -> colección donde vive el documento
+OWNER_COLLECTIONS = {
+    "reservation": "reservations",
+    "reservation_abono": "reservation_abonos",
+    "expense_abono": "expense_abonos",
+}
+
+# Campo del documento dueño que apunta a su padre (reservación o gasto)
+PARENT_FIELDS = {
+    "reservation": None,
+    "reservation_abono": "reservation_id",
+    "expense_abono": "expense_id",
+}
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+async def register_invoice_number(db, invoice_number: str, owner_type: str, owner_id: str, parent_id: Optional[str] = None) -> bool:
+    """
+    Reserva un número de factura para un documento
+    Devuelve False si el número ya pertenece a otro documento (índice único)
+    """
+    entry = {
+        "invoice_number": str(invoice_number),
+        "owner_type": owner_type,
+        "owner_id": owner_id,
+        "parent_id": parent_id,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    try:
+        await db[REGISTRY_COLLECTION].insert_one(entry)
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+async def release_invoice_number(db, owner_id: str) -> None:
+    """Libera el número de factura de un documento eliminado"""
+    await db[REGISTRY_COLLECTION].delete_many({"owner_id": owner_id})
+
+
+async def release_invoice_numbers_for_parent(db, parent_id: str) -> None:
+    """Libera los números de todos los abonos de una reservación o gasto eliminado"""
+    await db[REGISTRY_COLLECTION].delete_many({"parent_id": parent_id})
+
+
+async def get_invoice_number_entry(db, invoice_number: str) -> Optional[dict]:
+    """Lectura puntual (indexada) del dueño de un número de factura"""
+    return await db[REGISTRY_COLLECTION].find_one({"invoice_number": str(invoice_number)}, {"_id": 0})
+
+
+async def backfill_invoice_registry(db) -> dict:
+    """
+    Migración: registra los números de factura ya existentes en reservations,
+    reservation_abonos y expense_abonos (idempotente, en lotes)
+    """
+    summary = {}
+    for owner_type, collection_name in OWNER_COLLECTIONS.items():
+        parent_field = PARENT_FIELDS[owner_type]
+        projection = {"_id": 0, "id": 1, "invoice_number": 1, "created_at": 1}
+        if parent_field:
+            projection[parent_field] = 1
+
+        registered = 0
+        operations = []
+        cursor = db[collection_name].find({"invoice_number": {"$exists": True, "$ne": None}}, projection)
+        async for doc in cursor:
+            # $setOnInsert: si el número ya está registrado (por otro dueño) se conserva el primero
+            operations.append(UpdateOne(
+                {"invoice_number": str(doc["invoice_number"])},
+                {"$setOnInsert": {
+                    "owner_type": owner_type,
+                    "owner_id": doc.get("id"),
+                    "parent_id": doc.get(parent_field) if parent_field else None,
+                    "created_at": doc.get("created_at") or datetime.now(timezone.utc).isoformat()
+                }},
+                upsert=True
+            ))
+            if len(operations) >= BACKFILL_BATCH_SIZE:
+                result = await db[REGISTRY_COLLECTION].bulk_write(operations, ordered=False)
+                registered += result.upserted_count
+                operations = []
+
+        if operations:
+            result = await db[REGISTRY_COLLECTION].bulk_write(operations, ordered=False)
+            registered += result.upserted_count
+
+        logger.info(f"Registro de facturas: {registered} números nuevos desde {collection_name}")
+        summary[collection_name] = registered
+
+    return summary
+
+
+async def ensure_invoice_registry(db) -> None:
+    """Ejecuta el backfill al arrancar si el registro está vacío pero ya existen facturas"""
+    if await db[REGISTRY_COLLECTION].estimated_document_count() > 0:
+        return
+    if await db.reservations.estimated_document_count() == 0:
+        return
+    logger.info("Registro de facturas vacío, ejecutando backfill...")
+    await backfill_invoice_registry(db)
@@ -0,0 +1,79 @@
+"""
+Script de migración: convierte los campos de fecha guardados como string ISO a fechas nativas
+de BSON en reservaciones, gastos, abonos, comisiones y cotizaciones (ver BSON_DATE_FIELDS).
+Trabaja en lotes con bulk_write y es idempotente: solo toca documentos que aún tienen strings,
+así que se puede interrumpir y volver a ejecutar. Mientras corre, la API lee ambos formatos
+"""
+import asyncio
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+from database import BSON_DATE_FIELDS, to_bson_date
+
+MIGRATION_BATCH_SIZE = 1000
+
+
+async def migrate_collection(db, collection_name: str, fields: list, batch_size: int = MIGRATION_BATCH_SIZE) -> dict:
+    """Convierte los campos string de una colección; devuelve documentos revisados y actualizados"""
+    collection = db[collection_name]
+    query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    projection = {field: 1 for field in fields}
+
+    scanned = 0
+    updated = 0
+    operations = []
+    async for doc in collection.find(query, projection).batch_size(batch_size):
+        scanned += 1
+        converted = {}
+        for field in fields:
+            value = doc.get(field)
+            if isinstance(value, str):
+                new_value = to_bson_date(value)
+                if new_value is not value:
+                    converted[field] = new_value
+        if converted:
+            operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": converted}))
+
+        if len(operations) >= batch_size:
+            result = await collection.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+            operations = []
+
+    if operations:
+        result = await collection.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+
+    return {"scanned": scanned, "updated": updated}
+
+
+async def migrate_bson_dates():
+    # Conectar a MongoDB
+    mongo_url = os.getenv("MONGO_URL")
+    db_name = os.getenv("DB_NAME", "villa_management")
+
+    if not mongo_url:
+        print("❌ ERROR: MONGO_URL no configurado")
+        return
+
+    print(f"🔗 Conectando a MongoDB: {db_name}")
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    for collection_name, fields in BSON_DATE_FIELDS.items():
+        summary = await migrate_collection(db, collection_name, fields)
+        print(f"✅ {collection_name}: {summary['updated']} de {summary['scanned']} documentos convertidos")
+
+        # Lo que quede como string no es una fecha ISO válida: se reporta para revisarlo a mano
+        remaining = await db[collection_name].count_documents(
+            {"$or": [{field: {"$type": "string"}} for field in fields]}
+        )
+        if remaining:
+            print(f"⚠️  {collection_name}: {remaining} documentos con fechas que no se pudieron convertir")
+
+    print("\n🎉 Migración de fechas completada")
+    client.close()
+
+if __name__ == "__main__":
+    print("🚀 Iniciando migración de fechas a BSON...\n")
+    asyncio.run(migrate_bson_dates())
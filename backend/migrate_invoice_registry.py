@@ -0,0 +1,39 @@
+"""
+Script de migración para poblar el registro unificado de números de factura (invoice_numbers)
+con las reservaciones y abonos existentes. Es idempotente: se puede ejecutar varias veces
+"""
+import asyncio
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from indexes import ensure_indexes
+from invoice_registry import backfill_invoice_registry, REGISTRY_COLLECTION
+
+async def migrate_invoice_registry():
+    # Conectar a MongoDB
+    mongo_url = os.getenv("MONGO_URL")
+    db_name = os.getenv("DB_NAME", "villa_management")
+    
+    if not mongo_url:
+        print("❌ ERROR: MONGO_URL no configurado")
+        return
+    
+    print(f"🔗 Conectando a MongoDB: {db_name}")
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+    
+    # El índice único del registro debe existir antes de poblarlo
+    await ensure_indexes(db)
+    
+    summary = await backfill_invoice_registry(db)
+    for collection_name, registered in summary.items():
+        print(f"✅ {collection_name}: {registered} números registrados")
+    
+    total = await db[REGISTRY_COLLECTION].count_documents({})
+    print(f"\n🎉 Migración completada: {total} números en el registro")
+    
+    client.close()
+
+if __name__ == "__main__":
+    print("🚀 Iniciando migración del registro de facturas...\n")
+    asyncio.run(migrate_invoice_registry())
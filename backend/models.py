@@ -299,6 +299,7 @@ class Reservation(ReservationBase):
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     created_by: str  # user_id
     converted_from_quotation_number: Optional[str] = None  # Número de cotización de origen (ej: "COT-0001")
+    customer_identification_document: Optional[str] = None  # Cédula/RNC del cliente (solo lectura, se agrega al listar)
 
 
 # ============ QUOTATION (COTIZACIÓN) MODELS ============
@@ -557,6 +558,13 @@ class ExpenseUpdate(BaseModel):
     show_in_variables: Optional[bool] = None  # Para gastos únicos
     services_details: Optional[List[Dict[str, Any]]] = None
 
+class ExpenseAbonoSummary(BaseModel):
+    """Resumen de un abono embebido en el listado de gastos"""
+    id: str
+    amount: float
+    invoice_number: Optional[str] = None
+    payment_date: Optional[datetime] = None
+
 class Expense(ExpenseBase):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -564,6 +572,8 @@ class Expense(ExpenseBase):
     created_by: str
     total_paid: float = 0  # Total de abonos pagados
     balance_due: float = 0  # Saldo restante (puede ser negativo si se paga de más)
+    service_key: Optional[Dict[str, Any]] = None  # Gastos de suplidor: {service_id, supplier_name, line} de la reservación
+    abonos: Optional[List[ExpenseAbonoSummary]] = None  # Solo cuando se piden con include_abonos
 
 # ============ INVOICE COUNTER MODEL ============
 class InvoiceCounter(BaseModel):
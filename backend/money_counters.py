@@ -0,0 +1,223 @@
+"""
+Contadores de dinero atómicos
+amount_paid / total_owed se actualizan con un solo update por pipeline: el incremento y el
+balance_due derivado se calculan dentro de MongoDB sobre el valor actual del documento, así
+dos abonos (o pagos) simultáneos nunca pisan el resultado del otro y no hace falta leer antes
+de escribir. Las fórmulas son las mismas de calculate_balance:
+- reservaciones: balance_due = max(0, total_amount + deposit - amount_paid)
+- propietarios:  balance_due = max(0, total_owed - amount_paid)
+- gastos:        balance_due = amount - total_paid (negativo si se pagó de más)
+Los gastos guardan total_paid (suma de sus expense_abonos); repair_expense_balances lo
+verifica contra los abonos por lotes y corrige las diferencias
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo import ReturnDocument, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+EXPENSE_REPAIR_BATCH_SIZE = 500
+# Diferencia tolerada al verificar (sumas de floats acumuladas con $add)
+EXPENSE_BALANCE_TOLERANCE = 0.005
+EXPENSE_BALANCES_MARKER = "expense_balances"
+
+
+def _num(field: str) -> dict:
+    return {"$ifNull": [f"${field}", 0]}
+
+
+RESERVATION_BALANCE = {"$max": [0, {"$subtract": [{"$add": [_num("total_amount"), _num("deposit")]}, _num("amount_paid")]}]}
+OWNER_BALANCE = {"$max": [0, {"$subtract": [_num("total_owed"), _num("amount_paid")]}]}
+EXPENSE_BALANCE = {"$subtract": [_num("amount"), _num("total_paid")]}
+
+
+def increment_pipeline(field: str, amount: float, balance: dict, extra: Optional[dict] = None) -> list:
+    """Suma amount a field y recalcula balance_due con el valor ya incrementado (y marca updated_at)"""
+    return [
+        {"$set": {field: {"$add": [_num(field), amount]}, "updated_at": datetime.now(timezone.utc), **(extra or {})}},
+        {"$set": {"balance_due": balance}},
+    ]
+
+
+async def apply_reservation_payment(db, reservation_id: str, amount: float, session=None) -> Optional[dict]:
+    """
+    Suma (o resta, con amount negativo) un pago a la reservación
+    Devuelve el documento ANTES del cambio (None si no existe) para los contadores del dashboard
+    """
+    return await db.reservations.find_one_and_update(
+        {"id": reservation_id},
+        increment_pipeline("amount_paid", amount, RESERVATION_BALANCE),
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+
+
+def reservation_after_payment(before: dict, amount: float) -> dict:
+    """El documento después de apply_reservation_payment, calculado igual que el pipeline"""
+    amount_paid = (before.get("amount_paid") or 0) + amount
+    balance_due = max(0, (before.get("total_amount") or 0) + (before.get("deposit") or 0) - amount_paid)
+    return {**before, "amount_paid": amount_paid, "balance_due": balance_due}
+
+
+def reservation_update_pipeline(fields: dict) -> list:
+    """$set de campos de una reservación que recalcula balance_due sobre el amount_paid actual"""
+    return [
+        {"$set": {field: {"$literal": value} for field, value in fields.items()}},
+        {"$set": {"balance_due": RESERVATION_BALANCE}},
+    ]
+
+
+async def update_reservation_fields(db, reservation_id: str, fields: dict, session=None) -> Optional[dict]:
+    """
+    Actualiza campos de la reservación en un solo update por pipeline (un abono simultáneo no se pierde)
+    Devuelve el documento ANTES del cambio (None si no existe); reservation_after_update da el de después
+    """
+    return await db.reservations.find_one_and_update(
+        {"id": reservation_id},
+        reservation_update_pipeline(fields),
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE,
+        session=session
+    )
+
+
+def reservation_after_update(before: dict, fields: dict) -> dict:
+    """El documento después de update_reservation_fields, calculado igual que el pipeline"""
+    after = {**before, **fields}
+    after["balance_due"] = max(0, (after.get("total_amount") or 0) + (after.get("deposit") or 0) - (after.get("amount_paid") or 0))
+    return after
+
+
+async def apply_owner_payment(db, owner_id: str, amount: float, session=None) -> Optional[dict]:
+    """Suma un pago al propietario; devuelve el documento después del cambio (None si no existe)"""
+    return await db.villa_owners.find_one_and_update(
+        {"id": owner_id},
+        increment_pipeline("amount_paid", amount, OWNER_BALANCE),
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+
+
+def owner_debt_pipeline(amount: float, defaults: dict) -> list:
+    """
+    Upsert por pipeline que suma deuda al propietario; defaults son los campos que solo se
+    escriben si el propietario no existía (equivalente a $setOnInsert)
+    """
+    on_insert = {field: {"$ifNull": [f"${field}", {"$literal": value}]} for field, value in defaults.items()}
+    return increment_pipeline("total_owed", amount, OWNER_BALANCE, on_insert)
+
+
+async def set_owner_total_owed(db, owner_id: str, total_owed: float) -> Optional[dict]:
+    """Fija total_owed y recalcula balance_due con el amount_paid actual"""
+    return await db.villa_owners.find_one_and_update(
+        {"id": owner_id},
+        [{"$set": {"total_owed": total_owed, "updated_at": datetime.now(timezone.utc)}}, {"$set": {"balance_due": OWNER_BALANCE}}],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def new_expense_balance(expense: dict) -> dict:
+    """Gasto nuevo (sin abonos): total_paid = 0 y balance_due = amount"""
+    expense["total_paid"] = 0
+    expense["balance_due"] = expense.get("amount") or 0
+    return expense
+
+
+async def apply_expense_payment(db, expense_id: str, amount: float, session=None) -> Optional[dict]:
+    """Suma (o resta) un abono al gasto; devuelve el documento después del cambio (None si no existe)"""
+    return await db.expenses.find_one_and_update(
+        {"id": expense_id},
+        increment_pipeline("total_paid", amount, EXPENSE_BALANCE),
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+
+
+def expense_update_pipeline(fields: dict) -> list:
+    """
+    $set de campos de un gasto que recalcula balance_due (por si cambió amount)
+    Los valores van como $literal: en un pipeline un string que empieza con $ sería un campo
+    """
+    return [
+        {"$set": {field: {"$literal": value} for field, value in fields.items()}},
+        {"$set": {"balance_due": EXPENSE_BALANCE}},
+    ]
+
+
+async def _repair_batch(db, expenses: list, dry_run: bool) -> dict:
+    ids = [expense["id"] for expense in expenses]
+    paid = {
+        row["_id"]: row["total"]
+        async for row in db.expense_abonos.aggregate([
+            {"$match": {"expense_id": {"$in": ids}}},
+            {"$group": {"_id": "$expense_id", "total": {"$sum": "$amount"}}}
+        ])
+    }
+
+    operations = []
+    for expense in expenses:
+        actual = paid.get(expense["id"], 0)
+        expected_balance = (expense.get("amount") or 0) - actual
+        stored_paid = expense.get("total_paid")
+        stored_balance = expense.get("balance_due")
+        if (stored_paid is not None and stored_balance is not None
+                and abs(stored_paid - actual) <= EXPENSE_BALANCE_TOLERANCE
+                and abs(stored_balance - expected_balance) <= EXPENSE_BALANCE_TOLERANCE):
+            continue
+        # Solo si total_paid no cambió desde la lectura: un abono concurrente ya lo ajustó con $add
+        operations.append(UpdateOne(
+            {"id": expense["id"], "total_paid": stored_paid},
+            [{"$set": {"total_paid": actual, "updated_at": datetime.now(timezone.utc)}}, {"$set": {"balance_due": EXPENSE_BALANCE}}]
+        ))
+
+    fixed = 0
+    if operations and not dry_run:
+        result = await db.expenses.bulk_write(operations, ordered=False)
+        fixed = result.modified_count
+    return {"mismatched": len(operations), "fixed": fixed}
+
+
+async def repair_expense_balances(db, batch_size: int = EXPENSE_REPAIR_BATCH_SIZE, dry_run: bool = False) -> dict:
+    """
+    Verifica total_paid / balance_due de todos los gastos contra expense_abonos, en lotes de
+    batch_size gastos (una agregación + un bulk_write por lote). Idempotente
+    """
+    summary = {"expenses": 0, "mismatched": 0, "fixed": 0, "dry_run": dry_run}
+    batch = []
+    cursor = db.expenses.find({}, {"_id": 0, "id": 1, "amount": 1, "total_paid": 1, "balance_due": 1}).sort("id", 1)
+    async for expense in cursor:
+        batch.append(expense)
+        if len(batch) >= batch_size:
+            result = await _repair_batch(db, batch, dry_run)
+            summary["mismatched"] += result["mismatched"]
+            summary["fixed"] += result["fixed"]
+            summary["expenses"] += len(batch)
+            batch = []
+
+    if batch:
+        result = await _repair_batch(db, batch, dry_run)
+        summary["mismatched"] += result["mismatched"]
+        summary["fixed"] += result["fixed"]
+        summary["expenses"] += len(batch)
+
+    logger.info(f"Saldos de gastos verificados: {summary}")
+    return summary
+
+
+async def ensure_expense_balances(db) -> None:
+    """Ejecuta la reparación al arrancar una sola vez (gastos anteriores a total_paid guardado)"""
+    if await db.stats.find_one({"id": EXPENSE_BALANCES_MARKER}, {"_id": 0, "id": 1}):
+        return
+    logger.info("Calculando total_paid / balance_due de los gastos existentes...")
+    summary = await repair_expense_balances(db)
+    await db.stats.update_one(
+        {"id": EXPENSE_BALANCES_MARKER},
+        {"$set": {**summary, "repaired_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True
+    )
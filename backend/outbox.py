@@ -0,0 +1,250 @@
+"""
+Outbox transaccional para los efectos secundarios diferidos
+La petición escribe su documento principal y un evento en la colección outbox en la misma
+transacción; un worker en segundo plano (uno por proceso de uvicorn) reclama los eventos
+pendientes, ejecuta el handler registrado para su tipo y lo marca como procesado.
+- Cada evento tiene una idempotency_key única: encolar dos veces lo mismo no duplica el evento
+- El handler y la marca de 'done' van en la misma transacción (exactamente una vez); sin
+  replica set los handlers deben ser idempotentes por sí mismos
+- Un error reprograma el evento con backoff exponencial; al agotar OUTBOX_MAX_ATTEMPTS
+  queda en 'failed' y se puede reintentar desde GET/POST /api/admin/outbox
+- Un evento reclamado por un worker que murió se recupera al vencer su lease
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from transactions import run_in_transaction
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = "outbox"
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_LEASE_SECONDS = 60
+OUTBOX_RETRY_BASE_SECONDS = 2
+OUTBOX_RETRY_MAX_SECONDS = 600
+# Los eventos procesados se borran solos (índice TTL sobre processed_at)
+OUTBOX_RETENTION_SECONDS = 7 * 24 * 3600
+
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+
+Handler = Callable[[object, dict, object], Awaitable[None]]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+async def enqueue(db, event_type: str, idempotency_key: str, payload: dict, session=None) -> dict:
+    """
+    Escribe un evento pendiente (dentro de la transacción de quien llama si se pasa session)
+    Si ya existe un evento con la misma idempotency_key no se crea otro
+    """
+    now = _now()
+    event = {
+        "id": str(uuid.uuid4()),
+        "type": event_type,
+        "idempotency_key": idempotency_key,
+        "payload": payload,
+        "status": PENDING,
+        "attempts": 0,
+        "next_attempt_at": now,
+        "created_at": now,
+        "last_error": None,
+    }
+    try:
+        await db[OUTBOX_COLLECTION].insert_one(event, session=session)
+    except DuplicateKeyError:
+        logger.info(f"Evento {idempotency_key} ya estaba en el outbox")
+    return event
+
+
+def _retry_delay(attempts: int) -> float:
+    return min(OUTBOX_RETRY_MAX_SECONDS, OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+
+class OutboxWorker:
+    """Drena el outbox en segundo plano; notify() lo despierta en cuanto se encola algo"""
+
+    def __init__(self, poll_interval: float = OUTBOX_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.handlers: Dict[str, Handler] = {}
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self.last_processed_at: Optional[datetime] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, event_type: str, handler: Handler) -> None:
+        """handler(db, event, session): debe dejar aplicados todos los efectos del evento"""
+        self.handlers[event_type] = handler
+
+    def start(self, db) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self) -> None:
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _run(self, db) -> None:
+        while True:
+            try:
+                await self.drain(db)
+            except PyMongoError as e:
+                logger.error(f"Outbox: error leyendo eventos: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain(self, db) -> int:
+        """Procesa eventos hasta que no quede ninguno listo; devuelve cuántos procesó"""
+        count = 0
+        while True:
+            event = await self._claim(db)
+            if event is None:
+                return count
+            await self._process(db, event)
+            count += 1
+
+    async def _claim(self, db) -> Optional[dict]:
+        """Reclama atómicamente el evento listo más antiguo (o uno cuyo lease venció)"""
+        now = _now()
+        return await db[OUTBOX_COLLECTION].find_one_and_update(
+            {"$or": [
+                {"status": PENDING, "next_attempt_at": {"$lte": now}},
+                {"status": PROCESSING, "locked_until": {"$lt": now}},
+            ]},
+            {"$set": {"status": PROCESSING, "locked_until": now + timedelta(seconds=OUTBOX_LEASE_SECONDS)},
+             "$inc": {"attempts": 1}},
+            sort=[("next_attempt_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _process(self, db, event: dict) -> None:
+        handler = self.handlers.get(event["type"])
+        try:
+            if handler is None:
+                raise LookupError(f"Sin handler para eventos '{event['type']}'")
+
+            async def apply(session):
+                await handler(db, event, session)
+                await db[OUTBOX_COLLECTION].update_one(
+                    {"id": event["id"]},
+                    {"$set": {"status": DONE, "processed_at": _now(), "last_error": None},
+                     "$unset": {"locked_until": ""}},
+                    session=session
+                )
+
+            await run_in_transaction(db, apply)
+        except Exception as e:
+            await self._record_failure(db, event, e)
+            return
+
+        self.processed += 1
+        self.last_processed_at = _now()
+
+    async def _record_failure(self, db, event: dict, error: Exception) -> None:
+        attempts = event.get("attempts", 1)
+        gave_up = attempts >= OUTBOX_MAX_ATTEMPTS
+        update = {"status": FAILED if gave_up else PENDING, "last_error": f"{type(error).__name__}: {error}"}
+        if gave_up:
+            self.failed += 1
+            logger.error(f"Outbox: evento {event['idempotency_key']} falló tras {attempts} intentos: {error}")
+        else:
+            self.retried += 1
+            update["next_attempt_at"] = _now() + timedelta(seconds=_retry_delay(attempts))
+            logger.warning(f"Outbox: evento {event['idempotency_key']} falló (intento {attempts}), se reintentará: {error}")
+        try:
+            await db[OUTBOX_COLLECTION].update_one(
+                {"id": event["id"]}, {"$set": update, "$unset": {"locked_until": ""}}
+            )
+        except PyMongoError as e:
+            # El lease vence y el evento se vuelve a reclamar
+            logger.error(f"Outbox: no se pudo registrar el fallo de {event['idempotency_key']}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "handlers": sorted(self.handlers),
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "last_processed_at": self.last_processed_at.isoformat() if self.last_processed_at else None,
+        }
+
+
+outbox_worker = OutboxWorker()
+
+
+async def outbox_status(db, failed_limit: int = 50) -> dict:
+    """Conteo por estado, lag (antigüedad del evento sin procesar más viejo) y eventos fallidos"""
+    now = _now()
+    counts = {status: 0 for status in (PENDING, PROCESSING, DONE, FAILED)}
+    async for row in db[OUTBOX_COLLECTION].aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+        counts[row["_id"]] = row["count"]
+
+    oldest = await db[OUTBOX_COLLECTION].find_one(
+        {"status": {"$in": [PENDING, PROCESSING]}}, {"_id": 0, "created_at": 1}, sort=[("created_at", 1)]
+    )
+    lag_seconds = (now - _as_utc(oldest["created_at"])).total_seconds() if oldest else 0
+
+    # Tiempo de procesamiento (creación -> done) de los últimos eventos
+    recent = await db[OUTBOX_COLLECTION].find(
+        {"status": DONE}, {"_id": 0, "created_at": 1, "processed_at": 1}
+    ).sort("processed_at", -1).limit(100).to_list(100)
+    delays = [(_as_utc(e["processed_at"]) - _as_utc(e["created_at"])).total_seconds() * 1000 for e in recent]
+
+    failed = await db[OUTBOX_COLLECTION].find(
+        {"status": FAILED}, {"_id": 0, "payload": 0}
+    ).sort("created_at", -1).limit(failed_limit).to_list(failed_limit)
+
+    return {
+        "counts": counts,
+        "lag_seconds": round(lag_seconds, 3),
+        "processing_ms": {
+            "avg": round(sum(delays) / len(delays), 1) if delays else None,
+            "max": round(max(delays), 1) if delays else None,
+        },
+        "failed_events": failed,
+        "checked_at": now.isoformat(),
+    }
+
+
+async def retry_event(db, event_id: str) -> bool:
+    """Vuelve a poner en cola un evento fallido, con los intentos en cero"""
+    result = await db[OUTBOX_COLLECTION].update_one(
+        {"id": event_id, "status": FAILED},
+        {"$set": {"status": PENDING, "next_attempt_at": _now(), "attempts": 0}}
+    )
+    return result.modified_count == 1
@@ -0,0 +1,154 @@
+"""
+Paginación por cursor (keyset) y proyecciones parciales para los listados de la API
+El cursor es opaco para el cliente: codifica (en base64) el valor del campo de orden y el id
+del último documento de la página, y la página siguiente empieza justo después de ese par
+
+Contrato de todos los listados paginados (find_page + page_response):
+- limit: tamaño de página (DEFAULT_PAGE_SIZE por defecto, MAX_PAGE_SIZE como máximo)
+- X-Next-Cursor: cabecera con el cursor de la página siguiente (no viene en la última);
+  se devuelve como ?after= para pedir esa página
+- fields=a,b,c: proyección parcial (siempre incluye id y el campo de orden)
+- include_total=true: agrega X-Total-Count (un count_documents extra, solo si se pide)
+"""
+import base64
+import re
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from bson import json_util
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from doc_codec import ModelCodec
+
+# Cabeceras de respuesta: el cuerpo sigue siendo una lista para no romper a los clientes
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+PAGINATION_HEADERS = [NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER]
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(sort_value: Any, doc_id: str) -> str:
+    """json_util conserva el tipo (string ISO o datetime) del valor de orden"""
+    raw = json_util.dumps([sort_value, doc_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    try:
+        sort_value, doc_id = json_util.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return sort_value, doc_id
+
+
+def keyset_filter(cursor: Optional[str], sort_field: str, descending: bool = True) -> Optional[dict]:
+    """Condición 'después del cursor' para el orden (sort_field, id)"""
+    if not cursor:
+        return None
+    sort_value, doc_id = decode_cursor(cursor)
+    op = "$lt" if descending else "$gt"
+    conditions = [
+        {sort_field: {op: sort_value}},
+        {sort_field: sort_value, "id": {op: doc_id}}
+    ]
+    # Mientras conviven strings ISO y fechas nativas, MongoDB ordena todos los strings antes
+    # que todas las fechas y $lt/$gt no comparan entre tipos: los del otro tipo que quedan
+    # después del cursor se agregan explícitamente
+    if descending and isinstance(sort_value, datetime):
+        conditions.append({sort_field: {"$type": "string"}})
+    elif not descending and isinstance(sort_value, str):
+        conditions.append({sort_field: {"$type": "date"}})
+    return {"$or": conditions}
+
+
+def with_cursor(query: dict, cursor: Optional[str], sort_field: str, descending: bool = True) -> dict:
+    """Combina el filtro del listado con la condición del cursor"""
+    after = keyset_filter(cursor, sort_field, descending)
+    if not after:
+        return query
+    return {"$and": [query, after]} if query else after
+
+
+def sort_spec(sort_field: str, descending: bool = True) -> List[Tuple[str, int]]:
+    direction = -1 if descending else 1
+    return [(sort_field, direction), ("id", direction)]
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def set_page_headers(response: Response, docs: List[dict], limit: int, sort_field: str, total: Optional[int] = None) -> None:
+    """
+    Publica el cursor de la página siguiente (solo si la página vino llena) y,
+    si se pidió, el total de documentos que cumplen el filtro.
+    Se llama con los documentos tal como vienen de MongoDB (antes de decodificarlos)
+    """
+    if len(docs) == limit:
+        last = docs[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.get(sort_field), last.get("id"))
+    if total is not None:
+        response.headers[TOTAL_COUNT_HEADER] = str(total)
+
+
+FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_.]*$")
+
+
+def fields_projection(fields: Optional[str], required: List[str]) -> dict:
+    """
+    Proyección para fields=a,b,c (los campos de 'required', id y el de orden, siempre se incluyen)
+    Sin fields se devuelven todos los campos
+    """
+    if not fields:
+        return {"_id": 0}
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    invalid = [name for name in names if not FIELD_NAME.match(name)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Campos inválidos: {', '.join(invalid)}")
+    projection = {"_id": 0}
+    for name in dict.fromkeys(names + required):
+        projection[name] = 1
+    return projection
+
+
+async def find_page(
+    collection,
+    query: dict,
+    response: Response,
+    sort_field: str,
+    descending: bool = False,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    include_total: bool = False
+) -> List[dict]:
+    """
+    Una página de un listado: filtro + cursor, orden (sort_field, id), límite acotado,
+    proyección opcional y total opcional (count_documents solo si se pide)
+    """
+    page_size = clamp_limit(limit)
+    projection = fields_projection(fields, ["id", sort_field])
+    docs = await collection.find(
+        with_cursor(query, after, sort_field, descending), projection
+    ).sort(sort_spec(sort_field, descending)).limit(page_size).to_list(page_size)
+
+    total = await collection.count_documents(query) if include_total else None
+    set_page_headers(response, docs, page_size, sort_field, total)
+    return docs
+
+
+def page_response(docs: List[dict], response: Response, fields: Optional[str], codec: ModelCodec) -> Response:
+    """
+    Respuesta de una página serializada con el codec del modelo, conservando las cabeceras de paginación
+    Con fields= los documentos parciales no cumplen el response_model: se devuelven tal cual
+    """
+    headers = {name: response.headers[name] for name in PAGINATION_HEADERS if name in response.headers}
+    if fields:
+        return JSONResponse(content=jsonable_encoder(codec.decode_many(docs)), headers=headers)
+    return codec.json_response(docs, headers)
@@ -0,0 +1,163 @@
+"""
+Motor de estados de pago de gastos
+Calcula el payment_status del grafo de gastos de una reservación (pago_propietario,
+pago_suplidor y devolucion_deposito) con una sola agregación y escribe los cambios
+con un solo bulk_write
+
+Reglas:
+- pago_suplidor: 'paid' si los abonos cubren el monto, 'partial' si hay abonos, si no 'pending'
+- pago_propietario: 'paid' solo si el propietario está pagado, TODOS los suplidores están
+  pagados y el depósito fue devuelto (si la reservación tiene depósito); si no 'pending'
+- devolucion_deposito: su estado lo fija la reservación (deposit_returned), aquí solo se lee
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+OWNER_CATEGORY = "pago_propietario"
+SUPPLIER_CATEGORY = "pago_suplidor"
+DEPOSIT_CATEGORY = "devolucion_deposito"
+GRAPH_CATEGORIES = [OWNER_CATEGORY, SUPPLIER_CATEGORY, DEPOSIT_CATEGORY]
+
+RECOMPUTE_BATCH_SIZE = 500
+
+
+def status_from_payments(total_paid: float, amount: float) -> str:
+    """Estado de un gasto simple según lo abonado"""
+    if total_paid >= amount:
+        return "paid"
+    if total_paid > 0:
+        return "partial"
+    return "pending"
+
+
+def _graph_pipeline(reservation_ids: List[str]) -> List[dict]:
+    """Gastos del grafo agrupados por reservación, con lo abonado a cada uno (total_paid guardado) y el depósito"""
+    return [
+        {"$match": {"related_reservation_id": {"$in": reservation_ids}, "category": {"$in": GRAPH_CATEGORIES}}},
+        {"$group": {
+            "_id": "$related_reservation_id",
+            "expenses": {"$push": {
+                "id": "$id",
+                "category": "$category",
+                "amount": {"$ifNull": ["$amount", 0]},
+                "payment_status": "$payment_status",
+                "total_paid": {"$ifNull": ["$total_paid", 0]}
+            }}
+        }},
+        {"$lookup": {
+            "from": "reservations",
+            "let": {"reservation_id": "$_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$id", "$$reservation_id"]}}},
+                {"$project": {"_id": 0, "deposit": 1}}
+            ],
+            "as": "reservation"
+        }},
+        {"$project": {
+            "expenses": 1,
+            "deposit": {"$ifNull": [{"$arrayElemAt": ["$reservation.deposit", 0]}, 0]}
+        }}
+    ]
+
+
+def compute_graph_statuses(expenses: List[dict], deposit: float) -> Dict[str, str]:
+    """Estado que le corresponde a cada gasto propietario/suplidor de una reservación"""
+    statuses = {}
+
+    suppliers = [e for e in expenses if e["category"] == SUPPLIER_CATEGORY]
+    for supplier in suppliers:
+        statuses[supplier["id"]] = status_from_payments(supplier["total_paid"], supplier["amount"])
+    all_suppliers_paid = all(s["total_paid"] >= s["amount"] for s in suppliers)
+
+    deposit_returned = True
+    if (deposit or 0) > 0:
+        deposit_returned = any(
+            e["category"] == DEPOSIT_CATEGORY and e.get("payment_status") == "paid" for e in expenses
+        )
+
+    for owner in (e for e in expenses if e["category"] == OWNER_CATEGORY):
+        owner_paid = owner["total_paid"] >= owner["amount"]
+        statuses[owner["id"]] = "paid" if (owner_paid and all_suppliers_paid and deposit_returned) else "pending"
+
+    return statuses
+
+
+async def recompute_reservations_payment_status(db, reservation_ids: List[str]) -> int:
+    """
+    Recalcula el grafo de gastos de varias reservaciones: una agregación + un bulk_write
+    Devuelve cuántos gastos cambiaron de estado
+    """
+    if not reservation_ids:
+        return 0
+
+    operations = []
+    async for graph in db.expenses.aggregate(_graph_pipeline(list(reservation_ids))):
+        statuses = compute_graph_statuses(graph["expenses"], graph["deposit"])
+        for expense in graph["expenses"]:
+            new_status = statuses.get(expense["id"])
+            if new_status and new_status != expense.get("payment_status"):
+                operations.append(UpdateOne(
+                    {"id": expense["id"]}, {"$set": {"payment_status": new_status, "updated_at": datetime.now(timezone.utc)}}
+                ))
+
+    if not operations:
+        return 0
+    result = await db.expenses.bulk_write(operations, ordered=False)
+    return result.modified_count
+
+
+async def recompute_reservation_payment_status(db, reservation_id: str) -> int:
+    """Recalcula el grafo de gastos de una reservación"""
+    return await recompute_reservations_payment_status(db, [reservation_id])
+
+
+async def recompute_expense_payment_status(db, expense: dict) -> Optional[str]:
+    """
+    Recalcula el estado después de agregar o eliminar un abono de un gasto
+    expense debe traer el total_paid ya actualizado (apply_expense_payment)
+    Los gastos fuera del grafo (o de propietario/suplidor sin reservación, creados a mano)
+    se evalúan solos; si el gasto pertenece a una reservación se recalcula además todo su
+    grafo (p. ej. pagar un suplidor puede liberar al propietario)
+    Devuelve el nuevo estado del gasto
+    """
+    reservation_id = expense.get("related_reservation_id")
+
+    if not reservation_id or expense.get("category") not in (OWNER_CATEGORY, SUPPLIER_CATEGORY):
+        new_status = status_from_payments(expense.get("total_paid") or 0, expense.get("amount", 0))
+        await db.expenses.update_one(
+            {"id": expense["id"]}, {"$set": {"payment_status": new_status, "updated_at": datetime.now(timezone.utc)}}
+        )
+
+    if reservation_id:
+        await recompute_reservation_payment_status(db, reservation_id)
+
+    updated = await db.expenses.find_one({"id": expense["id"]}, {"_id": 0, "payment_status": 1})
+    return updated.get("payment_status") if updated else None
+
+
+async def recompute_all_payment_status(db, batch_size: int = RECOMPUTE_BATCH_SIZE) -> dict:
+    """
+    Reparación de datos históricos: recalcula el grafo de gastos de todas las
+    reservaciones, en lotes de batch_size reservaciones
+    """
+    reservations = 0
+    updated = 0
+    batch = []
+    async for reservation in db.reservations.find({}, {"_id": 0, "id": 1}):
+        batch.append(reservation["id"])
+        if len(batch) >= batch_size:
+            updated += await recompute_reservations_payment_status(db, batch)
+            reservations += len(batch)
+            batch = []
+
+    if batch:
+        updated += await recompute_reservations_payment_status(db, batch)
+        reservations += len(batch)
+
+    logger.info(f"Estados de pago recalculados: {reservations} reservaciones, {updated} gastos actualizados")
+    return {"reservations": reservations, "expenses_updated": updated}
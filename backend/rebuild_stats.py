@@ -0,0 +1,47 @@
+"""
+Script para reconstruir los contadores del dashboard (colección stats) desde cero
+y verificar que coinciden con una agregación completa. Es idempotente
+Uso: python rebuild_stats.py            -> reconstruye y verifica
+     python rebuild_stats.py --check    -> solo verifica (no modifica nada)
+"""
+import asyncio
+import os
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from stats_counters import rebuild_stats_counters, check_stats_drift
+
+async def rebuild_stats(check_only: bool):
+    # Conectar a MongoDB
+    mongo_url = os.getenv("MONGO_URL")
+    db_name = os.getenv("DB_NAME", "villa_management")
+    
+    if not mongo_url:
+        print("❌ ERROR: MONGO_URL no configurado")
+        return False
+    
+    print(f"🔗 Conectando a MongoDB: {db_name}")
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+    
+    if not check_only:
+        counters = await rebuild_stats_counters(db)
+        for field, value in counters.items():
+            print(f"✅ {field}: {value}")
+    
+    report = await check_stats_drift(db)
+    if report["ok"]:
+        print("\n🎉 Contadores sin desviación")
+    else:
+        print("\n⚠️ Desviación detectada:")
+        for field, values in report["drift"].items():
+            print(f"   {field}: guardado={values['stored']} real={values['actual']} diferencia={values['difference']}")
+    
+    client.close()
+    return report["ok"]
+
+if __name__ == "__main__":
+    check_only = "--check" in sys.argv
+    print("🚀 Verificando contadores del dashboard...\n" if check_only else "🚀 Reconstruyendo contadores del dashboard...\n")
+    ok = asyncio.run(rebuild_stats(check_only))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,34 @@
+"""
+Script de reparación: recalcula el payment_status de los gastos propietario/suplidor de
+todas las reservaciones (en lotes). Es idempotente: se puede ejecutar varias veces
+"""
+import asyncio
+import os
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from payment_status import recompute_all_payment_status
+
+async def recompute_payment_status():
+    # Conectar a MongoDB
+    mongo_url = os.getenv("MONGO_URL")
+    db_name = os.getenv("DB_NAME", "villa_management")
+    
+    if not mongo_url:
+        print("❌ ERROR: MONGO_URL no configurado")
+        return
+    
+    print(f"🔗 Conectando a MongoDB: {db_name}")
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+    
+    summary = await recompute_all_payment_status(db)
+    print(f"✅ Reservaciones procesadas: {summary['reservations']}")
+    print(f"✅ Gastos con estado corregido: {summary['expenses_updated']}")
+    
+    print("\n🎉 Recalculo completado")
+    
+    client.close()
+
+if __name__ == "__main__":
+    print("🚀 Recalculando estados de pago de gastos...\n")
+    asyncio.run(recompute_payment_status())
@@ -0,0 +1,191 @@
+"""
+Caché en memoria (por proceso) para los datos de referencia
+Villas, categorías de villas, categorías de gastos, servicios extras, plantilla de factura,
+términos de cotización y logo cambian poco pero se leen en casi todas las pantallas.
+Cada lectura pasa por get_or_load: la entrada vive REFERENCE_CACHE_TTL segundos y los endpoints
+que escriben esas colecciones la invalidan explícitamente. Si varias peticiones piden a la vez
+la misma clave vencida solo una consulta MongoDB y las demás esperan ese resultado (estampida)
+Cada namespace guarda como máximo REFERENCE_CACHE_MAX_ENTRIES entradas (LRU) y las vencidas se
+descartan al guardar una nueva, así las claves por página o por id no crecen sin límite
+"""
+import asyncio
+import copy
+import logging
+import os
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Response
+
+from pagination import find_page, PAGINATION_HEADERS
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_CACHE_TTL = float(os.environ.get("REFERENCE_CACHE_TTL", "300"))
+REFERENCE_CACHE_MAX_ENTRIES = int(os.environ.get("REFERENCE_CACHE_MAX_ENTRIES", "256"))
+
+# Namespaces: el nombre de la colección que cachean
+VILLAS = "villas"
+CATEGORIES = "categories"
+EXPENSE_CATEGORIES = "expense_categories"
+EXTRA_SERVICES = "extra_services"
+INVOICE_TEMPLATES = "invoice_templates"
+QUOTATION_TERMS = "quotation_terms"
+LOGO_CONFIG = "logo_config"
+REFERENCE_NAMESPACES = [
+    VILLAS, CATEGORIES, EXPENSE_CATEGORIES, EXTRA_SERVICES, INVOICE_TEMPLATES, QUOTATION_TERMS, LOGO_CONFIG
+]
+
+
+class ReferenceCache:
+    """Read-through con TTL, invalidación por namespace, single-flight y contadores"""
+
+    def __init__(self, ttl: float = REFERENCE_CACHE_TTL, max_entries: int = REFERENCE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # namespace -> clave -> (vence, valor), de la menos a la más recientemente usada
+        self._entries: Dict[str, "OrderedDict[Hashable, Tuple[float, Any]]"] = defaultdict(OrderedDict)
+        self._loading: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+        # Una invalidación durante una carga descarta el resultado de esa carga
+        self._generations: Dict[str, int] = defaultdict(int)
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0}
+        )
+
+    async def get_or_load(self, namespace: str, key: Hashable, loader: Callable[[], Awaitable[Any]],
+                          cache_none: bool = True) -> Any:
+        """
+        Valor cacheado de (namespace, key) o, si no está o venció, el de loader()
+        Devuelve siempre una copia: quien la reciba puede modificarla sin tocar la caché
+        cache_none=False: un None (p. ej. un id inexistente) no se guarda
+        """
+        cache_key = (namespace, key)
+        counters = self._counters[namespace]
+        entries = self._entries[namespace]
+
+        entry = entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            counters["hits"] += 1
+            entries.move_to_end(key)
+            return copy.deepcopy(entry[1])
+
+        pending = self._loading.get(cache_key)
+        if pending:
+            counters["coalesced"] += 1
+            try:
+                return copy.deepcopy(await asyncio.shield(pending))
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # se canceló la carga de otra petición, no esta: se vuelve a intentar
+                return await self.get_or_load(namespace, key, loader, cache_none)
+
+        counters["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._loading[cache_key] = future
+        generation = self._generations[namespace]
+        try:
+            value = await loader()
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # marcada como leída aunque nadie la esté esperando
+            raise
+        except BaseException:
+            # loader cancelado (CancelledError no es Exception): los que esperan no deben colgarse
+            future.cancel()
+            raise
+        finally:
+            self._loading.pop(cache_key, None)
+
+        if self._generations[namespace] == generation and (cache_none or value is not None):
+            self._store(namespace, key, value)
+        future.set_result(value)
+        return copy.deepcopy(value)
+
+    def _store(self, namespace: str, key: Hashable, value: Any) -> None:
+        """Guarda la entrada, descarta las vencidas del namespace y respeta el máximo (LRU)"""
+        entries = self._entries[namespace]
+        now = time.monotonic()
+        for expired in [k for k, (expires, _) in entries.items() if expires <= now]:
+            del entries[expired]
+        entries[key] = (now + self.ttl, value)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def invalidate(self, *namespaces: str) -> None:
+        """Descarta todas las entradas de los namespaces (después de escribir sus colecciones)"""
+        for namespace in namespaces:
+            self._generations[namespace] += 1
+            self._counters[namespace]["invalidations"] += 1
+            self._entries.pop(namespace, None)
+
+    def clear(self) -> None:
+        """Descarta todo (restauraciones, importaciones, reset)"""
+        self.invalidate(*REFERENCE_NAMESPACES)
+
+    def stats(self) -> dict:
+        namespaces = {}
+        for namespace in REFERENCE_NAMESPACES:
+            counters = dict(self._counters[namespace])
+            lookups = counters["hits"] + counters["misses"] + counters["coalesced"]
+            counters["hit_ratio"] = round((counters["hits"] + counters["coalesced"]) / lookups, 4) if lookups else None
+            counters["entries"] = len(self._entries.get(namespace, ()))
+            namespaces[namespace] = counters
+        return {"ttl_seconds": self.ttl, "max_entries": self.max_entries, "namespaces": namespaces}
+
+
+reference_cache = ReferenceCache()
+
+
+async def _find_one(db, collection: str, query: dict) -> Optional[dict]:
+    return await db[collection].find_one(query, {"_id": 0})
+
+
+async def get_villa(db, villa_id: str) -> Optional[dict]:
+    return await reference_cache.get_or_load(
+        VILLAS, ("id", villa_id), lambda: _find_one(db, VILLAS, {"id": villa_id}), cache_none=False
+    )
+
+
+async def get_active_categories(db, collection: str) -> list:
+    """Categorías activas (de villas o de gastos)"""
+    return await reference_cache.get_or_load(
+        collection, "active", lambda: db[collection].find({"is_active": True}, {"_id": 0}).to_list(1000)
+    )
+
+
+async def get_invoice_template(db) -> Optional[dict]:
+    return await reference_cache.get_or_load(
+        INVOICE_TEMPLATES, "main", lambda: _find_one(db, INVOICE_TEMPLATES, {"template_id": "main_template"})
+    )
+
+
+async def get_quotation_terms(db) -> Optional[dict]:
+    return await reference_cache.get_or_load(
+        QUOTATION_TERMS, "main", lambda: _find_one(db, QUOTATION_TERMS, {"terms_id": "main_quotation_terms"})
+    )
+
+
+async def get_logo(db) -> Optional[dict]:
+    return await reference_cache.get_or_load(
+        LOGO_CONFIG, "main", lambda: _find_one(db, LOGO_CONFIG, {"config_id": "main_logo"})
+    )
+
+
+async def find_page_cached(db, namespace: str, query: dict, response: Response, sort_field: str, **page_args) -> list:
+    """
+    find_page de un listado de referencia: la página y sus cabeceras se cachean por
+    (filtro, cursor, límite, campos, total)
+    """
+    async def load():
+        page = Response()
+        docs = await find_page(db[namespace], query, page, sort_field, **page_args)
+        return docs, {name: page.headers[name] for name in PAGINATION_HEADERS if name in page.headers}
+
+    key = ("page", repr(sorted(query.items())), tuple(sorted(page_args.items())))
+    docs, headers = await reference_cache.get_or_load(namespace, key, load)
+    for name, value in headers.items():
+        response.headers[name] = value
+    return docs
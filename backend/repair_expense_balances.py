@@ -0,0 +1,40 @@
+"""
+Script de reparación: verifica el total_paid / balance_due guardado en cada gasto contra la
+suma de sus expense_abonos (en lotes) y corrige las diferencias. Es idempotente
+Uso: python repair_expense_balances.py [--dry-run]
+"""
+import asyncio
+import os
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from money_counters import repair_expense_balances
+
+async def repair_balances(dry_run: bool):
+    # Conectar a MongoDB
+    mongo_url = os.getenv("MONGO_URL")
+    db_name = os.getenv("DB_NAME", "villa_management")
+
+    if not mongo_url:
+        print("❌ ERROR: MONGO_URL no configurado")
+        return
+
+    print(f"🔗 Conectando a MongoDB: {db_name}")
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    summary = await repair_expense_balances(db, dry_run=dry_run)
+    print(f"✅ Gastos verificados: {summary['expenses']}")
+    print(f"⚠️ Gastos con saldo incorrecto: {summary['mismatched']}")
+    if dry_run:
+        print("ℹ️ Modo --dry-run: no se escribió nada")
+    else:
+        print(f"✅ Gastos corregidos: {summary['fixed']}")
+
+    print("\n🎉 Verificación completada")
+
+    client.close()
+
+if __name__ == "__main__":
+    print("🚀 Verificando saldos de gastos...\n")
+    asyncio.run(repair_balances("--dry-run" in sys.argv[1:]))
@@ -0,0 +1,65 @@
+"""
+Script de restauración: restaura un backup completo seguido de sus incrementales, en orden
+Los archivos se leen por bloques (ver backup.py); si alguno está incompleto o no sigue la
+cadena, los datos actuales no se tocan
+Uso: python restore_backup.py completo.ndjson.gz [incremental1.ndjson.gz ...]
+"""
+import asyncio
+import os
+import sys
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from backup import (
+    aiter_records, iter_backup_records, is_legacy_backup, legacy_backup_records,
+    restore_backup, rebuild_derived_data, RESTORE_READ_SIZE
+)
+
+def _file_records(handle):
+    head = handle.read(64)
+    handle.seek(0)
+    if is_legacy_backup(head):
+        return aiter_records(legacy_backup_records(handle.read()))
+    return aiter_records(iter_backup_records(iter(lambda: handle.read(RESTORE_READ_SIZE), b"")))
+
+async def restore_files(paths):
+    # Conectar a MongoDB
+    mongo_url = os.getenv("MONGO_URL")
+    db_name = os.getenv("DB_NAME", "villa_management")
+
+    if not mongo_url:
+        print("❌ ERROR: MONGO_URL no configurado")
+        return
+    if not paths:
+        print("❌ ERROR: indica el backup completo y, después, sus incrementales en orden")
+        return
+
+    print(f"🔗 Conectando a MongoDB: {db_name}")
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+
+    handles = [open(path, "rb") for path in paths]
+    try:
+        result = await restore_backup(db, [_file_records(handle) for handle in handles])
+    except ValueError as e:
+        print(f"❌ Backup rechazado, no se modificó nada: {e}")
+        client.close()
+        return
+    finally:
+        for handle in handles:
+            handle.close()
+
+    for backup in result["backups"]:
+        print(f"📦 {backup['kind']}: {backup['backup_id'] or 'sin id'} (hasta {backup['until'] or 'desconocido'})")
+    for restored in result["restored"]:
+        print(f"✅ {restored['collection']}: {restored['documents']} documentos")
+    if result["skipped"]:
+        print(f"ℹ️ Colecciones ignoradas: {', '.join(result['skipped'])}")
+
+    await rebuild_derived_data(db, result["restored"])
+    print(f"\n🎉 Restauración completada: {result['documents']} documentos en {result['seconds']} s ({result['docs_per_second']} docs/s)")
+
+    client.close()
+
+if __name__ == "__main__":
+    print("🚀 Restaurando backup...\n")
+    asyncio.run(restore_files(sys.argv[1:]))
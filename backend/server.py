@@ -1,14 +1,17 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Response
 from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from pathlib import Path
 import os
+import asyncio
 import logging
-import io
+import re
 import uuid
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime, timezone, timedelta
+from pymongo import DeleteOne, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 
 # Import local modules
 from models import (
@@ -35,7 +38,44 @@ from auth import (
     verify_password, get_password_hash, create_access_token,
     get_current_user, require_admin
 )
-from database import Database, serialize_doc, serialize_docs, prepare_doc_for_insert, restore_datetimes
+from database import Database, prepare_doc_for_insert, bson_dates, date_range_query
+from doc_codec import codec_for
+from reference_cache import (
+    reference_cache, get_villa as get_cached_villa, get_active_categories, get_invoice_template as get_cached_invoice_template,
+    get_quotation_terms as get_cached_quotation_terms, get_logo as get_cached_logo, find_page_cached,
+    VILLAS, CATEGORIES, EXPENSE_CATEGORIES, EXTRA_SERVICES, INVOICE_TEMPLATES, QUOTATION_TERMS, LOGO_CONFIG,
+    REFERENCE_NAMESPACES
+)
+from cache_invalidation import invalidate_reference_data, invalidation_listener
+from indexes import ensure_indexes, get_index_usage_stats
+from dashboard_stats import (
+    compute_live_totals, compute_reservation_list_totals, compute_expense_month_groups, REQUIRED_RESERVATION_FIELDS
+)
+from stats_counters import (
+    track_reservation_change, track_expense_change, track_expenses_removed, track_expenses_added, track_expense_changes,
+    get_stats_counters, rebuild_stats_counters, check_stats_drift, apply_stats_delta, STATS_DELTA
+)
+from pagination import (
+    with_cursor, clamp_limit, set_page_headers, find_page, page_response, PAGINATION_HEADERS
+)
+from payment_status import (
+    recompute_reservation_payment_status,
+    recompute_expense_payment_status,
+    recompute_all_payment_status
+)
+from transactions import run_in_transaction, transactions_supported
+from change_tracking import stamped, touch, record_deletions, delete_one_tracked, delete_many_tracked
+from supplier_expenses import supplier_lines, new_supplier_expense, diff_supplier_expenses, keep_expenses_with_abonos
+from money_counters import (
+    apply_reservation_payment, reservation_after_payment, update_reservation_fields, reservation_after_update,
+    apply_owner_payment, owner_debt_pipeline, set_owner_total_owed,
+    new_expense_balance, apply_expense_payment, expense_update_pipeline, repair_expense_balances, ensure_expense_balances
+)
+from outbox import enqueue, outbox_worker, outbox_status, retry_event, OUTBOX_COLLECTION
+from invoice_registry import (
+    register_invoice_number, release_invoice_number, release_invoice_numbers_for_parent,
+    get_invoice_number_entry, ensure_invoice_registry, OWNER_COLLECTIONS
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -58,73 +98,77 @@ logger = logging.getLogger(__name__)
 
 # ============ HELPER FUNCTIONS ============
 
-async def get_next_invoice_number() -> int:
-    """Get next available invoice number starting from 1600 - skips manually created numbers"""
-    counter = await db.invoice_counter.find_one({"counter_id": "main_counter"})
-    
-    if not counter:
-        # Initialize counter
-        counter_doc = {"counter_id": "main_counter", "current_number": 1600}
-        await db.invoice_counter.insert_one(counter_doc)
-        invoice_num = 1600
-    else:
-        invoice_num = counter["current_number"]
-    
-    # Verificar si el número ya existe en reservations o abonos (por factura manual de admin)
-    # Si existe, buscar el siguiente número disponible
+INVOICE_NUMBER_START = 1600
+
+async def get_next_invoice_number(owner_type: str, owner_id: str, parent_id: Optional[str] = None) -> int:
+    """Atomically allocate the next invoice number starting from 1600 and register it for its owner - skips manually created numbers"""
+    # Si el número ya fue usado por una factura manual de admin, se descarta y se pide el siguiente
     max_attempts = 100  # Evitar bucle infinito
-    attempts = 0
     
-    while attempts < max_attempts:
-        invoice_str = str(invoice_num)
-        
-        # Verificar en reservations
-        existing_reservation = await db.reservations.find_one({"invoice_number": invoice_str}, {"_id": 0})
-        
-        # Verificar en abonos de reservaciones
-        existing_res_abono = await db.reservation_abonos.find_one({"invoice_number": invoice_str}, {"_id": 0})
-        
-        # Verificar en abonos de gastos
-        existing_exp_abono = await db.expense_abonos.find_one({"invoice_number": invoice_str}, {"_id": 0})
+    for _ in range(max_attempts):
+        # $inc atómico en un solo round trip: dos peticiones concurrentes nunca reciben el mismo número
+        counter = await db.invoice_counter.find_one_and_update(
+            {"counter_id": "main_counter"},
+            [{"$set": {"current_number": {"$add": [{"$ifNull": ["$current_number", INVOICE_NUMBER_START]}, 1]}}}],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        invoice_num = counter["current_number"] - 1
         
-        if not existing_reservation and not existing_res_abono and not existing_exp_abono:
-            # Número disponible encontrado
-            break
-        # Número ya existe, probar el siguiente
-        invoice_num += 1
-        attempts += 1
-    
-    # Actualizar contador al siguiente número después del encontrado
-    await db.invoice_counter.update_one(
-        {"counter_id": "main_counter"},
-        {"$set": {"current_number": invoice_num + 1}}
-    )
+        # El registro tiene índice único: si el número ya fue tomado, el insert falla y se prueba el siguiente
+        if await register_invoice_number(db, str(invoice_num), owner_type, owner_id, parent_id):
+            return invoice_num
     
-    return invoice_num
+    raise HTTPException(status_code=500, detail="No se pudo asignar un número de factura disponible")
 
 def calculate_balance(total: float, paid: float, deposit: float = 0) -> float:
     """Calculate balance due - includes deposit in calculation"""
     return max(0, total + deposit - paid)
 
-async def validate_invoice_number_available(invoice_num: str) -> bool:
-    """Check if an invoice number is available (not used in reservations or abonos)"""
-    # Verificar en reservations
-    existing_reservation = await db.reservations.find_one({"invoice_number": invoice_num}, {"_id": 0})
-    if existing_reservation:
-        return False
-    
-    # Verificar en abonos de reservaciones
-    existing_res_abono = await db.reservation_abonos.find_one({"invoice_number": invoice_num}, {"_id": 0})
-    if existing_res_abono:
-        return False
-    
-    # Verificar en abonos de gastos
-    existing_exp_abono = await db.expense_abonos.find_one({"invoice_number": invoice_num}, {"_id": 0})
-    if existing_exp_abono:
-        return False
+async def attach_customer_identification(reservations: List[dict]) -> List[dict]:
+    """Add customer_identification_document to each reservation using a single $in query"""
+    customer_ids = list({r["customer_id"] for r in reservations if r.get("customer_id")})
+    if not customer_ids:
+        return reservations
+    
+    customers = await db.customers.find(
+        {"id": {"$in": customer_ids}},
+        {"_id": 0, "id": 1, "identification_document": 1, "dni": 1}
+    ).to_list(None)
+    identification_by_customer = {
+        c["id"]: c.get("identification_document") or c.get("dni") for c in customers
+    }
     
-    return True
-
+    for r in reservations:
+        if r.get("customer_id") in identification_by_customer:
+            r["customer_identification_document"] = identification_by_customer[r["customer_id"]]
+    
+    return reservations
+
+async def load_expenses(query: dict, include_abonos: bool = False, limit: int = 1000) -> List[dict]:
+    """
+    Load expenses newest first; total_paid/balance_due are stored on each expense.
+    Only when include_abonos is set are the abonos joined in (a single aggregation)
+    """
+    if not include_abonos:
+        return await db.expenses.find(query, {"_id": 0}).sort([("expense_date", -1), ("id", -1)]).limit(limit).to_list(limit)
+    pipeline = [
+        {"$match": query},
+        {"$sort": {"expense_date": -1, "id": -1}},
+        {"$limit": limit},
+        {"$lookup": {
+            "from": "expense_abonos",
+            "let": {"expense_id": "$id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$expense_id", "$$expense_id"]}}},
+                {"$sort": {"payment_date": -1}},
+                {"$project": {"_id": 0, "id": 1, "amount": 1, "invoice_number": 1, "payment_date": 1}}
+            ],
+            "as": "abonos"
+        }},
+        {"$project": {"_id": 0}}
+    ]
+    return await db.expenses.aggregate(pipeline).to_list(limit)
 
 # ============ AUTH ENDPOINTS ============
 
@@ -160,7 +204,7 @@ async def register(user_data: UserCreate):
     )
     
     doc = prepare_doc_for_insert(user.model_dump())
-    await db.users.insert_one(doc)
+    await db.users.insert_one(stamped(doc))
     
     return UserResponse(**user.model_dump())
 
@@ -236,7 +280,7 @@ async def get_users(current_user: dict = Depends(require_admin)):
         if "is_approved" not in user:
             user["is_approved"] = True
     
-    return [restore_datetimes(u, ["created_at"]) for u in users]
+    return codec_for(UserResponse).json_response(users)
 
 @api_router.get("/users/{user_id}", response_model=UserResponse)
 async def get_user(user_id: str, current_user: dict = Depends(require_admin)):
@@ -251,7 +295,7 @@ async def get_user(user_id: str, current_user: dict = Depends(require_admin)):
     if "is_approved" not in user:
         user["is_approved"] = True
     
-    return restore_datetimes(user, ["created_at"])
+    return codec_for(UserResponse).decode(user)
 
 @api_router.put("/users/{user_id}", response_model=UserResponse)
 async def update_user(
@@ -290,11 +334,11 @@ async def update_user(
     
     await db.users.update_one(
         {"id": user_id},
-        {"$set": update_data}
+        touch({"$set": update_data})
     )
     
     updated_user = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
-    return restore_datetimes(updated_user, ["created_at"])
+    return codec_for(UserResponse).decode(updated_user)
 
 @api_router.delete("/users/{user_id}")
 async def delete_user(user_id: str, current_user: dict = Depends(require_admin)):
@@ -303,8 +347,8 @@ async def delete_user(user_id: str, current_user: dict = Depends(require_admin))
     if user_id == current_user["id"]:
         raise HTTPException(status_code=400, detail="Cannot delete your own account")
     
-    result = await db.users.delete_one({"id": user_id})
-    if result.deleted_count == 0:
+    deleted = await delete_one_tracked(db, "users", {"id": user_id})
+    if not deleted:
         raise HTTPException(status_code=404, detail="User not found")
     return {"message": "User deleted successfully"}
 
@@ -321,7 +365,7 @@ async def toggle_user_status(user_id: str, current_user: dict = Depends(require_
     new_status = not user.get("is_active", True)
     await db.users.update_one(
         {"id": user_id},
-        {"$set": {"is_active": new_status}}
+        touch({"$set": {"is_active": new_status}})
     )
     
     return {"message": f"User {'activated' if new_status else 'deactivated'} successfully", "is_active": new_status}
@@ -330,7 +374,7 @@ async def toggle_user_status(user_id: str, current_user: dict = Depends(require_
 async def get_pending_users(current_user: dict = Depends(require_admin)):
     """Get all pending approval users (admin only)"""
     users = await db.users.find({"is_approved": False}, {"_id": 0, "password_hash": 0}).to_list(1000)
-    return [restore_datetimes(u, ["created_at"]) for u in users]
+    return codec_for(UserResponse).json_response(users)
 
 @api_router.patch("/users/{user_id}/approve")
 async def approve_user(user_id: str, current_user: dict = Depends(require_admin)):
@@ -344,7 +388,7 @@ async def approve_user(user_id: str, current_user: dict = Depends(require_admin)
     
     await db.users.update_one(
         {"id": user_id},
-        {"$set": {"is_approved": True}}
+        touch({"$set": {"is_approved": True}})
     )
     
     return {"message": "User approved successfully", "is_approved": True}
@@ -352,8 +396,8 @@ async def approve_user(user_id: str, current_user: dict = Depends(require_admin)
 @api_router.patch("/users/{user_id}/reject")
 async def reject_user(user_id: str, current_user: dict = Depends(require_admin)):
     """Reject a pending user (delete account) (admin only)"""
-    result = await db.users.delete_one({"id": user_id})
-    if result.deleted_count == 0:
+    deleted = await delete_one_tracked(db, "users", {"id": user_id})
+    if not deleted:
         raise HTTPException(status_code=404, detail="User not found")
     return {"message": "User rejected and deleted successfully"}
 
@@ -442,7 +486,7 @@ async def reset_invoice_counter(
 @api_router.get("/config/invoice-template", response_model=InvoiceTemplate)
 async def get_invoice_template(current_user: dict = Depends(require_admin)):
     """Get invoice template configuration (admin only)"""
-    template = await db.invoice_templates.find_one({"template_id": "main_template"}, {"_id": 0})
+    template = await get_cached_invoice_template(db)
     
     if not template:
         # Create default template
@@ -452,9 +496,10 @@ async def get_invoice_template(current_user: dict = Depends(require_admin)):
         )
         doc = prepare_doc_for_insert(default_template.model_dump())
         await db.invoice_templates.insert_one(doc)
+        await invalidate_reference_data(db, INVOICE_TEMPLATES)
         return default_template
     
-    return restore_datetimes(template, ["created_at", "updated_at"])
+    return codec_for(InvoiceTemplate).decode(template)
 
 @api_router.put("/config/invoice-template", response_model=InvoiceTemplate)
 async def update_invoice_template(
@@ -477,6 +522,7 @@ async def update_invoice_template(
         )
         doc = prepare_doc_for_insert(new_template.model_dump())
         await db.invoice_templates.insert_one(doc)
+        await invalidate_reference_data(db, INVOICE_TEMPLATES)
         return new_template
     else:
         # Update existing template
@@ -484,9 +530,10 @@ async def update_invoice_template(
             {"template_id": "main_template"},
             {"$set": update_dict}
         )
+        await invalidate_reference_data(db, INVOICE_TEMPLATES)
         
         updated_template = await db.invoice_templates.find_one({"template_id": "main_template"}, {"_id": 0})
-        return restore_datetimes(updated_template, ["created_at", "updated_at"])
+        return codec_for(InvoiceTemplate).decode(updated_template)
 
 @api_router.post("/config/invoice-template/reset")
 async def reset_invoice_template(current_user: dict = Depends(require_admin)):
@@ -503,6 +550,7 @@ async def reset_invoice_template(current_user: dict = Depends(require_admin)):
         {"$set": doc},
         upsert=True
     )
+    await invalidate_reference_data(db, INVOICE_TEMPLATES)
     
     return {"message": "Plantilla reseteada a valores por defecto", "template": default_template}
 
@@ -512,7 +560,7 @@ async def reset_invoice_template(current_user: dict = Depends(require_admin)):
 @api_router.get("/config/quotation-terms", response_model=QuotationTerms)
 async def get_quotation_terms(current_user: dict = Depends(get_current_user)):
     """Get quotation terms and conditions"""
-    terms = await db.quotation_terms.find_one({"terms_id": "main_quotation_terms"}, {"_id": 0})
+    terms = await get_cached_quotation_terms(db)
     
     if not terms:
         # Return default terms
@@ -522,7 +570,7 @@ async def get_quotation_terms(current_user: dict = Depends(get_current_user)):
         )
         return default_terms
     
-    return restore_datetimes(terms, ["created_at", "updated_at"])
+    return codec_for(QuotationTerms).decode(terms)
 
 @api_router.put("/config/quotation-terms", response_model=QuotationTerms)
 async def update_quotation_terms(
@@ -546,6 +594,7 @@ async def update_quotation_terms(
         )
         doc = prepare_doc_for_insert(new_terms.model_dump())
         await db.quotation_terms.insert_one(doc)
+        await invalidate_reference_data(db, QUOTATION_TERMS)
         return new_terms
     else:
         # Update existing terms
@@ -553,16 +602,17 @@ async def update_quotation_terms(
             {"terms_id": "main_quotation_terms"},
             {"$set": update_dict}
         )
+        await invalidate_reference_data(db, QUOTATION_TERMS)
         
         updated_terms = await db.quotation_terms.find_one({"terms_id": "main_quotation_terms"}, {"_id": 0})
-        return restore_datetimes(updated_terms, ["created_at", "updated_at"])
+        return codec_for(QuotationTerms).decode(updated_terms)
 
 # ============ LOGO ENDPOINTS (ADMIN ONLY) ============
 
 @api_router.get("/config/logo")
 async def get_logo(current_user: dict = Depends(get_current_user)):
     """Get current logo (all users can view)"""
-    logo = await db.logo_config.find_one({"config_id": "main_logo"}, {"_id": 0})
+    logo = await get_cached_logo(db)
     
     if not logo:
         return {"logo_data": None, "logo_filename": None}
@@ -596,6 +646,7 @@ async def upload_logo(
         {"$set": doc},
         upsert=True
     )
+    await invalidate_reference_data(db, LOGO_CONFIG)
     
     return {"message": "Logo subido exitosamente", "logo_filename": logo_filename}
 
@@ -603,6 +654,7 @@ async def upload_logo(
 async def delete_logo(current_user: dict = Depends(require_admin)):
     """Delete logo (admin only)"""
     result = await db.logo_config.delete_one({"config_id": "main_logo"})
+    await invalidate_reference_data(db, LOGO_CONFIG)
     
     if result.deleted_count == 0:
         return {"message": "No hay logo para eliminar"}
@@ -616,14 +668,28 @@ async def create_customer(customer_data: CustomerCreate, current_user: dict = De
     """Create a new customer"""
     customer = Customer(**customer_data.model_dump(), created_by=current_user["id"])
     doc = prepare_doc_for_insert(customer.model_dump())
-    await db.customers.insert_one(doc)
+    await db.customers.insert_one(stamped(doc))
     return customer
 
 @api_router.get("/customers", response_model=List[Customer])
-async def get_customers(current_user: dict = Depends(get_current_user)):
-    """Get all customers ordered alphabetically by name"""
-    customers = await db.customers.find({}, {"_id": 0}).sort("name", 1).to_list(1000)
-    return [restore_datetimes(c, ["created_at"]) for c in customers]
+async def get_customers(
+    response: Response,
+    search: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    include_total: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get customers ordered alphabetically by name, optionally searching name/phone/email/document (paginated, see pagination.py)"""
+    query = {}
+    if search:
+        query["$or"] = [
+            {field: {"$regex": search, "$options": "i"}}
+            for field in ("name", "phone", "email", "identification_document")
+        ]
+    customers = await find_page(db.customers, query, response, "name", after=after, limit=limit, fields=fields, include_total=include_total)
+    return page_response(customers, response, fields, codec_for(Customer))
 
 @api_router.get("/customers/{customer_id}", response_model=Customer)
 async def get_customer(customer_id: str, current_user: dict = Depends(get_current_user)):
@@ -631,7 +697,7 @@ async def get_customer(customer_id: str, current_user: dict = Depends(get_curren
     customer = await db.customers.find_one({"id": customer_id}, {"_id": 0})
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
-    return restore_datetimes(customer, ["created_at"])
+    return codec_for(Customer).decode(customer)
 
 @api_router.put("/customers/{customer_id}", response_model=Customer)
 async def update_customer(customer_id: str, customer_data: CustomerCreate, current_user: dict = Depends(get_current_user)):
@@ -649,17 +715,17 @@ async def update_customer(customer_id: str, customer_data: CustomerCreate, curre
         if isinstance(value, datetime):
             update_dict[key] = value.isoformat()
     
-    await db.customers.update_one({"id": customer_id}, {"$set": update_dict})
+    await db.customers.update_one({"id": customer_id}, touch({"$set": update_dict}))
     
     # Devolver el cliente actualizado
     updated_customer = await db.customers.find_one({"id": customer_id}, {"_id": 0})
-    return restore_datetimes(updated_customer, ["created_at"])
+    return codec_for(Customer).decode(updated_customer)
 
 @api_router.delete("/customers/{customer_id}")
 async def delete_customer(customer_id: str, current_user: dict = Depends(require_admin)):
     """Delete a customer (admin only)"""
-    result = await db.customers.delete_one({"id": customer_id})
-    if result.deleted_count == 0:
+    deleted = await delete_one_tracked(db, "customers", {"id": customer_id})
+    if not deleted:
         raise HTTPException(status_code=404, detail="Customer not found")
     return {"message": "Customer deleted successfully"}
 
@@ -670,16 +736,17 @@ async def create_category(category_data: CategoryCreate, current_user: dict = De
     """Create a new category (admin only)"""
     category = Category(**category_data.model_dump(), created_by=current_user["id"])
     doc = prepare_doc_for_insert(category.model_dump())
-    await db.categories.insert_one(doc)
+    await db.categories.insert_one(stamped(doc))
+    await invalidate_reference_data(db, CATEGORIES)
     return category
 
 @api_router.get("/categories", response_model=List[Category])
 async def get_categories(current_user: dict = Depends(get_current_user)):
     """Get all categories ordered alphabetically"""
-    categories = await db.categories.find({"is_active": True}, {"_id": 0}).to_list(1000)
+    categories = await get_active_categories(db, CATEGORIES)
     # Ordenar alfabéticamente por nombre
-    sorted_categories = sorted([restore_datetimes(c, ["created_at"]) for c in categories], key=lambda x: x.get("name", "").lower())
-    return sorted_categories
+    sorted_categories = sorted(categories, key=lambda x: x.get("name", "").lower())
+    return codec_for(Category).json_response(sorted_categories)
 
 @api_router.get("/categories/{category_id}", response_model=Category)
 async def get_category(category_id: str, current_user: dict = Depends(get_current_user)):
@@ -687,7 +754,7 @@ async def get_category(category_id: str, current_user: dict = Depends(get_curren
     category = await db.categories.find_one({"id": category_id}, {"_id": 0})
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
-    return restore_datetimes(category, ["created_at"])
+    return codec_for(Category).decode(category)
 
 @api_router.put("/categories/{category_id}", response_model=Category)
 async def update_category(category_id: str, update_data: CategoryUpdate, current_user: dict = Depends(require_admin)):
@@ -699,10 +766,11 @@ async def update_category(category_id: str, update_data: CategoryUpdate, current
     update_dict = {k: v for k, v in update_data.model_dump(exclude_unset=True).items() if v is not None}
     
     if update_dict:
-        await db.categories.update_one({"id": category_id}, {"$set": update_dict})
+        await db.categories.update_one({"id": category_id}, touch({"$set": update_dict}))
+        await invalidate_reference_data(db, CATEGORIES)
     
     updated = await db.categories.find_one({"id": category_id}, {"_id": 0})
-    return restore_datetimes(updated, ["created_at"])
+    return codec_for(Category).decode(updated)
 
 @api_router.delete("/categories/{category_id}")
 async def delete_category(category_id: str, current_user: dict = Depends(require_admin)):
@@ -710,11 +778,12 @@ async def delete_category(category_id: str, current_user: dict = Depends(require
     # Remover category_id de todas las villas que la tengan asignada
     await db.villas.update_many(
         {"category_id": category_id},
-        {"$set": {"category_id": None}}
+        touch({"$set": {"category_id": None}})
     )
     
-    result = await db.categories.delete_one({"id": category_id})
-    if result.deleted_count == 0:
+    deleted = await delete_one_tracked(db, "categories", {"id": category_id})
+    await invalidate_reference_data(db, CATEGORIES, VILLAS)
+    if not deleted:
         raise HTTPException(status_code=404, detail="Category not found")
     return {"message": "Category deleted successfully, villas unassigned"}
 
@@ -725,15 +794,16 @@ async def create_expense_category(category_data: ExpenseCategoryCreate, current_
     """Create a new expense category (admin only)"""
     category = ExpenseCategory(**category_data.model_dump(), created_by=current_user["id"])
     doc = prepare_doc_for_insert(category.model_dump())
-    await db.expense_categories.insert_one(doc)
+    await db.expense_categories.insert_one(stamped(doc))
+    await invalidate_reference_data(db, EXPENSE_CATEGORIES)
     return category
 
 @api_router.get("/expense-categories", response_model=List[ExpenseCategory])
 async def get_expense_categories(current_user: dict = Depends(get_current_user)):
     """Get all expense categories ordered alphabetically"""
-    categories = await db.expense_categories.find({"is_active": True}, {"_id": 0}).to_list(1000)
-    sorted_categories = sorted([restore_datetimes(c, ["created_at"]) for c in categories], key=lambda x: x.get("name", "").lower())
-    return sorted_categories
+    categories = await get_active_categories(db, EXPENSE_CATEGORIES)
+    sorted_categories = sorted(categories, key=lambda x: x.get("name", "").lower())
+    return codec_for(ExpenseCategory).json_response(sorted_categories)
 
 @api_router.put("/expense-categories/{category_id}", response_model=ExpenseCategory)
 async def update_expense_category(category_id: str, update_data: ExpenseCategoryUpdate, current_user: dict = Depends(require_admin)):
@@ -745,21 +815,23 @@ async def update_expense_category(category_id: str, update_data: ExpenseCategory
     update_dict = {k: v for k, v in update_data.model_dump(exclude_unset=True).items() if v is not None}
     
     if update_dict:
-        await db.expense_categories.update_one({"id": category_id}, {"$set": update_dict})
+        await db.expense_categories.update_one({"id": category_id}, touch({"$set": update_dict}))
+        await invalidate_reference_data(db, EXPENSE_CATEGORIES)
     
     updated = await db.expense_categories.find_one({"id": category_id}, {"_id": 0})
-    return restore_datetimes(updated, ["created_at"])
+    return codec_for(ExpenseCategory).decode(updated)
 
 @api_router.delete("/expense-categories/{category_id}")
 async def delete_expense_category(category_id: str, current_user: dict = Depends(require_admin)):
     """Delete an expense category (admin only) - expenses quedan sin categoría"""
     await db.expenses.update_many(
         {"expense_category_id": category_id},
-        {"$set": {"expense_category_id": None}}
+        touch({"$set": {"expense_category_id": None}})
     )
     
-    result = await db.expense_categories.delete_one({"id": category_id})
-    if result.deleted_count == 0:
+    deleted = await delete_one_tracked(db, "expense_categories", {"id": category_id})
+    await invalidate_reference_data(db, EXPENSE_CATEGORIES)
+    if not deleted:
         raise HTTPException(status_code=404, detail="Expense category not found")
     return {"message": "Expense category deleted successfully, expenses unassigned"}
 
@@ -775,16 +847,22 @@ async def create_villa(villa_data: VillaCreate, current_user: dict = Depends(get
     
     villa = Villa(**villa_data.model_dump(), created_by=current_user["id"])
     doc = prepare_doc_for_insert(villa.model_dump())
-    await db.villas.insert_one(doc)
+    await db.villas.insert_one(stamped(doc))
+    await invalidate_reference_data(db, VILLAS)
     return villa
 
 @api_router.get("/villas", response_model=List[Villa])
 async def get_villas(
+    response: Response,
     search: Optional[str] = None,
     category_id: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    include_total: bool = False,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all villas with optional search and category filter"""
+    """Get villas ordered by code with optional search and category filter (paginated, see pagination.py)"""
     query = {}
     
     # Filtro por categoría
@@ -798,16 +876,21 @@ async def get_villas(
             {"name": {"$regex": search, "$options": "i"}}
         ]
     
-    villas = await db.villas.find(query, {"_id": 0}).to_list(1000)
-    return [restore_datetimes(v, ["created_at"]) for v in villas]
+    page_args = dict(after=after, limit=limit, fields=fields, include_total=include_total)
+    if search:
+        # Texto libre: cada búsqueda sería una clave distinta en la caché
+        villas = await find_page(db.villas, query, response, "code", **page_args)
+    else:
+        villas = await find_page_cached(db, VILLAS, query, response, "code", **page_args)
+    return page_response(villas, response, fields, codec_for(Villa))
 
 @api_router.get("/villas/{villa_id}", response_model=Villa)
 async def get_villa(villa_id: str, current_user: dict = Depends(get_current_user)):
     """Get a villa by ID"""
-    villa = await db.villas.find_one({"id": villa_id}, {"_id": 0})
+    villa = await get_cached_villa(db, villa_id)
     if not villa:
         raise HTTPException(status_code=404, detail="Villa not found")
-    return restore_datetimes(villa, ["created_at"])
+    return codec_for(Villa).decode(villa)
 
 @api_router.put("/villas/{villa_id}", response_model=Villa)
 async def update_villa(villa_id: str, villa_data: VillaCreate, current_user: dict = Depends(get_current_user)):
@@ -817,16 +900,18 @@ async def update_villa(villa_id: str, villa_data: VillaCreate, current_user: dic
         raise HTTPException(status_code=404, detail="Villa not found")
     
     update_dict = villa_data.model_dump()
-    await db.villas.update_one({"id": villa_id}, {"$set": update_dict})
+    await db.villas.update_one({"id": villa_id}, touch({"$set": update_dict}))
+    await invalidate_reference_data(db, VILLAS)
     
     updated = await db.villas.find_one({"id": villa_id}, {"_id": 0})
-    return restore_datetimes(updated, ["created_at"])
+    return codec_for(Villa).decode(updated)
 
 @api_router.delete("/villas/{villa_id}")
 async def delete_villa(villa_id: str, current_user: dict = Depends(require_admin)):
     """Delete a villa (admin only)"""
-    result = await db.villas.delete_one({"id": villa_id})
-    if result.deleted_count == 0:
+    deleted = await delete_one_tracked(db, "villas", {"id": villa_id})
+    await invalidate_reference_data(db, VILLAS)
+    if not deleted:
         raise HTTPException(status_code=404, detail="Villa not found")
     return {"message": "Villa deleted successfully"}
 
@@ -838,7 +923,7 @@ async def calculate_villa_price(
     current_user: dict = Depends(get_current_user)
 ):
     """Calculate suggested price based on number of people"""
-    villa = await db.villas.find_one({"id": villa_id}, {"_id": 0})
+    villa = await get_cached_villa(db, villa_id)
     if not villa:
         raise HTTPException(status_code=404, detail="Villa not found")
     
@@ -882,14 +967,22 @@ async def create_extra_service(service_data: ExtraServiceCreate, current_user: d
     """Create a new extra service"""
     service = ExtraService(**service_data.model_dump(), created_by=current_user["id"])
     doc = prepare_doc_for_insert(service.model_dump())
-    await db.extra_services.insert_one(doc)
+    await db.extra_services.insert_one(stamped(doc))
+    await invalidate_reference_data(db, EXTRA_SERVICES)
     return service
 
 @api_router.get("/extra-services", response_model=List[ExtraService])
-async def get_extra_services(current_user: dict = Depends(get_current_user)):
-    """Get all extra services"""
-    services = await db.extra_services.find({}, {"_id": 0}).to_list(1000)
-    return [restore_datetimes(s, ["created_at"]) for s in services]
+async def get_extra_services(
+    response: Response,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    include_total: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get extra services ordered by name (paginated, see pagination.py)"""
+    services = await find_page_cached(db, EXTRA_SERVICES, {}, response, "name", after=after, limit=limit, fields=fields, include_total=include_total)
+    return page_response(services, response, fields, codec_for(ExtraService))
 
 @api_router.put("/extra-services/{service_id}", response_model=ExtraService)
 async def update_extra_service(service_id: str, service_data: ExtraServiceCreate, current_user: dict = Depends(get_current_user)):
@@ -899,59 +992,50 @@ async def update_extra_service(service_id: str, service_data: ExtraServiceCreate
         raise HTTPException(status_code=404, detail="Service not found")
     
     update_dict = service_data.model_dump()
-    await db.extra_services.update_one({"id": service_id}, {"$set": update_dict})
+    await db.extra_services.update_one({"id": service_id}, touch({"$set": update_dict}))
+    await invalidate_reference_data(db, EXTRA_SERVICES)
     
     updated = await db.extra_services.find_one({"id": service_id}, {"_id": 0})
-    return restore_datetimes(updated, ["created_at"])
+    return codec_for(ExtraService).decode(updated)
 
 @api_router.delete("/extra-services/{service_id}")
 async def delete_extra_service(service_id: str, current_user: dict = Depends(require_admin)):
     """Delete an extra service (admin only)"""
-    result = await db.extra_services.delete_one({"id": service_id})
-    if result.deleted_count == 0:
+    deleted = await delete_one_tracked(db, "extra_services", {"id": service_id})
+    await invalidate_reference_data(db, EXTRA_SERVICES)
+    if not deleted:
         raise HTTPException(status_code=404, detail="Service not found")
     return {"message": "Service deleted successfully"}
 
 # ============ RESERVATION ENDPOINTS ============
 
-@api_router.post("/reservations", response_model=Reservation)
-async def create_reservation(reservation_data: ReservationCreate, current_user: dict = Depends(get_current_user)):
-    """Create a new reservation"""
-    # Si el usuario es admin y proporciona un invoice_number, usarlo
-    # De lo contrario, obtener el siguiente número disponible
-    if hasattr(reservation_data, 'invoice_number') and reservation_data.invoice_number is not None and current_user.get("role") == "admin":
-        # Admin proporcionó un número manual - convertir a string
-        invoice_number = str(reservation_data.invoice_number)
-        
-        # Verificar si ya existe
-        existing = await db.reservations.find_one({"invoice_number": invoice_number}, {"_id": 0})
-        if existing:
-            raise HTTPException(status_code=400, detail=f"El número de factura {invoice_number} ya existe")
-    else:
-        # Obtener siguiente número automático disponible
-        invoice_number_int = await get_next_invoice_number()
-        invoice_number = str(invoice_number_int)
-    
-    # Calculate balance: Total + Depósito - Pagado
-    balance_due = calculate_balance(
-        reservation_data.total_amount, 
-        reservation_data.amount_paid,
-        reservation_data.deposit
-    )
-    
-    reservation = Reservation(
-        **reservation_data.model_dump(exclude={'invoice_number'}),
-        invoice_number=invoice_number,
-        balance_due=balance_due,
-        created_by=current_user["id"]
-    )
-    
-    doc = prepare_doc_for_insert(reservation.model_dump())
-    await db.reservations.insert_one(doc)
-    
+def reservation_services_details(extra_services) -> List[dict]:
+    """Detalle de cada servicio adicional (se guarda en el gasto para mostrarlo en el modal)"""
+    return [
+        {
+            "service_name": svc.service_name if hasattr(svc, 'service_name') else 'N/A',
+            "supplier_name": svc.supplier_name if hasattr(svc, 'supplier_name') else 'N/A',
+            "quantity": svc.quantity if hasattr(svc, 'quantity') else 1,
+            "unit_price": svc.unit_price if hasattr(svc, 'unit_price') else 0,
+            "supplier_cost": svc.supplier_cost if hasattr(svc, 'supplier_cost') else 0,
+            "total": svc.total if hasattr(svc, 'total') else 0
+        }
+        for svc in extra_services or []
+    ]
+
+def build_reservation_expenses(
+    reservation_data: ReservationCreate, reservation_id: str, invoice_number: str, villa: Optional[dict], user_id: str
+) -> List[dict]:
+    """
+    Gastos automáticos de una reservación nueva, armados en memoria para insertarlos de una vez:
+    pago al propietario (con villa) o gasto contenedor (Solo Servicios) y un gasto por suplidor
+    """
+    expenses = []
+    now = datetime.now(timezone.utc)
+    services_details = reservation_services_details(reservation_data.extra_services)
+
     # AUTO-CREAR GASTO PARA PAGO AL PROPIETARIO (SIEMPRE, incluso si owner_price es 0)
     if reservation_data.villa_id:
-        villa = await db.villas.find_one({"id": reservation_data.villa_id}, {"_id": 0})
         if villa:
             # Calcular detalles del gasto
             details = []
@@ -969,20 +1053,9 @@ async def create_reservation(reservation_data: ReservationCreate, current_user:
             itbis_note = "Con ITBIS" if reservation_data.include_itbis else "Sin ITBIS"
             details.append(itbis_note)
             
-            # Indicar si tiene servicios adicionales y guardar detalles
-            services_details = []
-            if reservation_data.extra_services and len(reservation_data.extra_services) > 0:
-                details.append(f"Incluye {len(reservation_data.extra_services)} servicio(s) adicional(es)")
-                # Guardar detalles de cada servicio para mostrarlos en el modal
-                for svc in reservation_data.extra_services:
-                    services_details.append({
-                        "service_name": svc.service_name if hasattr(svc, 'service_name') else 'N/A',
-                        "supplier_name": svc.supplier_name if hasattr(svc, 'supplier_name') else 'N/A',
-                        "quantity": svc.quantity if hasattr(svc, 'quantity') else 1,
-                        "unit_price": svc.unit_price if hasattr(svc, 'unit_price') else 0,
-                        "supplier_cost": svc.supplier_cost if hasattr(svc, 'supplier_cost') else 0,
-                        "total": svc.total if hasattr(svc, 'total') else 0
-                    })
+            # Indicar si tiene servicios adicionales
+            if services_details:
+                details.append(f"Incluye {len(services_details)} servicio(s) adicional(es)")
             
             # Crear descripción detallada
             description = f"Pago propietario villa {villa['code']} - Factura #{invoice_number}"
@@ -1000,52 +1073,28 @@ async def create_reservation(reservation_data: ReservationCreate, current_user:
                 for svc in services_details:
                     notes_parts.append(f"\n- {svc['service_name']} (Suplidor: {svc['supplier_name']}) x{svc['quantity']} = RD$ {svc['total']:.2f}")
             
-            
-            # Crear gasto automático para el pago al propietario
-            from models import Expense
-            
-            expense = {
+            expenses.append({
                 "id": str(uuid.uuid4()),
                 "category": "pago_propietario",
                 "category_id": None,
                 "description": description,
                 "amount": total_owner_payment,
                 "currency": reservation_data.currency,
-                "expense_date": reservation_data.reservation_date if isinstance(reservation_data.reservation_date, str) else reservation_data.reservation_date.isoformat(),
+                "expense_date": reservation_data.reservation_date,
                 "payment_status": "pending",
                 "notes": ''.join(notes_parts),
-                "related_reservation_id": reservation.id,
-                "services_details": services_details if services_details else None,  # Nuevo campo
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "created_by": current_user["id"]
-            }
-            
-            await db.expenses.insert_one(expense)
+                "related_reservation_id": reservation_id,
+                "services_details": services_details if services_details else None,
+                "created_at": now,
+                "created_by": user_id
+            })
     
     # AUTO-CREAR GASTO CONTENEDOR PARA "SOLO SERVICIOS" (cuando NO hay villa)
     # Esto permite que los gastos de suplidores se vean en la vista principal
-    elif not reservation_data.villa_id and reservation_data.extra_services:
-        # Es una factura "Solo Servicios"
-        # Calcular total de servicios adicionales
-        total_services_cost = 0
-        services_details = []
-        
-        for svc in reservation_data.extra_services:
-            supplier_cost = svc.supplier_cost if hasattr(svc, 'supplier_cost') else 0
-            quantity = svc.quantity if hasattr(svc, 'quantity') else 1
-            total = supplier_cost * quantity
-            total_services_cost += total
-            
-            services_details.append({
-                "service_name": svc.service_name if hasattr(svc, 'service_name') else 'N/A',
-                "supplier_name": svc.supplier_name if hasattr(svc, 'supplier_name') else 'N/A',
-                "quantity": quantity,
-                "unit_price": svc.unit_price if hasattr(svc, 'unit_price') else 0,
-                "supplier_cost": supplier_cost,
-                "total": svc.total if hasattr(svc, 'total') else 0
-            })
+    elif services_details:
+        # Calcular total de servicios adicionales (costo de suplidor x cantidad)
+        total_services_cost = sum(svc['supplier_cost'] * svc['quantity'] for svc in services_details)
         
-        # Crear gasto contenedor
         description = f"Servicios - Factura #{invoice_number}"
         notes_parts = [
             f"Auto-generado. Cliente: {reservation_data.customer_name}.",
@@ -1056,147 +1105,305 @@ async def create_reservation(reservation_data: ReservationCreate, current_user:
         for svc in services_details:
             notes_parts.append(f"\n- {svc['service_name']} (Suplidor: {svc['supplier_name']}) x{svc['quantity']} = RD$ {svc['supplier_cost'] * svc['quantity']:.2f}")
         
-        from models import Expense
-        
-        expense = {
+        expenses.append({
             "id": str(uuid.uuid4()),
             "category": "pago_servicios",  # Nueva categoría para Solo Servicios
             "category_id": None,
             "description": description,
             "amount": total_services_cost,
             "currency": reservation_data.currency,
-            "expense_date": reservation_data.reservation_date if isinstance(reservation_data.reservation_date, str) else reservation_data.reservation_date.isoformat(),
+            "expense_date": reservation_data.reservation_date,
             "payment_status": "pending",
             "notes": ''.join(notes_parts),
-            "related_reservation_id": reservation.id,
-            "services_details": services_details if services_details else None,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "created_by": current_user["id"]
-        }
-        
-        await db.expenses.insert_one(expense)
+            "related_reservation_id": reservation_id,
+            "services_details": services_details,
+            "created_at": now,
+            "created_by": user_id
+        })
     
     # AUTO-CREAR GASTOS PARA SUPLIDORES DE SERVICIOS ADICIONALES
     # Estos gastos se crean pero NO se muestran en la lista principal
     # Solo se verán cuando se haga clic en el gasto del propietario
-    if reservation_data.extra_services:
-        for service in reservation_data.extra_services:
-            supplier_name = service.supplier_name if hasattr(service, 'supplier_name') else None
-            supplier_cost = service.supplier_cost if hasattr(service, 'supplier_cost') else 0
-            service_name = service.service_name if hasattr(service, 'service_name') else 'N/A'
-            quantity = service.quantity if hasattr(service, 'quantity') else 1
-            
-            if supplier_name and supplier_cost > 0:
-                supplier_total = supplier_cost * quantity
-                
-                supplier_expense = {
-                    "id": str(uuid.uuid4()),
-                    "category": "pago_suplidor",
-                    "category_id": None,
-                    "description": f"Pago suplidor: {supplier_name} - {service_name} - Factura #{invoice_number}",
-                    "amount": supplier_total,
-                    "currency": reservation_data.currency,
-                    "expense_date": reservation_data.reservation_date if isinstance(reservation_data.reservation_date, str) else reservation_data.reservation_date.isoformat(),
-                    "payment_status": "pending",
-                    "notes": f"Auto-generado. Cliente: {reservation_data.customer_name}. Cantidad: {quantity}",
-                    "related_reservation_id": reservation.id,
-                    "parent_expense_id": None,  # Se llenará después
-                    "created_at": datetime.now(timezone.utc).isoformat(),
-                    "created_by": current_user["id"]
-                }
-                
-                await db.expenses.insert_one(supplier_expense)
-    
-    # Si hay owner_price > 0, crear/actualizar deuda al propietario de la villa
-    if reservation_data.owner_price > 0 and reservation_data.villa_id:
-        villa = await db.villas.find_one({"id": reservation_data.villa_id}, {"_id": 0})
-        if villa:
-            # Buscar si ya existe un registro del propietario
-            owner_name = f"Propietario {villa['code']}"
-            owner = await db.villa_owners.find_one({"name": owner_name}, {"_id": 0})
-            
-            if not owner:
-                # Crear nuevo propietario
-                from models import VillaOwner
-                owner = {
-                    "id": str(uuid.uuid4()),
-                    "name": owner_name,
-                    "phone": villa.get("phone", ""),
-                    "email": "",
-                    "villas": [villa["code"]],
-                    "commission_percentage": 0,
-                    "total_owed": reservation_data.owner_price,
-                    "amount_paid": 0,
-                    "balance_due": reservation_data.owner_price,
-                    "notes": f"Auto-generado para {villa['code']}",
-                    "created_at": datetime.now(timezone.utc).isoformat(),
-                    "created_by": current_user["id"]
-                }
-                await db.villa_owners.insert_one(owner)
-            else:
-                # Actualizar deuda existente
-                new_total = owner.get("total_owed", 0) + reservation_data.owner_price
-                new_balance = new_total - owner.get("amount_paid", 0)
-                await db.villa_owners.update_one(
-                    {"id": owner["id"]},
-                    {"$set": {"total_owed": new_total, "balance_due": new_balance}}
-                )
+    # Cada uno queda enlazado a su línea de servicio con service_key
+    reservation = {
+        "id": reservation_id,
+        "invoice_number": invoice_number,
+        "currency": reservation_data.currency,
+        "reservation_date": reservation_data.reservation_date,
+        "customer_name": reservation_data.customer_name,
+    }
+    for key, service in supplier_lines(reservation_data.extra_services):
+        expenses.append(new_supplier_expense(service, key, reservation, user_id))
+    
+    return [bson_dates(new_expense_balance(expense), "expenses") for expense in expenses]
+
+def owner_debt_update(villa: dict, owner_price: float, user_id: str) -> tuple:
+    """
+    (filtro, pipeline) del upsert que crea el propietario de la villa o le suma la deuda:
+    total_owed y balance_due se calculan en MongoDB en vez de leer el registro y escribir los totales
+    """
+    return (
+        {"name": f"Propietario {villa['code']}"},
+        owner_debt_pipeline(owner_price, {
+            "id": str(uuid.uuid4()),
+            "phone": villa.get("phone", ""),
+            "email": "",
+            "villas": [villa["code"]],
+            "commission_percentage": 0,
+            "amount_paid": 0,
+            "notes": f"Auto-generado para {villa['code']}",
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "created_by": user_id
+        })
+    )
+
+def reservation_commission_fields(
+    reservation_data: ReservationCreate, reservation_id: str, invoice_number: str, villa: Optional[dict], current_user: dict
+) -> dict:
+    """Campos de CommissionCreate para la comisión automática del usuario"""
+    return {
+        "reservation_id": reservation_id,
+        "user_id": current_user["id"],
+        "user_name": current_user.get("full_name", current_user.get("username", "Unknown")),
+        "villa_code": villa.get("code", "N/A") if villa else "N/A",
+        "villa_name": villa.get("name", "N/A") if villa else "N/A",
+        "customer_name": reservation_data.customer_name,
+        "reservation_date": reservation_data.reservation_date.isoformat() if isinstance(reservation_data.reservation_date, datetime) else reservation_data.reservation_date,
+        "amount": 250.0,  # Comisión por defecto
+        "notes": f"Comisión por reservación #{invoice_number}"
+    }
+
+# Outbox: efectos de una reservación nueva
+RESERVATION_CREATED = "reservation.created"
+
+async def apply_reservation_created(db, event: dict, session) -> None:
+    """
+    Gastos automáticos, comisión y deuda al propietario de una reservación nueva (handler del outbox)
+    Con transacción se aplica exactamente una vez junto con la marca del evento; sin ella cada
+    paso es idempotente: los documentos se insertan por id con $setOnInsert y la deuda se marca
+    como aplicada en el propio evento
+    """
+    payload = event["payload"]
+    reservation_id = payload["reservation_id"]
+    if not await db.reservations.find_one({"id": reservation_id}, {"_id": 0, "id": 1}, session=session):
+        # Eliminada antes de procesar el evento: no dejar gastos ni comisiones huérfanos
+        logger.info(f"Outbox: reservación {reservation_id} ya no existe, efectos descartados")
+        return
+    
+    expenses = payload.get("expenses") or []
+    if expenses:
+        result = await db.expenses.bulk_write([
+            UpdateOne({"id": expense["id"]}, {"$setOnInsert": stamped(dict(expense))}, upsert=True) for expense in expenses
+        ], session=session)
+        # Solo suman a los contadores los gastos insertados en este intento
+        await track_expenses_added(db, [expenses[index] for index in result.upserted_ids], session=session)
+    
+    if payload.get("commission"):
+        commission = Commission(
+            **CommissionCreate(**payload["commission"]).model_dump(),
+            id=payload["commission_id"],
+            created_by=payload["commission"]["user_id"]
+        )
+        comm_doc = prepare_doc_for_insert(commission.model_dump(), "commissions")
+        await db.commissions.update_one({"id": comm_doc["id"]}, {"$setOnInsert": comm_doc}, upsert=True, session=session)
     
-    # AUTO-CREAR COMISIÓN PARA EL USUARIO
-    try:
-        # Obtener info de la villa
-        villa = await db.villas.find_one({"id": reservation_data.villa_id}, {"_id": 0})
-        villa_code = villa.get("code", "N/A") if villa else "N/A"
-        villa_name = villa.get("name", "N/A") if villa else "N/A"
-        
-        commission_data = CommissionCreate(
-            reservation_id=reservation.id,
-            user_id=current_user["id"],
-            user_name=current_user.get("full_name", current_user.get("username", "Unknown")),
-            villa_code=villa_code,
-            villa_name=villa_name,
-            customer_name=reservation_data.customer_name,
-            reservation_date=reservation_data.reservation_date.isoformat() if isinstance(reservation_data.reservation_date, datetime) else reservation_data.reservation_date,
-            amount=250.0,  # Comisión por defecto
-            notes=f"Comisión por reservación #{invoice_number}"
+    owner_debt = payload.get("owner_debt")
+    if owner_debt and not event.get("owner_debt_applied"):
+        await db.villa_owners.update_one(
+            *owner_debt_update(owner_debt["villa"], owner_debt["amount"], owner_debt["user_id"]), upsert=True, session=session
         )
+        if session is None:
+            # Sin transacción: un reintento no debe volver a sumar la deuda
+            await db[OUTBOX_COLLECTION].update_one({"id": event["id"]}, {"$set": {"owner_debt_applied": True}})
+
+outbox_worker.register(RESERVATION_CREATED, apply_reservation_created)
+# Contadores del dashboard de las escrituras transaccionales (fuera de la transacción de la petición)
+outbox_worker.register(STATS_DELTA, apply_stats_delta)
+
+async def undo_reservation_create(reservation_id: str, written: List[str]) -> None:
+    """
+    Deshace las escrituras de create_reservation que alcanzaron a aplicarse cuando MongoDB
+    no admite transacciones (standalone)
+    """
+    if "outbox" in written:
+        await db[OUTBOX_COLLECTION].delete_one({"idempotency_key": f"{RESERVATION_CREATED}:{reservation_id}"})
+    if "reservation" in written:
+        await delete_one_tracked(db, "reservations", {"id": reservation_id})
+
+@api_router.post("/reservations", response_model=Reservation)
+async def create_reservation(reservation_data: ReservationCreate, current_user: dict = Depends(get_current_user)):
+    """Create a new reservation"""
+    reservation_id = str(uuid.uuid4())
+    
+    # Si el usuario es admin y proporciona un invoice_number, usarlo
+    # De lo contrario, obtener el siguiente número disponible
+    if hasattr(reservation_data, 'invoice_number') and reservation_data.invoice_number is not None and current_user.get("role") == "admin":
+        # Admin proporcionó un número manual - convertir a string
+        invoice_number = str(reservation_data.invoice_number)
         
-        commission = Commission(**commission_data.model_dump(), created_by=current_user["id"])
-        comm_doc = prepare_doc_for_insert(commission.model_dump())
-        await db.commissions.insert_one(comm_doc)
-    except Exception as e:
-        # Si falla la comisión, no fallar la reservación
-        print(f"Error creating commission: {e}")
+        # Reservar el número en el registro (falla si ya existe en reservaciones o abonos)
+        if not await register_invoice_number(db, invoice_number, "reservation", reservation_id):
+            raise HTTPException(status_code=400, detail=f"El número de factura {invoice_number} ya existe")
+    else:
+        # Obtener siguiente número automático disponible
+        invoice_number_int = await get_next_invoice_number("reservation", reservation_id)
+        invoice_number = str(invoice_number_int)
+    
+    # Calculate balance: Total + Depósito - Pagado
+    balance_due = calculate_balance(
+        reservation_data.total_amount, 
+        reservation_data.amount_paid,
+        reservation_data.deposit
+    )
+    
+    reservation = Reservation(
+        **reservation_data.model_dump(exclude={'invoice_number'}),
+        id=reservation_id,
+        invoice_number=invoice_number,
+        balance_due=balance_due,
+        created_by=current_user["id"]
+    )
+    
+    doc = prepare_doc_for_insert(reservation.model_dump(), "reservations")
+    
+    # Prefetch: la villa una sola vez. Los efectos (gastos automáticos, comisión y deuda al
+    # propietario) viajan en un evento del outbox que el worker aplica fuera de la petición
+    villa = await get_cached_villa(db, reservation_data.villa_id) if reservation_data.villa_id else None
+    payload = {
+        "reservation_id": reservation.id,
+        "expenses": build_reservation_expenses(reservation_data, reservation.id, invoice_number, villa, current_user["id"]),
+        "commission_id": str(uuid.uuid4()),
+        "commission": reservation_commission_fields(reservation_data, reservation.id, invoice_number, villa, current_user),
+        # Si hay owner_price > 0, crear/actualizar deuda al propietario de la villa
+        "owner_debt": {
+            "villa": {"code": villa["code"], "phone": villa.get("phone", "")},
+            "amount": reservation_data.owner_price,
+            "user_id": current_user["id"]
+        } if villa and reservation_data.owner_price > 0 else None
+    }
+    
+    # La reservación y su evento en una transacción: o quedan los dos o ninguno
+    written = []
     
+    async def write_reservation(session):
+        written.clear()
+        await db.reservations.insert_one(stamped(doc), session=session)
+        written.append("reservation")
+        await enqueue(db, RESERVATION_CREATED, f"{RESERVATION_CREATED}:{reservation.id}", payload, session=session)
+        written.append("outbox")
+        await track_reservation_change(db, None, doc, session=session)
+    
+    try:
+        await run_in_transaction(db, write_reservation)
+    except Exception as e:
+        if not await transactions_supported(db):
+            await undo_reservation_create(reservation.id, written)
+        await release_invoice_number(db, reservation_id)
+        if isinstance(e, DuplicateKeyError):
+            raise HTTPException(status_code=409, detail=f"El número de factura {invoice_number} ya existe")
+        raise
+    
+    outbox_worker.notify()
     return reservation
 
+def date_bounds(date_from: Optional[str], date_to: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Rango [start, end) en 'YYYY-MM-DD' a partir de date_from/date_to (date_to inclusivo)"""
+    try:
+        start = datetime.fromisoformat(date_from[:10]).strftime("%Y-%m-%d") if date_from else None
+        end = (datetime.fromisoformat(date_to[:10]) + timedelta(days=1)).strftime("%Y-%m-%d") if date_to else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Las fechas deben tener formato YYYY-MM-DD")
+    return start, end
+
+def date_range_filter(field: str, date_from: Optional[str], date_to: Optional[str]) -> Optional[dict]:
+    """
+    Condición de rango sobre un campo de fecha; date_to es inclusivo (día completo)
+    Acepta tanto strings ISO como fechas nativas de BSON (ver migrate_bson_dates.py)
+    """
+    if not date_from and not date_to:
+        return None
+    return date_range_query(field, *date_bounds(date_from, date_to))
+
+def reservation_list_query(
+    status: Optional[str], date_from: Optional[str], date_to: Optional[str], villa_id: Optional[str],
+    customer_id: Optional[str], currency: Optional[str], has_balance_due: Optional[bool],
+    search: Optional[str], ids: Optional[str]
+) -> dict:
+    """Filtro del listado de reservaciones (compartido con sus totales)"""
+    query = {}
+    if status:
+        query["status"] = status
+    if villa_id:
+        query["villa_id"] = villa_id
+    if customer_id:
+        query["customer_id"] = customer_id
+    if currency:
+        query["currency"] = currency
+    if has_balance_due is not None:
+        query["balance_due"] = {"$gt": 0} if has_balance_due else {"$lte": 0}
+    if ids:
+        query["id"] = {"$in": [reservation_id for reservation_id in ids.split(",") if reservation_id]}
+    reservation_date = date_range_filter("reservation_date", date_from, date_to)
+    if reservation_date:
+        query.update(reservation_date)
+    if search:
+        # Mismo texto que buscaba el frontend: cliente, villa o número de factura
+        search_clause = {"$or": [
+            {field: {"$regex": search, "$options": "i"}}
+            for field in ("customer_name", "villa_code", "villa_name", "invoice_number")
+        ]}
+        query = {"$and": [query, search_clause]} if "$or" in query else {**query, **search_clause}
+    return query
+
 @api_router.get("/reservations", response_model=List[Reservation])
 async def get_reservations(
+    response: Response,
     status: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    villa_id: Optional[str] = None,
+    customer_id: Optional[str] = None,
+    currency: Optional[str] = None,
+    has_balance_due: Optional[bool] = None,
+    search: Optional[str] = None,
+    ids: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    include_total: bool = False,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all reservations with customer identification"""
-    query = {}
-    if status:
-        query["status"] = status
-    
-    reservations = await db.reservations.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    datetime_fields = ["reservation_date", "created_at", "updated_at"]
+    """
+    Get reservations (newest first) with customer identification (paginated, see pagination.py)
+    ids= (comma separated) returns only those reservations
+    """
+    query = reservation_list_query(status, date_from, date_to, villa_id, customer_id, currency, has_balance_due, search, ids)
+    
+    reservations = await find_page(
+        db.reservations, query, response, "created_at", descending=True,
+        after=after, limit=limit, fields=fields, include_total=include_total
+    )
     
-    # Enrich with customer identification document
-    enriched_reservations = []
-    for r in reservations:
-        restored = restore_datetimes(r, datetime_fields)
-        
-        # Get customer identification if customer_id exists
-        if r.get("customer_id"):
-            customer = await db.customers.find_one({"id": r["customer_id"]}, {"_id": 0})
-            if customer:
-                restored["customer_identification_document"] = customer.get("identification_document") or customer.get("dni")
-        
-        enriched_reservations.append(restored)
+    # Enrich with customer identification document (one batched query for all customers)
+    await attach_customer_identification(reservations)
     
-    return enriched_reservations
+    return page_response(reservations, response, fields, codec_for(Reservation))
+
+@api_router.get("/reservations/summary")
+async def get_reservations_summary(
+    status: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    villa_id: Optional[str] = None,
+    customer_id: Optional[str] = None,
+    currency: Optional[str] = None,
+    has_balance_due: Optional[bool] = None,
+    search: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Totals of the reservations list (same filters as GET /reservations) for its summary cards"""
+    query = reservation_list_query(status, date_from, date_to, villa_id, customer_id, currency, has_balance_due, search, None)
+    return await compute_reservation_list_totals(db, query)
 
 @api_router.get("/reservations/{reservation_id}", response_model=Reservation)
 async def get_reservation(reservation_id: str, current_user: dict = Depends(get_current_user)):
@@ -1204,7 +1411,7 @@ async def get_reservation(reservation_id: str, current_user: dict = Depends(get_
     reservation = await db.reservations.find_one({"id": reservation_id}, {"_id": 0})
     if not reservation:
         raise HTTPException(status_code=404, detail="Reservation not found")
-    return restore_datetimes(reservation, ["reservation_date", "created_at", "updated_at"])
+    return codec_for(Reservation).decode(reservation)
 
 @api_router.put("/reservations/{reservation_id}", response_model=Reservation)
 async def update_reservation(
@@ -1225,24 +1432,16 @@ async def update_reservation(
         print(f"💰 [UPDATE_RESERVATION] owner_price: {existing.get('owner_price')} → {update_dict['owner_price']}")
     
     if update_dict:
-        # Recalculate balance if amounts changed: Total + Depósito - Pagado
-        total = update_dict.get("total_amount", existing["total_amount"])
-        paid = update_dict.get("amount_paid", existing["amount_paid"])
-        deposit = update_dict.get("deposit", existing.get("deposit", 0))
-        update_dict["balance_due"] = calculate_balance(total, paid, deposit)
-        update_dict["updated_at"] = datetime.now(timezone.utc).isoformat()
+        update_dict["updated_at"] = datetime.now(timezone.utc)
         
-        prepared_update = {}
-        for key, value in update_dict.items():
-            if isinstance(value, datetime):
-                prepared_update[key] = value.isoformat()
-            else:
-                prepared_update[key] = value
+        prepared_update = prepare_doc_for_insert(update_dict, "reservations")
         
-        await db.reservations.update_one(
-            {"id": reservation_id},
-            {"$set": prepared_update}
-        )
+        # balance_due (Total + Depósito - Pagado) se recalcula en el mismo update sobre el amount_paid
+        # actual, y los contadores salen del documento que devolvió ese update (no del leído antes)
+        existing = await update_reservation_fields(db, reservation_id, prepared_update)
+        if not existing:
+            raise HTTPException(status_code=404, detail="Reservation not found")
+        await track_reservation_change(db, existing, reservation_after_update(existing, prepared_update))
         
         # Manejar cambios en deposit_returned
         if "deposit_returned" in update_dict and existing.get("deposit", 0) > 0:
@@ -1261,7 +1460,7 @@ async def update_reservation(
                     print(f"✅ [DEPOSITO] Actualizando gasto de devolución existente: {deposit_expense['id']}")
                     await db.expenses.update_one(
                         {"id": deposit_expense["id"]},
-                        {"$set": {"payment_status": "paid"}}
+                        touch({"$set": {"payment_status": "paid"}})
                     )
                 else:
                     # Crear nuevo gasto de devolución de depósito
@@ -1272,14 +1471,15 @@ async def update_reservation(
                         "amount": existing.get("deposit", 0),
                         "currency": existing.get("currency", "DOP"),
                         "category": "devolucion_deposito",
-                        "expense_date": datetime.now(timezone.utc).isoformat(),
+                        "expense_date": datetime.now(timezone.utc),
                         "payment_status": "paid",
                         "related_reservation_id": reservation_id,
                         "created_by": current_user["id"],
-                        "created_at": datetime.now(timezone.utc).isoformat(),
-                        "updated_at": datetime.now(timezone.utc).isoformat()
+                        "created_at": datetime.now(timezone.utc),
+                        "updated_at": datetime.now(timezone.utc)
                     }
-                    await db.expenses.insert_one(deposit_expense_data)
+                    await db.expenses.insert_one(stamped(new_expense_balance(deposit_expense_data)))
+                    await track_expense_change(db, None, deposit_expense_data)
                     print(f"✅ [DEPOSITO] Gasto de devolución creado")
             else:
                 # DESMARCAR como devuelto
@@ -1295,64 +1495,17 @@ async def update_reservation(
                     print(f"📝 [DEPOSITO] Actualizando gasto de devolución a pending")
                     await db.expenses.update_one(
                         {"id": deposit_expense["id"]},
-                        {"$set": {"payment_status": "pending"}}
+                        touch({"$set": {"payment_status": "pending"}})
                     )
-            
-            # Recalcular estado del gasto propietario después de cambio en depósito
-            owner_expense = await db.expenses.find_one({
-                "related_reservation_id": reservation_id,
-                "category": "pago_propietario"
-            }, {"_id": 0})
-            
-            if owner_expense:
-                print(f"🔍 [DEPOSITO] Verificando estado del gasto del propietario")
-                # Verificar si todos los requisitos están cumplidos
-                owner_abonos = await db.expense_abonos.find({"expense_id": owner_expense["id"]}, {"_id": 0}).to_list(1000)
-                owner_total_paid = sum(a.get("amount", 0) for a in owner_abonos)
-                owner_paid = owner_total_paid >= owner_expense.get("amount", 0)
-                
-                # Verificar suplidores
-                supplier_expenses = await db.expenses.find({
-                    "related_reservation_id": reservation_id,
-                    "category": "pago_suplidor"
-                }, {"_id": 0}).to_list(1000)
-                
-                all_suppliers_paid = True
-                for supplier_expense in supplier_expenses:
-                    supplier_abonos = await db.expense_abonos.find({"expense_id": supplier_expense["id"]}, {"_id": 0}).to_list(1000)
-                    supplier_total_paid = sum(a.get("amount", 0) for a in supplier_abonos)
-                    if supplier_total_paid < supplier_expense.get("amount", 0):
-                        all_suppliers_paid = False
-                        break
-                
-                # Verificar estado ACTUAL del depósito (después del cambio)
-                deposit_expense_check = await db.expenses.find_one({
-                    "related_reservation_id": reservation_id,
-                    "category": "devolucion_deposito",
-                    "payment_status": "paid"
-                }, {"_id": 0})
-                deposit_returned = deposit_expense_check is not None
-                
-                # Actualizar estado del gasto del propietario
-                new_status = "paid" if (owner_paid and all_suppliers_paid and deposit_returned) else "pending"
-                print(f"📌 [DEPOSITO] Propietario: {owner_paid}, Suplidores: {all_suppliers_paid}, Depósito: {deposit_returned} → Estado: {new_status}")
-                
-                await db.expenses.update_one(
-                    {"id": owner_expense["id"]},
-                    {"$set": {"payment_status": new_status}}
-                )
-                print(f"✅ [DEPOSITO] Estado del gasto propietario actualizado a: {new_status}")
         
         # Si se actualizó la fecha de reservación, actualizar también los gastos relacionados
         if "reservation_date" in update_dict:
-            new_date = update_dict["reservation_date"]
-            if isinstance(new_date, datetime):
-                new_date = new_date.isoformat()
+            new_date = prepared_update["reservation_date"]
             
             # Actualizar todos los gastos relacionados con esta reservación
             await db.expenses.update_many(
                 {"related_reservation_id": reservation_id},
-                {"$set": {"expense_date": new_date}}
+                touch({"$set": {"expense_date": new_date}})
             )
         
         # Si cambió owner_price (por horas/personas extras), actualizar gasto propietario
@@ -1373,46 +1526,10 @@ async def update_reservation(
                 # Actualizar el monto del gasto
                 await db.expenses.update_one(
                     {"id": owner_expense["id"]},
-                    {"$set": {"amount": new_amount}}
+                    touch(expense_update_pipeline({"amount": new_amount}))
                 )
+                await track_expense_change(db, owner_expense, {**owner_expense, "amount": new_amount})
                 
-                # Recalcular estado
-                owner_abonos = await db.expense_abonos.find({"expense_id": owner_expense["id"]}, {"_id": 0}).to_list(1000)
-                owner_total_paid = sum(a.get("amount", 0) for a in owner_abonos)
-                owner_paid = owner_total_paid >= new_amount
-                
-                # Verificar suplidores
-                supplier_expenses = await db.expenses.find({
-                    "related_reservation_id": reservation_id,
-                    "category": "pago_suplidor"
-                }, {"_id": 0}).to_list(1000)
-                
-                all_suppliers_paid = True
-                for supplier_expense in supplier_expenses:
-                    supplier_abonos = await db.expense_abonos.find({"expense_id": supplier_expense["id"]}, {"_id": 0}).to_list(1000)
-                    supplier_total_paid = sum(a.get("amount", 0) for a in supplier_abonos)
-                    if supplier_total_paid < supplier_expense.get("amount", 0):
-                        all_suppliers_paid = False
-                        break
-                
-                # Verificar depósito
-                deposit_returned = True
-                if existing.get("deposit", 0) > 0:
-                    deposit_expense = await db.expenses.find_one({
-                        "related_reservation_id": reservation_id,
-                        "category": "devolucion_deposito",
-                        "payment_status": "paid"
-                    }, {"_id": 0})
-                    deposit_returned = deposit_expense is not None
-                
-                # Actualizar estado
-                new_owner_status = "paid" if (owner_paid and all_suppliers_paid and deposit_returned) else "pending"
-                print(f"📌 [UPDATE_RESERVATION] Estado propietario: {new_owner_status} (Owner: {owner_paid}, Supp: {all_suppliers_paid}, Dep: {deposit_returned})")
-                
-                await db.expenses.update_one(
-                    {"id": owner_expense["id"]},
-                    {"$set": {"payment_status": new_owner_status}}
-                )
                 print(f"✅ [UPDATE_RESERVATION] Gasto propietario actualizado")
         
         # Si se agregaron/modificaron servicios extras, procesar gastos de suplidores
@@ -1422,136 +1539,64 @@ async def update_reservation(
             new_services = update_dict.get("extra_services", [])
             old_services = existing.get("extra_services", [])
             
-            # Obtener gastos de suplidores existentes
             existing_supplier_expenses = await db.expenses.find({
                 "related_reservation_id": reservation_id,
                 "category": "pago_suplidor"
             }, {"_id": 0}).to_list(1000)
             
-            # Crear mapa de gastos existentes por supplier_name
-            existing_suppliers_map = {}
-            for exp in existing_supplier_expenses:
-                # Extraer supplier_name del description
-                for service in old_services:
-                    if service.get("supplier_name") and service.get("supplier_name") in exp.get("description", ""):
-                        existing_suppliers_map[service.get("supplier_name")] = exp
-                        break
+            # Diff por service_key (servicio + suplidor + línea): inserts, updates y deletes
+            diff = diff_supplier_expenses(existing_supplier_expenses, old_services, new_services, {
+                "id": reservation_id,
+                "invoice_number": existing.get("invoice_number", reservation_id[-4:]),
+                "currency": existing.get("currency", "DOP"),
+                "reservation_date": existing.get("reservation_date"),
+                "customer_name": existing.get("customer_name"),
+            }, current_user["id"])
+            diff = await keep_expenses_with_abonos(db, diff)
             
-            # Procesar cada servicio nuevo
-            for service in new_services:
-                if service.get("supplier_name"):
-                    supplier_name = service.get("supplier_name")
-                    new_supplier_cost = service.get("supplier_cost", 0) * service.get("quantity", 1)
-                    
-                    # Verificar si ya existe el gasto para este suplidor
-                    if supplier_name in existing_suppliers_map:
-                        # Actualizar el gasto existente si el monto cambió
-                        existing_expense = existing_suppliers_map[supplier_name]
-                        old_amount = existing_expense.get("amount", 0)
-                        
-                        if old_amount != new_supplier_cost:
-                            print(f"📝 [UPDATE_RESERVATION] Actualizando gasto suplidor {supplier_name}: {old_amount} → {new_supplier_cost}")
-                            
-                            await db.expenses.update_one(
-                                {"id": existing_expense["id"]},
-                                {"$set": {
-                                    "amount": new_supplier_cost,
-                                    "updated_at": datetime.now(timezone.utc).isoformat()
-                                }}
-                            )
-                            
-                            # Recalcular estado del gasto suplidor
-                            supplier_abonos = await db.expense_abonos.find({"expense_id": existing_expense["id"]}, {"_id": 0}).to_list(1000)
-                            supplier_total_paid = sum(a.get("amount", 0) for a in supplier_abonos)
-                            supplier_paid = supplier_total_paid >= new_supplier_cost
-                            
-                            new_supplier_status = "paid" if supplier_paid else "pending"
-                            await db.expenses.update_one(
-                                {"id": existing_expense["id"]},
-                                {"$set": {"payment_status": new_supplier_status}}
-                            )
-                            print(f"✅ [UPDATE_RESERVATION] Gasto suplidor actualizado, nuevo estado: {new_supplier_status}")
-                    else:
-                        # Crear nuevo gasto para suplidor
-                        print(f"📝 [UPDATE_RESERVATION] Creando nuevo gasto para suplidor: {supplier_name}")
-                        
-                        supplier_expense = {
-                            "id": str(uuid.uuid4()),
-                            "description": f"Pago suplidor {supplier_name} - {service.get('service_name', 'Servicio')} (Factura #{existing.get('invoice_number', reservation_id[-4:])})",
-                            "amount": new_supplier_cost,
-                            "currency": existing.get("currency", "DOP"),
-                            "category": "pago_suplidor",
-                            "expense_date": existing.get("reservation_date") if isinstance(existing.get("reservation_date"), str) else datetime.now(timezone.utc).isoformat(),
-                            "payment_status": "pending",
-                            "related_reservation_id": reservation_id,
-                            "created_by": current_user["id"],
-                            "created_at": datetime.now(timezone.utc).isoformat(),
-                            "updated_at": datetime.now(timezone.utc).isoformat()
-                        }
-                        
-                        await db.expenses.insert_one(supplier_expense)
-                        print(f"✅ [UPDATE_RESERVATION] Gasto de suplidor creado: {supplier_expense['id']}")
-            
-            # Recalcular estado del gasto propietario
-            owner_expense = await db.expenses.find_one({
-                "related_reservation_id": reservation_id,
-                "category": "pago_propietario"
-            }, {"_id": 0})
+            now = datetime.now(timezone.utc)
+            operations = [InsertOne(stamped(bson_dates(new_expense_balance(expense), "expenses"))) for expense in diff["inserts"]]
+            operations += [
+                UpdateOne({"id": expense["id"]}, expense_update_pipeline({**changes, "updated_at": now}))
+                for expense, changes in diff["updates"]
+            ]
+            operations += [DeleteOne({"id": expense["id"]}) for expense in diff["deletes"]]
             
-            if owner_expense:
-                print(f"🔄 [UPDATE_RESERVATION] Recalculando estado del gasto propietario...")
-                
-                # Verificar si propietario está pagado
-                owner_abonos = await db.expense_abonos.find({"expense_id": owner_expense["id"]}, {"_id": 0}).to_list(1000)
-                owner_total_paid = sum(a.get("amount", 0) for a in owner_abonos)
-                owner_paid = owner_total_paid >= owner_expense.get("amount", 0)
-                
-                # Verificar si todos los suplidores están pagados
-                all_supplier_expenses = await db.expenses.find({
-                    "related_reservation_id": reservation_id,
-                    "category": "pago_suplidor"
-                }, {"_id": 0}).to_list(1000)
-                
-                all_suppliers_paid = True
-                for supplier_expense in all_supplier_expenses:
-                    supplier_abonos = await db.expense_abonos.find({"expense_id": supplier_expense["id"]}, {"_id": 0}).to_list(1000)
-                    supplier_total_paid = sum(a.get("amount", 0) for a in supplier_abonos)
-                    if supplier_total_paid < supplier_expense.get("amount", 0):
-                        all_suppliers_paid = False
-                        print(f"❌ [UPDATE_RESERVATION] Suplidor sin pagar: {supplier_expense.get('description')}")
-                        break
-                
-                # Verificar si depósito fue devuelto
-                deposit_returned = True
-                if existing.get("deposit", 0) > 0:
-                    deposit_expense = await db.expenses.find_one({
-                        "related_reservation_id": reservation_id,
-                        "category": "devolucion_deposito",
-                        "payment_status": "paid"
-                    }, {"_id": 0})
-                    deposit_returned = deposit_expense is not None
-                
-                # Actualizar estado del propietario
-                new_owner_status = "paid" if (owner_paid and all_suppliers_paid and deposit_returned) else "pending"
-                print(f"📌 [UPDATE_RESERVATION] Nuevo estado propietario: {new_owner_status} (Owner: {owner_paid}, Supp: {all_suppliers_paid}, Dep: {deposit_returned})")
-                
-                await db.expenses.update_one(
-                    {"id": owner_expense["id"]},
-                    {"$set": {"payment_status": new_owner_status}}
-                )
-                print(f"✅ [UPDATE_RESERVATION] Estado propietario actualizado")
+            if operations:
+                await db.expenses.bulk_write(operations, ordered=False)
+                await record_deletions(db, "expenses", [expense["id"] for expense in diff["deletes"]])
+                await track_expense_changes(db, [
+                    *((None, expense) for expense in diff["inserts"]),
+                    *((expense, {**expense, **changes}) for expense, changes in diff["updates"]),
+                    *((expense, None) for expense in diff["deletes"]),
+                ])
+            print(
+                f"✅ [UPDATE_RESERVATION] Gastos de suplidores: {len(diff['inserts'])} creados, "
+                f"{len(diff['updates'])} actualizados, {len(diff['deletes'])} eliminados, {len(diff['kept'])} con abonos conservados"
+            )
+        
+        # Recalcular estados del grafo de gastos (propietario, suplidores, depósito) en una pasada
+        if any(field in update_dict for field in ("deposit_returned", "owner_price", "extra_services")):
+            changed = await recompute_reservation_payment_status(db, reservation_id)
+            print(f"📌 [UPDATE_RESERVATION] Estados de pago recalculados ({changed} gastos cambiaron)")
     
     updated = await db.reservations.find_one({"id": reservation_id}, {"_id": 0})
-    return restore_datetimes(updated, ["reservation_date", "created_at", "updated_at"])
+    return codec_for(Reservation).decode(updated)
 
 @api_router.delete("/reservations/{reservation_id}")
 async def delete_reservation(reservation_id: str, current_user: dict = Depends(require_admin)):
     """Delete a reservation (admin only) - También elimina gasto asociado si existe"""
     # Eliminar gasto auto-generado asociado a esta reservación
-    await db.expenses.delete_many({"related_reservation_id": reservation_id})
+    related_expenses = await db.expenses.find(
+        {"related_reservation_id": reservation_id},
+        {"_id": 0, "amount": 1, "currency": 1}
+    ).to_list(None)
+    await delete_many_tracked(db, "expenses", {"related_reservation_id": reservation_id})
+    await track_expenses_removed(db, related_expenses)
     
     # Eliminar abonos de la reservación
-    await db.reservation_abonos.delete_many({"reservation_id": reservation_id})
+    await delete_many_tracked(db, "reservation_abonos", {"reservation_id": reservation_id})
+    await release_invoice_numbers_for_parent(db, reservation_id)
     
     # Marcar comisión como eliminada (NO eliminar)
     await db.commissions.update_many(
@@ -1563,9 +1608,12 @@ async def delete_reservation(reservation_id: str, current_user: dict = Depends(r
     )
     
     # Eliminar la reservación
-    result = await db.reservations.delete_one({"id": reservation_id})
-    if result.deleted_count == 0:
+    reservation = await db.reservations.find_one_and_delete({"id": reservation_id}, {"_id": 0})
+    if not reservation:
         raise HTTPException(status_code=404, detail="Reservation not found")
+    await record_deletions(db, "reservations", [reservation_id])
+    await track_reservation_change(db, reservation, None)
+    await release_invoice_number(db, reservation_id)
     return {"message": "Reservation and related expenses deleted successfully, commission marked as deleted"}
 
 # ============ ABONOS TO RESERVATIONS ============
@@ -1573,51 +1621,56 @@ async def delete_reservation(reservation_id: str, current_user: dict = Depends(r
 @api_router.post("/reservations/{reservation_id}/abonos", response_model=Abono)
 async def add_abono_to_reservation(reservation_id: str, abono_data: AbonoCreate, current_user: dict = Depends(get_current_user)):
     """Add a payment (abono) to a reservation - each abono gets its own invoice number"""
-    reservation = await db.reservations.find_one({"id": reservation_id}, {"_id": 0})
-    if not reservation:
+    # Solo se verifica que exista antes de asignar el número de factura; los montos se actualizan con $inc
+    if not await db.reservations.find_one({"id": reservation_id}, {"_id": 0, "id": 1}):
         raise HTTPException(status_code=404, detail="Reservation not found")
     
+    abono_id = str(uuid.uuid4())
+    
     # Handle invoice_number generation
     if abono_data.invoice_number:
-        # Admin provided manual invoice number - validate it's available
+        # Admin provided manual invoice number - register it if it's available
         if current_user.get("role") != "admin":
             raise HTTPException(status_code=403, detail="Only admins can specify manual invoice numbers")
         
         invoice_num_str = str(abono_data.invoice_number)
-        is_available = await validate_invoice_number_available(invoice_num_str)
-        if not is_available:
+        if not await register_invoice_number(db, invoice_num_str, "reservation_abono", abono_id, reservation_id):
             raise HTTPException(status_code=400, detail=f"Invoice number {invoice_num_str} is already in use")
         invoice_number = invoice_num_str
     else:
         # Auto-generate invoice number for employee/admin
-        invoice_number = str(await get_next_invoice_number())
+        invoice_number = str(await get_next_invoice_number("reservation_abono", abono_id, reservation_id))
     
     # Create abono record with invoice_number
     abono_dict = abono_data.model_dump()
     abono_dict["invoice_number"] = invoice_number  
-    abono = Abono(**abono_dict, created_by=current_user["id"])
-    abono_doc = prepare_doc_for_insert(abono.model_dump())
+    abono = Abono(**abono_dict, id=abono_id, created_by=current_user["id"])
+    abono_doc = prepare_doc_for_insert(abono.model_dump(), "reservation_abonos")
     
     # Store in reservation_abonos collection
     abono_doc["reservation_id"] = reservation_id
-    await db.reservation_abonos.insert_one(abono_doc)
-    
-    # Update reservation amount_paid and balance_due: Total + Depósito - Pagado
-    new_amount_paid = reservation.get("amount_paid", 0) + abono_data.amount
-    new_balance_due = calculate_balance(
-        reservation.get("total_amount", 0), 
-        new_amount_paid,
-        reservation.get("deposit", 0)
-    )
+    written = []
+    
+    async def write_abono(session):
+        written.clear()
+        await db.reservation_abonos.insert_one(stamped(abono_doc), session=session)
+        written.append("abono")
+        # amount_paid += abono y balance_due (Total + Depósito - Pagado) en el mismo update atómico
+        reservation = await apply_reservation_payment(db, reservation_id, abono_data.amount, session=session)
+        if not reservation:
+            raise HTTPException(status_code=404, detail="Reservation not found")
+        await track_reservation_change(db, reservation, reservation_after_payment(reservation, abono_data.amount), session=session)
     
-    await db.reservations.update_one(
-        {"id": reservation_id},
-        {"$set": {
-            "amount_paid": new_amount_paid,
-            "balance_due": new_balance_due,
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
-    )
+    try:
+        await run_in_transaction(db, write_abono)
+    except Exception as e:
+        if "abono" in written and not await transactions_supported(db):
+            await delete_one_tracked(db, "reservation_abonos", {"id": abono_id})
+        await release_invoice_number(db, abono_id)
+        if isinstance(e, DuplicateKeyError):
+            raise HTTPException(status_code=409, detail=f"Invoice number {invoice_number} is already in use")
+        raise
+    outbox_worker.notify()
     
     return abono
 
@@ -1625,45 +1678,47 @@ async def add_abono_to_reservation(reservation_id: str, abono_data: AbonoCreate,
 async def get_reservation_abonos(reservation_id: str, current_user: dict = Depends(get_current_user)):
     """Get all abonos for a reservation"""
     abonos = await db.reservation_abonos.find({"reservation_id": reservation_id}, {"_id": 0}).sort("payment_date", -1).to_list(100)
-    return [restore_datetimes(a, ["payment_date", "created_at"]) for a in abonos]
+    return codec_for(Abono).json_response(abonos)
 
 @api_router.delete("/reservations/{reservation_id}/abonos/{abono_id}")
 async def delete_reservation_abono(reservation_id: str, abono_id: str, current_user: dict = Depends(require_admin)):
     """Delete an abono from a reservation (admin only) - to correct errors"""
-    # Get the abono to delete
-    abono_to_delete = await db.reservation_abonos.find_one({"reservation_id": reservation_id, "id": abono_id}, {"_id": 0})
-    if not abono_to_delete:
-        raise HTTPException(status_code=404, detail="Abono not found")
-    
-    # Delete the abono
-    await db.reservation_abonos.delete_one({"reservation_id": reservation_id, "id": abono_id})
-    
-    # Recalculate reservation balance: Total + Depósito - Pagado
-    reservation = await db.reservations.find_one({"id": reservation_id}, {"_id": 0})
-    if reservation:
-        # Recalculate total paid from remaining abonos
-        all_abonos = await db.reservation_abonos.find({"reservation_id": reservation_id}, {"_id": 0}).to_list(1000)
-        total_from_abonos = sum(a.get("amount", 0) for a in all_abonos)
-        
-        # Original payment is stored in the reservation
-        new_amount_paid = reservation.get("amount_paid", 0) - abono_to_delete.get("amount", 0)
-        new_balance_due = calculate_balance(
-            reservation.get("total_amount", 0), 
-            new_amount_paid,
-            reservation.get("deposit", 0)
+    async def remove_abono(session):
+        # find_one_and_delete: dos borrados simultáneos del mismo abono no lo restan dos veces
+        abono_to_delete = await db.reservation_abonos.find_one_and_delete(
+            {"reservation_id": reservation_id, "id": abono_id}, projection={"_id": 0, "amount": 1}, session=session
         )
+        if not abono_to_delete:
+            raise HTTPException(status_code=404, detail="Abono not found")
+        await record_deletions(db, "reservation_abonos", [abono_id], session=session)
         
-        await db.reservations.update_one(
-            {"id": reservation_id},
-            {"$set": {
-                "amount_paid": new_amount_paid,
-                "balance_due": new_balance_due
-            }}
-        )
+        # Restar el abono: amount_paid -= monto y balance_due (Total + Depósito - Pagado) en un update atómico
+        amount = -(abono_to_delete.get("amount") or 0)
+        reservation = await apply_reservation_payment(db, reservation_id, amount, session=session)
+        if reservation:
+            await track_reservation_change(db, reservation, reservation_after_payment(reservation, amount), session=session)
+    
+    await run_in_transaction(db, remove_abono)
+    outbox_worker.notify()
+    await release_invoice_number(db, abono_id)
     
     return {"message": "Abono deleted successfully"}
 
 
+# ============ INVOICE NUMBER LOOKUP ============
+
+@api_router.get("/invoices/{invoice_number}")
+async def lookup_invoice_number(invoice_number: str, current_user: dict = Depends(get_current_user)):
+    """Look up which reservation or abono owns an invoice number"""
+    entry = await get_invoice_number_entry(db, invoice_number)
+    if not entry:
+        raise HTTPException(status_code=404, detail=f"Factura #{invoice_number} no encontrada")
+    
+    collection_name = OWNER_COLLECTIONS[entry["owner_type"]]
+    document = await db[collection_name].find_one({"invoice_number": entry["invoice_number"]}, {"_id": 0})
+    
+    return {**entry, "document": document}
+
 # ============ QUOTATION (COTIZACIÓN) ENDPOINTS ============
 
 @api_router.post("/quotations", response_model=Quotation)
@@ -1697,26 +1752,31 @@ async def create_quotation(quotation_data: QuotationCreate, current_user: dict =
         created_by=current_user["id"]
     )
     
-    doc = prepare_doc_for_insert(quotation.model_dump())
+    doc = prepare_doc_for_insert(quotation.model_dump(), "quotations")
     await db.quotations.insert_one(doc)
     
     return quotation
 
 @api_router.get("/quotations", response_model=List[Quotation])
 async def get_quotations(
+    response: Response,
     status: Optional[str] = None,
     customer_id: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    include_total: bool = False,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all quotations"""
+    """Get quotations (newest first) (paginated, see pagination.py)"""
     query = {}
     if status:
         query["status"] = status
     if customer_id:
         query["customer_id"] = customer_id
     
-    quotations = await db.quotations.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return quotations
+    quotations = await find_page(db.quotations, query, response, "created_at", descending=True, after=after, limit=limit, fields=fields, include_total=include_total)
+    return page_response(quotations, response, fields, codec_for(Quotation))
 
 @api_router.get("/quotations/{quotation_id}", response_model=Quotation)
 async def get_quotation(quotation_id: str, current_user: dict = Depends(get_current_user)):
@@ -1724,7 +1784,7 @@ async def get_quotation(quotation_id: str, current_user: dict = Depends(get_curr
     quotation = await db.quotations.find_one({"id": quotation_id}, {"_id": 0})
     if not quotation:
         raise HTTPException(status_code=404, detail="Quotation not found")
-    return quotation
+    return codec_for(Quotation).decode(quotation)
 
 @api_router.put("/quotations/{quotation_id}", response_model=Quotation)
 async def update_quotation(quotation_id: str, quotation_data: QuotationUpdate, current_user: dict = Depends(get_current_user)):
@@ -1734,9 +1794,9 @@ async def update_quotation(quotation_id: str, quotation_data: QuotationUpdate, c
         raise HTTPException(status_code=404, detail="Quotation not found")
     
     update_data = {k: v for k, v in quotation_data.model_dump().items() if v is not None}
-    update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+    update_data["updated_at"] = datetime.now(timezone.utc)
     
-    update_data = prepare_doc_for_insert(update_data)
+    update_data = prepare_doc_for_insert(update_data, "quotations")
     
     await db.quotations.update_one(
         {"id": quotation_id},
@@ -1811,14 +1871,18 @@ async def update_quotation(quotation_id: str, quotation_data: QuotationUpdate, c
             invoice_update["internal_notes"] = update_data["internal_notes"]
         
         if invoice_update:
-            invoice_update["updated_at"] = datetime.now(timezone.utc).isoformat()
-            await db.reservations.update_one(
+            invoice_update["updated_at"] = datetime.now(timezone.utc)
+            previous_invoice = await db.reservations.find_one_and_update(
                 {"id": invoice_id},
-                {"$set": invoice_update}
+                touch({"$set": invoice_update}),
+                projection={"_id": 0},
+                return_document=ReturnDocument.BEFORE
             )
+            if previous_invoice:
+                await track_reservation_change(db, previous_invoice, {**previous_invoice, **invoice_update})
     
     updated = await db.quotations.find_one({"id": quotation_id}, {"_id": 0})
-    return updated
+    return codec_for(Quotation).decode(updated)
 
 @api_router.delete("/quotations/{quotation_id}")
 async def delete_quotation(quotation_id: str, current_user: dict = Depends(require_admin)):
@@ -1854,19 +1918,12 @@ async def convert_quotation_to_invoice(quotation_id: str, current_user: dict = D
             created_by=current_user["id"]
         )
         customer_doc = prepare_doc_for_insert(new_customer.model_dump())
-        await db.customers.insert_one(customer_doc)
+        await db.customers.insert_one(stamped(customer_doc))
         customer_id = new_customer.id
     
-    # Generate invoice number
-    last_reservation = await db.reservations.find_one(
-        sort=[("created_at", -1)],
-        projection={"invoice_number": 1, "_id": 0}
-    )
-    
-    if last_reservation:
-        invoice_number = str(int(last_reservation["invoice_number"]) + 1)
-    else:
-        invoice_number = "1600"
+    # Generate invoice number (same allocator as regular invoices)
+    reservation_id = str(uuid.uuid4())
+    invoice_number = str(await get_next_invoice_number("reservation", reservation_id))
     
     # Calculate balance
     balance_due = calculate_balance(
@@ -1876,6 +1933,7 @@ async def convert_quotation_to_invoice(quotation_id: str, current_user: dict = D
     )
     
     reservation = Reservation(
+        id=reservation_id,
         customer_id=customer_id,  # Use the created or existing customer_id
         customer_name=quotation["customer_name"],
         villa_id=quotation.get("villa_id"),
@@ -1914,8 +1972,13 @@ async def convert_quotation_to_invoice(quotation_id: str, current_user: dict = D
         converted_from_quotation_number=quotation["quotation_number"]  # Agregar referencia a cotización
     )
     
-    doc = prepare_doc_for_insert(reservation.model_dump())
-    await db.reservations.insert_one(doc)
+    doc = prepare_doc_for_insert(reservation.model_dump(), "reservations")
+    try:
+        await db.reservations.insert_one(stamped(doc))
+    except DuplicateKeyError:
+        await release_invoice_number(db, reservation_id)
+        raise HTTPException(status_code=409, detail=f"El número de factura {invoice_number} ya existe")
+    await track_reservation_change(db, None, doc)
     
     # Create owner payment expense if owner_price > 0 and villa exists
     if quotation.get("owner_price", 0) > 0 and quotation.get("villa_id"):
@@ -1929,7 +1992,8 @@ async def convert_quotation_to_invoice(quotation_id: str, current_user: dict = D
                 is_active=True,
                 created_by=current_user["id"]
             )
-            await db.expense_categories.insert_one(prepare_doc_for_insert(pago_propietario_cat.model_dump()))
+            await db.expense_categories.insert_one(stamped(prepare_doc_for_insert(pago_propietario_cat.model_dump())))
+            await invalidate_reference_data(db, EXPENSE_CATEGORIES)
         
         # Create expense
         expense = Expense(
@@ -1942,9 +2006,12 @@ async def convert_quotation_to_invoice(quotation_id: str, current_user: dict = D
             related_reservation_id=reservation.id,
             expense_type="variable",
             show_in_variables=True,
-            created_by=current_user["id"]
+            created_by=current_user["id"],
+            balance_due=quotation["owner_price"]
         )
-        await db.expenses.insert_one(prepare_doc_for_insert(expense.model_dump()))
+        expense_doc = prepare_doc_for_insert(expense.model_dump(), "expenses")
+        await db.expenses.insert_one(stamped(expense_doc))
+        await track_expense_change(db, None, expense_doc)
     
     # Create commission for the employee who created the quotation
     creator_user = await db.users.find_one({"id": quotation["created_by"]}, {"_id": 0})
@@ -1955,7 +2022,7 @@ async def convert_quotation_to_invoice(quotation_id: str, current_user: dict = D
             user_id=quotation["created_by"],
             user_name=creator_user.get("username", ""),
             reservation_id=reservation.id,
-            reservation_date=quotation["quotation_date"],
+            reservation_date=quotation["quotation_date"].isoformat() if isinstance(quotation["quotation_date"], datetime) else quotation["quotation_date"],
             villa_code=quotation.get("villa_code"),
             customer_name=quotation["customer_name"],
             total_amount=quotation["total_amount"],
@@ -1966,7 +2033,7 @@ async def convert_quotation_to_invoice(quotation_id: str, current_user: dict = D
             invoice_deleted=False,
             created_by=current_user["id"]
         )
-        await db.commissions.insert_one(prepare_doc_for_insert(commission.model_dump()))
+        await db.commissions.insert_one(prepare_doc_for_insert(commission.model_dump(), "commissions"))
     
     # Mark quotation as converted
     await db.quotations.update_one(
@@ -1974,7 +2041,7 @@ async def convert_quotation_to_invoice(quotation_id: str, current_user: dict = D
         {"$set": {
             "status": "converted",
             "converted_to_invoice_id": reservation.id,
-            "updated_at": datetime.now(timezone.utc).isoformat()
+            "updated_at": datetime.now(timezone.utc)
         }}
     )
     
@@ -2020,19 +2087,24 @@ async def create_conduce(conduce_data: ConduceCreate, current_user: dict = Depen
 
 @api_router.get("/conduces", response_model=List[Conduce])
 async def get_conduces(
+    response: Response,
     status: Optional[str] = None,
     recipient_type: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    include_total: bool = False,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all conduces"""
+    """Get conduces (newest first) (paginated, see pagination.py)"""
     query = {}
     if status:
         query["status"] = status
     if recipient_type:
         query["recipient_type"] = recipient_type
     
-    conduces = await db.conduces.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return conduces
+    conduces = await find_page(db.conduces, query, response, "created_at", descending=True, after=after, limit=limit, fields=fields, include_total=include_total)
+    return page_response(conduces, response, fields, codec_for(Conduce))
 
 @api_router.get("/conduces/{conduce_id}", response_model=Conduce)
 async def get_conduce(conduce_id: str, current_user: dict = Depends(get_current_user)):
@@ -2072,69 +2144,159 @@ async def delete_conduce(conduce_id: str, current_user: dict = Depends(require_a
 
 # ============ COMMISSION ENDPOINTS ============
 
+def commission_list_query(
+    user_id: Optional[str], paid: Optional[bool], invoice_deleted: Optional[bool],
+    month: Optional[str], fortnight: Optional[int]
+) -> dict:
+    """
+    Filtros de la vista de comisiones; month ('YYYY-MM') y fortnight (1: días 1-14, 2: días 15-31)
+    se aplican sobre reservation_date, que se guarda como string 'YYYY-MM-DD'
+    """
+    query = {}
+    if user_id:
+        query["user_id"] = user_id
+    if paid is not None:
+        query["paid"] = True if paid else {"$ne": True}
+    if invoice_deleted is not None:
+        query["invoice_deleted"] = True if invoice_deleted else {"$ne": True}
+    if month or fortnight:
+        if month and not re.fullmatch(r"\d{4}-\d{2}", month):
+            raise HTTPException(status_code=400, detail="month debe tener formato YYYY-MM")
+        if fortnight not in (None, 1, 2):
+            raise HTTPException(status_code=400, detail="fortnight debe ser 1 o 2")
+        month_pattern = month or r"\d{4}-\d{2}"
+        day_pattern = {None: r"\d{2}", 1: r"(0\d|1[0-4])", 2: r"(1[5-9]|[23]\d)"}[fortnight]
+        query["reservation_date"] = {"$regex": f"^{month_pattern}-{day_pattern}"}
+    return query
+
 @api_router.get("/commissions", response_model=List[Commission])
-async def get_commissions(current_user: dict = Depends(require_admin)):
-    """Get all commissions (admin only)"""
-    commissions = await db.commissions.find({}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return [restore_datetimes(c, ["created_at"]) for c in commissions]
+async def get_commissions(
+    response: Response,
+    user_id: Optional[str] = None,
+    paid: Optional[bool] = None,
+    invoice_deleted: Optional[bool] = None,
+    month: Optional[str] = None,
+    fortnight: Optional[int] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    include_total: bool = False,
+    current_user: dict = Depends(require_admin)
+):
+    """Get commissions, newest first, filtered like the commissions view (admin only) (paginated, see pagination.py)"""
+    query = commission_list_query(user_id, paid, invoice_deleted, month, fortnight)
+    commissions = await find_page(db.commissions, query, response, "created_at", descending=True, after=after, limit=limit, fields=fields, include_total=include_total)
+    return page_response(commissions, response, fields, codec_for(Commission))
 
 @api_router.get("/commissions/user/{user_id}", response_model=List[Commission])
-async def get_user_commissions(user_id: str, current_user: dict = Depends(require_admin)):
-    """Get commissions for a specific user (admin only)"""
-    commissions = await db.commissions.find({"user_id": user_id}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return [restore_datetimes(c, ["created_at"]) for c in commissions]
+async def get_user_commissions(
+    user_id: str,
+    response: Response,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    include_total: bool = False,
+    current_user: dict = Depends(require_admin)
+):
+    """Get commissions for a specific user, newest first (admin only) (paginated, see pagination.py)"""
+    commissions = await find_page(db.commissions, {"user_id": user_id}, response, "created_at", descending=True, after=after, limit=limit, fields=fields, include_total=include_total)
+    return page_response(commissions, response, fields, codec_for(Commission))
+
+def fortnight_date_range(fortnight: int, month: int, year: int) -> tuple:
+    """Rango [inicio, fin) de una quincena como strings 'YYYY-MM-DD' (días 1-14 o 15-fin de mes)"""
+    if fortnight not in (1, 2) or not 1 <= month <= 12:
+        raise HTTPException(status_code=400, detail="fortnight debe ser 1 o 2 y month entre 1 y 12")
+    if fortnight == 1:
+        return f"{year}-{month:02d}-01", f"{year}-{month:02d}-15"
+    next_month = f"{year + 1}-01-01" if month == 12 else f"{year}-{month + 1:02d}-01"
+    return f"{year}-{month:02d}-15", next_month
+
+def commission_date_filter(
+    start_date: Optional[str],
+    end_date: Optional[str],
+    fortnight: Optional[int],
+    month: Optional[int],
+    year: Optional[int]
+) -> Optional[dict]:
+    """Filtro sobre reservation_date (string ISO); end_date es inclusivo"""
+    if fortnight is not None:
+        if month is None or year is None:
+            raise HTTPException(status_code=400, detail="fortnight requiere month y year")
+        start, end = fortnight_date_range(fortnight, month, year)
+        return {"$gte": start, "$lt": end}
+    
+    date_filter = {}
+    if start_date:
+        date_filter["$gte"] = start_date[:10]
+    if end_date:
+        try:
+            next_day = datetime.fromisoformat(end_date[:10]) + timedelta(days=1)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="end_date debe tener formato YYYY-MM-DD")
+        date_filter["$lt"] = next_day.strftime("%Y-%m-%d")
+    return date_filter or None
 
 @api_router.get("/commissions/stats")
-async def get_commission_stats(current_user: dict = Depends(require_admin)):
-    """Get commission statistics (admin only)"""
-    all_commissions = await db.commissions.find({}, {"_id": 0}).to_list(10000)
-    
-    total_amount = 0
-    total_paid = 0
-    total_pending = 0
-    
-    # Group by user
-    user_totals = {}
-    for comm in all_commissions:
-        user_id = comm.get("user_id")
-        user_name = comm.get("user_name", "Unknown")
-        amount = comm.get("amount", 0)
-        is_paid = comm.get("paid", False)
-        
-        total_amount += amount
-        if is_paid:
-            total_paid += amount
-        else:
-            total_pending += amount
-        
-        if user_id not in user_totals:
-            user_totals[user_id] = {
-                "user_id": user_id,
-                "user_name": user_name,
-                "total_commissions": 0,
-                "total_paid": 0,
-                "total_pending": 0,
-                "commission_count": 0,
-                "paid_count": 0,
-                "pending_count": 0
-            }
-        
-        user_totals[user_id]["total_commissions"] += amount
-        user_totals[user_id]["commission_count"] += 1
-        
-        if is_paid:
-            user_totals[user_id]["total_paid"] += amount
-            user_totals[user_id]["paid_count"] += 1
-        else:
-            user_totals[user_id]["total_pending"] += amount
-            user_totals[user_id]["pending_count"] += 1
+async def get_commission_stats(
+    user_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    fortnight: Optional[int] = None,
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    current_user: dict = Depends(require_admin)
+):
+    """Get commission statistics (admin only) - optional user, date range or fortnight filters"""
+    query = {}
+    if user_id:
+        query["user_id"] = user_id
+    date_filter = commission_date_filter(start_date, end_date, fortnight, month, year)
+    if date_filter:
+        query["reservation_date"] = date_filter
+    
+    is_paid = {"$eq": ["$paid", True]}
+    paid_amount = {"$cond": [is_paid, "$amount", 0]}
+    pending_amount = {"$cond": [is_paid, 0, "$amount"]}
+    
+    pipeline = [
+        {"$match": query},
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "total_commissions": {"$sum": "$amount"},
+                    "total_paid": {"$sum": paid_amount},
+                    "total_pending": {"$sum": pending_amount},
+                    "total_count": {"$sum": 1}
+                }}
+            ],
+            # Group by user
+            "by_user": [
+                {"$group": {
+                    "_id": "$user_id",
+                    "user_name": {"$first": {"$ifNull": ["$user_name", "Unknown"]}},
+                    "total_commissions": {"$sum": "$amount"},
+                    "total_paid": {"$sum": paid_amount},
+                    "total_pending": {"$sum": pending_amount},
+                    "commission_count": {"$sum": 1},
+                    "paid_count": {"$sum": {"$cond": [is_paid, 1, 0]}},
+                    "pending_count": {"$sum": {"$cond": [is_paid, 0, 1]}}
+                }},
+                {"$addFields": {"user_id": "$_id"}},
+                {"$project": {"_id": 0}},
+                {"$sort": {"user_name": 1}}
+            ]
+        }}
+    ]
+    result = await db.commissions.aggregate(pipeline).to_list(1)
+    totals = result[0]["totals"][0] if result and result[0]["totals"] else {}
     
     return {
-        "total_commissions": total_amount,
-        "total_paid": total_paid,
-        "total_pending": total_pending,
-        "total_count": len(all_commissions),
-        "by_user": list(user_totals.values())
+        "total_commissions": totals.get("total_commissions", 0),
+        "total_paid": totals.get("total_paid", 0),
+        "total_pending": totals.get("total_pending", 0),
+        "total_count": totals.get("total_count", 0),
+        "by_user": result[0]["by_user"] if result else []
     }
 
 @api_router.patch("/commissions/{commission_id}", response_model=Commission)
@@ -2154,7 +2316,7 @@ async def update_commission(
         await db.commissions.update_one({"id": commission_id}, {"$set": update_data})
     
     updated = await db.commissions.find_one({"id": commission_id}, {"_id": 0})
-    return restore_datetimes(updated, ["created_at"])
+    return codec_for(Commission).decode(updated)
 
 @api_router.delete("/commissions/{commission_id}")
 async def delete_commission(commission_id: str, current_user: dict = Depends(require_admin)):
@@ -2204,21 +2366,7 @@ async def pay_fortnight_commissions(
 ):
     """Pay all unpaid commissions for a user in a specific fortnight"""
     # Determinar rango de fechas según quincena
-    if fortnight == 1:
-        start_day = 1
-        end_day = 14
-    else:  # fortnight == 2
-        start_day = 15
-        # Último día del mes
-        if month == 2:
-            end_day = 28 if year % 4 != 0 else 29
-        elif month in [4, 6, 9, 11]:
-            end_day = 30
-        else:
-            end_day = 31
-    
-    start_date = f"{year}-{month:02d}-{start_day:02d}"
-    end_date = f"{year}-{month:02d}-{end_day:02d}"
+    start_date, end_date = fortnight_date_range(fortnight, month, year)
     
     paid_date = datetime.now(timezone.utc).isoformat()
     
@@ -2229,7 +2377,7 @@ async def pay_fortnight_commissions(
             "paid": False,
             "reservation_date": {
                 "$gte": start_date,
-                "$lte": end_date
+                "$lt": end_date
             }
         },
         {"$set": {"paid": True, "paid_date": paid_date}}
@@ -2248,14 +2396,21 @@ async def create_owner(owner_data: VillaOwnerCreate, current_user: dict = Depend
     """Create a new villa owner"""
     owner = VillaOwner(**owner_data.model_dump(), created_by=current_user["id"])
     doc = prepare_doc_for_insert(owner.model_dump())
-    await db.villa_owners.insert_one(doc)
+    await db.villa_owners.insert_one(stamped(doc))
     return owner
 
 @api_router.get("/owners", response_model=List[VillaOwner])
-async def get_owners(current_user: dict = Depends(get_current_user)):
-    """Get all villa owners"""
-    owners = await db.villa_owners.find({}, {"_id": 0}).to_list(1000)
-    return [restore_datetimes(o, ["created_at"]) for o in owners]
+async def get_owners(
+    response: Response,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    include_total: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get villa owners ordered by name (paginated, see pagination.py)"""
+    owners = await find_page(db.villa_owners, {}, response, "name", after=after, limit=limit, fields=fields, include_total=include_total)
+    return page_response(owners, response, fields, codec_for(VillaOwner))
 
 @api_router.get("/owners/{owner_id}", response_model=VillaOwner)
 async def get_owner(owner_id: str, current_user: dict = Depends(get_current_user)):
@@ -2263,7 +2418,7 @@ async def get_owner(owner_id: str, current_user: dict = Depends(get_current_user
     owner = await db.villa_owners.find_one({"id": owner_id}, {"_id": 0})
     if not owner:
         raise HTTPException(status_code=404, detail="Owner not found")
-    return restore_datetimes(owner, ["created_at"])
+    return codec_for(VillaOwner).decode(owner)
 
 @api_router.put("/owners/{owner_id}", response_model=VillaOwner)
 async def update_owner(owner_id: str, update_data: VillaOwnerUpdate, current_user: dict = Depends(get_current_user)):
@@ -2275,117 +2430,198 @@ async def update_owner(owner_id: str, update_data: VillaOwnerUpdate, current_use
     update_dict = {k: v for k, v in update_data.model_dump(exclude_unset=True).items() if v is not None}
     
     if update_dict:
-        await db.villa_owners.update_one({"id": owner_id}, {"$set": update_dict})
+        await db.villa_owners.update_one({"id": owner_id}, touch({"$set": update_dict}))
     
     updated = await db.villa_owners.find_one({"id": owner_id}, {"_id": 0})
-    return restore_datetimes(updated, ["created_at"])
+    return codec_for(VillaOwner).decode(updated)
 
 @api_router.delete("/owners/{owner_id}")
 async def delete_owner(owner_id: str, current_user: dict = Depends(require_admin)):
     """Delete an owner (admin only)"""
-    result = await db.villa_owners.delete_one({"id": owner_id})
-    if result.deleted_count == 0:
+    deleted = await delete_one_tracked(db, "villa_owners", {"id": owner_id})
+    if not deleted:
         raise HTTPException(status_code=404, detail="Owner not found")
     return {"message": "Owner deleted successfully"}
 
 @api_router.post("/owners/{owner_id}/payments", response_model=Payment)
 async def create_owner_payment(owner_id: str, payment_data: PaymentCreate, current_user: dict = Depends(get_current_user)):
     """Record a payment to an owner"""
-    owner = await db.villa_owners.find_one({"id": owner_id}, {"_id": 0})
-    if not owner:
-        raise HTTPException(status_code=404, detail="Owner not found")
-    
     payment = Payment(**payment_data.model_dump(), created_by=current_user["id"])
     doc = prepare_doc_for_insert(payment.model_dump())
-    await db.owner_payments.insert_one(doc)
+    written = []
     
-    new_amount_paid = owner.get("amount_paid", 0) + payment_data.amount
-    new_balance_due = calculate_balance(owner.get("total_owed", 0), new_amount_paid)
+    async def write_payment(session):
+        written.clear()
+        # amount_paid += pago y balance_due (Total - Pagado) en un update atómico, sin leer antes
+        if not await apply_owner_payment(db, owner_id, payment_data.amount, session=session):
+            raise HTTPException(status_code=404, detail="Owner not found")
+        written.append("owner")
+        await db.owner_payments.insert_one(doc, session=session)
     
-    await db.villa_owners.update_one(
-        {"id": owner_id},
-        {"$set": {"amount_paid": new_amount_paid, "balance_due": new_balance_due}}
-    )
+    try:
+        await run_in_transaction(db, write_payment)
+    except Exception:
+        if "owner" in written and not await transactions_supported(db):
+            await apply_owner_payment(db, owner_id, -payment_data.amount)
+        raise
     
     return payment
 
 @api_router.get("/owners/{owner_id}/payments", response_model=List[Payment])
-async def get_owner_payments(owner_id: str, current_user: dict = Depends(get_current_user)):
-    """Get all payments for an owner"""
-    payments = await db.owner_payments.find({"owner_id": owner_id}, {"_id": 0}).sort("payment_date", -1).to_list(1000)
-    return [restore_datetimes(p, ["payment_date"]) for p in payments]
+async def get_owner_payments(
+    owner_id: str,
+    response: Response,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    include_total: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get payments for an owner, newest first (paginated, see pagination.py)"""
+    payments = await find_page(db.owner_payments, {"owner_id": owner_id}, response, "payment_date", descending=True, after=after, limit=limit, fields=fields, include_total=include_total)
+    return page_response(payments, response, fields, codec_for(Payment))
 
 @api_router.put("/owners/{owner_id}/amounts")
 async def update_owner_amounts(owner_id: str, total_owed: float, current_user: dict = Depends(get_current_user)):
     """Update owner's total owed and recalculate balance"""
-    owner = await db.villa_owners.find_one({"id": owner_id}, {"_id": 0})
+    owner = await set_owner_total_owed(db, owner_id, total_owed)
     if not owner:
         raise HTTPException(status_code=404, detail="Owner not found")
     
-    amount_paid = owner.get("amount_paid", 0)
-    balance_due = calculate_balance(total_owed, amount_paid)
-    
-    await db.villa_owners.update_one(
-        {"id": owner_id},
-        {"$set": {"total_owed": total_owed, "balance_due": balance_due}}
-    )
-    
-    return {"message": "Amounts updated successfully", "balance_due": balance_due}
+    return {"message": "Amounts updated successfully", "balance_due": owner["balance_due"]}
 
 # ============ EXPENSE ENDPOINTS ============
 
 @api_router.post("/expenses", response_model=Expense)
 async def create_expense(expense_data: ExpenseCreate, current_user: dict = Depends(get_current_user)):
     """Create a new expense"""
-    expense = Expense(**expense_data.model_dump(), created_by=current_user["id"])
-    doc = prepare_doc_for_insert(expense.model_dump())
-    await db.expenses.insert_one(doc)
+    expense = Expense(**expense_data.model_dump(), created_by=current_user["id"], balance_due=expense_data.amount)
+    doc = prepare_doc_for_insert(expense.model_dump(), "expenses")
+    await db.expenses.insert_one(stamped(doc))
+    await track_expense_change(db, None, doc)
     return expense
 
+# Gastos que pertenecen al tab de Reservaciones (propietarios, suplidores, depósitos, solo servicios)
+RESERVATION_EXPENSE_CATEGORIES = ["pago_propietario", "pago_suplidor", "devolucion_deposito", "pago_servicios"]
+
+def expense_tab_filter(tab: str) -> dict:
+    """Filtro de cada tab de la vista de gastos (antes se calculaba en el frontend)"""
+    reservation_clause = {"$or": [
+        {"category": {"$in": RESERVATION_EXPENSE_CATEGORIES}},
+        {"related_reservation_id": {"$ne": None}}
+    ]}
+    if tab == "propietarios":
+        return reservation_clause
+    
+    # Los demás tabs excluyen todos los gastos de reservaciones
+    not_reservation = {"category": {"$nin": RESERVATION_EXPENSE_CATEGORIES}, "related_reservation_id": None}
+    if tab == "fijos":
+        return {**not_reservation, "expense_type": "fijo"}
+    if tab == "unicos":
+        return {**not_reservation, "expense_type": "unico"}
+    if tab == "variables":
+        # Variables + únicos marcados como show_in_variables (sin expense_type = variable)
+        return {**not_reservation, "$or": [
+            {"expense_type": {"$in": ["variable", None]}},
+            {"expense_type": "unico", "show_in_variables": True}
+        ]}
+    raise HTTPException(status_code=400, detail="tab debe ser propietarios, fijos, unicos o variables")
+
 @api_router.get("/expenses", response_model=List[Expense])
 async def get_expenses(
+    response: Response,
     category: Optional[str] = None,
     category_id: Optional[str] = None,
     search: Optional[str] = None,
+    include_abonos: bool = False,
+    tab: Optional[str] = None,
+    expense_type: Optional[str] = None,
+    show_in_variables: Optional[bool] = None,
+    payment_status: Optional[str] = None,
+    currency: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    related_reservation_id: Optional[str] = None,
+    hide_supplier_rows: bool = False,
+    carry_pending: bool = False,
+    has_payment_reminder: Optional[bool] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    include_total: bool = False,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all expenses with optional filters and search, including balance_due calculation"""
-    query = {}
-    if category:
-        query["category"] = category
-    if category_id:
-        query["category_id"] = category_id
+    """
+    Get expenses (newest expense_date first) with balance_due calculation (and optionally their abonos).
+    Server-side tab/type/status/currency/date filters (paginated, see pagination.py).
+    hide_supplier_rows excludes the pago_suplidor children shown under their owner expense;
+    carry_pending also returns the pending expenses dated before date_from (monthly view)
+    """
+    clauses = []
+    equality = {
+        "category": category,
+        "category_id": category_id,
+        "expense_type": expense_type,
+        "show_in_variables": show_in_variables,
+        "payment_status": payment_status,
+        "currency": currency,
+        "related_reservation_id": related_reservation_id,
+        "has_payment_reminder": has_payment_reminder,
+    }
+    simple_query = {field: value for field, value in equality.items() if value is not None}
+    if simple_query:
+        clauses.append(simple_query)
+    if tab:
+        clauses.append(expense_tab_filter(tab))
+    if hide_supplier_rows:
+        clauses.append({"$nor": [{"category": "pago_suplidor", "related_reservation_id": {"$ne": None}}]})
+    expense_date = date_range_filter("expense_date", date_from, date_to)
+    if expense_date and carry_pending and date_from:
+        expense_date = {"$or": [
+            expense_date,
+            {"$and": [date_range_query("expense_date", None, date_bounds(date_from, None)[0]), {"payment_status": "pending"}]}
+        ]}
+    if expense_date:
+        clauses.append(expense_date)
     
     # Advanced search: invoice, villa, customer, owner
     if search:
         # Search in description and notes
-        search_query = {
+        clauses.append({
             "$or": [
                 {"description": {"$regex": search, "$options": "i"}},
                 {"notes": {"$regex": search, "$options": "i"}}
             ]
-        }
-        
-        # If query already has conditions, combine with $and
-        if query:
-            query = {"$and": [query, search_query]}
-        else:
-            query = search_query
+        })
     
-    expenses = await db.expenses.find(query, {"_id": 0}).sort("expense_date", -1).to_list(1000)
+    if not clauses:
+        query = {}
+    elif len(clauses) == 1:
+        query = clauses[0]
+    else:
+        query = {"$and": clauses}
     
-    # Calculate balance_due for each expense based on abonos
-    for expense in expenses:
-        expense_id = expense.get("id")
-        # Get all abonos for this expense
-        abonos = await db.expense_abonos.find({"expense_id": expense_id}, {"_id": 0}).to_list(1000)
-        total_paid = sum(a.get("amount", 0) for a in abonos)
-        
-        # Calculate balance_due: original amount - total paid
-        expense["total_paid"] = total_paid
-        expense["balance_due"] = expense.get("amount", 0) - total_paid
+    page_size = clamp_limit(limit)
+    
+    # total_paid/balance_due vienen guardados en cada gasto; los abonos solo si se piden
+    expenses = await load_expenses(
+        with_cursor(query, after, "expense_date"), include_abonos=include_abonos, limit=page_size
+    )
+    
+    total = await db.expenses.count_documents(query) if include_total else None
+    set_page_headers(response, expenses, page_size, "expense_date", total)
     
-    return [restore_datetimes(e, ["expense_date", "created_at"]) for e in expenses]
+    return page_response(expenses, response, None, codec_for(Expense))
+
+@api_router.get("/expenses/summary")
+async def get_expenses_summary(
+    date_from: str,
+    date_to: str,
+    category: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Month totals of the expenses view (plus pending carried from earlier months), grouped for its summary cards"""
+    start, end = date_bounds(date_from, date_to)
+    return await compute_expense_month_groups(db, start, end, category)
 
 @api_router.get("/expenses/{expense_id}", response_model=Expense)
 async def get_expense(expense_id: str, current_user: dict = Depends(get_current_user)):
@@ -2394,15 +2630,7 @@ async def get_expense(expense_id: str, current_user: dict = Depends(get_current_
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
     
-    # Calculate balance_due based on abonos
-    abonos = await db.expense_abonos.find({"expense_id": expense_id}, {"_id": 0}).to_list(1000)
-    total_paid = sum(a.get("amount", 0) for a in abonos)
-    
-    # Calculate balance_due: original amount - total paid
-    expense["total_paid"] = total_paid
-    expense["balance_due"] = expense.get("amount", 0) - total_paid
-    
-    return restore_datetimes(expense, ["expense_date", "created_at"])
+    return codec_for(Expense).decode(expense)
 
 @api_router.put("/expenses/{expense_id}", response_model=Expense)
 async def update_expense(expense_id: str, update_data: ExpenseUpdate, current_user: dict = Depends(get_current_user)):
@@ -2414,17 +2642,14 @@ async def update_expense(expense_id: str, update_data: ExpenseUpdate, current_us
     update_dict = {k: v for k, v in update_data.model_dump(exclude_unset=True).items() if v is not None}
     
     if update_dict:
-        prepared_update = {}
-        for key, value in update_dict.items():
-            if isinstance(value, datetime):
-                prepared_update[key] = value.isoformat()
-            else:
-                prepared_update[key] = value
+        prepared_update = prepare_doc_for_insert(update_dict, "expenses")
         
-        await db.expenses.update_one({"id": expense_id}, {"$set": prepared_update})
+        # balance_due se recalcula en el mismo update por si cambió el monto
+        await db.expenses.update_one({"id": expense_id}, touch(expense_update_pipeline(prepared_update)))
+        await track_expense_change(db, existing, {**existing, **prepared_update})
     
     updated = await db.expenses.find_one({"id": expense_id}, {"_id": 0})
-    return restore_datetimes(updated, ["expense_date", "created_at"])
+    return codec_for(Expense).decode(updated)
 
 @api_router.delete("/expenses/{expense_id}")
 async def delete_expense(expense_id: str, current_user: dict = Depends(require_admin)):
@@ -2435,10 +2660,12 @@ async def delete_expense(expense_id: str, current_user: dict = Depends(require_a
         raise HTTPException(status_code=404, detail="Expense not found")
     
     # Eliminar abonos asociados
-    await db.expense_abonos.delete_many({"expense_id": expense_id})
+    await delete_many_tracked(db, "expense_abonos", {"expense_id": expense_id})
+    await release_invoice_numbers_for_parent(db, expense_id)
     
     # Eliminar el gasto
-    result = await db.expenses.delete_one({"id": expense_id})
+    if await delete_one_tracked(db, "expenses", {"id": expense_id}):
+        await track_expense_change(db, expense, None)
     return {"message": "Expense deleted successfully"}
 
 # ============ ABONOS TO EXPENSES ============
@@ -2450,163 +2677,66 @@ async def add_abono_to_expense(expense_id: str, abono_data: AbonoCreate, current
     print(f"💰 [ADD_ABONO] Data recibida: {abono_data}")
     print(f"💰 [ADD_ABONO] User: {current_user.get('username')}")
     
-    expense = await db.expenses.find_one({"id": expense_id}, {"_id": 0})
+    expense = await db.expenses.find_one({"id": expense_id}, {"_id": 0, "id": 1, "description": 1, "category": 1})
     if not expense:
         print(f"❌ [ADD_ABONO] Expense no encontrado: {expense_id}")
         raise HTTPException(status_code=404, detail="Expense not found")
     
     print(f"✅ [ADD_ABONO] Expense encontrado: {expense.get('description')}, categoria: {expense.get('category')}")
     
+    abono_id = str(uuid.uuid4())
+    
     # Handle invoice_number generation
     if abono_data.invoice_number:
-        # Admin provided manual invoice number - validate it's available
+        # Admin provided manual invoice number - register it if it's available
         if current_user.get("role") != "admin":
             raise HTTPException(status_code=403, detail="Only admins can specify manual invoice numbers")
         
         invoice_num_str = str(abono_data.invoice_number)
-        is_available = await validate_invoice_number_available(invoice_num_str)
-        if not is_available:
+        if not await register_invoice_number(db, invoice_num_str, "expense_abono", abono_id, expense_id):
             raise HTTPException(status_code=400, detail=f"Invoice number {invoice_num_str} is already in use")
         invoice_number = invoice_num_str
     else:
         # Auto-generate invoice number for employee/admin
-        invoice_number = str(await get_next_invoice_number())
+        invoice_number = str(await get_next_invoice_number("expense_abono", abono_id, expense_id))
     
     print(f"📄 [ADD_ABONO] Invoice number asignado: {invoice_number}")
     
     # Create abono record with invoice_number
     abono_dict = abono_data.model_dump()
     abono_dict["invoice_number"] = invoice_number  
-    abono = Abono(**abono_dict, created_by=current_user["id"])
-    abono_doc = prepare_doc_for_insert(abono.model_dump())
+    abono = Abono(**abono_dict, id=abono_id, created_by=current_user["id"])
+    abono_doc = prepare_doc_for_insert(abono.model_dump(), "expense_abonos")
     
     # Store in expense_abonos collection
     abono_doc["expense_id"] = expense_id
     print(f"💾 [ADD_ABONO] Guardando abono en DB...")
-    await db.expense_abonos.insert_one(abono_doc)
-    print(f"✅ [ADD_ABONO] Abono guardado exitosamente")
+    written = []
+    
+    async def write_abono(session):
+        written.clear()
+        await db.expense_abonos.insert_one(stamped(abono_doc), session=session)
+        written.append("abono")
+        # total_paid += abono y balance_due en el mismo update atómico
+        updated = await apply_expense_payment(db, expense_id, abono_data.amount, session=session)
+        if not updated:
+            raise HTTPException(status_code=404, detail="Expense not found")
+        return updated
     
-    # Get total abonos for this expense
-    all_abonos = await db.expense_abonos.find({"expense_id": expense_id}, {"_id": 0}).to_list(1000)
-    total_paid = sum(a.get("amount", 0) for a in all_abonos)
-    print(f"📊 [ADD_ABONO] Total abonos: {len(all_abonos)}, Total pagado: {total_paid}, Monto expense: {expense.get('amount', 0)}")
-    
-    # Check payment status based on expense category
-    print(f"🔍 [ADD_ABONO] Verificando estado de pago, categoria: {expense.get('category')}")
-    if expense.get("category") == "pago_propietario":
-        print(f"💼 [ADD_ABONO] Es pago propietario, revisando gastos relacionados...")
-        # For owner payments, check if all related expenses are paid
-        supplier_expenses = []
-        if expense.get("related_reservation_id"):
-            supplier_expenses = await db.expenses.find({
-                "related_reservation_id": expense.get("related_reservation_id"),
-                "category": "pago_suplidor"
-            }, {"_id": 0}).to_list(1000)
-        
-        print(f"📋 [ADD_ABONO] Supplier expenses encontrados: {len(supplier_expenses)}")
-        
-        # Check if all supplier expenses are paid
-        all_suppliers_paid = True
-        for supplier_expense in supplier_expenses:
-            supplier_abonos = await db.expense_abonos.find({"expense_id": supplier_expense["id"]}, {"_id": 0}).to_list(1000)
-            supplier_total_paid = sum(a.get("amount", 0) for a in supplier_abonos)
-            if supplier_total_paid < supplier_expense.get("amount", 0):
-                all_suppliers_paid = False
-                print(f"❌ [ADD_ABONO] Suplidor {supplier_expense.get('description')} AÚN DEBE: {supplier_expense.get('amount', 0) - supplier_total_paid}")
-                break
-        
-        # Check if deposit was returned (if applicable)
-        deposit_returned = True
-        if expense.get("related_reservation_id"):
-            reservation = await db.reservations.find_one({"id": expense.get("related_reservation_id")}, {"_id": 0})
-            if reservation and reservation.get("deposit", 0) > 0:
-                deposit_expense = await db.expenses.find_one({
-                    "related_reservation_id": expense.get("related_reservation_id"),
-                    "category": "devolucion_deposito",
-                    "payment_status": "paid"
-                }, {"_id": 0})
-                deposit_returned = deposit_expense is not None
-                print(f"💵 [ADD_ABONO] Depósito devuelto: {deposit_returned}")
-        
-        # ONLY mark owner payment as 'paid' if ALL conditions met
-        # For owner payments, status remains 'pending' until all conditions are satisfied
-        owner_paid = total_paid >= expense.get("amount", 0)
-        if owner_paid and all_suppliers_paid and deposit_returned:
-            new_status = "paid"
-        else:
-            new_status = "pending"
-        print(f"📌 [ADD_ABONO] Propietario pagado: {owner_paid}, Suplidores pagados: {all_suppliers_paid}, Depósito devuelto: {deposit_returned}")
-        print(f"✅ [ADD_ABONO] Nuevo estado propietario: {new_status}")
-    else:
-        # For supplier payments and other expenses, check for partial payments
-        if total_paid >= expense.get("amount", 0):
-            new_status = "paid"
-        elif total_paid > 0:
-            new_status = "partial"
-        else:
-            new_status = "pending"
-        print(f"✅ [ADD_ABONO] Nuevo estado suplidor: {new_status}")
-        
-        # Si es un pago de suplidor, también recalcular estado del propietario
-        if expense.get("category") == "pago_suplidor" and expense.get("related_reservation_id"):
-            print(f"🔄 [ADD_ABONO] Recalculando estado del propietario después de pagar suplidor...")
-            
-            owner_expense = await db.expenses.find_one({
-                "related_reservation_id": expense.get("related_reservation_id"),
-                "category": "pago_propietario"
-            }, {"_id": 0})
-            
-            if owner_expense:
-                # Verificar si propietario está pagado
-                owner_abonos = await db.expense_abonos.find({"expense_id": owner_expense["id"]}, {"_id": 0}).to_list(1000)
-                owner_total_paid = sum(a.get("amount", 0) for a in owner_abonos)
-                owner_paid = owner_total_paid >= owner_expense.get("amount", 0)
-                
-                # Verificar si TODOS los suplidores están pagados
-                supplier_expenses = await db.expenses.find({
-                    "related_reservation_id": expense.get("related_reservation_id"),
-                    "category": "pago_suplidor"
-                }, {"_id": 0}).to_list(1000)
-                
-                all_suppliers_paid = True
-                for supp_exp in supplier_expenses:
-                    supp_abonos = await db.expense_abonos.find({"expense_id": supp_exp["id"]}, {"_id": 0}).to_list(1000)
-                    supp_total_paid = sum(a.get("amount", 0) for a in supp_abonos)
-                    if supp_total_paid < supp_exp.get("amount", 0):
-                        all_suppliers_paid = False
-                        print(f"❌ [ADD_ABONO] Suplidor {supp_exp.get('description')} AÚN PENDIENTE")
-                        break
-                
-                # Verificar depósito
-                deposit_returned = True
-                reservation = await db.reservations.find_one({"id": expense.get("related_reservation_id")}, {"_id": 0})
-                if reservation and reservation.get("deposit", 0) > 0:
-                    deposit_expense = await db.expenses.find_one({
-                        "related_reservation_id": expense.get("related_reservation_id"),
-                        "category": "devolucion_deposito",
-                        "payment_status": "paid"
-                    }, {"_id": 0})
-                    deposit_returned = deposit_expense is not None
-                
-                # Actualizar estado del propietario
-                # For owner payments, status remains 'pending' until all conditions are satisfied
-                if owner_paid and all_suppliers_paid and deposit_returned:
-                    owner_new_status = "paid"
-                else:
-                    owner_new_status = "pending"
-                print(f"📌 [ADD_ABONO] Estado propietario: Owner={owner_paid}, Supp={all_suppliers_paid}, Dep={deposit_returned} → {owner_new_status}")
-                
-                await db.expenses.update_one(
-                    {"id": owner_expense["id"]},
-                    {"$set": {"payment_status": owner_new_status}}
-                )
-                print(f"✅ [ADD_ABONO] Estado propietario actualizado a: {owner_new_status}")
+    try:
+        expense = await run_in_transaction(db, write_abono)
+    except Exception as e:
+        if "abono" in written and not await transactions_supported(db):
+            await delete_one_tracked(db, "expense_abonos", {"id": abono_id})
+        await release_invoice_number(db, abono_id)
+        if isinstance(e, DuplicateKeyError):
+            raise HTTPException(status_code=409, detail=f"Invoice number {invoice_number} is already in use")
+        raise
+    print(f"✅ [ADD_ABONO] Abono guardado exitosamente")
     
+    # Recalcular estado del gasto (y de su reservación: propietario/suplidores/depósito)
     print(f"💾 [ADD_ABONO] Actualizando estado en BD...")
-    await db.expenses.update_one(
-        {"id": expense_id},
-        {"$set": {"payment_status": new_status}}
-    )
+    new_status = await recompute_expense_payment_status(db, expense)
     print(f"✅ [ADD_ABONO] Estado actualizado a: {new_status}")
     
     return abono
@@ -2615,153 +2745,32 @@ async def add_abono_to_expense(expense_id: str, abono_data: AbonoCreate, current
 async def get_expense_abonos(expense_id: str, current_user: dict = Depends(get_current_user)):
     """Get all abonos for an expense"""
     abonos = await db.expense_abonos.find({"expense_id": expense_id}, {"_id": 0}).sort("payment_date", -1).to_list(100)
-    return [restore_datetimes(a, ["payment_date", "created_at"]) for a in abonos]
+    return codec_for(Abono).json_response(abonos)
 
 @api_router.delete("/expenses/{expense_id}/abonos/{abono_id}")
 async def delete_expense_abono(expense_id: str, abono_id: str, current_user: dict = Depends(require_admin)):
     """Delete an abono from an expense (admin only) - to correct errors"""
     print(f"🗑️ [DELETE_ABONO] Eliminando abono {abono_id} del expense {expense_id}")
     
-    # Delete the abono
-    result = await db.expense_abonos.delete_one({"expense_id": expense_id, "id": abono_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Abono not found")
+    async def remove_abono(session):
+        # find_one_and_delete: dos borrados simultáneos del mismo abono no lo restan dos veces
+        deleted = await db.expense_abonos.find_one_and_delete(
+            {"expense_id": expense_id, "id": abono_id}, projection={"_id": 0, "amount": 1}, session=session
+        )
+        if not deleted:
+            raise HTTPException(status_code=404, detail="Abono not found")
+        await record_deletions(db, "expense_abonos", [abono_id], session=session)
+        return await apply_expense_payment(db, expense_id, -(deleted.get("amount") or 0), session=session)
+    
+    expense = await run_in_transaction(db, remove_abono)
+    await release_invoice_number(db, abono_id)
     
     print(f"✅ [DELETE_ABONO] Abono eliminado, recalculando estado...")
     
-    # Recalculate expense status using same logic as add_abono
-    expense = await db.expenses.find_one({"id": expense_id}, {"_id": 0})
+    # Recalculate expense status using the same engine as add_abono
     if expense:
-        all_abonos = await db.expense_abonos.find({"expense_id": expense_id}, {"_id": 0}).to_list(1000)
-        total_paid = sum(a.get("amount", 0) for a in all_abonos)
-        
-        print(f"🔍 [DELETE_ABONO] Verificando estado, categoria: {expense.get('category')}")
-        
-        if expense.get("category") == "pago_propietario":
-            print(f"💼 [DELETE_ABONO] Es pago propietario, revisando todos los requisitos...")
-            
-            # Check if all supplier expenses are paid
-            supplier_expenses = []
-            if expense.get("related_reservation_id"):
-                supplier_expenses = await db.expenses.find({
-                    "related_reservation_id": expense.get("related_reservation_id"),
-                    "category": "pago_suplidor"
-                }, {"_id": 0}).to_list(1000)
-            
-            all_suppliers_paid = True
-            for supplier_expense in supplier_expenses:
-                supplier_abonos = await db.expense_abonos.find({"expense_id": supplier_expense["id"]}, {"_id": 0}).to_list(1000)
-                supplier_total_paid = sum(a.get("amount", 0) for a in supplier_abonos)
-                if supplier_total_paid < supplier_expense.get("amount", 0):
-                    all_suppliers_paid = False
-                    print(f"❌ [DELETE_ABONO] Suplidor {supplier_expense.get('description')} AÚN DEBE: {supplier_expense.get('amount', 0) - supplier_total_paid}")
-                    break
-            
-            # Check if deposit was returned
-            deposit_returned = True
-            if expense.get("related_reservation_id"):
-                reservation = await db.reservations.find_one({"id": expense.get("related_reservation_id")}, {"_id": 0})
-                if reservation and reservation.get("deposit", 0) > 0:
-                    deposit_expense = await db.expenses.find_one({
-                        "related_reservation_id": expense.get("related_reservation_id"),
-                        "category": "devolucion_deposito",
-                        "payment_status": "paid"
-                    }, {"_id": 0})
-                    deposit_returned = deposit_expense is not None
-                    print(f"💵 [DELETE_ABONO] Depósito devuelto: {deposit_returned}")
-            
-            # ONLY mark owner payment as 'paid' if ALL conditions met
-            # For owner payments, status remains 'pending' until all conditions are satisfied
-            owner_paid = total_paid >= expense.get("amount", 0)
-            if owner_paid and all_suppliers_paid and deposit_returned:
-                new_status = "paid"
-            else:
-                new_status = "pending"
-            print(f"📌 [DELETE_ABONO] Propietario pagado: {owner_paid}, Suplidores: {all_suppliers_paid}, Depósito: {deposit_returned}")
-            print(f"✅ [DELETE_ABONO] Nuevo estado propietario: {new_status}")
-            
-            # También actualizar el estado del gasto propietario después de eliminar cualquier abono de suplidor o depósito
-            await db.expenses.update_one(
-                {"id": expense_id},
-                {"$set": {"payment_status": new_status}}
-            )
-        elif expense.get("category") == "pago_suplidor":
-            # Si eliminamos abono de un suplidor, también debemos recalcular el estado del propietario
-            print(f"🛎️ [DELETE_ABONO] Es pago suplidor, actualizando estado del suplidor y del propietario...")
-            
-            # Actualizar estado del suplidor
-            if total_paid >= expense.get("amount", 0):
-                new_status = "paid"
-            elif total_paid > 0:
-                new_status = "partial"
-            else:
-                new_status = "pending"
-            await db.expenses.update_one(
-                {"id": expense_id},
-                {"$set": {"payment_status": new_status}}
-            )
-            print(f"✅ [DELETE_ABONO] Estado suplidor actualizado: {new_status}")
-            
-            # Ahora actualizar el estado del propietario
-            if expense.get("related_reservation_id"):
-                owner_expense = await db.expenses.find_one({
-                    "related_reservation_id": expense.get("related_reservation_id"),
-                    "category": "pago_propietario"
-                }, {"_id": 0})
-                
-                if owner_expense:
-                    print(f"🔄 [DELETE_ABONO] Recalculando estado del propietario...")
-                    
-                    # Verificar propietario pagado
-                    owner_abonos = await db.expense_abonos.find({"expense_id": owner_expense["id"]}, {"_id": 0}).to_list(1000)
-                    owner_total_paid = sum(a.get("amount", 0) for a in owner_abonos)
-                    owner_paid = owner_total_paid >= owner_expense.get("amount", 0)
-                    
-                    # Verificar suplidores
-                    supplier_expenses = await db.expenses.find({
-                        "related_reservation_id": expense.get("related_reservation_id"),
-                        "category": "pago_suplidor"
-                    }, {"_id": 0}).to_list(1000)
-                    
-                    all_suppliers_paid = True
-                    for supp_exp in supplier_expenses:
-                        supp_abonos = await db.expense_abonos.find({"expense_id": supp_exp["id"]}, {"_id": 0}).to_list(1000)
-                        supp_total_paid = sum(a.get("amount", 0) for a in supp_abonos)
-                        if supp_total_paid < supp_exp.get("amount", 0):
-                            all_suppliers_paid = False
-                            break
-                    
-                    # Verificar depósito
-                    deposit_returned = True
-                    reservation = await db.reservations.find_one({"id": expense.get("related_reservation_id")}, {"_id": 0})
-                    if reservation and reservation.get("deposit", 0) > 0:
-                        deposit_expense = await db.expenses.find_one({
-                            "related_reservation_id": expense.get("related_reservation_id"),
-                            "category": "devolucion_deposito",
-                            "payment_status": "paid"
-                        }, {"_id": 0})
-                        deposit_returned = deposit_expense is not None
-                    
-                    # Actualizar estado del propietario
-                    # For owner payments, status remains 'pending' until all conditions are satisfied
-                    if owner_paid and all_suppliers_paid and deposit_returned:
-                        owner_new_status = "paid"
-                    else:
-                        owner_new_status = "pending"
-                    print(f"📌 [DELETE_ABONO] Estado propietario: {owner_new_status} (Owner: {owner_paid}, Supp: {all_suppliers_paid}, Dep: {deposit_returned})")
-                    
-                    await db.expenses.update_one(
-                        {"id": owner_expense["id"]},
-                        {"$set": {"payment_status": owner_new_status}}
-                    )
-        else:
-            # For other expense types, simple check
-            new_status = "paid" if total_paid >= expense.get("amount", 0) else "pending"
-            await db.expenses.update_one(
-                {"id": expense_id},
-                {"$set": {"payment_status": new_status}}
-            )
-            print(f"✅ [DELETE_ABONO] Estado actualizado: {new_status}")
+        new_status = await recompute_expense_payment_status(db, expense)
+        print(f"✅ [DELETE_ABONO] Estado actualizado: {new_status}")
     
     return {"message": "Abono deleted successfully"}
 
@@ -2769,39 +2778,17 @@ async def delete_expense_abono(expense_id: str, abono_id: str, current_user: dic
 
 @api_router.get("/dashboard/stats", response_model=DashboardStats)
 async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
-    """Get dashboard statistics"""
-    all_reservations = await db.reservations.find({}, {"_id": 0}).to_list(10000)
-    
-    total_reservations = len(all_reservations)
-    # Solo contar como pendiente si balance_due > 0 Y tiene campos requeridos
-    pending_reservations = len([
-        r for r in all_reservations 
-        if r.get("balance_due", 0) > 0 
-        and all(key in r for key in ['check_in_time', 'check_out_time', 'base_price', 'subtotal'])
-    ])
-    
-    total_revenue_dop = sum(r.get("amount_paid", 0) for r in all_reservations if r.get("currency") == "DOP")
-    total_revenue_usd = sum(r.get("amount_paid", 0) for r in all_reservations if r.get("currency") == "USD")
-    
-    pending_payments_dop = sum(r.get("balance_due", 0) for r in all_reservations if r.get("currency") == "DOP")
-    pending_payments_usd = sum(r.get("balance_due", 0) for r in all_reservations if r.get("currency") == "USD")
-    
-    all_expenses = await db.expenses.find({}, {"_id": 0}).to_list(10000)
-    total_expenses_dop = sum(e.get("amount", 0) for e in all_expenses if e.get("currency") == "DOP")
-    total_expenses_usd = sum(e.get("amount", 0) for e in all_expenses if e.get("currency") == "USD")
-    
-    all_owners = await db.villa_owners.find({}, {"_id": 0}).to_list(1000)
-    total_owners = len(all_owners)
-    owners_balance_due_dop = sum(o.get("balance_due", 0) for o in all_owners)
-    owners_balance_due_usd = 0
+    """Get dashboard statistics - history totals come from the incrementally maintained stats document"""
+    totals = await get_stats_counters(db)
+    totals.update(await compute_live_totals(db))
     
     # Obtener reservaciones recientes - filtrar las que tengan todos los campos requeridos
     recent_reservations_raw = await db.reservations.find({}, {"_id": 0}).sort("created_at", -1).limit(5).to_list(5)
     recent_reservations = []
     for r in recent_reservations_raw:
         # Solo agregar si tiene campos críticos
-        if all(key in r for key in ['check_in_time', 'check_out_time', 'base_price', 'subtotal']):
-            recent_reservations.append(restore_datetimes(r, ["reservation_date", "created_at", "updated_at"]))
+        if all(key in r for key in REQUIRED_RESERVATION_FIELDS):
+            recent_reservations.append(codec_for(Reservation).decode(r))
     
     # Obtener reservaciones con pagos pendientes - filtrar las que tengan todos los campos requeridos
     pending_payment_reservations_raw = await db.reservations.find(
@@ -2811,63 +2798,75 @@ async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
     pending_payment_reservations = []
     for r in pending_payment_reservations_raw:
         # Solo agregar si tiene campos críticos
-        if all(key in r for key in ['check_in_time', 'check_out_time', 'base_price', 'subtotal']):
-            pending_payment_reservations.append(restore_datetimes(r, ["reservation_date", "created_at", "updated_at"]))
-    
-    # Calcular compromisos del mes actual
-    from datetime import datetime, timezone
-    now = datetime.now(timezone.utc)
-    current_month = now.month
-    current_year = now.year
-    
-    # Obtener todos los gastos con categoría "compromiso" del mes actual
-    commitments = []
-    for expense in all_expenses:
-        if expense.get("category") == "compromiso":
-            expense_date = expense.get("expense_date")
-            if isinstance(expense_date, str):
-                expense_date = datetime.fromisoformat(expense_date.replace('Z', '+00:00'))
-            if expense_date and expense_date.month == current_month and expense_date.year == current_year:
-                commitments.append(expense)
-    
-    commitments_count = len(commitments)
-    commitments_total_dop = sum(c.get("amount", 0) for c in commitments if c.get("currency") == "DOP")
-    commitments_total_usd = sum(c.get("amount", 0) for c in commitments if c.get("currency") == "USD")
-    commitments_paid_count = len([c for c in commitments if c.get("payment_status") == "paid"])
-    commitments_pending_count = len([c for c in commitments if c.get("payment_status") == "pending"])
-    
-    # Contar compromisos vencidos (pendientes con fecha pasada)
-    commitments_overdue_count = 0
-    for commitment in commitments:
-        if commitment.get("payment_status") == "pending":
-            expense_date = commitment.get("expense_date")
-            if isinstance(expense_date, str):
-                expense_date = datetime.fromisoformat(expense_date.replace('Z', '+00:00'))
-            if expense_date and expense_date.date() < now.date():
-                commitments_overdue_count += 1
+        if all(key in r for key in REQUIRED_RESERVATION_FIELDS):
+            pending_payment_reservations.append(codec_for(Reservation).decode(r))
     
     return DashboardStats(
-        total_reservations=total_reservations,
-        pending_reservations=pending_reservations,
-        total_revenue_dop=total_revenue_dop,
-        total_revenue_usd=total_revenue_usd,
-        pending_payments_dop=pending_payments_dop,
-        pending_payments_usd=pending_payments_usd,
-        total_expenses_dop=total_expenses_dop,
-        total_expenses_usd=total_expenses_usd,
-        total_owners=total_owners,
-        owners_balance_due_dop=owners_balance_due_dop,
-        owners_balance_due_usd=owners_balance_due_usd,
+        **totals,
         recent_reservations=recent_reservations,
-        pending_payment_reservations=pending_payment_reservations,
-        commitments_count=commitments_count,
-        commitments_total_dop=commitments_total_dop,
-        commitments_total_usd=commitments_total_usd,
-        commitments_paid_count=commitments_paid_count,
-        commitments_pending_count=commitments_pending_count,
-        commitments_overdue_count=commitments_overdue_count
+        pending_payment_reservations=pending_payment_reservations
     )
 
+@api_router.post("/admin/stats/rebuild")
+async def rebuild_dashboard_stats(current_user: dict = Depends(require_admin)):
+    """Recompute the dashboard counters from scratch (admin only)"""
+    counters = await rebuild_stats_counters(db)
+    return {"message": "Dashboard counters rebuilt", "counters": counters}
+
+@api_router.post("/admin/expenses/repair-balances")
+async def repair_expense_balances_endpoint(dry_run: bool = False, current_user: dict = Depends(require_admin)):
+    """Verify every expense's stored total_paid/balance_due against its abonos and fix mismatches (admin only)"""
+    return await repair_expense_balances(db, dry_run=dry_run)
+
+@api_router.get("/admin/stats/drift")
+async def get_dashboard_stats_drift(current_user: dict = Depends(require_admin)):
+    """Compare the stored dashboard counters against a full aggregation (admin only)"""
+    return await check_stats_drift(db)
+
+# ============ INDEX ENDPOINTS (ADMIN ONLY) ============
+
+@api_router.get("/admin/indexes/stats")
+async def get_indexes_stats(current_user: dict = Depends(require_admin)):
+    """Get usage stats for every registered index (admin only)"""
+    stats = await get_index_usage_stats(db)
+    return {"indexes": stats}
+
+# ============ PAYMENT STATUS (ADMIN ONLY) ============
+
+@api_router.post("/admin/payment-status/recompute")
+async def recompute_payment_status(current_user: dict = Depends(require_admin)):
+    """Recompute owner/supplier expense payment status for every reservation, in batches (admin only)"""
+    summary = await recompute_all_payment_status(db)
+    return {"message": "Payment status recomputed", **summary}
+
+# ============ REFERENCE CACHE (ADMIN ONLY) ============
+
+@api_router.get("/admin/cache/stats")
+async def get_reference_cache_stats(current_user: dict = Depends(require_admin)):
+    """Hit/miss counters of this worker's reference data cache and its cross-worker invalidation lag (admin only)"""
+    return {**reference_cache.stats(), "invalidation": invalidation_listener.stats()}
+
+@api_router.post("/admin/cache/clear")
+async def clear_reference_cache(current_user: dict = Depends(require_admin)):
+    """Drop every cached reference entry, in every worker (admin only)"""
+    await invalidate_reference_data(db, *REFERENCE_NAMESPACES)
+    return {"message": "Reference cache cleared"}
+
+# ============ OUTBOX (ADMIN ONLY) ============
+
+@api_router.get("/admin/outbox")
+async def get_outbox_status(current_user: dict = Depends(require_admin)):
+    """Outbox lag, event counts by status and failed events (admin only)"""
+    return {**await outbox_status(db), "worker": outbox_worker.stats()}
+
+@api_router.post("/admin/outbox/{event_id}/retry")
+async def retry_outbox_event(event_id: str, current_user: dict = Depends(require_admin)):
+    """Requeue a failed outbox event (admin only)"""
+    if not await retry_event(db, event_id):
+        raise HTTPException(status_code=404, detail="Failed event not found")
+    outbox_worker.notify()
+    return {"message": "Event requeued"}
+
 # ============ HEALTH CHECK ============
 
 @api_router.get("/health")
@@ -2876,93 +2875,115 @@ async def health_check():
     return {"status": "healthy", "service": "espacios-con-piscina-api"}
 
 # ============ BACKUP/RESTORE SYSTEM ============
-import json
-from bson import json_util
+from backup import (
+    stream_backup, backup_filename, plan_backup, is_legacy_backup, legacy_backup_records, aiter_records,
+    aiter_backup_records, restore_backup, rebuild_derived_data, reset_backup_chains, restore_progress,
+    RESTORE_BATCH_SIZE
+)
+from backup_scheduler import backup_scheduler, list_backups, verify_backup
 
 @api_router.get("/backup/download")
-async def download_full_backup(current_user: dict = Depends(require_admin)):
-    """Descargar backup completo de toda la base de datos"""
+async def download_full_backup(incremental: bool = False, current_user: dict = Depends(require_admin)):
+    """
+    Descargar backup de toda la base de datos
+    NDJSON comprimido con gzip, generado por lotes desde los cursores (ver backup.py)
+    incremental=true: solo lo creado, modificado o eliminado desde el backup anterior descargado
+    """
     try:
-        backup_data = {
-            "backup_date": datetime.now(timezone.utc).isoformat(),
-            "app_version": "1.0",
-            "collections": {}
-        }
-        
-        # Colecciones a respaldar
-        collections_to_backup = [
-            "users", "customers", "categories", "expense_categories",
-            "villas", "extra_services", "reservations", "villa_owners",
-            "expenses", "reservation_abonos", "expense_abonos",
-            "invoice_counter", "invoice_templates", "logo_config"
-        ]
-        
-        for collection_name in collections_to_backup:
-            collection = db[collection_name]
-            # Obtener todos los documentos
-            documents = await collection.find({}, {"_id": 0}).to_list(None)
-            backup_data["collections"][collection_name] = documents
-        
-        # Convertir a JSON
-        json_str = json.dumps(backup_data, indent=2, default=json_util.default, ensure_ascii=False)
-        
-        # Crear nombre de archivo con fecha
-        filename = f"espacios_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        
-        # Retornar como descarga
-        return StreamingResponse(
-            io.BytesIO(json_str.encode('utf-8')),
-            media_type="application/json",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al crear backup: {str(e)}")
+        plan = await plan_backup(db, incremental=incremental)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        stream_backup(db, plan=plan),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f"attachment; filename={backup_filename(kind=plan['kind'])}"}
+    )
+
+async def _backup_records(file: UploadFile):
+    head = await file.read(64)
+    await file.seek(0)
+    if is_legacy_backup(head):
+        # Formato anterior (un solo JSON): no se puede leer por partes
+        return aiter_records(legacy_backup_records(await file.read()))
+    return aiter_backup_records(file.read)
 
 @api_router.post("/backup/restore")
-async def restore_from_backup(file: UploadFile = File(...), current_user: dict = Depends(require_admin)):
-    """Restaurar backup completo - CUIDADO: Sobrescribe datos existentes"""
+async def restore_from_backup(
+    file: UploadFile = File(...),
+    increments: List[UploadFile] = File(default=[]),
+    batch_size: int = RESTORE_BATCH_SIZE,
+    current_user: dict = Depends(require_admin)
+):
+    """
+    Restaurar backup completo - CUIDADO: Sobrescribe datos existentes
+    increments: los backups incrementales descargados después de file, en orden
+    Se lee por bloques, se carga en colecciones sombra por lotes de batch_size y solo al final
+    se renombran sobre las reales; el progreso se consulta en GET /api/backup/restore/status
+    """
+    if restore_progress.running:
+        raise HTTPException(status_code=409, detail="Ya hay una restauración en curso")
+    if batch_size < 1:
+        raise HTTPException(status_code=400, detail="batch_size debe ser mayor que 0")
     try:
-        # Leer archivo
-        content = await file.read()
-        backup_data = json.loads(content.decode('utf-8'))
+        sources = [await _backup_records(upload) for upload in [file, *increments]]
         
-        if "collections" not in backup_data:
-            raise HTTPException(status_code=400, detail="Formato de backup inválido")
+        try:
+            result = await restore_backup(db, sources, batch_size=batch_size, progress=restore_progress)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        restored_collections = result["restored"]
         
-        restored_collections = []
-        errors = []
-        
-        for collection_name, documents in backup_data["collections"].items():
-            try:
-                collection = db[collection_name]
-                
-                if documents:  # Solo si hay documentos
-                    # Eliminar datos existentes (CUIDADO!)
-                    await collection.delete_many({})
-                    
-                    # Insertar documentos del backup
-                    if documents:
-                        await collection.insert_many(documents)
-                    
-                    restored_collections.append({
-                        "collection": collection_name,
-                        "documents": len(documents)
-                    })
-            except Exception as e:
-                errors.append({
-                    "collection": collection_name,
-                    "error": str(e)
-                })
+        # Registro de facturas, saldos de gastos, contadores, caché y cadenas de backups
+        await rebuild_derived_data(db, restored_collections)
         
         return {
             "message": "Backup restaurado exitosamente",
             "restored": restored_collections,
-            "errors": errors if errors else None,
-            "backup_date": backup_data.get("backup_date", "Desconocida")
+            "skipped": result["skipped"] or None,
+            "backups": result["backups"],
+            "documents": result["documents"],
+            "seconds": result["seconds"],
+            "docs_per_second": result["docs_per_second"],
+            "backup_date": result["header"].get("backup_date") or "Desconocida"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al restaurar backup: {str(e)}")
 
+@api_router.get("/backup/restore/status")
+async def get_restore_status(current_user: dict = Depends(require_admin)):
+    """Progreso de la restauración en curso (o de la última): fase, documentos y docs/s"""
+    return restore_progress.snapshot()
+
+@api_router.get("/backup/scheduled")
+async def list_scheduled_backups(current_user: dict = Depends(require_admin)):
+    """Estado del scheduler de backups y manifiestos de los archivos en BACKUP_DIR"""
+    return {
+        "scheduler": backup_scheduler.stats(),
+        "backups": await asyncio.to_thread(list_backups, backup_scheduler.directory)
+    }
+
+@api_router.post("/backup/scheduled/run")
+async def run_scheduled_backup(current_user: dict = Depends(require_admin)):
+    """Escribe ahora un backup en BACKUP_DIR y aplica la retención"""
+    if not backup_scheduler.enabled:
+        raise HTTPException(status_code=400, detail="BACKUP_DIR no está configurado")
+    try:
+        return await backup_scheduler.run_once(db)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@api_router.post("/backup/scheduled/{filename}/verify")
+async def verify_scheduled_backup(filename: str, current_user: dict = Depends(require_admin)):
+    """Relee un backup programado y compara archivo y colecciones con su manifiesto"""
+    backups = await asyncio.to_thread(list_backups, backup_scheduler.directory)
+    if filename not in {manifest["file"] for manifest in backups}:
+        raise HTTPException(status_code=404, detail="Backup no encontrado")
+    return await asyncio.to_thread(verify_backup, os.path.join(backup_scheduler.directory, filename))
+
 @api_router.get("/backup/info")
 async def get_backup_info(current_user: dict = Depends(require_admin)):
     """Obtener información de estadísticas de la base de datos para backup"""
@@ -3007,7 +3028,10 @@ async def reset_all_data(admin_code: str, current_user: dict = Depends(require_a
             "customers", "categories", "expense_categories",
             "villas", "extra_services", "reservations", "villa_owners",
             "expenses", "reservation_abonos", "expense_abonos",
-            "invoice_counter", "invoice_templates", "logo_config"
+            "invoice_counter", "invoice_numbers", "stats", "invoice_templates", "logo_config",
+            "tombstones",
+            # Eventos pendientes de datos ya borrados (efectos de reservaciones, contadores)
+            "outbox"
         ]
         
         for collection_name in collections_to_clear:
@@ -3017,6 +3041,9 @@ async def reset_all_data(admin_code: str, current_user: dict = Depends(require_a
                 "collection": collection_name,
                 "deleted": result.deleted_count
             })
+        await invalidate_reference_data(db, *REFERENCE_NAMESPACES)
+        # Los backups anteriores ya no continúan: el próximo incremental exige uno completo
+        await reset_backup_chains(db)
         
         # NO eliminar usuarios - se mantienen todos (admin y empleados)
         deleted_summary.append({
@@ -3156,6 +3183,10 @@ async def import_from_excel(
 Total errores: {sum(len(r.get('errors', [])) for r in results.values())}
         """
         
+        # Los contadores del dashboard se derivan de reservaciones y gastos
+        await rebuild_stats_counters(db)
+        await invalidate_reference_data(db, *REFERENCE_NAMESPACES)
+        
         return {
             "success": True,
             "summary": summary,
@@ -3333,6 +3364,7 @@ async def import_villa_categories_file(file: UploadFile = File(...), current_use
     try:
         content = await file.read()
         result = await import_villa_categories(content, db)
+        await invalidate_reference_data(db, CATEGORIES)
         
         summary = f"""✅ Importación de Categorías de Villas completada:
 
@@ -3359,6 +3391,7 @@ async def import_villas_file(file: UploadFile = File(...), current_user: dict =
     try:
         content = await file.read()
         result = await import_villas(content, db)
+        await invalidate_reference_data(db, VILLAS)
         
         summary = f"""✅ Importación de Villas completada:
 
@@ -3385,6 +3418,7 @@ async def import_services_file(file: UploadFile = File(...), current_user: dict
     try:
         content = await file.read()
         result = await import_services(content, db)
+        await invalidate_reference_data(db, EXTRA_SERVICES)
         
         summary = f"""✅ Importación de Servicios Extra completada:
 
@@ -3411,6 +3445,7 @@ async def import_expense_categories_file(file: UploadFile = File(...), current_u
     try:
         content = await file.read()
         result = await import_expense_categories(content, db)
+        await invalidate_reference_data(db, EXPENSE_CATEGORIES)
         
         summary = f"""✅ Importación de Categorías de Gastos completada:
 
@@ -3437,6 +3472,7 @@ async def import_reservations_file(file: UploadFile = File(...), current_user: d
     try:
         content = await file.read()
         result = await import_reservations(content, db)
+        await rebuild_stats_counters(db)
         
         summary = f"""✅ Importación de Reservaciones completada:
 
@@ -3459,11 +3495,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=PAGINATION_HEADERS
 )
 
 
+# Startup event
+@app.on_event("startup")
+async def startup_event():
+    await ensure_indexes(db)
+    await ensure_invoice_registry(db)
+    await ensure_expense_balances(db)
+    invalidation_listener.start(db)
+    outbox_worker.start(db)
+    backup_scheduler.start(db)
+
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
+    await invalidation_listener.stop()
+    await outbox_worker.stop()
+    await backup_scheduler.stop()
     Database.close_db()
@@ -0,0 +1,206 @@
+"""
+Contadores del dashboard mantenidos de forma incremental
+Un único documento (colección stats, id 'dashboard') con los totales de reservaciones y
+gastos. Cada escritura aplica con $inc la diferencia entre el documento antes y después
+del cambio, así GET /api/dashboard/stats lo lee en O(1) en vez de agregar todo el historial.
+Dentro de una transacción (session) la diferencia no toca el documento: se encola un evento
+stats.delta en el outbox y el worker hace el $inc después, así los abonos simultáneos no
+chocan en el documento de stats (los contadores quedan al día en cuanto se drena el outbox).
+rebuild_stats_counters lo recalcula desde cero y check_stats_drift lo compara con la agregación
+"""
+import logging
+from datetime import datetime, timezone
+import uuid
+from typing import Dict, Iterable, Optional, Tuple
+
+from dashboard_stats import compute_history_totals, CURRENCIES, REQUIRED_RESERVATION_FIELDS
+from outbox import enqueue, OUTBOX_COLLECTION, PENDING, PROCESSING
+
+logger = logging.getLogger(__name__)
+
+STATS_COLLECTION = "stats"
+DASHBOARD_STATS_ID = "dashboard"
+# Evento del outbox con la diferencia de una escritura transaccional
+STATS_DELTA = "stats.delta"
+
+COUNTER_FIELDS = [
+    "total_reservations",
+    "pending_reservations",
+    "total_revenue_dop",
+    "total_revenue_usd",
+    "pending_payments_dop",
+    "pending_payments_usd",
+    "total_expenses_dop",
+    "total_expenses_usd",
+]
+
+# Diferencia tolerada por el verificador (sumas de floats acumuladas con $inc)
+DRIFT_TOLERANCE = 0.01
+
+
+def reservation_counters(reservation: Optional[dict]) -> Dict[str, float]:
+    """Lo que aporta una reservación a los contadores"""
+    if not reservation:
+        return {}
+    counters = {"total_reservations": 1}
+    balance_due = reservation.get("balance_due") or 0
+    if balance_due > 0 and all(key in reservation for key in REQUIRED_RESERVATION_FIELDS):
+        counters["pending_reservations"] = 1
+    currency = reservation.get("currency")
+    if currency in CURRENCIES:
+        suffix = currency.lower()
+        counters[f"total_revenue_{suffix}"] = reservation.get("amount_paid") or 0
+        counters[f"pending_payments_{suffix}"] = balance_due
+    return counters
+
+
+def expense_counters(expense: Optional[dict]) -> Dict[str, float]:
+    """Lo que aporta un gasto a los contadores"""
+    if not expense:
+        return {}
+    currency = expense.get("currency")
+    if currency not in CURRENCIES:
+        return {}
+    return {f"total_expenses_{currency.lower()}": expense.get("amount") or 0}
+
+
+def _delta(before: Dict[str, float], after: Dict[str, float]) -> Dict[str, float]:
+    delta = {}
+    for field in set(before) | set(after):
+        change = after.get(field, 0) - before.get(field, 0)
+        if change:
+            delta[field] = change
+    return delta
+
+
+async def _inc_counters(db, delta: Dict[str, float], session=None) -> None:
+    await db[STATS_COLLECTION].update_one(
+        {"id": DASHBOARD_STATS_ID},
+        {"$inc": delta, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True,
+        session=session
+    )
+
+
+async def _apply_delta(db, delta: Dict[str, float], session=None) -> None:
+    """Sin session: $inc directo. Con session: evento stats.delta en la misma transacción"""
+    if not delta:
+        return
+    if session is None:
+        await _inc_counters(db, delta)
+        return
+    await enqueue(db, STATS_DELTA, f"{STATS_DELTA}:{uuid.uuid4()}", {"delta": delta}, session=session)
+
+
+async def apply_stats_delta(db, event: dict, session) -> None:
+    """
+    Handler del outbox: suma la diferencia del evento a los contadores
+    Los eventos anteriores a la última reconstrucción ya están en la agregación y se descartan
+    """
+    stats = await db[STATS_COLLECTION].find_one(
+        {"id": DASHBOARD_STATS_ID}, {"_id": 0, "deltas_since": 1}, session=session
+    ) or {}
+    deltas_since = stats.get("deltas_since")
+    if deltas_since and event["created_at"] < deltas_since:
+        return
+    await _inc_counters(db, event["payload"]["delta"], session=session)
+
+
+async def _pending_deltas(db) -> Dict[str, float]:
+    """Suma de los eventos stats.delta que el worker todavía no aplicó"""
+    pending: Dict[str, float] = {}
+    async for event in db[OUTBOX_COLLECTION].find(
+        {"type": STATS_DELTA, "status": {"$in": [PENDING, PROCESSING]}}, {"_id": 0, "payload": 1}
+    ):
+        for field, value in event["payload"]["delta"].items():
+            pending[field] = pending.get(field, 0) + value
+    return pending
+
+
+async def track_reservation_change(db, before: Optional[dict], after: Optional[dict], session=None) -> None:
+    """
+    Aplica el cambio de una reservación: before=None al crear, after=None al eliminar
+    Los documentos pueden ser parciales siempre que incluyan los campos que cuentan
+    """
+    await _apply_delta(db, _delta(reservation_counters(before), reservation_counters(after)), session=session)
+
+
+async def track_expense_change(db, before: Optional[dict], after: Optional[dict]) -> None:
+    """Aplica el cambio de un gasto: before=None al crear, after=None al eliminar"""
+    await _apply_delta(db, _delta(expense_counters(before), expense_counters(after)))
+
+
+async def track_expenses_added(db, expenses: Iterable[dict], session=None) -> None:
+    """Suma varios gastos nuevos con un solo $inc (p. ej. los automáticos de una reservación)"""
+    added: Dict[str, float] = {}
+    for expense in expenses:
+        for field, value in expense_counters(expense).items():
+            added[field] = added.get(field, 0) + value
+    await _apply_delta(db, _delta({}, added), session=session)
+
+
+async def track_expense_changes(db, changes: Iterable[Tuple[Optional[dict], Optional[dict]]]) -> None:
+    """Varios cambios (antes, después) de gastos con un solo $inc (p. ej. el diff de suplidores)"""
+    total: Dict[str, float] = {}
+    for before, after in changes:
+        for field, value in _delta(expense_counters(before), expense_counters(after)).items():
+            total[field] = total.get(field, 0) + value
+    await _apply_delta(db, _delta({}, total))
+
+
+async def track_expenses_removed(db, expenses: Iterable[dict]) -> None:
+    """Resta varios gastos eliminados de una vez (p. ej. los de una reservación borrada)"""
+    removed: Dict[str, float] = {}
+    for expense in expenses:
+        for field, value in expense_counters(expense).items():
+            removed[field] = removed.get(field, 0) + value
+    await _apply_delta(db, _delta(removed, {}))
+
+
+async def rebuild_stats_counters(db) -> dict:
+    """
+    Recalcula los contadores desde cero con la agregación completa
+    deltas_since (el inicio de la agregación) hace que el worker descarte los stats.delta
+    encolados antes, que la agregación ya incluye
+    """
+    started_at = datetime.now(timezone.utc)
+    totals = await compute_history_totals(db)
+    counters = {field: totals.get(field, 0) for field in COUNTER_FIELDS}
+    now = datetime.now(timezone.utc).isoformat()
+    await db[STATS_COLLECTION].update_one(
+        {"id": DASHBOARD_STATS_ID},
+        {"$set": {**counters, "updated_at": now, "rebuilt_at": now, "deltas_since": started_at}},
+        upsert=True
+    )
+    logger.info(f"Contadores del dashboard reconstruidos: {counters}")
+    return counters
+
+
+async def get_stats_counters(db) -> dict:
+    """Lectura O(1) de los contadores; si el documento no existe se reconstruye"""
+    stats = await db[STATS_COLLECTION].find_one({"id": DASHBOARD_STATS_ID}, {"_id": 0})
+    if not stats or "rebuilt_at" not in stats:
+        return await rebuild_stats_counters(db)
+    return {field: stats.get(field, 0) for field in COUNTER_FIELDS}
+
+
+async def check_stats_drift(db) -> dict:
+    """Compara los contadores guardados (más los stats.delta pendientes) con una agregación completa"""
+    stats = await db[STATS_COLLECTION].find_one({"id": DASHBOARD_STATS_ID}, {"_id": 0}) or {}
+    pending = await _pending_deltas(db)
+    totals = await compute_history_totals(db)
+
+    drift = {}
+    for field in COUNTER_FIELDS:
+        stored = stats.get(field, 0) + pending.get(field, 0)
+        actual = totals.get(field, 0)
+        if abs(stored - actual) > DRIFT_TOLERANCE:
+            drift[field] = {"stored": stored, "actual": actual, "difference": round(stored - actual, 2)}
+
+    return {
+        "ok": not drift,
+        "drift": drift,
+        "updated_at": stats.get("updated_at"),
+        "rebuilt_at": stats.get("rebuilt_at"),
+        "checked_at": datetime.now(timezone.utc).isoformat()
+    }
@@ -0,0 +1,176 @@
+"""
+Gastos de suplidores (pago_suplidor) enlazados a las líneas de servicios de una reservación
+Cada gasto guarda service_key = {service_id, supplier_name, line}: la línea es la posición del
+servicio en extra_services y distingue dos servicios con el mismo suplidor. Al cambiar los
+servicios, diff_supplier_expenses calcula inserts / updates / deletes comparando llaves (un
+diccionario por llave, sin buscar el suplidor dentro de la descripción) y server.py los aplica
+con un solo bulk_write
+"""
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+SUPPLIER_CATEGORY = "pago_suplidor"
+
+
+def _field(service, name: str, default=None):
+    """Los servicios llegan como modelos (crear) o como diccionarios (actualizar)"""
+    if isinstance(service, dict):
+        value = service.get(name, default)
+    else:
+        value = getattr(service, name, default)
+    return default if value is None else value
+
+
+def supplier_service_key(service, line: int) -> dict:
+    return {
+        "service_id": _field(service, "service_id"),
+        "supplier_name": _field(service, "supplier_name"),
+        "line": line,
+    }
+
+
+def _key_tuple(key: dict) -> tuple:
+    return (key.get("service_id"), key.get("supplier_name"), key.get("line"))
+
+
+def supplier_lines(services) -> List[Tuple[dict, dict]]:
+    """(service_key, servicio) de las líneas que generan gasto: con suplidor y costo"""
+    return [
+        (supplier_service_key(service, line), service)
+        for line, service in enumerate(services or [])
+        if _field(service, "supplier_name") and _field(service, "supplier_cost", 0) > 0
+    ]
+
+
+def supplier_amount(service) -> float:
+    return _field(service, "supplier_cost", 0) * _field(service, "quantity", 1)
+
+
+def new_supplier_expense(service, key: dict, reservation: dict, user_id: str) -> dict:
+    """
+    Gasto de un suplidor; reservation trae id, invoice_number, currency, reservation_date
+    y customer_name
+    """
+    now = datetime.now(timezone.utc)
+    return {
+        "id": str(uuid.uuid4()),
+        "category": SUPPLIER_CATEGORY,
+        "category_id": None,
+        "description": (
+            f"Pago suplidor: {key['supplier_name']} - {_field(service, 'service_name', 'N/A')} "
+            f"- Factura #{reservation.get('invoice_number')}"
+        ),
+        "amount": supplier_amount(service),
+        "currency": reservation.get("currency") or "DOP",
+        "expense_date": reservation.get("reservation_date") or now,
+        "payment_status": "pending",
+        "notes": f"Auto-generado. Cliente: {reservation.get('customer_name')}. Cantidad: {_field(service, 'quantity', 1)}",
+        "related_reservation_id": reservation["id"],
+        "parent_expense_id": None,  # Se llenará después
+        "service_key": key,
+        "created_at": now,
+        "created_by": user_id,
+    }
+
+
+def _legacy_keys(expenses: List[dict], old_services) -> Dict[str, dict]:
+    """
+    Gastos creados antes de service_key: se les asigna la llave de la línea anterior cuyo
+    suplidor (y servicio, si aparece) está en la descripción. Solo corre mientras queden
+    gastos sin llave; al aplicar el diff quedan guardadas
+    """
+    legacy = [e for e in expenses if not e.get("service_key")]
+    assigned = {}
+    for key, service in supplier_lines(old_services):
+        supplier = key["supplier_name"]
+        service_name = _field(service, "service_name", "")
+        candidates = [e for e in legacy if e["id"] not in assigned and supplier in (e.get("description") or "")]
+        match = next((e for e in candidates if service_name and service_name in e["description"]), None)
+        match = match or (candidates[0] if candidates else None)
+        if match:
+            assigned[match["id"]] = key
+    return assigned
+
+
+def diff_supplier_expenses(
+    expenses: List[dict], old_services, new_services, reservation: dict, user_id: str
+) -> dict:
+    """
+    Compara los gastos de suplidores existentes con las líneas nuevas:
+    - una línea con la misma llave conserva su gasto (update si cambió el monto)
+    - si la línea se movió (otra posición, mismo servicio y suplidor) conserva el gasto y su llave se actualiza
+    - una línea sin gasto genera un insert
+    - un gasto sin línea se elimina, salvo que ya tenga abonos (se conserva y se registra)
+    Devuelve {"inserts": [...], "updates": [(antes, cambios)], "deletes": [...], "kept": [...]}
+    """
+    legacy = _legacy_keys(expenses, old_services)
+    keyed = {}
+    unmatched = []
+    for expense in expenses:
+        key = expense.get("service_key") or legacy.get(expense["id"])
+        if key and _key_tuple(key) not in keyed:
+            keyed[_key_tuple(key)] = (expense, key)
+        else:
+            unmatched.append(expense)
+
+    lines = supplier_lines(new_services)
+    matches: Dict[int, dict] = {}
+    for index, (key, _) in enumerate(lines):
+        found = keyed.pop(_key_tuple(key), None)
+        if found:
+            matches[index] = found[0]
+
+    # Segunda pasada: líneas que cambiaron de posición (mismo servicio y suplidor)
+    moved = {}
+    for expense, key in keyed.values():
+        moved.setdefault((key.get("service_id"), key.get("supplier_name")), []).append(expense)
+    for index, (key, _) in enumerate(lines):
+        if index not in matches:
+            candidates = moved.get((key["service_id"], key["supplier_name"]))
+            if candidates:
+                matches[index] = candidates.pop(0)
+    unmatched.extend(expense for pending in moved.values() for expense in pending)
+
+    diff = {"inserts": [], "updates": [], "deletes": [], "kept": []}
+    for index, (key, service) in enumerate(lines):
+        expense = matches.get(index)
+        if expense is None:
+            diff["inserts"].append(new_supplier_expense(service, key, reservation, user_id))
+            continue
+        changes = {}
+        if expense.get("amount") != supplier_amount(service):
+            changes["amount"] = supplier_amount(service)
+        if expense.get("service_key") != key:
+            changes["service_key"] = key
+        if changes:
+            diff["updates"].append((expense, changes))
+
+    for expense in unmatched:
+        if (expense.get("total_paid") or 0) > 0:
+            logger.warning(f"Gasto de suplidor {expense['id']} sin servicio pero con abonos: se conserva")
+            diff["kept"].append(expense)
+        else:
+            diff["deletes"].append(expense)
+    return diff
+
+
+async def keep_expenses_with_abonos(db, diff: dict) -> dict:
+    """
+    total_paid puede faltar o estar desactualizado (gastos importados antes de los saldos
+    guardados, reparación pendiente): antes de eliminar, los candidatos con abonos reales en
+    expense_abonos pasan a 'kept'. Una sola consulta para todos los candidatos
+    """
+    if not diff["deletes"]:
+        return diff
+    paid = set(await db.expense_abonos.distinct(
+        "expense_id", {"expense_id": {"$in": [expense["id"] for expense in diff["deletes"]]}}
+    ))
+    for expense in (e for e in diff["deletes"] if e["id"] in paid):
+        logger.warning(f"Gasto de suplidor {expense['id']} sin servicio pero con abonos: se conserva")
+        diff["kept"].append(expense)
+    diff["deletes"] = [expense for expense in diff["deletes"] if expense["id"] not in paid]
+    return diff
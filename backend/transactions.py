@@ -0,0 +1,36 @@
+"""
+Transacciones multi-documento
+run_in_transaction ejecuta un callback (que recibe la sesión) dentro de una transacción de
+MongoDB, reintentando los errores transitorios (with_transaction). Las transacciones requieren
+replica set o mongos; con un mongod standalone el callback se ejecuta con session=None y quien
+llama debe deshacer lo que haya escrito si falla (ver create_reservation)
+"""
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_transactions_supported: Optional[bool] = None
+
+
+async def transactions_supported(db) -> bool:
+    """Replica set o mongos (se consulta una vez por proceso)"""
+    global _transactions_supported
+    if _transactions_supported is None:
+        hello = await db.command("hello")
+        _transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        if not _transactions_supported:
+            logger.warning("MongoDB standalone: las escrituras multi-documento no serán transaccionales")
+    return _transactions_supported
+
+
+async def run_in_transaction(db, callback: Callable[[Any], Awaitable[Any]]) -> Any:
+    """
+    Ejecuta callback(session) en una transacción y devuelve su resultado
+    El callback puede ejecutarse más de una vez (TransientTransactionError): no debe tener
+    efectos fuera de MongoDB ni depender de estado que la ejecución anterior haya modificado
+    """
+    if not await transactions_supported(db):
+        return await callback(None)
+    async with await db.client.start_session() as session:
+        return await session.with_transaction(callback)
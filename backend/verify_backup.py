@@ -0,0 +1,36 @@
+"""
+Script de verificación: relee backups programados y los compara con su manifiesto
+(SHA-256 del archivo y cantidad y SHA-256 de los documentos de cada colección)
+Uso: python verify_backup.py [archivo.ndjson.gz ...]   (sin archivos: todos los de BACKUP_DIR)
+"""
+import os
+import sys
+
+from backup_scheduler import BACKUP_DIR, list_backups, verify_backup
+
+def verify_files(paths):
+    if not paths:
+        if not BACKUP_DIR:
+            print("❌ ERROR: indica los archivos o configura BACKUP_DIR")
+            return False
+        paths = [os.path.join(BACKUP_DIR, manifest["file"]) for manifest in list_backups(BACKUP_DIR)]
+        print(f"📁 {len(paths)} backups en {BACKUP_DIR}")
+
+    all_ok = True
+    for path in paths:
+        result = verify_backup(path)
+        if result["ok"]:
+            documents = sum(entry["documents"] for entry in result["collections"].values())
+            print(f"✅ {result['file']}: {documents} documentos en {len(result['collections'])} colecciones")
+        else:
+            all_ok = False
+            print(f"❌ {result['file']}:")
+            for error in result["errors"]:
+                print(f"   - {error}")
+
+    print("\n🎉 Todos los backups son válidos" if all_ok else "\n⚠️ Hay backups con errores")
+    return all_ok
+
+if __name__ == "__main__":
+    print("🚀 Verificando backups...\n")
+    sys.exit(0 if verify_files(sys.argv[1:]) else 1)
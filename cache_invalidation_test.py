@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Cross-worker cache invalidation test (change stream + polling fallback)
+Runs directly against MongoDB, simulating two uvicorn workers in one process: each "worker" has its
+own ReferenceCache and InvalidationListener. Worker A updates a villa; worker B must drop its cached
+copy without handling the write.
+
+Change streams need a replica set. A local single-node one is enough:
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017
+    mongosh --eval "rs.initiate()"
+    MONGO_URL="mongodb://localhost:27017/?replicaSet=rs0" python cache_invalidation_test.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from cache_invalidation import InvalidationListener, invalidate_reference_data
+from reference_cache import ReferenceCache, reference_cache, VILLAS
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017/?replicaSet=rs0")
+TEST_DB_NAME = f"{os.environ.get('DB_NAME', 'villa_management')}_cache_test"
+POLL_INTERVAL = 0.5
+INVALIDATION_TIMEOUT = 10
+
+
+class CacheInvalidationTester:
+    def __init__(self, db):
+        self.db = db
+        self.test_results = []
+
+    def log_test(self, test_name: str, success: bool, message: str):
+        self.test_results.append({"test": test_name, "success": success, "message": message})
+        status = "✅ PASS" if success else "❌ FAIL"
+        print(f"{status}: {test_name} - {message}")
+
+    async def read_villa_name(self, cache: ReferenceCache, villa_id: str) -> str:
+        villa = await cache.get_or_load(VILLAS, ("id", villa_id), lambda: self.db.villas.find_one({"id": villa_id}, {"_id": 0}))
+        return villa["name"]
+
+    async def run_scenario(self, mode: str, force_polling: bool):
+        worker_b_cache = ReferenceCache(ttl=3600)
+        listener = InvalidationListener(cache=worker_b_cache, poll_interval=POLL_INTERVAL)
+        listener.start(self.db, force_polling=force_polling)
+
+        villa_id = str(uuid.uuid4())
+        await self.db.villas.insert_one({"id": villa_id, "code": f"TEST-{villa_id[:6]}", "name": "Antes"})
+        try:
+            # Esperar a que el listener esté activo antes de escribir
+            deadline = time.monotonic() + INVALIDATION_TIMEOUT
+            while listener.mode is None and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(POLL_INTERVAL * 2)
+
+            # Worker B cachea la villa
+            first = await self.read_villa_name(worker_b_cache, villa_id)
+
+            # Worker A la modifica (como update_villa)
+            written_at = time.monotonic()
+            await self.db.villas.update_one({"id": villa_id}, {"$set": {"name": "Después"}})
+            await invalidate_reference_data(self.db, VILLAS)
+
+            seen = first
+            while seen != "Después" and time.monotonic() - written_at < INVALIDATION_TIMEOUT:
+                await asyncio.sleep(0.05)
+                seen = await self.read_villa_name(worker_b_cache, villa_id)
+            elapsed_ms = (time.monotonic() - written_at) * 1000
+
+            self.log_test(f"{mode}: listener mode", listener.mode == mode, f"mode={listener.mode}")
+            self.log_test(
+                f"{mode}: worker B sees the write",
+                first == "Antes" and seen == "Después",
+                f"{first} -> {seen} in {elapsed_ms:.0f} ms"
+            )
+            stats = listener.stats()
+            self.log_test(
+                f"{mode}: lag metric reported",
+                stats["events"] > 0 and stats["lag_ms"]["last"] is not None,
+                f"events={stats['events']} lag_ms={stats['lag_ms']}"
+            )
+        finally:
+            await listener.stop()
+            await self.db.villas.delete_one({"id": villa_id})
+            reference_cache.clear()
+
+    async def run_all_tests(self):
+        print("🚀 Cross-worker cache invalidation tests\n")
+        await self.run_scenario("change_stream", force_polling=False)
+        await self.run_scenario("polling", force_polling=True)
+
+        passed = sum(1 for r in self.test_results if r["success"])
+        print(f"\n📊 {passed}/{len(self.test_results)} tests passed")
+        return passed == len(self.test_results)
+
+
+async def main():
+    client = AsyncIOMotorClient(MONGO_URL)
+    db = client[TEST_DB_NAME]
+    try:
+        return await CacheInvalidationTester(db).run_all_tests()
+    finally:
+        await client.drop_database(TEST_DB_NAME)
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
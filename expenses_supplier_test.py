@@ -9,6 +9,7 @@ import json
 import sys
 from typing import Dict, Any, Optional
 import uuid
+import time
 
 # Backend URL from environment
 BACKEND_URL = "https://piscinapp-1.preview.emergentagent.com/api"
@@ -903,6 +904,141 @@ class ExpensesSupplierTester:
         else:
             self.log_test("Get Final Owner Status", False, "Failed to get final owner status")
     
+    def supplier_expenses_for(self, reservation_id: str) -> list:
+        """Supplier expenses linked to a reservation (server-side filter, not the first page of every expense)"""
+        result = self.make_request("GET", "/expenses", {
+            "category": "pago_suplidor",
+            "related_reservation_id": reservation_id
+        }, self.admin_token)
+        return result["data"] if result.get("success") else []
+    
+    def wait_for_supplier_expenses(self, reservation_id: str, count: int, timeout: float = 15.0) -> list:
+        """Los gastos se crean desde el outbox: consultar hasta que aparezcan (o se venza el timeout)"""
+        deadline = time.monotonic() + timeout
+        expenses = self.supplier_expenses_for(reservation_id)
+        while len(expenses) < count and time.monotonic() < deadline:
+            time.sleep(0.25)
+            expenses = self.supplier_expenses_for(reservation_id)
+        return expenses
+    
+    def test_6_shared_supplier_service_keys(self):
+        """Test 6: Dos servicios con el mismo suplidor se reconcilian por service_key al editar"""
+        print("\n🔑 TEST 6: Servicios con el mismo suplidor - actualizar, mover y eliminar líneas")
+        
+        if len(self.extra_services) < 2:
+            self.log_test("Find Services for Test", False, "Not enough extra services available")
+            return
+        
+        chef = {
+            "service_id": self.extra_services[0]["id"],
+            "service_name": "Chef",
+            "supplier_name": "Eventos Compartidos",
+            "quantity": 1,
+            "unit_price": 3000.0,
+            "supplier_cost": 2000.0,
+            "total": 3000.0
+        }
+        decoracion = {
+            "service_id": self.extra_services[1]["id"],
+            "service_name": "Decoración",
+            "supplier_name": "Eventos Compartidos",
+            "quantity": 2,
+            "unit_price": 1500.0,
+            "supplier_cost": 1000.0,
+            "total": 3000.0
+        }
+        
+        result = self.make_request("POST", "/reservations", {
+            "customer_id": self.test_customer["id"],
+            "customer_name": self.test_customer["name"],
+            "villa_id": self.test_villa["id"],
+            "villa_code": self.test_villa["code"],
+            "rental_type": "pasadia",
+            "reservation_date": "2025-02-15T00:00:00Z",
+            "guests": 10,
+            "base_price": 10000.0,
+            "owner_price": 7000.0,
+            "subtotal": 16000.0,
+            "total_amount": 16000.0,
+            "amount_paid": 0.0,
+            "currency": "DOP",
+            "status": "confirmed",
+            "extra_services": [chef, decoracion]
+        }, self.admin_token)
+        
+        if not result.get("success"):
+            self.log_test("Create Reservation with Shared Supplier", False, "Failed to create reservation", result)
+            return
+        reservation = result["data"]
+        self.created_reservations.append(reservation)
+        
+        expenses = self.wait_for_supplier_expenses(reservation["id"], 2)
+        amounts = sorted(exp["amount"] for exp in expenses)
+        lines = sorted((exp.get("service_key") or {}).get("line", -1) for exp in expenses)
+        self.log_test("Shared Supplier Expenses Created", amounts == [2000.0, 2000.0] and lines == [0, 1],
+                     f"amounts={amounts}, lines={lines}")
+        
+        # Quitar el chef: la decoración pasa a la línea 0 y cambia de cantidad
+        decoracion_id = next((exp["id"] for exp in expenses if exp.get("service_key", {}).get("line") == 1), None)
+        result = self.make_request("PUT", f"/reservations/{reservation['id']}", {
+            "extra_services": [{**decoracion, "quantity": 3, "total": 4500.0}]
+        }, self.admin_token)
+        if not result.get("success"):
+            self.log_test("Update Shared Supplier Services", False, "Failed to update reservation", result)
+            return
+        
+        expenses = self.supplier_expenses_for(reservation["id"])
+        if len(expenses) == 1:
+            expense = expenses[0]
+            kept = expense["id"] == decoracion_id
+            correct = expense["amount"] == 3000.0 and expense.get("service_key", {}).get("line") == 0
+            self.log_test("Shared Supplier Expenses Reconciled", kept and correct,
+                         f"expense kept={kept}, amount={expense['amount']}, service_key={expense.get('service_key')}")
+        else:
+            self.log_test("Shared Supplier Expenses Reconciled", False,
+                         f"Expected 1 supplier expense after update, found {len(expenses)}")
+    
+    def test_7_owner_expense_without_reservation(self):
+        """Test 7: Un gasto de propietario creado a mano (sin reservación) cambia de estado con sus abonos"""
+        print("\n🧾 TEST 7: Gasto pago_propietario sin reservación")
+        
+        result = self.make_request("POST", "/expenses", {
+            "category": "pago_propietario",
+            "description": "Pago manual a propietario (test)",
+            "amount": 5000.0,
+            "currency": "DOP",
+            "expense_date": "2025-02-20T00:00:00Z"
+        }, self.admin_token)
+        if not result.get("success"):
+            self.log_test("Create Manual Owner Expense", False, "Failed to create expense", result)
+            return
+        expense = result["data"]
+        self.created_expenses.append(expense)
+        
+        def status_after(step: str, expected: str):
+            current = self.make_request("GET", f"/expenses/{expense['id']}", token=self.admin_token)
+            status = current.get("data", {}).get("payment_status")
+            self.log_test(f"Manual Owner Expense {step}", status == expected,
+                         f"payment_status={status}, expected {expected}")
+        
+        payment = {"currency": "DOP", "payment_method": "efectivo", "payment_date": "2025-02-21T10:00:00Z"}
+        partial = self.make_request("POST", f"/expenses/{expense['id']}/abonos",
+                                    {**payment, "amount": 2000.0}, self.admin_token)
+        if not partial.get("success"):
+            self.log_test("Pay Manual Owner Expense", False, "Failed to add abono", partial)
+            return
+        status_after("Partial Payment", "partial")
+        
+        rest = self.make_request("POST", f"/expenses/{expense['id']}/abonos",
+                                 {**payment, "amount": 3000.0}, self.admin_token)
+        if not rest.get("success"):
+            self.log_test("Pay Manual Owner Expense", False, "Failed to add abono", rest)
+            return
+        status_after("Full Payment", "paid")
+        
+        self.make_request("DELETE", f"/expenses/{expense['id']}/abonos/{rest['data']['id']}", token=self.admin_token)
+        status_after("Payment Deleted", "partial")
+    
     def run_all_tests(self):
         """Run all expense supplier tests"""
         print("🚀 Starting Comprehensive Expenses Supplier Testing")
@@ -933,6 +1069,12 @@ class ExpensesSupplierTester:
         print("\n" + "=" * 80)
         self.test_5_payment_status_synchronization()
         
+        print("\n" + "=" * 80)
+        self.test_6_shared_supplier_service_keys()
+        
+        print("\n" + "=" * 80)
+        self.test_7_owner_expense_without_reservation()
+        
         # Summary
         print("\n" + "=" * 80)
         self.print_summary()
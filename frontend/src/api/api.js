@@ -9,8 +9,25 @@ if (token) {
   axios.defaults.headers.common['Authorization'] = `Bearer ${token}`;
 }
 
+// Listados paginados (keyset): el servidor devuelve una página y el cursor de la siguiente
+// en la cabecera X-Next-Cursor. getAllPages recorre todas las páginas y devuelve la
+// respuesta de la última con data = todos los documentos: solo para listas de referencia
+// pequeñas (villas, servicios) o filtradas; las vistas piden página a página (usePagedList)
+const getAllPages = async (url, params = {}) => {
+  const data = [];
+  let after = null;
+  let response;
+  do {
+    response = await axios.get(url, { params: { ...params, after: after || undefined } });
+    data.push(...response.data);
+    after = response.headers['x-next-cursor'];
+  } while (after);
+  return { ...response, data };
+};
+
 // ============ CUSTOMERS ============
-export const getCustomers = () => axios.get(`${API}/customers`);
+// Una página de clientes (por nombre): params = { after, limit, search, fields, include_total }
+export const getCustomersPage = (params = {}) => axios.get(`${API}/customers`, { params });
 export const getCustomer = (id) => axios.get(`${API}/customers/${id}`);
 export const createCustomer = (data) => axios.post(`${API}/customers`, data);
 export const updateCustomer = (id, data) => axios.put(`${API}/customers/${id}`, data);
@@ -30,37 +47,36 @@ export const updateExpenseCategory = (id, data) => axios.put(`${API}/expense-cat
 export const deleteExpenseCategory = (id) => axios.delete(`${API}/expense-categories/${id}`);
 
 // ============ VILLAS ============
-export const getVillas = (search = null, categoryId = null) => {
-  let url = `${API}/villas`;
-  const params = [];
-  if (search) params.push(`search=${encodeURIComponent(search)}`);
-  if (categoryId) params.push(`category_id=${categoryId}`);
-  if (params.length > 0) url += `?${params.join('&')}`;
-  return axios.get(url);
-};
+export const getVillas = (search = null, categoryId = null) =>
+  getAllPages(`${API}/villas`, { search: search || undefined, category_id: categoryId || undefined });
 export const getVilla = (id) => axios.get(`${API}/villas/${id}`);
 export const createVilla = (data) => axios.post(`${API}/villas`, data);
 export const updateVilla = (id, data) => axios.put(`${API}/villas/${id}`, data);
 export const deleteVilla = (id) => axios.delete(`${API}/villas/${id}`);
 
 // ============ EXTRA SERVICES ============
-export const getExtraServices = () => axios.get(`${API}/extra-services`);
+export const getExtraServices = () => getAllPages(`${API}/extra-services`);
 export const createExtraService = (data) => axios.post(`${API}/extra-services`, data);
 export const updateExtraService = (id, data) => axios.put(`${API}/extra-services/${id}`, data);
 export const deleteExtraService = (id) => axios.delete(`${API}/extra-services/${id}`);
 
 // ============ RESERVATIONS ============
-export const getReservations = (status = null) => {
-  const url = status ? `${API}/reservations?status=${status}` : `${API}/reservations`;
-  return axios.get(url);
-};
+// Una página de reservaciones (keyset): params = { after, limit, status, date_from, date_to,
+// villa_id, customer_id, currency, has_balance_due, search, include_total }.
+// El cursor de la página siguiente viene en la cabecera X-Next-Cursor
+export const getReservationsPage = (params = {}) => axios.get(`${API}/reservations`, { params });
+// Totales de las tarjetas de resumen, con los mismos filtros del listado
+export const getReservationsSummary = (params = {}) => axios.get(`${API}/reservations/summary`, { params });
+// Solo las reservaciones indicadas (p. ej. las que referencian los gastos cargados)
+export const getReservationsByIds = (ids) =>
+  getAllPages(`${API}/reservations`, { ids: ids.join(','), fields: 'id,invoice_number,villa_code,extra_services' });
 export const getReservation = (id) => axios.get(`${API}/reservations/${id}`);
 export const createReservation = (data) => axios.post(`${API}/reservations`, data);
 export const updateReservation = (id, data) => axios.put(`${API}/reservations/${id}`, data);
 export const deleteReservation = (id) => axios.delete(`${API}/reservations/${id}`);
 
 // ============ VILLA OWNERS ============
-export const getOwners = () => axios.get(`${API}/owners`);
+export const getOwnersPage = (params = {}) => axios.get(`${API}/owners`, { params });
 export const getOwner = (id) => axios.get(`${API}/owners/${id}`);
 export const createOwner = (data) => axios.post(`${API}/owners`, data);
 export const updateOwner = (id, data) => axios.put(`${API}/owners/${id}`, data);
@@ -68,19 +84,21 @@ export const deleteOwner = (id) => axios.delete(`${API}/owners/${id}`);
 
 // Owner payments
 export const createOwnerPayment = (ownerId, data) => axios.post(`${API}/owners/${ownerId}/payments`, data);
-export const getOwnerPayments = (ownerId) => axios.get(`${API}/owners/${ownerId}/payments`);
+export const getOwnerPaymentsPage = ({ owner_id, ...params }) => axios.get(`${API}/owners/${owner_id}/payments`, { params });
 export const updateOwnerAmounts = (ownerId, totalOwed) => 
   axios.put(`${API}/owners/${ownerId}/amounts?total_owed=${totalOwed}`);
 
 // ============ EXPENSES ============
-export const getExpenses = (category = null, search = null) => {
-  let url = `${API}/expenses`;
-  const params = [];
-  if (category) params.push(`category=${category}`);
-  if (search) params.push(`search=${encodeURIComponent(search)}`);
-  if (params.length > 0) url += `?${params.join('&')}`;
-  return axios.get(url);
-};
+// Una página de gastos (keyset): params = { after, limit, tab, expense_type, show_in_variables,
+// payment_status, currency, date_from, date_to, carry_pending, related_reservation_id,
+// hide_supplier_rows, category, search, include_abonos, include_total }.
+// El cursor siguiente viene en X-Next-Cursor
+export const getExpensesPage = (params = {}) => axios.get(`${API}/expenses`, { params });
+// Grupos (categoría, tipo, estado, moneda, periodo) con los totales del mes de la vista de gastos
+export const getExpensesSummary = (dateFrom, dateTo, category = null) =>
+  axios.get(`${API}/expenses/summary`, { params: { date_from: dateFrom, date_to: dateTo, category: category || undefined } });
+// Gastos con recordatorio de pago (pocos: los fijos recurrentes)
+export const getExpenseReminders = () => getAllPages(`${API}/expenses`, { has_payment_reminder: true });
 export const getExpense = (id) => axios.get(`${API}/expenses/${id}`);
 export const createExpense = (data) => axios.post(`${API}/expenses`, data);
 export const updateExpense = (id, data) => axios.put(`${API}/expenses/${id}`, data);
@@ -96,19 +114,20 @@ export const addAbonoToReservation = (reservationId, data) => axios.post(`${API}
 export const getReservationAbonos = (reservationId) => axios.get(`${API}/reservations/${reservationId}/abonos`);
 export const deleteReservationAbono = (reservationId, abonoId) => axios.delete(`${API}/reservations/${reservationId}/abonos/${abonoId}`);
 
+// Invoice lookup (reservations and abonos share the same invoice numbers)
+export const lookupInvoice = (invoiceNumber) => axios.get(`${API}/invoices/${invoiceNumber}`);
+
 // ============ DASHBOARD ============
 export const getDashboardStats = () => axios.get(`${API}/dashboard/stats`);
 
+// ============ COMMISSIONS ============
+// Una página de comisiones: params = { after, limit, user_id, paid, invoice_deleted, month, fortnight, include_total }
+export const getCommissionsPage = (params = {}) => axios.get(`${API}/commissions`, { params });
+
 
 // ============ QUOTATIONS (COTIZACIONES) ============
-export const getQuotations = (status = null, customerId = null) => {
-  let url = `${API}/quotations`;
-  const params = [];
-  if (status) params.push(`status=${status}`);
-  if (customerId) params.push(`customer_id=${customerId}`);
-  if (params.length > 0) url += `?${params.join('&')}`;
-  return axios.get(url);
-};
+// Una página de cotizaciones: params = { after, limit, status, customer_id, include_total }
+export const getQuotationsPage = (params = {}) => axios.get(`${API}/quotations`, { params });
 export const getQuotation = (id) => axios.get(`${API}/quotations/${id}`);
 export const createQuotation = (data) => axios.post(`${API}/quotations`, data);
 export const updateQuotation = (id, data) => axios.put(`${API}/quotations/${id}`, data);
@@ -116,14 +135,8 @@ export const deleteQuotation = (id) => axios.delete(`${API}/quotations/${id}`);
 export const convertQuotationToInvoice = (id) => axios.post(`${API}/quotations/${id}/convert-to-invoice`);
 
 // ============ CONDUCES (DELIVERY NOTES) ============
-export const getConduces = (status = null, recipientType = null) => {
-  let url = `${API}/conduces`;
-  const params = [];
-  if (status) params.push(`status=${status}`);
-  if (recipientType) params.push(`recipient_type=${recipientType}`);
-  if (params.length > 0) url += `?${params.join('&')}`;
-  return axios.get(url);
-};
+// Una página de conduces: params = { after, limit, status, recipient_type, include_total }
+export const getConducesPage = (params = {}) => axios.get(`${API}/conduces`, { params });
 export const getConduce = (id) => axios.get(`${API}/conduces/${id}`);
 export const createConduce = (data) => axios.post(`${API}/conduces`, data);
 export const updateConduce = (id, data) => axios.put(`${API}/conduces/${id}`, data);
@@ -1,12 +1,12 @@
 import React, { useState, useEffect } from 'react';
 import { useAuth } from '../context/AuthContext';
+import { getCommissionsPage } from '../api/api';
+import { usePagedList } from '../hooks/use-paged-list';
 
 const API_URL = process.env.REACT_APP_BACKEND_URL || '';
 
 function Commissions() {
   const { user } = useAuth();
-  const [commissions, setCommissions] = useState([]);
-  const [filteredCommissions, setFilteredCommissions] = useState([]);
   const [stats, setStats] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
@@ -23,75 +23,31 @@ function Commissions() {
   const [selectedCommissions, setSelectedCommissions] = useState([]);
   const [selectAll, setSelectAll] = useState(false);
 
+  // Comisiones filtradas por el servidor (estado, empleado, mes, quincena, facturas eliminadas)
+  // y entregadas por páginas
+  const {
+    items: filteredCommissions, total: commissionsTotal, hasMore, loading: loadingMore, reload, loadMore
+  } = usePagedList(getCommissionsPage, {
+    paid: selectedStatus === 'all' ? undefined : selectedStatus === 'paid',
+    user_id: selectedUser === 'all' ? undefined : selectedUser,
+    invoice_deleted: showDeletedInvoices,
+    month: selectedMonth === 'all' ? undefined : selectedMonth,
+    fortnight: selectedFortnight === 'all' ? undefined : Number(selectedFortnight)
+  });
+
   useEffect(() => {
-    fetchCommissions();
     fetchStats();
   }, []);
 
   useEffect(() => {
-    // Filtrar comisiones por usuario, mes, quincena y estado
-    let filtered = commissions;
-    
-    // Filtro por facturas eliminadas
-    if (showDeletedInvoices) {
-      filtered = filtered.filter(c => c.invoice_deleted === true);
-    } else {
-      filtered = filtered.filter(c => !c.invoice_deleted);
-    }
-    
-    // Filtro por estado (pendientes/pagadas/todas)
-    if (selectedStatus === 'pending') {
-      filtered = filtered.filter(c => !c.paid);
-    } else if (selectedStatus === 'paid') {
-      filtered = filtered.filter(c => c.paid);
-    }
-    // Si es 'all', no filtramos
-    
-    // Filtro por usuario
-    if (selectedUser !== 'all') {
-      filtered = filtered.filter(c => c.user_id === selectedUser);
-    }
-    
-    // Filtro por mes
-    if (selectedMonth !== 'all') {
-      filtered = filtered.filter(c => {
-        if (!c.reservation_date) return false;
-        const reservationMonth = c.reservation_date.substring(0, 7); // YYYY-MM
-        return reservationMonth === selectedMonth;
-      });
-    }
-    
-    // Filtro por quincena (usa reservation_date, NO created_at)
-    if (selectedFortnight !== 'all') {
-      filtered = filtered.filter(c => {
-        if (!c.reservation_date) return false;
-        const day = parseInt(c.reservation_date.split('-')[2]);
-        
-        if (selectedFortnight === '1') {
-          return day >= 1 && day <= 14;
-        } else if (selectedFortnight === '2') {
-          return day >= 15 && day <= 31;
-        }
-        return true;
-      });
-    }
-    
-    setFilteredCommissions(filtered);
-  }, [selectedUser, selectedMonth, selectedFortnight, selectedStatus, commissions, showDeletedInvoices]);
+    fetchCommissions();
+  }, [selectedUser, selectedMonth, selectedFortnight, selectedStatus, showDeletedInvoices]);
 
   const fetchCommissions = async () => {
     try {
-      const token = localStorage.getItem('token');
-      const response = await fetch(`${API_URL}/api/commissions`, {
-        headers: { 'Authorization': `Bearer ${token}` }
-      });
-      
-      if (!response.ok) throw new Error('Error al cargar comisiones');
-      
-      const data = await response.json();
-      setCommissions(data);
+      await reload();
     } catch (err) {
-      setError(err.message);
+      setError('Error al cargar comisiones');
     } finally {
       setLoading(false);
     }
@@ -753,6 +709,17 @@ function Commissions() {
             </tbody>
           </table>
         </div>
+        {hasMore && (
+          <div className="flex justify-center p-4 border-t">
+            <button
+              onClick={() => loadMore().catch(() => setError('Error al cargar comisiones'))}
+              disabled={loadingMore}
+              className="px-4 py-2 bg-gray-100 text-gray-700 rounded hover:bg-gray-200 text-sm"
+            >
+              {loadingMore ? 'Cargando...' : `Cargar más (${filteredCommissions.length} de ${commissionsTotal})`}
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
@@ -314,35 +314,43 @@ function Configuration() {
             <p className="text-xs text-gray-600 mb-3">
               Incluye: Usuarios, Clientes, Villas, Reservaciones, Gastos, Categorías, Configuraciones, etc.
             </p>
-            <button
-              onClick={async () => {
-                try {
-                  const token = localStorage.getItem('token');
-                  const response = await fetch(`${API_URL}/api/backup/download`, {
-                    headers: { 'Authorization': `Bearer ${token}` }
-                  });
-                  
-                  if (!response.ok) throw new Error('Error al descargar backup');
-                  
-                  const blob = await response.blob();
-                  const url = window.URL.createObjectURL(blob);
-                  const a = document.createElement('a');
-                  a.href = url;
-                  a.download = response.headers.get('Content-Disposition')?.split('filename=')[1] || 'backup.json';
-                  document.body.appendChild(a);
-                  a.click();
-                  a.remove();
-                  window.URL.revokeObjectURL(url);
-                  
-                  alert('✅ Backup descargado exitosamente! Guárdalo en un lugar seguro.');
-                } catch (err) {
-                  alert('❌ Error al descargar backup: ' + err.message);
-                }
-              }}
-              className="w-full px-4 py-3 bg-green-600 text-white rounded-lg hover:bg-green-700 font-semibold"
-            >
-              📥 Descargar Backup Ahora
-            </button>
+            {[false, true].map((incremental) => (
+              <button
+                key={incremental ? 'incremental' : 'full'}
+                onClick={async () => {
+                  try {
+                    const token = localStorage.getItem('token');
+                    const response = await fetch(`${API_URL}/api/backup/download?incremental=${incremental}`, {
+                      headers: { 'Authorization': `Bearer ${token}` }
+                    });
+                    
+                    if (!response.ok) {
+                      const error = await response.json().catch(() => ({}));
+                      throw new Error(error.detail || 'Error al descargar backup');
+                    }
+                    
+                    const blob = await response.blob();
+                    const url = window.URL.createObjectURL(blob);
+                    const a = document.createElement('a');
+                    a.href = url;
+                    a.download = response.headers.get('Content-Disposition')?.split('filename=')[1] || 'backup.ndjson.gz';
+                    document.body.appendChild(a);
+                    a.click();
+                    a.remove();
+                    window.URL.revokeObjectURL(url);
+                    
+                    alert('✅ Backup descargado exitosamente! Guárdalo en un lugar seguro.');
+                  } catch (err) {
+                    alert('❌ Error al descargar backup: ' + err.message);
+                  }
+                }}
+                className={incremental
+                  ? "w-full mt-2 px-4 py-2 bg-white text-green-700 border-2 border-green-600 rounded-lg hover:bg-green-50 font-semibold text-sm"
+                  : "w-full px-4 py-3 bg-green-600 text-white rounded-lg hover:bg-green-700 font-semibold"}
+              >
+                {incremental ? '📥 Solo cambios desde el último backup' : '📥 Descargar Backup Ahora'}
+              </button>
+            ))}
           </div>
 
           {/* Restore Backup */}
@@ -354,14 +362,20 @@ function Configuration() {
             <p className="text-xs text-red-600 mb-3">
               ⚠️ <strong>CUIDADO:</strong> Esto ELIMINARÁ todos los datos actuales y los reemplazará con el backup.
             </p>
+            <p className="text-xs text-gray-600 mb-3">
+              Para incrementales, selecciona el backup completo junto con sus archivos "incremental" (se aplican en orden de fecha).
+            </p>
             <input
               type="file"
-              accept=".json"
+              accept=".gz,.ndjson,.json"
+              multiple
               onChange={async (e) => {
-                const file = e.target.files[0];
+                const files = Array.from(e.target.files).sort((a, b) => a.name.localeCompare(b.name));
+                const file = files.find(f => !f.name.includes('_incremental'));
                 if (!file) return;
+                const increments = files.filter(f => f !== file);
                 
-                if (!window.confirm(`⚠️ ADVERTENCIA CRÍTICA ⚠️\n\n¿Estás SEGURO de restaurar "${file.name}"?\n\nEsto eliminará TODOS los datos actuales:\n- Usuarios\n- Clientes\n- Villas\n- Reservaciones\n- Gastos\n- Configuraciones\n\nY los reemplazará con los datos del backup.\n\n¿Continuar?`)) {
+                if (!window.confirm(`⚠️ ADVERTENCIA CRÍTICA ⚠️\n\n¿Estás SEGURO de restaurar "${file.name}"${increments.length ? ` y ${increments.length} incremental(es)` : ''}?\n\nEsto eliminará TODOS los datos actuales:\n- Usuarios\n- Clientes\n- Villas\n- Reservaciones\n- Gastos\n- Configuraciones\n\nY los reemplazará con los datos del backup.\n\n¿Continuar?`)) {
                   e.target.value = '';
                   return;
                 }
@@ -370,6 +384,7 @@ function Configuration() {
                   const token = localStorage.getItem('token');
                   const formData = new FormData();
                   formData.append('file', file);
+                  increments.forEach(f => formData.append('increments', f));
                   
                   const response = await fetch(`${API_URL}/api/backup/restore`, {
                     method: 'POST',
@@ -390,6 +405,7 @@ function Configuration() {
                   result.restored.forEach(r => {
                     message += `- ${r.collection}: ${r.documents} documentos\n`;
                   });
+                  message += `\n${result.documents} documentos en ${result.seconds} s (${result.docs_per_second} docs/s)\n`;
                   
                   alert(message);
                   
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
-import { getCustomers, createCustomer, updateCustomer, deleteCustomer } from '../api/api';
+import { getCustomersPage, createCustomer, updateCustomer, deleteCustomer } from '../api/api';
+import { usePagedList } from '../hooks/use-paged-list';
 import { Button } from './ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from './ui/card';
 import { Input } from './ui/input';
@@ -11,9 +12,8 @@ import { useAuth } from '../context/AuthContext';
 
 const Customers = () => {
   const { user } = useAuth();
-  const [customers, setCustomers] = useState([]);
-  const [filteredCustomers, setFilteredCustomers] = useState([]);
   const [searchTerm, setSearchTerm] = useState('');
+  const [searchQuery, setSearchQuery] = useState('');  // searchTerm ya estabilizado (se busca en el servidor)
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [isFormOpen, setIsFormOpen] = useState(false);
@@ -31,30 +31,23 @@ const Customers = () => {
     address: ''
   });
 
+  // El servidor busca por nombre, teléfono, email o documento y entrega los clientes por páginas
+  const {
+    items: customers, total: customersTotal, hasMore, loading: loadingMore, reload, loadMore
+  } = usePagedList(getCustomersPage, { search: searchQuery || undefined });
+
   useEffect(() => {
-    fetchCustomers();
-  }, []);
+    const timer = setTimeout(() => setSearchQuery(searchTerm.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
 
   useEffect(() => {
-    // Filtrar clientes cuando cambia el término de búsqueda
-    if (searchTerm.trim() === '') {
-      setFilteredCustomers(customers);
-    } else {
-      const filtered = customers.filter(customer =>
-        customer.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        customer.phone?.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        customer.email?.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        customer.identification_document?.toLowerCase().includes(searchTerm.toLowerCase())
-      );
-      setFilteredCustomers(filtered);
-    }
-  }, [searchTerm, customers]);
+    fetchCustomers();
+  }, [searchQuery]);
 
   const fetchCustomers = async () => {
     try {
-      const response = await getCustomers();
-      setCustomers(response.data);
-      setFilteredCustomers(response.data);
+      await reload();
     } catch (err) {
       setError('Error al cargar clientes');
       console.error(err);
@@ -130,7 +123,7 @@ const Customers = () => {
       setSelectedCustomers([]);
       setSelectAll(false);
     } else {
-      setSelectedCustomers(filteredCustomers.map(c => c.id));
+      setSelectedCustomers(customers.map(c => c.id));
       setSelectAll(true);
     }
   };
@@ -267,7 +260,7 @@ const Customers = () => {
       <Card>
         <CardHeader>
           <div className="flex justify-between items-center flex-wrap gap-4">
-            <CardTitle>Lista de Clientes ({filteredCustomers.length})</CardTitle>
+            <CardTitle>Lista de Clientes ({customersTotal ?? customers.length})</CardTitle>
             <div className="flex items-center space-x-2">
               {selectedCustomers.length > 0 && user?.role === 'admin' && (
                 <Button
@@ -316,8 +309,8 @@ const Customers = () => {
                 </tr>
               </thead>
               <tbody>
-                {filteredCustomers.length > 0 ? (
-                  filteredCustomers.map((customer) => (
+                {customers.length > 0 ? (
+                  customers.map((customer) => (
                     <tr key={customer.id} className="border-b hover:bg-gray-50">
                       {user?.role === 'admin' && (
                         <td className="p-2 text-sm">
@@ -381,6 +374,13 @@ const Customers = () => {
               </tbody>
             </table>
           </div>
+          {hasMore && (
+            <div className="flex justify-center pt-4">
+              <Button variant="outline" onClick={() => loadMore().catch(() => setError('Error al cargar clientes'))} disabled={loadingMore}>
+                {loadingMore ? 'Cargando...' : `Cargar más (${customers.length} de ${customersTotal})`}
+              </Button>
+            </div>
+          )}
         </CardContent>
       </Card>
     </div>
@@ -1,9 +1,10 @@
 import React, { useState, useEffect } from 'react';
 import { 
-  getExpenses, createExpense, updateExpense, deleteExpense,
+  getExpensesPage, getExpensesSummary, getExpenseReminders, createExpense, updateExpense, deleteExpense,
   addAbonoToExpense, getExpenseAbonos, deleteExpenseAbono,
-  getExpenseCategories
+  getExpenseCategories, getVillas, getReservationsByIds, getDashboardStats
 } from '../api/api';
+import { usePagedList } from '../hooks/use-paged-list';
 import { Button } from './ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from './ui/card';
 import { Input } from './ui/input';
@@ -13,9 +14,31 @@ import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from
 import { Plus, Edit, Trash2, Filter, DollarSign, X, Bell, AlertCircle } from 'lucide-react';
 import { useAuth } from '../context/AuthContext';
 
+// 'YYYY-MM-DD' local (los filtros de fecha del servidor son por día)
+const toDateParam = (date) =>
+  `${date.getFullYear()}-${String(date.getMonth() + 1).padStart(2, '0')}-${String(date.getDate()).padStart(2, '0')}`;
+
+// Tab de la vista al que pertenece un grupo de GET /expenses/summary (mismo criterio que el servidor)
+const RESERVATION_CATEGORIES = ['pago_propietario', 'pago_suplidor', 'devolucion_deposito', 'pago_servicios'];
+const isInTab = (item, tab) => {
+  const isReservationExpense = RESERVATION_CATEGORIES.includes(item.category) || Boolean(item.has_reservation);
+  if (tab === 'propietarios') return isReservationExpense;
+  if (isReservationExpense) return false;
+  const type = item.expense_type || 'variable';
+  if (tab === 'variables') return type === 'variable' || (type === 'unico' && item.show_in_variables === true);
+  return type === (tab === 'fijos' ? 'fijo' : 'unico');
+};
+
+// Suma de montos y cantidad de gastos de los grupos de GET /expenses/summary
+const sumAmount = (groups, currency) =>
+  groups.filter(g => g.currency === currency).reduce((sum, g) => sum + g.amount, 0);
+const countOf = (groups) => groups.reduce((sum, g) => sum + g.count, 0);
+
 const Expenses = () => {
   const { user } = useAuth();
-  const [expenses, setExpenses] = useState([]);
+  const [summaryGroups, setSummaryGroups] = useState([]);
+  const [reminderExpenses, setReminderExpenses] = useState([]);
+  const [generalTotals, setGeneralTotals] = useState({ total_expenses_dop: 0, total_expenses_usd: 0 });
   const [expenseCategories, setExpenseCategories] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
@@ -51,9 +74,6 @@ const Expenses = () => {
   const [relatedReservation, setRelatedReservation] = useState(null);
   const [supplierExpenses, setSupplierExpenses] = useState([]); // Gastos de suplidores para mostrar balance_due
   const [supplierAbonos, setSupplierAbonos] = useState({}); // Abonos de cada supplierExpense: { [expenseId]: [abonos] }
-  
-  // Estado para almacenar los abonos de cada gasto (para mostrar invoice_numbers)
-  const [expenseAbonos, setExpenseAbonos] = useState({});
   const [abonoFormData, setAbonoFormData] = useState({
     amount: 0,
     currency: 'DOP',
@@ -80,12 +100,37 @@ const Expenses = () => {
     show_in_variables: false // Nuevo campo para gastos únicos
   });
 
+  // Filas del tab activo: el servidor filtra por tab, categoría, estado y mes (más los pendientes
+  // de meses anteriores) y las entrega por páginas
+  const monthFrom = toDateParam(new Date(selectedYear, selectedMonth, 1));
+  const monthTo = toDateParam(new Date(selectedYear, selectedMonth + 1, 0));
+  const {
+    items: expenses, total: expensesTotal, hasMore: hasMoreExpenses, loading: loadingMoreExpenses,
+    reload: reloadExpenses, loadMore: loadMoreExpenses
+  } = usePagedList(getExpensesPage, {
+    tab: activeTab,
+    category: filterCategory || undefined,
+    payment_status: paymentStatusFilter === 'all' ? undefined : paymentStatusFilter,
+    date_from: monthFrom,
+    date_to: monthTo,
+    carry_pending: paymentStatusFilter !== 'paid' || undefined,
+    include_abonos: true
+  });
+
+  // Los abonos (invoice_number, fecha, monto) vienen embebidos en cada gasto
+  const expenseAbonos = {};
+  for (const expense of expenses) {
+    expenseAbonos[expense.id] = expense.abonos || [];
+  }
+
   useEffect(() => {
-    fetchExpenses();
     fetchExpenseCategories();
-    fetchReservations();
     fetchVillas();
-  }, [filterCategory, selectedMonth, selectedYear]);
+  }, []);
+
+  useEffect(() => {
+    fetchExpenses();
+  }, [filterCategory, selectedMonth, selectedYear, activeTab, paymentStatusFilter]);
 
   const fetchExpenseCategories = async () => {
     try {
@@ -96,16 +141,14 @@ const Expenses = () => {
     }
   };
 
-  const fetchReservations = async () => {
+  // Solo las reservaciones que referencian los gastos cargados (y que aún no se tienen)
+  const fetchReservations = async (expensesPage) => {
+    const loaded = new Set(reservations.map(r => r.id));
+    const ids = [...new Set(expensesPage.map(e => e.related_reservation_id).filter(id => id && !loaded.has(id)))];
+    if (ids.length === 0) return;
     try {
-      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/reservations`, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
-      if (!response.ok) throw new Error('Error al cargar reservaciones');
-      const data = await response.json();
-      setReservations(data);
+      const response = await getReservationsByIds(ids);
+      setReservations(prev => [...prev, ...response.data]);
     } catch (err) {
       console.error('Error fetching reservations:', err);
     }
@@ -113,37 +156,29 @@ const Expenses = () => {
 
   const fetchVillas = async () => {
     try {
-      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/villas`, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
-      if (!response.ok) throw new Error('Error al cargar villas');
-      const data = await response.json();
-      setVillas(data);
+      const response = await getVillas();
+      setVillas(response.data);
     } catch (err) {
       console.error('Error fetching villas:', err);
     }
   };
 
+  // Totales de las tarjetas: agregados en el servidor, no sumando las filas cargadas
+  const fetchSummary = async () => {
+    const [summaryResponse, statsResponse, remindersResponse] = await Promise.all([
+      getExpensesSummary(monthFrom, monthTo, filterCategory || null),
+      getDashboardStats(),
+      getExpenseReminders()
+    ]);
+    setSummaryGroups(summaryResponse.data);
+    setGeneralTotals(statsResponse.data);
+    setReminderExpenses(remindersResponse.data);
+  };
+
   const fetchExpenses = async () => {
     try {
-      const response = await getExpenses(filterCategory || null);
-      setExpenses(response.data);
-      
-      // Cargar abonos de cada gasto para mostrar sus invoice_numbers
-      const abonosMap = {};
-      for (const expense of response.data) {
-        try {
-          const abonosResponse = await getExpenseAbonos(expense.id);
-          if (abonosResponse.data) {
-            abonosMap[expense.id] = abonosResponse.data;
-          }
-        } catch (err) {
-          console.error(`Error loading abonos for expense ${expense.id}:`, err);
-        }
-      }
-      setExpenseAbonos(abonosMap);
+      const [expensesPage] = await Promise.all([reloadExpenses(), fetchSummary()]);
+      await fetchReservations(expensesPage);
     } catch (err) {
       setError('Error al cargar gastos');
       console.error(err);
@@ -152,6 +187,16 @@ const Expenses = () => {
     }
   };
 
+  const handleLoadMoreExpenses = async () => {
+    try {
+      const expensesPage = await loadMoreExpenses();
+      await fetchReservations(expensesPage);
+    } catch (err) {
+      setError('Error al cargar gastos');
+      console.error(err);
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     setError('');
@@ -279,7 +324,7 @@ const Expenses = () => {
           console.log('📞 Cargando gastos de suplidores...');
           try {
             const allExpensesResponse = await fetch(
-              `${process.env.REACT_APP_BACKEND_URL}/api/expenses`,
+              `${process.env.REACT_APP_BACKEND_URL}/api/expenses?category=pago_suplidor&related_reservation_id=${expense.related_reservation_id}`,
               {
                 headers: {
                   'Authorization': `Bearer ${localStorage.getItem('token')}`
@@ -455,7 +500,7 @@ const Expenses = () => {
         
         // Refresh supplierExpenses to show updated balance
         const allExpensesResponse = await fetch(
-          `${process.env.REACT_APP_BACKEND_URL}/api/expenses`,
+          `${process.env.REACT_APP_BACKEND_URL}/api/expenses?category=pago_suplidor&related_reservation_id=${selectedExpense.related_reservation_id}`,
           {
             headers: {
               'Authorization': `Bearer ${localStorage.getItem('token')}`
@@ -484,29 +529,6 @@ const Expenses = () => {
     return currency === 'DOP' ? `RD$ ${formatted}` : `$ ${formatted}`;
   };
 
-  // Función para filtrar gastos por mes seleccionado
-  const filterByMonth = (expensesList) => {
-    return expensesList.filter(expense => {
-      const expenseDate = new Date(expense.expense_date);
-      return expenseDate.getMonth() === selectedMonth && expenseDate.getFullYear() === selectedYear;
-    });
-  };
-
-  // Función para obtener gastos pendientes de meses anteriores
-  const getPendingFromPreviousMonths = () => {
-    const selectedDate = new Date(selectedYear, selectedMonth, 1);
-    
-    return expenses.filter(expense => {
-      // Solo gastos pendientes
-      if (expense.payment_status !== 'pending') return false;
-      
-      const expenseDate = new Date(expense.expense_date);
-      
-      // Solo gastos de meses anteriores al seleccionado
-      return expenseDate < selectedDate;
-    });
-  };
-
   // Función para obtener información de la reservación asociada
   const getReservationInfo = (expense) => {
     if (!expense.related_reservation_id) return null;
@@ -545,37 +567,8 @@ const Expenses = () => {
   const getFilteredAndSortedExpenses = () => {
     // Tab especial: Reservaciones (propietarios, suplidores, depósitos)
     if (activeTab === 'propietarios') {
-      let filtered = expenses.filter(expense => 
-        expense.category === 'pago_propietario' || 
-        expense.category === 'pago_suplidor' ||  // ✅ INCLUIR gastos de suplidores
-        expense.category === 'devolucion_deposito' ||  // ✅ INCLUIR devoluciones de depósito
-        expense.category === 'pago_servicios' ||  // Nueva categoría para Solo Servicios
-        expense.related_reservation_id
-      );
-      
-      // Filtrar por estado de pago
-      if (paymentStatusFilter === 'pending') {
-        filtered = filtered.filter(expense => expense.payment_status === 'pending');
-      } else if (paymentStatusFilter === 'paid') {
-        filtered = filtered.filter(expense => expense.payment_status === 'paid');
-      }
-      
-      // Filtrar por mes seleccionado
-      const monthFiltered = filterByMonth(filtered);
-      
-      // Agregar pendientes de meses anteriores
-      let pendingFiltered = [];
-      if (paymentStatusFilter !== 'paid') {
-        pendingFiltered = expenses.filter(expense => {
-          if (!(expense.category === 'pago_propietario' || expense.category === 'pago_suplidor' || expense.category === 'devolucion_deposito' || expense.category === 'pago_servicios' || expense.related_reservation_id)) return false;
-          if (expense.payment_status !== 'pending') return false;
-          const expenseDate = new Date(expense.expense_date);
-          const selectedDate = new Date(selectedYear, selectedMonth, 1);
-          return expenseDate < selectedDate;
-        });
-      }
-      
-      filtered = [...monthFiltered, ...pendingFiltered];
+      // El servidor ya filtró por tab, estado y mes (con los pendientes de meses anteriores)
+      let filtered = expenses;
       
       // ===== AGREGAR LÓGICA DE URGENCIA =====
       const today = new Date();
@@ -613,62 +606,8 @@ const Expenses = () => {
       return filtered;
     }
     
-    // Mapear tabs a tipos del backend (para otros tabs)
-    const typeMap = {
-      'variables': 'variable',
-      'fijos': 'fijo',
-      'unicos': 'unico'
-    };
-    
-    const targetType = typeMap[activeTab];
-    
-    // Filtrar por tipo de tab activo
-    let filtered = expenses.filter(expense => {
-      // EXCLUIR todos los gastos de reservaciones de los otros tabs
-      if (expense.category === 'pago_propietario' || 
-          expense.category === 'pago_suplidor' || 
-          expense.category === 'devolucion_deposito' || 
-          expense.category === 'pago_servicios' || 
-          expense.related_reservation_id) {
-        return false;
-      }
-      
-      const type = expense.expense_type || 'variable';
-      
-      // Si es tab Variables, incluir también gastos únicos marcados como "show_in_variables"
-      if (activeTab === 'variables') {
-        return type === 'variable' || (type === 'unico' && expense.show_in_variables === true);
-      }
-      
-      return type === targetType;
-    });
-
-    // Filtrar por estado de pago (NUEVO)
-    if (paymentStatusFilter === 'pending') {
-      filtered = filtered.filter(expense => expense.payment_status === 'pending');
-    } else if (paymentStatusFilter === 'paid') {
-      filtered = filtered.filter(expense => expense.payment_status === 'paid');
-    }
-    // Si es 'all', no filtramos por payment_status
-
-    // Filtrar por mes seleccionado
-    const monthFiltered = filterByMonth(filtered);
-    
-    // Agregar pendientes de meses anteriores (solo si filtro es 'pending' o 'all')
-    let pendingFiltered = [];
-    if (paymentStatusFilter !== 'paid') {
-      pendingFiltered = expenses.filter(expense => {
-        const type = expense.expense_type || 'variable';
-        if (type !== targetType) return false;
-        if (expense.payment_status !== 'pending') return false;
-        const expenseDate = new Date(expense.expense_date);
-        const selectedDate = new Date(selectedYear, selectedMonth, 1);
-        return expenseDate < selectedDate;
-      });
-    }
-    
-    // Combinar gastos del mes con pendientes de meses anteriores
-    filtered = [...monthFiltered, ...pendingFiltered];
+    // El servidor ya filtró por tab, estado y mes (con los pendientes de meses anteriores)
+    let filtered = expenses;
 
     // Aplicar filtros adicionales
     if (filterVilla) {
@@ -866,7 +805,7 @@ const Expenses = () => {
     const today = new Date();
     const currentDay = today.getDate();
     
-    return expenses.filter(expense => {
+    return reminderExpenses.filter(expense => {
       if (!expense.has_payment_reminder || !expense.payment_reminder_day) return false;
       
       const reminderDay = expense.payment_reminder_day;
@@ -877,54 +816,56 @@ const Expenses = () => {
     }).sort((a, b) => a.payment_reminder_day - b.payment_reminder_day);
   };
 
-  // Calculate totals generales
-  const totalDOP = expenses.filter(e => e.currency === 'DOP').reduce((sum, e) => sum + e.amount, 0);
-  const totalUSD = expenses.filter(e => e.currency === 'USD').reduce((sum, e) => sum + e.amount, 0);
-  
-  // Calculate totals por mes seleccionado
-  const monthExpenses = filterByMonth(expenses);
-  const pendingFromPrevious = getPendingFromPreviousMonths();
+  // Calculate totals generales (contadores del dashboard)
+  const totalDOP = generalTotals.total_expenses_dop || 0;
+  const totalUSD = generalTotals.total_expenses_usd || 0;
   
-  // Combinar gastos del mes actual con pendientes de meses anteriores
-  const allRelevantExpenses = [...monthExpenses, ...pendingFromPrevious];
+  // Totales del mes seleccionado + pendientes de meses anteriores (grupos agregados en el servidor)
+  const monthGroups = summaryGroups.filter(g => g.period === 'month');
+  const pendingPreviousGroups = summaryGroups.filter(g => g.period === 'previous');
   
   // Totales por tipo (mes actual + pendientes anteriores)
-  const compromisosDOP = allRelevantExpenses.filter(e => e.category === 'compromiso' && e.currency === 'DOP').reduce((sum, e) => sum + e.amount, 0);
-  const compromisosUSD = allRelevantExpenses.filter(e => e.category === 'compromiso' && e.currency === 'USD').reduce((sum, e) => sum + e.amount, 0);
+  const compromisoGroups = summaryGroups.filter(g => g.category === 'compromiso');
+  const compromisosDOP = sumAmount(compromisoGroups, 'DOP');
+  const compromisosUSD = sumAmount(compromisoGroups, 'USD');
   
-  const fijosDOP = allRelevantExpenses.filter(e => e.expense_type === 'fijo' && e.currency === 'DOP').reduce((sum, e) => sum + e.amount, 0);
-  const fijosUSD = allRelevantExpenses.filter(e => e.expense_type === 'fijo' && e.currency === 'USD').reduce((sum, e) => sum + e.amount, 0);
+  const fijoGroups = summaryGroups.filter(g => g.expense_type === 'fijo');
+  const fijosDOP = sumAmount(fijoGroups, 'DOP');
+  const fijosUSD = sumAmount(fijoGroups, 'USD');
   
-  const variablesDOP = allRelevantExpenses.filter(e => e.expense_type === 'variable' && e.currency === 'DOP').reduce((sum, e) => sum + e.amount, 0);
-  const variablesUSD = allRelevantExpenses.filter(e => e.expense_type === 'variable' && e.currency === 'USD').reduce((sum, e) => sum + e.amount, 0);
+  const variableGroups = summaryGroups.filter(g => g.expense_type === 'variable');
+  const variablesDOP = sumAmount(variableGroups, 'DOP');
+  const variablesUSD = sumAmount(variableGroups, 'USD');
   
-  const unicosDOP = allRelevantExpenses.filter(e => e.expense_type === 'unico' && e.currency === 'DOP').reduce((sum, e) => sum + e.amount, 0);
-  const unicosUSD = allRelevantExpenses.filter(e => e.expense_type === 'unico' && e.currency === 'USD').reduce((sum, e) => sum + e.amount, 0);
+  const unicoGroups = summaryGroups.filter(g => g.expense_type === 'unico');
+  const unicosDOP = sumAmount(unicoGroups, 'DOP');
+  const unicosUSD = sumAmount(unicoGroups, 'USD');
   
   // Gastos de Propietarios (auto-generados)
-  const propietariosExpenses = allRelevantExpenses.filter(e => e.category === 'pago_propietario' || e.related_reservation_id);
-  const propietariosDOP = propietariosExpenses.filter(e => e.currency === 'DOP').reduce((sum, e) => sum + e.amount, 0);
-  const propietariosUSD = propietariosExpenses.filter(e => e.currency === 'USD').reduce((sum, e) => sum + e.amount, 0);
-  const propietariosPendientes = propietariosExpenses.filter(e => e.payment_status === 'pending').length;
-  const propietariosPagados = propietariosExpenses.filter(e => e.payment_status === 'paid').length;
-  const propietariosPendientesDOP = propietariosExpenses.filter(e => e.payment_status === 'pending' && e.currency === 'DOP').reduce((sum, e) => sum + e.amount, 0);
-  const propietariosPendientesUSD = propietariosExpenses.filter(e => e.payment_status === 'pending' && e.currency === 'USD').reduce((sum, e) => sum + e.amount, 0);
+  const propietariosGroups = summaryGroups.filter(g => g.category === 'pago_propietario' || g.has_reservation);
+  const propietariosPendingGroups = propietariosGroups.filter(g => g.payment_status === 'pending');
+  const propietariosDOP = sumAmount(propietariosGroups, 'DOP');
+  const propietariosUSD = sumAmount(propietariosGroups, 'USD');
+  const propietariosPendientes = countOf(propietariosPendingGroups);
+  const propietariosPagados = countOf(propietariosGroups.filter(g => g.payment_status === 'paid'));
+  const propietariosPendientesDOP = sumAmount(propietariosPendingGroups, 'DOP');
+  const propietariosPendientesUSD = sumAmount(propietariosPendingGroups, 'USD');
   
   // Totales de pendientes de meses anteriores
-  const pendingPreviousDOP = pendingFromPrevious.filter(e => e.currency === 'DOP').reduce((sum, e) => sum + e.amount, 0);
-  const pendingPreviousUSD = pendingFromPrevious.filter(e => e.currency === 'USD').reduce((sum, e) => sum + e.amount, 0);
+  const pendingPreviousCount = countOf(pendingPreviousGroups);
+  const pendingPreviousDOP = sumAmount(pendingPreviousGroups, 'DOP');
+  const pendingPreviousUSD = sumAmount(pendingPreviousGroups, 'USD');
   
   // Compromisos del mes
-  const compromisosDelMes = monthExpenses.filter(e => e.category === 'compromiso');
-  const compromisosPagados = compromisosDelMes.filter(e => e.payment_status === 'paid').length;
-  const compromisosPendientes = compromisosDelMes.filter(e => e.payment_status === 'pending').length;
-  const compromisosVencidos = compromisosDelMes.filter(e => {
-    if (e.payment_status === 'paid') return false;
-    const expenseDate = new Date(e.expense_date);
-    const today = new Date();
-    today.setHours(0, 0, 0, 0);
-    return expenseDate < today;
-  }).length;
+  const compromisosDelMes = monthGroups.filter(g => g.category === 'compromiso');
+  const compromisosPagados = countOf(compromisosDelMes.filter(g => g.payment_status === 'paid'));
+  const compromisosPendientes = countOf(compromisosDelMes.filter(g => g.payment_status === 'pending'));
+  const compromisosVencidos = countOf(compromisosDelMes.filter(g => g.payment_status !== 'paid' && g.overdue));
+  
+  // Pagos a suplidores del mes
+  const supplierGroups = monthGroups.filter(g => g.category === 'pago_suplidor');
+  const supplierPendingGroups = supplierGroups.filter(g => g.payment_status === 'pending');
+  const supplierPaidGroups = supplierGroups.filter(g => g.payment_status === 'paid');
   
   const upcomingPayments = getUpcomingPayments();
 
@@ -1224,7 +1165,7 @@ const Expenses = () => {
             <span className="text-2xl mr-2">🚚</span>
             Gastos a Suplidores - Mes Actual
             <span className="ml-auto text-sm font-normal text-purple-600">
-              {expenses.filter(e => e.category === 'pago_suplidor' && new Date(e.expense_date).getMonth() === new Date().getMonth()).length} pagos
+              {countOf(supplierGroups)} pagos
             </span>
           </CardTitle>
         </CardHeader>
@@ -1234,12 +1175,7 @@ const Expenses = () => {
             <div className="bg-white p-4 rounded-lg border-2 border-purple-200">
               <p className="text-sm text-gray-600 font-medium mb-1">💰 Total del Mes</p>
               <p className="text-3xl font-bold text-purple-700">
-                {formatCurrency(
-                  expenses
-                    .filter(e => e.category === 'pago_suplidor' && new Date(e.expense_date).getMonth() === new Date().getMonth() && e.currency === 'DOP')
-                    .reduce((sum, e) => sum + e.amount, 0),
-                  'DOP'
-                )}
+                {formatCurrency(sumAmount(supplierGroups, 'DOP'), 'DOP')}
               </p>
             </div>
             
@@ -1247,15 +1183,10 @@ const Expenses = () => {
             <div className="bg-orange-50 p-4 rounded-lg border-2 border-orange-200">
               <p className="text-sm text-orange-800 font-medium mb-1">⏳ Pendiente de Pago</p>
               <p className="text-3xl font-bold text-orange-600">
-                {formatCurrency(
-                  expenses
-                    .filter(e => e.category === 'pago_suplidor' && e.payment_status === 'pending' && new Date(e.expense_date).getMonth() === new Date().getMonth())
-                    .reduce((sum, e) => sum + e.amount, 0),
-                  'DOP'
-                )}
+                {formatCurrency(sumAmount(supplierPendingGroups, 'DOP'), 'DOP')}
               </p>
               <p className="text-xs text-gray-600 mt-1">
-                {expenses.filter(e => e.category === 'pago_suplidor' && e.payment_status === 'pending' && new Date(e.expense_date).getMonth() === new Date().getMonth()).length} pagos pendientes
+                {countOf(supplierPendingGroups)} pagos pendientes
               </p>
             </div>
             
@@ -1263,15 +1194,10 @@ const Expenses = () => {
             <div className="bg-blue-50 p-4 rounded-lg border-2 border-blue-200">
               <p className="text-sm text-blue-800 font-medium mb-1">✅ Ya Pagado</p>
               <p className="text-3xl font-bold text-blue-600">
-                {formatCurrency(
-                  expenses
-                    .filter(e => e.category === 'pago_suplidor' && e.payment_status === 'paid' && new Date(e.expense_date).getMonth() === new Date().getMonth())
-                    .reduce((sum, e) => sum + e.amount, 0),
-                  'DOP'
-                )}
+                {formatCurrency(sumAmount(supplierPaidGroups, 'DOP'), 'DOP')}
               </p>
               <p className="text-xs text-gray-600 mt-1">
-                {expenses.filter(e => e.category === 'pago_suplidor' && e.payment_status === 'paid' && new Date(e.expense_date).getMonth() === new Date().getMonth()).length} pagos realizados
+                {countOf(supplierPaidGroups)} pagos realizados
               </p>
             </div>
           </div>
@@ -1531,11 +1457,11 @@ const Expenses = () => {
       </div>
 
       {/* Alerta de Gastos Pendientes de Meses Anteriores */}
-      {pendingFromPrevious.length > 0 && (
+      {pendingPreviousCount > 0 && (
         <Alert className="bg-yellow-50 border-yellow-300">
           <AlertCircle className="h-4 w-4 text-yellow-600" />
           <AlertDescription className="text-yellow-800">
-            <strong>⚠️ Gastos Pendientes de Meses Anteriores:</strong> Tienes {pendingFromPrevious.length} gasto(s) pendiente(s) de meses anteriores por un total de{' '}
+            <strong>⚠️ Gastos Pendientes de Meses Anteriores:</strong> Tienes {pendingPreviousCount} gasto(s) pendiente(s) de meses anteriores por un total de{' '}
             <strong className="text-red-600">{formatCurrency(pendingPreviousDOP, 'DOP')}</strong>
             {pendingPreviousUSD > 0 && <> y <strong className="text-red-600">{formatCurrency(pendingPreviousUSD, 'USD')}</strong></>}.
             Estos gastos se muestran en la lista con un indicador especial.
@@ -1554,7 +1480,7 @@ const Expenses = () => {
                 : 'text-gray-600 hover:bg-gray-50'
             }`}
           >
-            🏡 Reservaciones ({expenses.filter(e => e.category === 'pago_propietario' || e.category === 'pago_suplidor' || e.category === 'devolucion_deposito').length})
+            🏡 Reservaciones ({countOf(summaryGroups.filter(g => isInTab(g, 'propietarios')))})
           </button>
           <button
             onClick={() => setActiveTab('fijos')}
@@ -1564,7 +1490,7 @@ const Expenses = () => {
                 : 'text-gray-600 hover:bg-gray-50'
             }`}
           >
-            🔁 Fijos ({expenses.filter(e => e.expense_type === 'fijo').length})
+            🔁 Fijos ({countOf(summaryGroups.filter(g => isInTab(g, 'fijos')))})
           </button>
           <button
             onClick={() => setActiveTab('unicos')}
@@ -1574,7 +1500,7 @@ const Expenses = () => {
                 : 'text-gray-600 hover:bg-gray-50'
             }`}
           >
-            💰 Únicos ({expenses.filter(e => e.expense_type === 'unico').length})
+            💰 Únicos ({countOf(summaryGroups.filter(g => isInTab(g, 'unicos')))})
           </button>
           <button
             onClick={() => setActiveTab('variables')}
@@ -1584,12 +1510,7 @@ const Expenses = () => {
                 : 'text-gray-600 hover:bg-gray-50'
             }`}
           >
-            📅 Variables ({expenses.filter(e => {
-              // Excluir gastos de propietarios
-              if (e.category === 'pago_propietario' || e.related_reservation_id) return false;
-              // Incluir variables + únicos marcados como show_in_variables
-              return (e.expense_type || 'variable') === 'variable' || (e.expense_type === 'unico' && e.show_in_variables);
-            }).length})
+            📅 Variables ({countOf(summaryGroups.filter(g => isInTab(g, 'variables')))})
           </button>
         </div>
       </div>
@@ -1603,7 +1524,7 @@ const Expenses = () => {
             {activeTab === 'unicos' && '💰 Gastos Únicos (Ya pagados)'}
             {activeTab === 'variables' && '📅 Gastos Variables (Con fecha de pago)'}
             <span className="text-sm font-normal text-gray-500 ml-2">
-              ({getFilteredAndSortedExpenses().length})
+              ({getFilteredAndSortedExpenses().length}{expensesTotal > expenses.length ? ` de ${expensesTotal}` : ''})
             </span>
           </CardTitle>
         </CardHeader>
@@ -1640,7 +1561,7 @@ const Expenses = () => {
                           if (expense.category === 'pago_propietario' && expense.related_reservation_id) {
                             try {
                               const allExpenses = await (await fetch(
-                                `${process.env.REACT_APP_BACKEND_URL}/api/expenses`,
+                                `${process.env.REACT_APP_BACKEND_URL}/api/expenses?category=pago_suplidor&related_reservation_id=${expense.related_reservation_id}`,
                                 {
                                   headers: {
                                     'Authorization': `Bearer ${localStorage.getItem('token')}`
@@ -1978,6 +1899,13 @@ const Expenses = () => {
               })}
             </div>
           )}
+          {hasMoreExpenses && (
+            <div className="flex justify-center pt-4">
+              <Button variant="outline" onClick={handleLoadMoreExpenses} disabled={loadingMoreExpenses}>
+                {loadingMoreExpenses ? 'Cargando...' : `Cargar más (${expenses.length} de ${expensesTotal})`}
+              </Button>
+            </div>
+          )}
         </CardContent>
       </Card>
 
@@ -2347,7 +2275,7 @@ const Expenses = () => {
                                       
                                       // Buscar todos los gastos
                                       const allExpensesResponse = await fetch(
-                                        `${process.env.REACT_APP_BACKEND_URL}/api/expenses`,
+                                        `${process.env.REACT_APP_BACKEND_URL}/api/expenses?category=pago_suplidor&related_reservation_id=${relatedReservation.id}`,
                                         {
                                           headers: {
                                             'Authorization': `Bearer ${localStorage.getItem('token')}`
@@ -2433,7 +2361,7 @@ const Expenses = () => {
                                       
                                       // Recargar supplierExpenses para actualizar balance_due
                                       const allExpensesResponse = await fetch(
-                                        `${process.env.REACT_APP_BACKEND_URL}/api/expenses`,
+                                        `${process.env.REACT_APP_BACKEND_URL}/api/expenses?category=pago_suplidor&related_reservation_id=${relatedReservation.id}`,
                                         {
                                           headers: {
                                             'Authorization': `Bearer ${localStorage.getItem('token')}`
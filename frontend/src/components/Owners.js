@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
-import { getOwners, createOwner, updateOwner, deleteOwner, createOwnerPayment, getOwnerPayments, updateOwnerAmounts } from '../api/api';
+import { getOwnersPage, createOwner, updateOwner, deleteOwner, createOwnerPayment, getOwnerPaymentsPage, updateOwnerAmounts } from '../api/api';
+import { usePagedList } from '../hooks/use-paged-list';
 import { Button } from './ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from './ui/card';
 import { Input } from './ui/input';
@@ -11,7 +12,6 @@ import { useAuth } from '../context/AuthContext';
 
 const Owners = () => {
   const { user } = useAuth();
-  const [owners, setOwners] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [isFormOpen, setIsFormOpen] = useState(false);
@@ -20,7 +20,6 @@ const Owners = () => {
   const [isPaymentHistoryOpen, setIsPaymentHistoryOpen] = useState(false);
   const [editingOwner, setEditingOwner] = useState(null);
   const [selectedOwner, setSelectedOwner] = useState(null);
-  const [paymentHistory, setPaymentHistory] = useState([]);
   const [formData, setFormData] = useState({
     name: '',
     phone: '',
@@ -39,14 +38,28 @@ const Owners = () => {
     total_owed: 0
   });
 
+  // Propietarios (por nombre) e historial de pagos del propietario seleccionado, por páginas
+  const {
+    items: owners, total: ownersTotal, hasMore, loading: loadingMore, reload, loadMore
+  } = usePagedList(getOwnersPage);
+  const {
+    items: paymentHistory, hasMore: hasMorePayments, loading: loadingMorePayments,
+    reload: reloadPayments, loadMore: loadMorePayments
+  } = usePagedList(getOwnerPaymentsPage, { owner_id: selectedOwner?.id });
+
   useEffect(() => {
     fetchOwners();
   }, []);
 
+  useEffect(() => {
+    if (isPaymentHistoryOpen && selectedOwner) {
+      fetchPaymentHistory();
+    }
+  }, [isPaymentHistoryOpen, selectedOwner]);
+
   const fetchOwners = async () => {
     try {
-      const response = await getOwners();
-      setOwners(response.data);
+      await reload();
     } catch (err) {
       setError('Error al cargar propietarios');
       console.error(err);
@@ -55,10 +68,9 @@ const Owners = () => {
     }
   };
 
-  const fetchPaymentHistory = async (ownerId) => {
+  const fetchPaymentHistory = async () => {
     try {
-      const response = await getOwnerPayments(ownerId);
-      setPaymentHistory(response.data);
+      await reloadPayments();
     } catch (err) {
       console.error('Error al cargar historial de pagos:', err);
     }
@@ -155,7 +167,6 @@ const Owners = () => {
 
   const openPaymentHistory = (owner) => {
     setSelectedOwner(owner);
-    fetchPaymentHistory(owner.id);
     setIsPaymentHistoryOpen(true);
   };
 
@@ -407,6 +418,13 @@ const Owners = () => {
             ) : (
               <p className="text-center text-gray-500 py-4">No hay pagos registrados</p>
             )}
+            {hasMorePayments && (
+              <div className="flex justify-center">
+                <Button variant="outline" onClick={() => loadMorePayments().catch(err => console.error('Error al cargar historial de pagos:', err))} disabled={loadingMorePayments}>
+                  {loadingMorePayments ? 'Cargando...' : 'Cargar más'}
+                </Button>
+              </div>
+            )}
           </div>
         </DialogContent>
       </Dialog>
@@ -503,6 +521,13 @@ const Owners = () => {
           </div>
         )}
       </div>
+      {hasMore && (
+        <div className="flex justify-center">
+          <Button variant="outline" onClick={() => loadMore().catch(() => setError('Error al cargar propietarios'))} disabled={loadingMore}>
+            {loadingMore ? 'Cargando...' : `Cargar más (${owners.length} de ${ownersTotal})`}
+          </Button>
+        </div>
+      )}
     </div>
   );
 };
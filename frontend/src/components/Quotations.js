@@ -1,19 +1,24 @@
 import React, { useState, useEffect } from 'react';
-import { getQuotations, createQuotation, updateQuotation, deleteQuotation, convertQuotationToInvoice } from '../api/api';
+import { getQuotationsPage, createQuotation, updateQuotation, deleteQuotation, convertQuotationToInvoice } from '../api/api';
 import { Card, CardHeader, CardTitle, CardContent } from './ui/card';
 import { Button } from './ui/button';
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from './ui/dialog';
 import { AlertCircle, Plus, Edit2, Trash2, Printer, CheckCircle, FileText } from 'lucide-react';
 import QuotationForm from './QuotationForm';
+import { usePagedList } from '../hooks/use-paged-list';
 
 const Quotations = () => {
-  const [quotations, setQuotations] = useState([]);
   const [loading, setLoading] = useState(true);
   const [isFormOpen, setIsFormOpen] = useState(false);
   const [editingQuotation, setEditingQuotation] = useState(null);
   const [error, setError] = useState('');
   const [selectedQuotations, setSelectedQuotations] = useState([]); // Para selección múltiple
   
+  // Cotizaciones (más recientes primero) por páginas
+  const {
+    items: quotations, total: quotationsTotal, hasMore, loading: loadingMore, reload, loadMore
+  } = usePagedList(getQuotationsPage);
+  
   useEffect(() => {
     fetchQuotations();
   }, []);
@@ -21,8 +26,7 @@ const Quotations = () => {
   const fetchQuotations = async () => {
     try {
       setLoading(true);
-      const response = await getQuotations();
-      setQuotations(response.data);
+      await reload();
     } catch (err) {
       setError('Error al cargar cotizaciones');
     } finally {
@@ -818,6 +822,13 @@ const Quotations = () => {
                 ))
             )}
           </div>
+          {hasMore && (
+            <div className="flex justify-center pt-4">
+              <Button variant="outline" onClick={() => loadMore().catch(() => setError('Error al cargar cotizaciones'))} disabled={loadingMore}>
+                {loadingMore ? 'Cargando...' : `Cargar más (${quotations.length} de ${quotationsTotal})`}
+              </Button>
+            </div>
+          )}
         </CardContent>
       </Card>
     </div>
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
-import { getReservations, getCustomers, getVillas, getExtraServices, createReservation, updateReservation, deleteReservation, addAbonoToReservation } from '../api/api';
+import { getReservationsPage, getReservationsSummary, getCustomersPage, getVillas, getExtraServices, createReservation, updateReservation, deleteReservation, addAbonoToReservation } from '../api/api';
+import { usePagedList } from '../hooks/use-paged-list';
 import { Button } from './ui/button';
 import { Card, CardContent, CardHeader, CardTitle } from './ui/card';
 import { Input } from './ui/input';
@@ -11,10 +12,10 @@ import { useAuth } from '../context/AuthContext';
 import CustomerDialog from './CustomerDialog';
 
 const API_URL = process.env.REACT_APP_BACKEND_URL || '';
+const CUSTOMER_SEARCH_LIMIT = 20;
 
 const Reservations = () => {
   const { user } = useAuth();
-  const [reservations, setReservations] = useState([]);
   const [customers, setCustomers] = useState([]);
   const [villas, setVillas] = useState([]);
   const [extraServices, setExtraServices] = useState([]);
@@ -23,6 +24,15 @@ const Reservations = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [searchTerm, setSearchTerm] = useState('');
+  const [searchQuery, setSearchQuery] = useState('');  // searchTerm ya estabilizado (se busca en el servidor)
+  const [totals, setTotals] = useState({
+    total_reservations: 0,
+    upcoming_reservations: 0,
+    total_paid_dop: 0,
+    total_paid_usd: 0,
+    total_remaining_dop: 0,
+    total_remaining_usd: 0
+  });
   const [isFormOpen, setIsFormOpen] = useState(false);
   const [editingReservation, setEditingReservation] = useState(null);
   const [selectedExtraServices, setSelectedExtraServices] = useState([]);
@@ -97,12 +107,32 @@ const Reservations = () => {
     invoice_number: null  // Solo admin puede establecer manualmente
   });
 
+  // Lista de facturas: el servidor busca (cliente, villa o número de factura) y la entrega por páginas
+  const {
+    items: reservations, total: reservationsTotal, hasMore: hasMoreReservations,
+    loading: loadingMoreReservations, reload: reloadReservations, loadMore: loadMoreReservations
+  } = usePagedList(getReservationsPage, { search: searchQuery || undefined });
+
   useEffect(() => {
     fetchData();
     fetchLogo();
     fetchInvoiceTemplate();
   }, []);
 
+  useEffect(() => {
+    const timer = setTimeout(() => setSearchQuery(searchTerm.trim()), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  useEffect(() => {
+    const timer = setTimeout(() => fetchCustomersOnly(), 300);
+    return () => clearTimeout(timer);
+  }, [customerSearchTerm]);
+
+  useEffect(() => {
+    fetchReservations();
+  }, [searchQuery]);
+
   const fetchInvoiceTemplate = async () => {
     try {
       const token = localStorage.getItem('token');
@@ -141,40 +171,54 @@ const Reservations = () => {
     }
   };
 
+  // Listas de referencia para el formulario (villas y servicios)
   const fetchData = async () => {
     try {
-      const [resResponse, custResponse, villasResponse, servicesResponse] = await Promise.all([
-        getReservations(),
-        getCustomers(),
+      const [villasResponse, servicesResponse] = await Promise.all([
         getVillas(),
         getExtraServices()
       ]);
-      setReservations(resResponse.data);
-      setCustomers(custResponse.data);
       setVillas(villasResponse.data);
       setExtraServices(servicesResponse.data);
       
       console.log('📋 Servicios cargados:', servicesResponse.data);
       console.log('📋 Total servicios:', servicesResponse.data.length);
-      
-      // Cargar abonos de cada reservación para mostrar sus invoice_numbers
-      const abonosMap = {};
-      for (const reservation of resResponse.data) {
-        try {
-          const abonosResponse = await fetch(`${API_URL}/api/reservations/${reservation.id}/abonos`, {
-            headers: {
-              'Authorization': `Bearer ${localStorage.getItem('token')}`
-            }
-          });
-          if (abonosResponse.ok) {
-            const abonos = await abonosResponse.json();
-            abonosMap[reservation.id] = abonos;
+    } catch (err) {
+      setError('Error al cargar datos');
+      console.error(err);
+    }
+  };
+
+  // Abonos de cada reservación de la página, para mostrar sus invoice_numbers
+  const fetchAbonos = async (reservationsPage, replace = false) => {
+    const abonosMap = {};
+    for (const reservation of reservationsPage) {
+      try {
+        const abonosResponse = await fetch(`${API_URL}/api/reservations/${reservation.id}/abonos`, {
+          headers: {
+            'Authorization': `Bearer ${localStorage.getItem('token')}`
           }
-        } catch (err) {
-          console.error(`Error loading abonos for reservation ${reservation.id}:`, err);
+        });
+        if (abonosResponse.ok) {
+          const abonos = await abonosResponse.json();
+          abonosMap[reservation.id] = abonos;
         }
+      } catch (err) {
+        console.error(`Error loading abonos for reservation ${reservation.id}:`, err);
       }
-      setReservationAbonos(abonosMap);
+    }
+    setReservationAbonos(prev => (replace ? abonosMap : { ...prev, ...abonosMap }));
+  };
+
+  // Primera página de la lista y totales de las tarjetas (agregados en el servidor con el mismo filtro)
+  const fetchReservations = async () => {
+    try {
+      const [reservationsPage, summaryResponse] = await Promise.all([
+        reloadReservations(),
+        getReservationsSummary({ search: searchQuery || undefined })
+      ]);
+      setTotals(summaryResponse.data);
+      await fetchAbonos(reservationsPage, true);
     } catch (err) {
       setError('Error al cargar datos');
       console.error(err);
@@ -183,9 +227,24 @@ const Reservations = () => {
     }
   };
 
+  const handleLoadMoreReservations = async () => {
+    try {
+      const reservationsPage = await loadMoreReservations();
+      await fetchAbonos(reservationsPage);
+    } catch (err) {
+      setError('Error al cargar datos');
+      console.error(err);
+    }
+  };
+
+  // Clientes del buscador del formulario: el servidor busca por nombre/teléfono y devuelve los primeros
   const fetchCustomersOnly = async () => {
     try {
-      const custResponse = await getCustomers();
+      const custResponse = await getCustomersPage({
+        search: customerSearchTerm.trim() || undefined,
+        limit: CUSTOMER_SEARCH_LIMIT,
+        fields: 'id,name,phone'
+      });
       setCustomers(custResponse.data);
       // NO recargamos reservations, villas ni servicios
     } catch (err) {
@@ -459,7 +518,7 @@ const Reservations = () => {
       
       const dataToSend = {
         ...formData,
-        customer_name: customer?.name || '',
+        customer_name: customer?.name || formData.customer_name || '',
         reservation_date: reservationDate,
         extra_services: selectedExtraServices.filter(s => s.service_id)
       };
@@ -470,7 +529,7 @@ const Reservations = () => {
         await createReservation(dataToSend);
       }
       
-      await fetchData();
+      await fetchReservations();
       setIsFormOpen(false);
       resetForm();
     } catch (err) {
@@ -504,11 +563,8 @@ const Reservations = () => {
       setVillaSearchTerm(`${villa.code} - ${villa.name}`);
     }
 
-    // Encontrar el cliente para establecer el texto de búsqueda
-    const customer = customers.find(c => c.id === reservation.customer_id);
-    if (customer) {
-      setCustomerSearchTerm(customer.name);
-    }
+    // Texto de búsqueda del cliente: el nombre guardado en la reservación
+    setCustomerSearchTerm(reservation.customer_name || '');
     
     setFormData({
       customer_id: reservation.customer_id,
@@ -554,7 +610,7 @@ const Reservations = () => {
     if (window.confirm('¿Estás seguro de eliminar esta reservación?')) {
       try {
         await deleteReservation(id);
-        await fetchData();
+        await fetchReservations();
       } catch (err) {
         setError('Error al eliminar reservación');
       }
@@ -578,7 +634,7 @@ const Reservations = () => {
       setSelectedReservations([]);
       setSelectAllReservations(false);
     } else {
-      setSelectedReservations(filteredReservations.map(r => r.id));
+      setSelectedReservations(reservations.map(r => r.id));
       setSelectAllReservations(true);
     }
   };
@@ -595,7 +651,7 @@ const Reservations = () => {
         await Promise.all(selectedReservations.map(id => deleteReservation(id)));
         setSelectedReservations([]);
         setSelectAllReservations(false);
-        await fetchData();
+        await fetchReservations();
       } catch (err) {
         setError('Error al eliminar reservaciones');
         console.error(err);
@@ -697,7 +753,7 @@ const Reservations = () => {
         notes: '',
         invoice_number: ''
       });
-      await fetchData();
+      await fetchReservations();
       alert('Abono registrado exitosamente');
     } catch (err) {
       setError(err.response?.data?.detail || 'Error al registrar abono');
@@ -1556,69 +1612,6 @@ const Reservations = () => {
     return currency === 'DOP' ? `RD$ ${formatted}` : `$ ${formatted}`;
   };
 
-  const filteredReservations = reservations.filter(r => 
-    r.customer_name?.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    r.villa_code?.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    r.villa_name?.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    r.invoice_number?.toLowerCase().includes(searchTerm.toLowerCase())
-  );
-
-  // Calcular totales de reservaciones
-  const calculateReservationTotals = () => {
-    const today = new Date();
-    today.setHours(0, 0, 0, 0);
-    
-    const totalReservations = filteredReservations.length;
-    
-    // Reservaciones pendientes (futuras - que aún no han pasado su fecha)
-    const upcomingReservations = filteredReservations.filter(r => {
-      const reservationDate = new Date(r.reservation_date);
-      reservationDate.setHours(0, 0, 0, 0);
-      return reservationDate >= today;
-    }).length;
-    
-    // Total pagado (suma de amount_paid)
-    const totalPaid = filteredReservations.reduce((sum, r) => {
-      return sum + (r.amount_paid || 0);
-    }, 0);
-    
-    // Total restante (suma de balance_due)
-    const totalRemaining = filteredReservations.reduce((sum, r) => {
-      return sum + (r.balance_due || 0);
-    }, 0);
-    
-    // Agrupar por moneda
-    const totalPaidDOP = filteredReservations
-      .filter(r => r.currency === 'DOP')
-      .reduce((sum, r) => sum + (r.amount_paid || 0), 0);
-    
-    const totalPaidUSD = filteredReservations
-      .filter(r => r.currency === 'USD')
-      .reduce((sum, r) => sum + (r.amount_paid || 0), 0);
-    
-    const totalRemainingDOP = filteredReservations
-      .filter(r => r.currency === 'DOP')
-      .reduce((sum, r) => sum + (r.balance_due || 0), 0);
-    
-    const totalRemainingUSD = filteredReservations
-      .filter(r => r.currency === 'USD')
-      .reduce((sum, r) => sum + (r.balance_due || 0), 0);
-    
-    return {
-      totalReservations,
-      upcomingReservations,
-      totalPaid,
-      totalRemaining,
-      totalPaidDOP,
-      totalPaidUSD,
-      totalRemainingDOP,
-      totalRemainingUSD
-    };
-  };
-  
-  const totals = calculateReservationTotals();
-
-
   // Filtrar y ordenar villas y servicios alfabéticamente
   const filteredVillas = villas
     .filter(v => 
@@ -1634,13 +1627,8 @@ const Reservations = () => {
     )
     .sort((a, b) => a.name.localeCompare(b.name));
 
-  // Filtrar y ordenar clientes alfabéticamente
-  const filteredCustomers = customers
-    .filter(c =>
-      c.name?.toLowerCase().includes(customerSearchTerm.toLowerCase()) ||
-      c.phone?.toLowerCase().includes(customerSearchTerm.toLowerCase())
-    )
-    .sort((a, b) => a.name.localeCompare(b.name));
+  // Clientes que coinciden con la búsqueda (filtrados y ordenados por nombre en el servidor)
+  const filteredCustomers = customers;
 
   const handleSelectVilla = (villaId) => {
     const villa = villas.find(v => v.id === villaId);
@@ -2544,7 +2532,7 @@ const Reservations = () => {
             <CardTitle className="text-sm font-medium text-gray-600">📋 Total Facturas</CardTitle>
           </CardHeader>
           <CardContent>
-            <div className="text-2xl font-bold text-blue-600">{totals.totalReservations}</div>
+            <div className="text-2xl font-bold text-blue-600">{totals.total_reservations}</div>
             <p className="text-xs text-gray-500 mt-1">Todas las facturas</p>
           </CardContent>
         </Card>
@@ -2555,7 +2543,7 @@ const Reservations = () => {
             <CardTitle className="text-sm font-medium text-gray-600">📅 Facturas Pendientes</CardTitle>
           </CardHeader>
           <CardContent>
-            <div className="text-2xl font-bold text-orange-600">{totals.upcomingReservations}</div>
+            <div className="text-2xl font-bold text-orange-600">{totals.upcoming_reservations}</div>
             <p className="text-xs text-gray-500 mt-1">Futuras (no han pasado)</p>
           </CardContent>
         </Card>
@@ -2568,11 +2556,11 @@ const Reservations = () => {
           <CardContent>
             <div className="space-y-1">
               <div className="text-xl font-bold text-green-600">
-                RD$ {totals.totalPaidDOP.toLocaleString('es-DO', { minimumFractionDigits: 2, maximumFractionDigits: 2 })}
+                RD$ {totals.total_paid_dop.toLocaleString('es-DO', { minimumFractionDigits: 2, maximumFractionDigits: 2 })}
               </div>
-              {totals.totalPaidUSD > 0 && (
+              {totals.total_paid_usd > 0 && (
                 <div className="text-sm font-semibold text-green-500">
-                  US$ {totals.totalPaidUSD.toLocaleString('en-US', { minimumFractionDigits: 2, maximumFractionDigits: 2 })}
+                  US$ {totals.total_paid_usd.toLocaleString('en-US', { minimumFractionDigits: 2, maximumFractionDigits: 2 })}
                 </div>
               )}
             </div>
@@ -2588,11 +2576,11 @@ const Reservations = () => {
           <CardContent>
             <div className="space-y-1">
               <div className="text-xl font-bold text-red-600">
-                RD$ {totals.totalRemainingDOP.toLocaleString('es-DO', { minimumFractionDigits: 2, maximumFractionDigits: 2 })}
+                RD$ {totals.total_remaining_dop.toLocaleString('es-DO', { minimumFractionDigits: 2, maximumFractionDigits: 2 })}
               </div>
-              {totals.totalRemainingUSD > 0 && (
+              {totals.total_remaining_usd > 0 && (
                 <div className="text-sm font-semibold text-red-500">
-                  US$ {totals.totalRemainingUSD.toLocaleString('en-US', { minimumFractionDigits: 2, maximumFractionDigits: 2 })}
+                  US$ {totals.total_remaining_usd.toLocaleString('en-US', { minimumFractionDigits: 2, maximumFractionDigits: 2 })}
                 </div>
               )}
             </div>
@@ -2615,7 +2603,7 @@ const Reservations = () => {
       <Card>
         <CardHeader>
           <div className="flex justify-between items-center">
-            <CardTitle>Lista de Facturas ({filteredReservations.length})</CardTitle>
+            <CardTitle>Lista de Facturas ({reservationsTotal ?? reservations.length})</CardTitle>
             {selectedReservations.length > 0 && user?.role === 'admin' && (
               <div className="flex items-center space-x-2">
                 <Button
@@ -2640,8 +2628,8 @@ const Reservations = () => {
         </CardHeader>
         <CardContent className="p-0">
           <div className="divide-y max-h-[600px] overflow-y-auto">
-            {filteredReservations.length > 0 ? (
-              filteredReservations.map((res) => {
+            {reservations.length > 0 ? (
+              reservations.map((res) => {
                 const isExpanded = expandedReservations[res.id];
                 return (
                   <div key={res.id} className="hover:bg-gray-50 transition-colors">
@@ -2834,6 +2822,13 @@ const Reservations = () => {
               </div>
             )}
           </div>
+          {hasMoreReservations && (
+            <div className="flex justify-center p-4 border-t">
+              <Button variant="outline" onClick={handleLoadMoreReservations} disabled={loadingMoreReservations}>
+                {loadingMoreReservations ? 'Cargando...' : `Cargar más (${reservations.length} de ${reservationsTotal})`}
+              </Button>
+            </div>
+          )}
         </CardContent>
       </Card>
 
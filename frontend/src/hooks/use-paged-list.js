@@ -0,0 +1,44 @@
+import { useState, useCallback } from "react"
+
+// Filas que se piden por página en las vistas con "Cargar más"
+export const PAGE_SIZE = 50
+
+// Listado paginado (keyset) para las vistas: fetchPage(params) devuelve una página y el cursor
+// de la siguiente en la cabecera X-Next-Cursor. reload() vuelve a la primera página con los
+// filtros actuales (y pide X-Total-Count); loadMore() agrega la página siguiente
+export function usePagedList(fetchPage, params = {}, pageSize = PAGE_SIZE) {
+  const [items, setItems] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
+  const [total, setTotal] = useState(null)
+  const [loading, setLoading] = useState(false)
+  const paramsKey = JSON.stringify(params)
+
+  const loadPage = useCallback(async (after) => {
+    setLoading(true)
+    try {
+      const response = await fetchPage({
+        ...JSON.parse(paramsKey),
+        limit: pageSize,
+        after: after || undefined,
+        include_total: after ? undefined : true
+      })
+      setItems((prev) => (after ? [...prev, ...response.data] : response.data))
+      setNextCursor(response.headers["x-next-cursor"] || null)
+      if (!after) {
+        const totalHeader = response.headers["x-total-count"]
+        setTotal(totalHeader !== undefined ? Number(totalHeader) : response.data.length)
+      }
+      return response.data
+    } finally {
+      setLoading(false)
+    }
+  }, [fetchPage, paramsKey, pageSize])
+
+  const reload = useCallback(() => loadPage(null), [loadPage])
+  const loadMore = useCallback(
+    () => (nextCursor ? loadPage(nextCursor) : Promise.resolve([])),
+    [loadPage, nextCursor]
+  )
+
+  return { items, setItems, total, hasMore: Boolean(nextCursor), loading, reload, loadMore }
+}
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Stress Test for the Atomic Invoice Number Allocator
+Fires hundreds of concurrent allocations (abonos + reservations) and asserts there are no duplicates
+"""
+
+import requests
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+
+# Backend URL from environment
+BACKEND_URL = "https://piscinapp-1.preview.emergentagent.com/api"
+
+CONCURRENT_ABONOS = 300
+CONCURRENT_RESERVATIONS = 50
+MAX_WORKERS = 50
+
+class InvoiceAllocatorStressTester:
+    def __init__(self):
+        self.admin_token = None
+        self.test_results = []
+
+    def log_test(self, test_name: str, success: bool, message: str, details: Any = None):
+        """Log test result"""
+        result = {
+            "test": test_name,
+            "success": success,
+            "message": message,
+            "details": details
+        }
+        self.test_results.append(result)
+        status = "✅ PASS" if success else "❌ FAIL"
+        print(f"{status}: {test_name} - {message}")
+        if details and not success:
+            print(f"   Details: {details}")
+
+    def make_request(self, method: str, endpoint: str, data: Dict = None, token: str = None) -> Dict:
+        """Make HTTP request to backend"""
+        url = f"{BACKEND_URL}{endpoint}"
+        headers = {"Content-Type": "application/json"}
+
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+
+        try:
+            if method == "GET":
+                response = requests.get(url, headers=headers, params=data)
+            elif method == "POST":
+                response = requests.post(url, headers=headers, json=data)
+            elif method == "DELETE":
+                response = requests.delete(url, headers=headers)
+            else:
+                return {"error": f"Unsupported method: {method}"}
+
+            return {
+                "status_code": response.status_code,
+                "data": response.json() if response.content else {},
+                "success": 200 <= response.status_code < 300
+            }
+        except Exception as e:
+            return {"error": str(e), "success": False}
+
+    def login_admin(self) -> bool:
+        """Login admin user"""
+        result = self.make_request("POST", "/auth/login", {"username": "admin", "password": "admin123"})
+        if result.get("success"):
+            self.admin_token = result["data"]["access_token"]
+            self.log_test("Admin Login", True, "Admin logged in successfully")
+            return True
+
+        self.log_test("Admin Login", False, "Admin login failed", result)
+        return False
+
+    def reservation_payload(self, customer: Dict, label: str) -> Dict:
+        """Build a services-only reservation payload (no villa, no side-effect expenses)"""
+        return {
+            "customer_id": customer["id"],
+            "customer_name": customer["name"],
+            "reservation_date": "2025-02-01T00:00:00Z",
+            "subtotal": 1000000.0,
+            "total_amount": 1000000.0,
+            "amount_paid": 0.0,
+            "currency": "DOP",
+            "status": "confirmed",
+            "notes": f"Stress test allocator {label}"
+        }
+
+    def setup_test_data(self):
+        """Create a customer and a reservation to receive the abonos"""
+        customer_result = self.make_request("POST", "/customers", {
+            "name": "Stress Test Allocator",
+            "phone": "809-555-0300"
+        }, self.admin_token)
+        if not customer_result.get("success"):
+            self.log_test("Create Test Customer", False, "Failed to create test customer", customer_result)
+            return None, None
+        customer = customer_result["data"]
+
+        reservation_result = self.make_request("POST", "/reservations", self.reservation_payload(customer, "base"), self.admin_token)
+        if not reservation_result.get("success"):
+            self.log_test("Create Test Reservation", False, "Failed to create test reservation", reservation_result)
+            return customer, None
+        reservation = reservation_result["data"]
+        self.log_test("Create Test Reservation", True, f"Created reservation #{reservation['invoice_number']}")
+
+        return customer, reservation
+
+    def post_abono(self, reservation_id: str, index: int) -> Dict:
+        return self.make_request("POST", f"/reservations/{reservation_id}/abonos", {
+            "amount": 1.0,
+            "currency": "DOP",
+            "payment_method": "efectivo",
+            "notes": f"Stress abono {index}"
+        }, self.admin_token)
+
+    def post_reservation(self, customer: Dict, index: int) -> Dict:
+        return self.make_request("POST", "/reservations", self.reservation_payload(customer, str(index)), self.admin_token)
+
+    def check_unique(self, test_name: str, results: List[Dict]) -> List[str]:
+        """Assert every request succeeded and every invoice number is distinct"""
+        failures = [r for r in results if not r.get("success")]
+        numbers = [r["data"]["invoice_number"] for r in results if r.get("success")]
+        duplicates = sorted({n for n in numbers if numbers.count(n) > 1})
+
+        if failures:
+            self.log_test(test_name, False, f"{len(failures)} of {len(results)} requests failed", failures[:5])
+        if duplicates:
+            self.log_test(test_name, False, f"Duplicate invoice numbers allocated: {duplicates[:20]}")
+        if not failures and not duplicates:
+            self.log_test(test_name, True, f"{len(numbers)} concurrent allocations, all distinct")
+
+        return numbers
+
+    def test_concurrent_abonos(self, reservation: Dict) -> List[str]:
+        """Fire CONCURRENT_ABONOS abonos at the same reservation in parallel"""
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            results = list(executor.map(lambda i: self.post_abono(reservation["id"], i), range(CONCURRENT_ABONOS)))
+
+        numbers = self.check_unique("Concurrent Abono Allocation", results)
+
+        # Verificar también lo que quedó persistido en la base de datos
+        abonos_result = self.make_request("GET", f"/reservations/{reservation['id']}/abonos", token=self.admin_token)
+        if abonos_result.get("success"):
+            stored = [a["invoice_number"] for a in abonos_result["data"]]
+            if len(stored) == len(set(stored)):
+                self.log_test("Stored Abono Invoice Numbers", True, f"{len(stored)} stored abonos with distinct numbers")
+            else:
+                self.log_test("Stored Abono Invoice Numbers", False, "Duplicate invoice numbers persisted")
+
+        return numbers
+
+    def test_concurrent_reservations(self, customer: Dict) -> List[str]:
+        """Fire CONCURRENT_RESERVATIONS reservations in parallel (they share the allocator with abonos)"""
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            results = list(executor.map(lambda i: self.post_reservation(customer, i), range(CONCURRENT_RESERVATIONS)))
+
+        return self.check_unique("Concurrent Reservation Allocation", results)
+
+    def cleanup(self, reservation_ids: List[str]):
+        for reservation_id in reservation_ids:
+            self.make_request("DELETE", f"/reservations/{reservation_id}", token=self.admin_token)
+
+    def run_tests(self):
+        """Run the stress test"""
+        print("🚀 Starting Invoice Allocator Stress Test")
+        print("=" * 60)
+
+        if not self.login_admin():
+            return False
+
+        customer, reservation = self.setup_test_data()
+        if not reservation:
+            return False
+
+        abono_numbers = self.test_concurrent_abonos(reservation)
+        reservation_numbers = self.test_concurrent_reservations(customer)
+
+        # Abonos y reservaciones comparten la misma secuencia de facturas
+        all_numbers = abono_numbers + reservation_numbers + [reservation["invoice_number"]]
+        if len(all_numbers) == len(set(all_numbers)):
+            self.log_test("Cross-Collection Uniqueness", True, f"{len(all_numbers)} invoice numbers, no collisions")
+        else:
+            self.log_test("Cross-Collection Uniqueness", False, "Abono and reservation numbers collided")
+
+        reservations_result = self.make_request("GET", "/reservations", token=self.admin_token)
+        if reservations_result.get("success"):
+            self.cleanup([
+                r["id"] for r in reservations_result["data"]
+                if (r.get("notes") or "").startswith("Stress test allocator")
+            ])
+
+        passed = sum(1 for result in self.test_results if result["success"])
+        failed = len(self.test_results) - passed
+
+        print("\n" + "=" * 60)
+        print(f"Total Tests: {len(self.test_results)}")
+        print(f"✅ Passed: {passed}")
+        print(f"❌ Failed: {failed}")
+
+        return failed == 0
+
+if __name__ == "__main__":
+    tester = InvoiceAllocatorStressTester()
+    success = tester.run_tests()
+
+    if success:
+        print("\n🎉 All tests passed!")
+        sys.exit(0)
+    else:
+        print("\n💥 Some tests failed!")
+        sys.exit(1)
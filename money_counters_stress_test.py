@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Stress Test for the Atomic Money Counters
+Fires hundreds of concurrent abonos, abono deletions and owner payments and asserts that
+amount_paid / balance_due end up exactly where they should (no lost updates)
+"""
+
+import requests
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+
+# Backend URL from environment
+BACKEND_URL = "https://piscinapp-1.preview.emergentagent.com/api"
+
+RESERVATION_TOTAL = 1000000.0
+OWNER_TOTAL_OWED = 500000.0
+CONCURRENT_ABONOS = 300
+CONCURRENT_DELETES = 100
+CONCURRENT_UPDATES = 100
+CONCURRENT_OWNER_PAYMENTS = 200
+MAX_WORKERS = 50
+
+class MoneyCountersStressTester:
+    def __init__(self):
+        self.admin_token = None
+        self.test_results = []
+
+    def log_test(self, test_name: str, success: bool, message: str, details: Any = None):
+        """Log test result"""
+        result = {
+            "test": test_name,
+            "success": success,
+            "message": message,
+            "details": details
+        }
+        self.test_results.append(result)
+        status = "✅ PASS" if success else "❌ FAIL"
+        print(f"{status}: {test_name} - {message}")
+        if details and not success:
+            print(f"   Details: {details}")
+
+    def make_request(self, method: str, endpoint: str, data: Dict = None, token: str = None, params: Dict = None) -> Dict:
+        """Make HTTP request to backend"""
+        url = f"{BACKEND_URL}{endpoint}"
+        headers = {"Content-Type": "application/json"}
+
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+
+        try:
+            if method == "GET":
+                response = requests.get(url, headers=headers, params=params or data)
+            elif method == "POST":
+                response = requests.post(url, headers=headers, json=data, params=params)
+            elif method == "PUT":
+                response = requests.put(url, headers=headers, json=data, params=params)
+            elif method == "DELETE":
+                response = requests.delete(url, headers=headers)
+            else:
+                return {"error": f"Unsupported method: {method}"}
+
+            return {
+                "status_code": response.status_code,
+                "data": response.json() if response.content else {},
+                "success": 200 <= response.status_code < 300
+            }
+        except Exception as e:
+            return {"error": str(e), "success": False}
+
+    def login_admin(self) -> bool:
+        """Login admin user"""
+        result = self.make_request("POST", "/auth/login", {"username": "admin", "password": "admin123"})
+        if result.get("success"):
+            self.admin_token = result["data"]["access_token"]
+            self.log_test("Admin Login", True, "Admin logged in successfully")
+            return True
+
+        self.log_test("Admin Login", False, "Admin login failed", result)
+        return False
+
+    def setup_reservation(self):
+        """Create a customer and a services-only reservation to receive the abonos"""
+        customer_result = self.make_request("POST", "/customers", {
+            "name": "Stress Test Money Counters",
+            "phone": "809-555-0400"
+        }, self.admin_token)
+        if not customer_result.get("success"):
+            self.log_test("Create Test Customer", False, "Failed to create test customer", customer_result)
+            return None
+        customer = customer_result["data"]
+
+        reservation_result = self.make_request("POST", "/reservations", {
+            "customer_id": customer["id"],
+            "customer_name": customer["name"],
+            "reservation_date": "2025-02-01T00:00:00Z",
+            "subtotal": RESERVATION_TOTAL,
+            "total_amount": RESERVATION_TOTAL,
+            "amount_paid": 0.0,
+            "currency": "DOP",
+            "status": "confirmed",
+            "notes": "Stress test money counters"
+        }, self.admin_token)
+        if not reservation_result.get("success"):
+            self.log_test("Create Test Reservation", False, "Failed to create test reservation", reservation_result)
+            return None
+        reservation = reservation_result["data"]
+        self.log_test("Create Test Reservation", True, f"Created reservation #{reservation['invoice_number']}")
+        return reservation
+
+    def setup_owner(self):
+        """Create an owner with a known debt"""
+        owner_result = self.make_request("POST", "/owners", {
+            "name": "Stress Test Money Counters Owner",
+            "phone": "809-555-0401"
+        }, self.admin_token)
+        if not owner_result.get("success"):
+            self.log_test("Create Test Owner", False, "Failed to create test owner", owner_result)
+            return None
+        owner = owner_result["data"]
+
+        amounts_result = self.make_request("PUT", f"/owners/{owner['id']}/amounts", token=self.admin_token,
+                                           params={"total_owed": OWNER_TOTAL_OWED})
+        if not amounts_result.get("success"):
+            self.log_test("Set Owner Debt", False, "Failed to set owner debt", amounts_result)
+            return None
+        return owner
+
+    def post_abono(self, reservation_id: str, index: int) -> Dict:
+        return self.make_request("POST", f"/reservations/{reservation_id}/abonos", {
+            "amount": 1.0,
+            "currency": "DOP",
+            "payment_method": "efectivo",
+            "notes": f"Stress money abono {index}"
+        }, self.admin_token)
+
+    def check_amounts(self, test_name: str, document: Dict, expected_paid: float, expected_balance: float):
+        paid = document.get("amount_paid")
+        balance = document.get("balance_due")
+        if abs(paid - expected_paid) < 0.001 and abs(balance - expected_balance) < 0.001:
+            self.log_test(test_name, True, f"amount_paid={paid:,.2f}, balance_due={balance:,.2f}")
+        else:
+            self.log_test(test_name, False,
+                          f"expected paid={expected_paid:,.2f} balance={expected_balance:,.2f}, "
+                          f"got paid={paid} balance={balance}")
+
+    def test_concurrent_abonos(self, reservation: Dict) -> List[Dict]:
+        """Fire CONCURRENT_ABONOS abonos of 1.00 at the same reservation in parallel"""
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            results = list(executor.map(lambda i: self.post_abono(reservation["id"], i), range(CONCURRENT_ABONOS)))
+
+        failures = [r for r in results if not r.get("success")]
+        if failures:
+            self.log_test("Concurrent Abonos", False, f"{len(failures)} of {len(results)} requests failed", failures[:5])
+        abonos = [r["data"] for r in results if r.get("success")]
+
+        stored = self.make_request("GET", f"/reservations/{reservation['id']}", token=self.admin_token)["data"]
+        self.check_amounts("Balance After Concurrent Abonos", stored,
+                           float(len(abonos)), RESERVATION_TOTAL - len(abonos))
+        return abonos
+
+    def test_concurrent_deletes(self, reservation: Dict, abonos: List[Dict]):
+        """Delete CONCURRENT_DELETES abonos in parallel, each one twice (only one delete may count)"""
+        targets = abonos[:CONCURRENT_DELETES]
+        requests_to_fire = [abono["id"] for abono in targets] * 2
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            results = list(executor.map(
+                lambda abono_id: self.make_request("DELETE", f"/reservations/{reservation['id']}/abonos/{abono_id}", token=self.admin_token),
+                requests_to_fire
+            ))
+
+        deleted = sum(1 for r in results if r.get("success"))
+        not_found = sum(1 for r in results if r.get("status_code") == 404)
+        self.log_test("Concurrent Abono Deletes", deleted == len(targets) and not_found == len(targets),
+                      f"{deleted} deleted, {not_found} duplicates rejected with 404")
+
+        remaining = len(abonos) - deleted
+        stored = self.make_request("GET", f"/reservations/{reservation['id']}", token=self.admin_token)["data"]
+        self.check_amounts("Balance After Concurrent Deletes", stored, float(remaining), RESERVATION_TOTAL - remaining)
+        return remaining
+
+    def test_abonos_during_updates(self, reservation: Dict, paid_before: float):
+        """Edit the reservation while abonos arrive: the edits must not overwrite amount_paid / balance_due"""
+        def fire(i: int) -> Dict:
+            if i % 2:
+                return self.make_request("PUT", f"/reservations/{reservation['id']}",
+                                         {"notes": f"Stress money update {i}"}, self.admin_token)
+            return self.post_abono(reservation["id"], i)
+
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            results = list(executor.map(fire, range(CONCURRENT_UPDATES * 2)))
+
+        failures = [r for r in results if not r.get("success")]
+        if failures:
+            self.log_test("Abonos During Updates", False, f"{len(failures)} of {len(results)} requests failed", failures[:5])
+        added = sum(1 for i, r in enumerate(results) if i % 2 == 0 and r.get("success"))
+
+        paid = paid_before + added
+        stored = self.make_request("GET", f"/reservations/{reservation['id']}", token=self.admin_token)["data"]
+        self.check_amounts("Balance After Abonos During Updates", stored, paid, RESERVATION_TOTAL - paid)
+
+    def test_concurrent_owner_payments(self, owner: Dict):
+        """Fire CONCURRENT_OWNER_PAYMENTS payments of 1.00 to the same owner in parallel"""
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            results = list(executor.map(
+                lambda i: self.make_request("POST", f"/owners/{owner['id']}/payments", {
+                    "owner_id": owner["id"],
+                    "amount": 1.0,
+                    "currency": "DOP",
+                    "notes": f"Stress owner payment {i}"
+                }, self.admin_token),
+                range(CONCURRENT_OWNER_PAYMENTS)
+            ))
+
+        paid = sum(1 for r in results if r.get("success"))
+        if paid != len(results):
+            self.log_test("Concurrent Owner Payments", False, f"{len(results) - paid} of {len(results)} requests failed")
+
+        stored = self.make_request("GET", f"/owners/{owner['id']}", token=self.admin_token)["data"]
+        self.check_amounts("Owner Balance After Concurrent Payments", stored, float(paid), OWNER_TOTAL_OWED - paid)
+
+    def test_stats_drift(self, timeout: float = 15.0):
+        """The outbox applies the dashboard counter deltas: once it drains they must not drift"""
+        deadline = time.monotonic() + timeout
+        result = self.make_request("GET", "/admin/stats/drift", token=self.admin_token)
+        while result.get("success") and not result["data"]["ok"] and time.monotonic() < deadline:
+            time.sleep(0.5)
+            result = self.make_request("GET", "/admin/stats/drift", token=self.admin_token)
+        if result.get("success"):
+            self.log_test("Dashboard Counters Drift", result["data"]["ok"], "no drift" if result["data"]["ok"] else "drift detected",
+                          result["data"].get("drift"))
+
+    def run_tests(self):
+        """Run the stress test"""
+        print("🚀 Starting Money Counters Stress Test")
+        print("=" * 60)
+
+        if not self.login_admin():
+            return False
+
+        reservation = self.setup_reservation()
+        owner = self.setup_owner()
+        if not reservation or not owner:
+            return False
+
+        abonos = self.test_concurrent_abonos(reservation)
+        remaining = self.test_concurrent_deletes(reservation, abonos)
+        self.test_abonos_during_updates(reservation, float(remaining))
+        self.test_concurrent_owner_payments(owner)
+        self.test_stats_drift()
+
+        self.make_request("DELETE", f"/reservations/{reservation['id']}", token=self.admin_token)
+        self.make_request("DELETE", f"/owners/{owner['id']}", token=self.admin_token)
+
+        passed = sum(1 for result in self.test_results if result["success"])
+        failed = len(self.test_results) - passed
+
+        print("\n" + "=" * 60)
+        print(f"Total Tests: {len(self.test_results)}")
+        print(f"✅ Passed: {passed}")
+        print(f"❌ Failed: {failed}")
+
+        return failed == 0
+
+if __name__ == "__main__":
+    tester = MoneyCountersStressTester()
+    success = tester.run_tests()
+
+    if success:
+        print("\n🎉 All tests passed!")
+        sys.exit(0)
+    else:
+        print("\n💥 Some tests failed!")
+        sys.exit(1)